@@ -3,6 +3,11 @@
 import time
 import json
 
+try:
+    import uplink
+except ImportError:
+    uplink = None
+
 try:
     import wifi
     import socketpool
@@ -306,7 +311,14 @@ class DjangoAPIClient:
         
         self.log(f"Flushing outbox ({len(self.outbox)} events, max={max_items})...")
         sent_count = 0
-        
+
+        # Leading sensor readings go out as one batch envelope per request
+        while self.outbox:
+            batched = self._post_outbox_batch()
+            if not batched:
+                break
+            sent_count += batched
+
         # Process in order (FIFO)
         while self.outbox and sent_count < max_items:
             event = self.outbox[0]  # Peek first
@@ -334,6 +346,36 @@ class DjangoAPIClient:
         
         return sent_count
     
+    def _post_outbox_batch(self):
+        """POST the leading sensor readings of the outbox in one batch. Returns how many were sent."""
+        if uplink is None or not self.server_configured or self._should_backoff():
+            return 0
+        readings = uplink.leading_readings(self.outbox, uplink.MAX_BATCH)
+        if len(readings) < 2:
+            return 0
+        if not self.ensure_connection():
+            return 0
+
+        body, headers = uplink.encode_batch(self.device, readings)
+        headers["X-API-KEY"] = self.api_key
+        url = "{}{}".format(self.server_url, self.events_endpoint)
+        try:
+            response = self.requests.post(url, headers=headers, data=body, timeout=10)
+            status = response.status_code
+            response.close()
+        except Exception as e:
+            self.log(f"Outbox batch post exception: {e}")
+            self._handle_connection_failure()
+            return 0
+
+        if status in (200, 201):
+            del self.outbox[:len(readings)]
+            self._handle_connection_success()
+            self.log(f"✓ Outbox batch sent: {len(readings)} readings in {len(body)} bytes")
+            return len(readings)
+        self.log(f"✗ Outbox batch failed: HTTP {status}")
+        return 0
+
     def load_local_config(self):
         """Load previously saved wifi_config.json"""
         try:
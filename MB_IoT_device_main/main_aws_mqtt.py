@@ -18,6 +18,7 @@ DJANGO_API_KEY = getattr(config, "DJANGO_API_KEY", None)
 # MQTT
 import mqtt_client
 import publisher
+import signing
 import subscriber
 
 # sensors / actuators
@@ -62,6 +63,7 @@ MQTT_PUBLISH_INTERVAL = getattr(config, "MQTT_PUBLISH_INTERVAL", 30)
 DJANGO_EVENT_INTERVAL = getattr(config, "DJANGO_EVENT_INTERVAL", 30)
 
 _http_session = None
+_uplink = None
 
 
 # ------------------------
@@ -115,16 +117,17 @@ def build_django_payload(event_type, extra=None):
 def post_to_django(payload):
     """
     Django /api/iot/events/ に POST（失敗しても止めない）
+    Returns True when the server accepted the event.
     """
     global _http_session
 
     if not DJANGO_EVENTS_URL or not DJANGO_API_KEY:
-        return
+        return False
 
     try:
         sess = get_http_session()
         if not sess:
-            return
+            return False
 
         headers = {
             "Content-Type": "application/json",
@@ -141,12 +144,62 @@ def post_to_django(payload):
                 print("Django response:", resp.text)
             except Exception:
                 pass
+            return resp.status_code in (200, 201)
         finally:
             resp.close()
 
     except Exception as e:
         print("Django POST error:", e)
         _http_session = None
+        return False
+
+
+def _post_batch(body, headers):
+    """Send one batch envelope; returns the HTTP status (0 on network errors)."""
+    global _http_session
+
+    sess = get_http_session()
+    if not sess:
+        return 0
+    headers = dict(headers)
+    headers["X-API-KEY"] = DJANGO_API_KEY
+    try:
+        resp = sess.post(DJANGO_EVENTS_URL, data=body, headers=headers)
+    except Exception as e:
+        print("Django batch POST error:", e)
+        _http_session = None
+        return 0
+    try:
+        return resp.status_code
+    finally:
+        resp.close()
+
+
+def get_uplink():
+    """Lazy init the batched uplink (None when Django is not configured)."""
+    global _uplink
+    if _uplink is not None or not DJANGO_EVENTS_URL or not DJANGO_API_KEY:
+        return _uplink
+    try:
+        import outbox
+        import uplink
+        _uplink = uplink.BatchUplink(
+            outbox.RingOutbox(),
+            _post_batch,
+            getattr(config, "DEVICE_ID", "device"),
+        )
+    except Exception as e:
+        print("Uplink init error:", e)
+        _uplink = None
+    return _uplink
+
+
+def _wifi_rssi():
+    try:
+        import wifi
+        return wifi.radio.ap_info.rssi
+    except Exception:
+        return None
 
 
 # ------------------------
@@ -653,24 +706,46 @@ def main_loop():
                     "hum": cached_sensors.get("hum"),
                     "ts": int(time.time()),
                 }
-                publisher.publish_json(getattr(config, "TOPIC_SENSOR"), mqtt_payload)
+                # Signed with the Django API key so the ingest worker can authenticate
+                # the device (the key itself is not sent)
+                if DJANGO_API_KEY:
+                    message = signing.sign_message(DJANGO_API_KEY, mqtt_payload)
+                else:
+                    message = mqtt_payload
+                publisher.publish_json(getattr(config, "TOPIC_SENSOR"), message)
                 print("✅ Published to MQTT:", mqtt_payload)
             except Exception as e:
                 print("Sensor MQTT publish error:", e)
 
             last_mqtt_publish_ts = now
 
-        # ---- post Django ----
+        # ---- send live readings to Django ----
+        # Live readings (MQ-9 spikes included) go out immediately; only readings
+        # that could not be delivered are queued in the outbox.
         if now - last_django_publish_ts >= DJANGO_EVENT_INTERVAL:
             try:
-                django_payload = build_django_payload(event_type="sensor")
-                print("Posting sensors to Django:", django_payload)
-                post_to_django(django_payload)
+                up = get_uplink()
+                reading = build_django_payload(event_type="sensor")
+                # While the uplink is backing off the link is known to be down:
+                # queue directly instead of blocking on another failed POST.
+                offline = up is not None and up.backoff_remaining(now) > 0
+                if (offline or not post_to_django(reading)) and up:
+                    reading.pop("device", None)
+                    reading.pop("event_type", None)
+                    up.add(reading)
             except Exception as e:
-                print("Sensor Django post error:", e)
+                print("Sensor Django POST error:", e)
 
             last_django_publish_ts = now
 
+        # ---- drain the backlog in batches ----
+        up = _uplink
+        if up and up.pending():
+            try:
+                up.flush(now, rssi=_wifi_rssi())
+            except Exception as e:
+                print("Sensor Django batch error:", e)
+
         # ---- IR + MQTT loop ----
         monitor_ir_and_publish_once()
 
@@ -1,59 +1,335 @@
 # outbox.py
-import os, json
+# Crash-safe ring-buffer outbox for readings that could not be sent.
+#
+# Layout (under OUTBOX_DIR):
+#   seg0.bin .. seg{N-1}.bin  fixed-size segments, records appended in order
+#   ptr.bin                   head pointer, two alternating CRC-checked slots
+#
+# Record: header <HHII (magic, length, seq, crc32) + JSON body
+#   {"topic": ..., "payload": ...}. crc covers seq + body.
+#
+# enqueue() writes one record, ack() rewrites one pointer slot (18 bytes), and
+# entering a segment truncates it once, so draining a backlog is O(1) per
+# entry and flash wear is bounded by SEGMENT_COUNT * SEGMENT_SIZE. When the
+# ring is full the oldest segment is dropped. The tail is not stored: on
+# start-up the records after the head are scanned and the first torn or
+# CRC-failing record marks the tail (power loss mid-write loses only that
+# record). A power loss between a send and its ack re-sends the entry
+# (at-least-once).
+#
+# Runs on CircuitPython/MicroPython and CPython; `fs` can be replaced by a
+# file-backed stand-in (tests inject torn writes through it).
 
+import json
+import os
+import struct
+
+try:
+    from binascii import crc32 as _crc32
+except ImportError:  # pragma: no cover - ports without binascii.crc32
+    def _crc32(data, crc=0):
+        crc = ~crc & 0xFFFFFFFF
+        for b in data:
+            crc ^= b
+            for _ in range(8):
+                crc = (crc >> 1) ^ (0xEDB88320 if crc & 1 else 0)
+        return ~crc & 0xFFFFFFFF
+
+OUTBOX_DIR = "outbox"
+SEGMENT_SIZE = 4 * 1024
+SEGMENT_COUNT = 16
+MAX_FILE_SIZE = SEGMENT_SIZE * SEGMENT_COUNT
+
+# Legacy single-file outbox (imported once, then removed)
 OUTBOX_FILE = "outbox.jsonl"
-MAX_FILE_SIZE = 64 * 1024
 
-def _ensure_file():
-    if OUTBOX_FILE not in os.listdir():
-        with open(OUTBOX_FILE, "w") as f:
+_MAGIC = 0x4F42
+_HEADER = "<HHII"
+_HEADER_SIZE = struct.calcsize(_HEADER)
+_SLOT = "<IHIII"  # generation, segment, offset, seq, crc
+_SLOT_SIZE = struct.calcsize(_SLOT)
+
+
+def _crc(seq, body):
+    return _crc32(body, _crc32(struct.pack("<I", seq))) & 0xFFFFFFFF
+
+
+class FlashFS:
+    """Files under a root directory (the device filesystem, or a temp dir on CPython)."""
+
+    def __init__(self, root):
+        self.root = root
+
+    def path(self, name):
+        return self.root + "/" + name
+
+    def ensure_root(self):
+        try:
+            os.mkdir(self.root)
+        except OSError:
             pass
 
-def enqueue(topic, payload):
-    _ensure_file()
-    entry = {"topic": topic, "payload": payload}
-    s = json.dumps(entry, separators=(",", ":"))
-    with open(OUTBOX_FILE, "a") as f:
-        f.write(s + "\n")
-    _rotate_if_needed()
+    def exists(self, name):
+        try:
+            os.stat(self.path(name))
+            return True
+        except OSError:
+            return False
 
-def peek_all():
-    if OUTBOX_FILE not in os.listdir():
-        return []
-    items = []
-    with open(OUTBOX_FILE, "r") as f:
-        for line in f:
-            line = line.strip()
-            if not line:
-                continue
+    def size(self, name):
+        try:
+            return os.stat(self.path(name))[6]
+        except OSError:
+            return 0
+
+    def read(self, name, offset, length):
+        try:
+            with open(self.path(name), "rb") as f:
+                f.seek(offset)
+                return f.read(length)
+        except OSError:
+            return b""
+
+    def write(self, name, offset, data):
+        with open(self.path(name), "r+b") as f:
+            f.seek(offset)
+            f.write(data)
+
+    def create(self, name, data=b""):
+        with open(self.path(name), "wb") as f:
+            f.write(data)
+
+
+class RingOutbox:
+    """Fixed-size segment ring buffer with a persisted head pointer."""
+
+    def __init__(self, root=OUTBOX_DIR, segment_size=SEGMENT_SIZE, segment_count=SEGMENT_COUNT, fs=None):
+        self.fs = fs or FlashFS(root)
+        self.segment_size = segment_size
+        self.segment_count = segment_count
+        self.dropped = 0
+        self._generation = 0
+        self.fs.ensure_root()
+        self._recover()
+
+    # -- public interface ---------------------------------------------------
+
+    def enqueue(self, topic, payload):
+        """Append an entry. Returns its sequence number, or None if it cannot be stored."""
+        body = json.dumps({"topic": topic, "payload": payload}, separators=(",", ":")).encode()
+        size = _HEADER_SIZE + len(body)
+        if size > self.segment_size:
+            print("[OUTBOX] Entry too large ({} bytes), dropped".format(size))
+            return None
+
+        seg, off, seq = self._tail
+        if off + size > self.segment_size:
+            seg, off = self._next_segment(seg), 0
+            if seg == self._head[0]:
+                self._drop_head_segment(seg)
+            self.fs.create(self._seg_name(seg))
+
+        record = struct.pack(_HEADER, _MAGIC, len(body), seq, _crc(seq, body)) + body
+        try:
+            self.fs.write(self._seg_name(seg), off, record)
+        except OSError as e:
+            print("[OUTBOX] Write failed: {}".format(e))
+            return None
+        self._tail = (seg, off + size, seq + 1)
+        return seq
+
+    def peek(self, max_items=1):
+        """Return up to max_items oldest entries as dicts with topic, payload and seq."""
+        items = []
+        pos = self._head
+        while len(items) < max_items and pos[2] < self._tail[2]:
+            found = self._record_at(pos)
+            if found is None:
+                break
+            entry, pos = found
+            items.append(entry)
+        return items
+
+    def ack(self, count=1):
+        """Remove the count oldest entries (one pointer write). Returns how many were removed."""
+        pos = self._head
+        removed = 0
+        while removed < count and pos[2] < self._tail[2]:
+            found = self._record_at(pos, header_only=True)
+            if found is None:
+                break
+            pos = found[1]
+            removed += 1
+        if removed:
+            self._set_head(pos)
+        return removed
+
+    def __len__(self):
+        return self._tail[2] - self._head[2]
+
+    # -- records --------------------------------------------------------------
+
+    def _seg_name(self, seg):
+        return "seg{}.bin".format(seg)
+
+    def _next_segment(self, seg):
+        return (seg + 1) % self.segment_count
+
+    def _read_record(self, seg, off, seq, header_only=False):
+        """Return (body or None, size) of the record with sequence seq at (seg, off), or None."""
+        header = self.fs.read(self._seg_name(seg), off, _HEADER_SIZE)
+        if len(header) < _HEADER_SIZE:
+            return None
+        magic, length, rec_seq, crc = struct.unpack(_HEADER, header)
+        if magic != _MAGIC or rec_seq != seq or off + _HEADER_SIZE + length > self.segment_size:
+            return None
+        if header_only:
+            return None, _HEADER_SIZE + length
+        body = self.fs.read(self._seg_name(seg), off + _HEADER_SIZE, length)
+        if len(body) < length or _crc(seq, body) != crc:
+            return None
+        return body, _HEADER_SIZE + length
+
+    def _locate(self, pos):
+        """Position of the record for pos's seq (it may start the next segment)."""
+        seg, off, seq = pos
+        if self._read_record(seg, off, seq, header_only=True) is not None:
+            return pos
+        nxt = self._next_segment(seg)
+        if nxt != seg and self._read_record(nxt, 0, seq, header_only=True) is not None:
+            return (nxt, 0, seq)
+        return None
+
+    def _record_at(self, pos, header_only=False):
+        pos = self._locate(pos)
+        if pos is None:
+            return None
+        seg, off, seq = pos
+        found = self._read_record(seg, off, seq, header_only=header_only)
+        if found is None:
+            return None
+        body, size = found
+        entry = None
+        if body is not None:
             try:
-                items.append(json.loads(line))
-            except Exception:
+                entry = json.loads(body.decode())
+            except ValueError:
+                entry = {"topic": None, "payload": None}
+            entry["seq"] = seq
+        return entry, (seg, off + size, seq + 1)
+
+    def _drop_head_segment(self, entering):
+        """Ring full: the tail is entering the head segment, so discard its entries."""
+        seg, _, seq = self._head
+        nxt = self._next_segment(seg)
+        new_head = (entering, 0, self._tail[2])
+        if nxt != entering:
+            header = self.fs.read(self._seg_name(nxt), 0, _HEADER_SIZE)
+            if len(header) == _HEADER_SIZE:
+                magic, _, first_seq, _ = struct.unpack(_HEADER, header)
+                if magic == _MAGIC and seq <= first_seq <= self._tail[2]:
+                    new_head = (nxt, 0, first_seq)
+        if new_head[2] > seq:
+            self.dropped += new_head[2] - seq
+            print("[OUTBOX] Full, dropped {} oldest entries".format(new_head[2] - seq))
+        self._set_head(new_head)
+
+    # -- head pointer ---------------------------------------------------------
+
+    def _set_head(self, pos):
+        self._generation += 1
+        seg, off, seq = pos
+        slot = struct.pack("<IHII", self._generation, seg, off, seq)
+        slot += struct.pack("<I", _crc32(slot) & 0xFFFFFFFF)
+        self.fs.write("ptr.bin", (self._generation % 2) * _SLOT_SIZE, slot)
+        self._head = pos
+
+    def _load_head(self):
+        data = self.fs.read("ptr.bin", 0, 2 * _SLOT_SIZE)
+        best = None
+        for i in range(len(data) // _SLOT_SIZE):
+            raw = data[i * _SLOT_SIZE:(i + 1) * _SLOT_SIZE]
+            generation, seg, off, seq, crc = struct.unpack(_SLOT, raw)
+            if generation and crc == _crc32(raw[:-4]) & 0xFFFFFFFF and seg < self.segment_count:
+                if best is None or generation > best[0]:
+                    best = (generation, (seg, off, seq))
+        return best
+
+    def _recover(self):
+        """Load the head pointer and scan forward for the tail."""
+        if self.fs.size("ptr.bin") < 2 * _SLOT_SIZE:
+            self.fs.create("ptr.bin", bytes(2 * _SLOT_SIZE))
+        loaded = self._load_head()
+        if loaded is None:
+            self.fs.create(self._seg_name(0))
+            self._head = self._tail = (0, 0, 1)
+            self._set_head(self._head)
+            self._import_legacy()
+            return
+        self._generation, self._head = loaded
+        if not self.fs.exists(self._seg_name(self._head[0])):
+            self.fs.create(self._seg_name(self._head[0]))
+
+        pos = self._head
+        while True:
+            found = self._record_at(pos)
+            if found is None:
+                break
+            pos = found[1]
+        self._tail = pos
+
+    def _import_legacy(self):
+        try:
+            with open(OUTBOX_FILE, "r") as f:
+                lines = f.readlines()
+        except OSError:
+            return
+        for line in lines:
+            try:
+                item = json.loads(line)
+            except ValueError:
                 continue
-    return items
+            self.enqueue(item.get("topic"), item.get("payload"))
+        try:
+            os.remove(OUTBOX_FILE)
+        except OSError:
+            pass
+
+
+# ---------------------------------------------------------------------------
+# Module-level interface (default outbox under OUTBOX_DIR)
+# ---------------------------------------------------------------------------
+
+_outbox = None
+
+
+def _default():
+    global _outbox
+    if _outbox is None:
+        _outbox = RingOutbox()
+    return _outbox
+
+
+def enqueue(topic, payload):
+    return _default().enqueue(topic, payload)
+
+
+def peek(max_items=1):
+    return _default().peek(max_items)
+
+
+def ack(count=1):
+    return _default().ack(count)
+
+
+def pending():
+    return len(_default())
+
+
+def peek_all():
+    box = _default()
+    return box.peek(len(box))
+
 
 def remove_first():
-    if OUTBOX_FILE not in os.listdir():
-        return
-    with open(OUTBOX_FILE, "r") as f:
-        lines = f.readlines()
-    if not lines:
-        return
-    with open(OUTBOX_FILE, "w") as f:
-        f.writelines(lines[1:])
-
-def _rotate_if_needed():
-    try:
-        size = os.stat(OUTBOX_FILE)[6]
-        if size > MAX_FILE_SIZE:
-            i = 1
-            while True:
-                name = f"outbox.{i}.bak"
-                if name not in os.listdir():
-                    os.rename(OUTBOX_FILE, name)
-                    break
-                i += 1
-            with open(OUTBOX_FILE, "w") as f:
-                pass
-    except Exception:
-        pass
\ No newline at end of file
+    _default().ack(1)
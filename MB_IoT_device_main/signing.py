@@ -0,0 +1,52 @@
+# signing.py
+# Signs MQTT sensor messages for the Django ingest worker
+# (booking/services/iot_mqtt_ingest.py).
+#
+#   {"body": "<JSON of the reading>", "sig": "<hex HMAC-SHA256 of body>"}
+#
+# The HMAC key is the SHA-256 hex digest of the device's Django API key, which
+# is what the server stores as IoTDevice.api_key_hash. The API key itself never
+# goes on the wire, and the server can verify without knowing it.
+#
+# The body is sent as a string so the server checks exactly the bytes that were
+# signed (json.dumps on the device does not sort keys or format floats like
+# CPython does).
+
+import binascii
+import json
+
+try:
+    import hashlib
+except ImportError:
+    import adafruit_hashlib as hashlib
+
+BLOCK_SIZE = 64
+
+
+def _sha256(data):
+    return hashlib.new("sha256", data).digest()
+
+
+def _hex(data):
+    return binascii.hexlify(data).decode()
+
+
+def hmac_sha256(key, msg):
+    """HMAC-SHA256 (RFC 2104); hmac is not available on CircuitPython."""
+    if len(key) > BLOCK_SIZE:
+        key = _sha256(key)
+    key = key + b"\x00" * (BLOCK_SIZE - len(key))
+    inner = _sha256(bytes(b ^ 0x36 for b in key) + msg)
+    return _sha256(bytes(b ^ 0x5C for b in key) + inner)
+
+
+def signing_key(api_key):
+    """HMAC key derived from the API key (= IoTDevice.api_key_hash)."""
+    return _hex(_sha256(api_key.encode("utf-8"))).encode()
+
+
+def sign_message(api_key, reading):
+    """Wrap a reading dict in a signed envelope (dict, ready for publish_json)."""
+    body = json.dumps(reading)
+    sig = _hex(hmac_sha256(signing_key(api_key), body.encode("utf-8")))
+    return {"body": body, "sig": sig}
@@ -0,0 +1,245 @@
+# uplink.py
+# Batched uplink of buffered sensor readings to Django (/api/iot/events/).
+#
+# Live readings are posted one by one as they are sampled; only readings that
+# could not be delivered (network down, server error) are queued in the
+# persistent outbox (outbox.RingOutbox). The backlog is drained as one
+# delta-encoded envelope per POST (decoded by
+# booking/services/iot_batch.py):
+#
+#   Content-Type: application/x-iot-batch
+#   X-Batch-Encoding: zlib          (only when compression is available and smaller)
+#
+#   {"v": 1, "device": ..., "event_type": "sensor", "fields": [...],
+#    "scale": 100, "t0": <first ts>, "rows": [[dt, d_mq9, d_light, ...], ...]}
+#
+# Values are scaled to integers (2 decimals) and stored as the difference to
+# the previous non-null value of the same column; dt is the difference to the
+# previous row's ts. Consecutive readings of slowly changing sensors become
+# small integers that compress well.
+#
+# The batch size adapts to the link: it doubles after a fast successful send,
+# halves after a slow one, a failure or on a weak RSSI. Failures back off
+# exponentially with jitter so a fleet does not retry in lockstep.
+
+import json
+import random
+import time
+
+BATCH_CONTENT_TYPE = "application/x-iot-batch"
+BATCH_VERSION = 1
+FIELDS = ("mq9", "light", "sound", "pir", "temp", "hum")
+SCALE = 100
+
+MIN_BATCH = 1
+MAX_BATCH = 120  # server accepts up to 500 rows
+INITIAL_BATCH = 10
+SLOW_SEND_SECONDS = 3.0
+WEAK_RSSI = -75
+BASE_BACKOFF = 5
+MAX_BACKOFF = 600
+EVENT_TOPIC = "django/events"
+
+
+# Event types the server accepts in a batch envelope (others are posted one by one)
+BATCH_EVENT_TYPES = ("sensor", "sensor_reading", "heartbeat")
+
+
+def _number_or_none(value):
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        return None
+    return value
+
+
+def reading_from_event(event):
+    """Sensor reading for a queued /api/iot/events/ body, or None if it must be sent on its own."""
+    if not isinstance(event, dict) or event.get("event_type", "sensor") not in BATCH_EVENT_TYPES:
+        return None
+    payload = event.get("payload")
+    if isinstance(payload, dict):
+        sensors = payload.get("sensors") if isinstance(payload.get("sensors"), dict) else payload
+    else:
+        sensors = {}
+    reading = {}
+    for name in FIELDS:
+        value = event.get(name)
+        reading[name] = sensors.get(name) if value is None else value
+    if reading["mq9"] is None:
+        reading["mq9"] = event.get("mq9_value")
+    ts = event.get("ts")
+    reading["ts"] = _number_or_none(sensors.get("ts") if ts is None else ts)
+    return reading
+
+
+def leading_readings(events, limit):
+    """Readings for the leading run of batchable events (at most limit)."""
+    readings = []
+    for event in events:
+        if len(readings) >= limit:
+            break
+        reading = reading_from_event(event)
+        if reading is None:
+            break
+        readings.append(reading)
+    return readings
+
+
+def _compress(data):
+    try:
+        import zlib
+        if hasattr(zlib, "compress"):
+            return zlib.compress(data)
+    except ImportError:
+        pass
+    try:
+        # MicroPython >= 1.21
+        import deflate
+        import io
+        buf = io.BytesIO()
+        with deflate.DeflateIO(buf, deflate.ZLIB) as d:
+            d.write(data)
+        return buf.getvalue()
+    except Exception:
+        return None
+
+
+def _quantize(value):
+    if value is None:
+        return None
+    if value is True or value is False:
+        value = 1 if value else 0
+    try:
+        return int(round(float(value) * SCALE))
+    except (TypeError, ValueError):
+        return None
+
+
+def encode_batch(device_id, readings, event_type="sensor", compress=True):
+    """Pack readings (dicts with ts and FIELDS) into (body bytes, headers)."""
+    t0 = int(readings[0].get("ts") or 0) if readings else 0
+    prev_ts = t0
+    last = [0] * len(FIELDS)
+    rows = []
+    for reading in readings:
+        ts = int(reading.get("ts") or prev_ts)
+        row = [ts - prev_ts]
+        prev_ts = ts
+        for i, name in enumerate(FIELDS):
+            q = _quantize(reading.get(name))
+            if q is None:
+                row.append(None)
+            else:
+                row.append(q - last[i])
+                last[i] = q
+        rows.append(row)
+
+    envelope = {
+        "v": BATCH_VERSION,
+        "device": device_id,
+        "event_type": event_type,
+        "fields": list(FIELDS),
+        "scale": SCALE,
+        "t0": t0,
+        "rows": rows,
+    }
+    body = json.dumps(envelope, separators=(",", ":")).encode()
+    headers = {"Content-Type": BATCH_CONTENT_TYPE}
+    if compress:
+        packed = _compress(body)
+        if packed is not None and len(packed) < len(body):
+            body = packed
+            headers["X-Batch-Encoding"] = "zlib"
+    return body, headers
+
+
+class BatchUplink:
+    """Drains the outbox in adaptive batches.
+
+    post(body, headers) sends one request and returns the HTTP status code
+    (raise or return 0 on network errors).
+    """
+
+    def __init__(self, outbox, post, device_id, min_batch=MIN_BATCH, max_batch=MAX_BATCH,
+                 initial_batch=INITIAL_BATCH, base_backoff=BASE_BACKOFF, max_backoff=MAX_BACKOFF,
+                 clock=None, rng=None):
+        self.outbox = outbox
+        self.post = post
+        self.device_id = device_id
+        self.min_batch = min_batch
+        self.max_batch = max_batch
+        self.batch_size = max(min_batch, min(initial_batch, max_batch))
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.clock = clock or time.monotonic
+        self.rng = rng or random
+        self.failures = 0
+        self.next_attempt = 0
+
+    def add(self, reading):
+        """Queue one reading (dict with ts and sensor fields)."""
+        return self.outbox.enqueue(EVENT_TOPIC, reading)
+
+    def pending(self):
+        return len(self.outbox)
+
+    def batch_limit(self, rssi=None):
+        if rssi is not None and rssi < WEAK_RSSI:
+            return max(self.min_batch, self.batch_size // 4)
+        return self.batch_size
+
+    def backoff_remaining(self, now=None):
+        now = self.clock() if now is None else now
+        return max(0, self.next_attempt - now)
+
+    def flush(self, now=None, rssi=None):
+        """Send one batch if not backing off. Returns the number of readings delivered."""
+        now = self.clock() if now is None else now
+        if now < self.next_attempt:
+            return 0
+        items = self.outbox.peek(self.batch_limit(rssi))
+        if not items:
+            return 0
+
+        body, headers = encode_batch(self.device_id, [item["payload"] for item in items])
+        started = self.clock()
+        try:
+            status = self.post(body, headers)
+        except Exception as e:
+            print("[UPLINK] POST error:", e)
+            status = 0
+        elapsed = self.clock() - started
+
+        if status in (200, 201):
+            self.outbox.ack(len(items))
+            self._on_success(elapsed)
+            print("[UPLINK] Sent {} readings ({} bytes), next batch {}".format(
+                len(items), len(body), self.batch_size))
+            return len(items)
+
+        if status == 400:
+            # The server will never accept this batch; drop it so it does not jam the queue
+            print("[UPLINK] Batch rejected (400), dropped {} readings".format(len(items)))
+            self.outbox.ack(len(items))
+            return 0
+
+        if status == 413:
+            self.batch_size = max(self.min_batch, len(items) // 2)
+        self._on_failure(now + elapsed)
+        print("[UPLINK] Send failed (status {}), retry in {:.0f}s".format(
+            status, self.backoff_remaining(now + elapsed)))
+        return 0
+
+    def _on_success(self, elapsed):
+        self.failures = 0
+        self.next_attempt = 0
+        if elapsed <= SLOW_SEND_SECONDS:
+            self.batch_size = min(self.max_batch, self.batch_size * 2)
+        else:
+            self.batch_size = max(self.min_batch, self.batch_size // 2)
+
+    def _on_failure(self, now):
+        self.failures += 1
+        self.batch_size = max(self.min_batch, self.batch_size // 2)
+        delay = min(self.max_backoff, self.base_backoff * (2 ** (self.failures - 1)))
+        # "equal jitter": half fixed, half random
+        self.next_attempt = now + delay / 2 + self.rng.random() * delay / 2
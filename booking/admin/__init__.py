@@ -56,7 +56,7 @@ from .cms import (  # noqa: F401
     SecurityAuditAdmin, SecurityLogAdmin, CostReportAdmin,
     POSTransactionAdmin,
     VisitorCountAdmin, VisitorAnalyticsConfigAdmin,
-    StaffRecommendationModelAdmin, StaffRecommendationResultAdmin,
+    StaffRecommendationModelAdmin, StaffRecommendationResultAdmin, SalesForecastAdmin,
     BusinessInsightAdmin, CustomerFeedbackAdmin,
     EvaluationCriteriaAdmin, StaffEvaluationAdmin,
     TinyMCEWidget,
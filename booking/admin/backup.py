@@ -1,7 +1,7 @@
 """Backup admin: BackupConfig (singleton), BackupHistory (read-only log)."""
 from django.contrib import admin
 from django.shortcuts import redirect
-from django.utils.html import format_html
+from django.utils.html import format_html, format_html_join
 from django.utils.translation import gettext_lazy as _
 
 from ..admin_site import custom_site
@@ -73,7 +73,7 @@ class BackupHistoryAdmin(admin.ModelAdmin):
     readonly_fields = (
         'backup_file', 'file_size_bytes', 'status', 'trigger',
         's3_uploaded', 's3_key', 'error_message',
-        'duration_seconds', 'started_at', 'completed_at',
+        'duration_seconds', 'throughput_display', 'started_at', 'completed_at',
     )
     ordering = ('-started_at',)
     list_per_page = 20
@@ -111,6 +111,20 @@ class BackupHistoryAdmin(admin.ModelAdmin):
         return f'{kb:.1f} KB'
     file_size_display.short_description = _('サイズ')
 
+    def throughput_display(self, obj):
+        stats = obj.stats or {}
+        rows = [
+            format_html('{}: {} MB/s', stage, entry['mb_per_s'] if entry['mb_per_s'] is not None else '-')
+            for stage, entry in stats.get('stages', {}).items()
+        ]
+        if stats.get('chunks'):
+            rows.append(format_html(
+                '新規チャンク {}/{}（保存 {} KB）',
+                stats['new_chunks'], stats['chunks'], f"{stats['stored_bytes'] / 1024:.1f}",
+            ))
+        return format_html_join('', '{}<br>', ((row,) for row in rows)) if rows else '-'
+    throughput_display.short_description = _('スループット')
+
 
 custom_site.register(BackupConfig, BackupConfigAdmin)
 custom_site.register(BackupHistory, BackupHistoryAdmin)
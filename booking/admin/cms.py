@@ -1,7 +1,7 @@
 """CMS admin: Notice, Company, Media, SiteSettings, AdminSidebar,
 HomepageCustomBlock, HeroBanner, BannerAd, ExternalLink, AdminMenuConfig,
 SecurityAudit, SecurityLog, CostReport, POSTransaction, VisitorCount,
-VisitorAnalyticsConfig, StaffRecommendationModel, StaffRecommendationResult,
+VisitorAnalyticsConfig, StaffRecommendationModel, StaffRecommendationResult, SalesForecast,
 BusinessInsight, CustomerFeedback, EvaluationCriteria, StaffEvaluation."""
 import json
 
@@ -25,7 +25,7 @@ from ..models import (
     SecurityAudit, SecurityLog, CostReport,
     POSTransaction,
     VisitorCount, VisitorAnalyticsConfig,
-    StaffRecommendationModel, StaffRecommendationResult,
+    StaffRecommendationModel, StaffRecommendationResult, SalesForecast,
     BusinessInsight, CustomerFeedback,
     EvaluationCriteria, StaffEvaluation,
     ErrorReport,
@@ -683,7 +683,8 @@ class SecurityAuditAdmin(admin.ModelAdmin):
     list_display = ('created_at', 'severity', 'status', 'check_name', 'category', 'message')
     list_filter = ('severity', 'status', 'category')
     search_fields = ('check_name', 'message')
-    readonly_fields = ('run_id', 'check_name', 'category', 'severity', 'status', 'message', 'recommendation', 'created_at')
+    readonly_fields = ('run_id', 'check_name', 'category', 'severity', 'status', 'message', 'recommendation',
+                       'fingerprint', 'duration_ms', 'expires_at', 'created_at')
     ordering = ('-created_at',)
     list_per_page = 10
     date_hierarchy = 'created_at'
@@ -691,13 +692,26 @@ class SecurityAuditAdmin(admin.ModelAdmin):
     def has_add_permission(self, request):
         return False
 
+    def changelist_view(self, request, extra_context=None):
+        # チェックは実行せず、保存済みの最新結果を表示する
+        from booking.services.security_audit import latest_report, report_summary
+        extra_context = extra_context or {}
+        report = latest_report()
+        extra_context['audit_report'] = report
+        extra_context['audit_summary'] = report_summary(report)
+        return super().changelist_view(request, extra_context=extra_context)
+
     actions = ['run_security_audit']
 
     @admin.action(description=_('セキュリティ監査を実行'))
     def run_security_audit(self, request, queryset):
-        from django.core.management import call_command
-        call_command('security_audit')
-        self.message_user(request, 'セキュリティ監査を実行しました。ページを更新して結果を確認してください。')
+        from booking.services.security_audit import run_audit
+        audit = run_audit()
+        self.message_user(
+            request,
+            f'セキュリティ監査を実行しました（実行: {audit["executed"]}件 / 前回結果: {audit["cached"]}件 / '
+            f'{audit["wall_ms"]} ms）。',
+        )
 
 
 class SecurityLogAdmin(admin.ModelAdmin):
@@ -791,6 +805,15 @@ class StaffRecommendationResultAdmin(admin.ModelAdmin):
     date_hierarchy = 'date'
 
 
+class SalesForecastAdmin(admin.ModelAdmin):
+    list_display = ('store', 'channel', 'date', 'predicted', 'lower', 'upper', 'method', 'generated_at')
+    list_filter = ('store', 'channel', 'method')
+    readonly_fields = ('generated_at',)
+    list_per_page = 10
+    ordering = ('store', 'channel', 'date')
+    date_hierarchy = 'date'
+
+
 # ==============================
 # ビジネスインサイト
 # ==============================
@@ -979,6 +1002,7 @@ custom_site.register(VisitorCount, VisitorCountAdmin)
 custom_site.register(VisitorAnalyticsConfig, VisitorAnalyticsConfigAdmin)
 custom_site.register(StaffRecommendationModel, StaffRecommendationModelAdmin)
 custom_site.register(StaffRecommendationResult, StaffRecommendationResultAdmin)
+custom_site.register(SalesForecast, SalesForecastAdmin)
 custom_site.register(BusinessInsight, BusinessInsightAdmin)
 custom_site.register(CustomerFeedback, CustomerFeedbackAdmin)
 custom_site.register(EvaluationCriteria, EvaluationCriteriaAdmin)
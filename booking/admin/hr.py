@@ -138,11 +138,18 @@ class PayrollPeriodAdmin(admin.ModelAdmin):
 
     @admin.action(description=_('給与計算を実行'))
     def run_payroll_calculation(self, request, queryset):
-        from booking.services.payroll_calculator import calculate_payroll_for_period
+        from booking.services.payroll_calculator import calculate_payroll_batch, period_calculation
         total = 0
         for period in queryset.filter(status__in=['draft', 'confirmed']):
-            entries = calculate_payroll_for_period(period)
-            total += len(entries)
+            with period_calculation(period) as (assignments, salary_structure):
+                result = calculate_payroll_batch(period, assignments, salary_structure)
+            total += len(result.entries)
+            if result.failed:
+                names = '、'.join(staff.name for staff in result.failed)
+                self.message_user(
+                    request, f'{period}: 計算に失敗したスタッフがいます（{names}）', messages.WARNING,
+                )
+            self.message_user(request, f'{period}: {result.timing_summary()}', messages.INFO)
         self.message_user(request, f'{total} 件の給与明細を計算しました。')
 
     @admin.action(description=_('全銀フォーマットCSVダウンロード'))
@@ -554,6 +554,11 @@ class StockMovementAdmin(admin.ModelAdmin):
         for pid, delta in deltas.items():
             Product.objects.filter(id=pid).update(stock=F('stock') + delta)
 
+        # queryset.update() はシグナルを発行しないため、客側メニューの在庫を明示的に更新
+        from booking.services import menu_catalogue
+        for store_id in set(Product.objects.filter(id__in=deltas.keys()).values_list('store_id', flat=True)):
+            menu_catalogue.refresh_stock(store_id)
+
     def get_queryset(self, request):
         qs = super().get_queryset(request)
         if _is_owner_or_super(request):
@@ -53,7 +53,7 @@ GROUPS = [
     {'slug': 'iot', 'name': _('IoT制御登録'), 'models': ['iotdevice', 'ventilationautocontrol'], 'hidden_models': ['iotdevice']},
     {'slug': 'payment', 'name': _('決済'), 'models': ['paymentmethod'], 'hidden': True},
     {'slug': 'property', 'name': _('物件管理'), 'models': ['property'], 'hidden': True},
-    {'slug': 'analytics', 'name': _('分析'), 'models': ['visitorcount', 'visitoranalyticsconfig', 'staffrecommendationmodel', 'staffrecommendationresult', 'businessinsight', 'customerfeedback'], 'hidden': True},
+    {'slug': 'analytics', 'name': _('分析'), 'models': ['visitorcount', 'visitoranalyticsconfig', 'staffrecommendationmodel', 'staffrecommendationresult', 'salesforecast', 'businessinsight', 'customerfeedback'], 'hidden': True},
     {'slug': 'page_settings', 'name': _('メインページ設定'), 'models': ['sitesettings', 'notice']},
     {'slug': 'page_settings_sub', 'name': _('ページ設定(サブ)'), 'models': ['company', 'media', 'homepagecustomblock', 'herobanner', 'bannerad', 'externallink'], 'hidden': True},
     {'slug': 'system', 'name': _('システム'), 'models': ['systemconfig', 'admintheme', 'dashboardlayout', 'adminmenuconfig', 'adminsidebarsettings']},
@@ -210,7 +210,7 @@ DEFAULT_ALLOWED_MODELS = {
         'attendancetotpconfig', 'attendancestamp',
         'tableseat', 'paymentmethod', 'postransaction', 'producttranslation',
         'visitorcount', 'visitoranalyticsconfig',
-        'staffrecommendationmodel', 'staffrecommendationresult',
+        'staffrecommendationmodel', 'staffrecommendationresult', 'salesforecast',
         'staffevaluation', 'evaluationcriteria',
         'eccategory', 'ecproduct', 'shippingconfig',
         'ventilationautocontrol',
@@ -473,9 +473,9 @@ class RoleBasedAdminSite(AdminSite):
         # EC有効判定
         try:
             from .models import SystemConfig
-            ec_enabled = SystemConfig.get('ec_enabled', '')
+            ec_enabled = SystemConfig.get_bool('ec_enabled', False)
         except Exception:
-            ec_enabled = ''
+            ec_enabled = False
 
         # SiteSettings サイドバー表示フラグ
         try:
@@ -4,7 +4,7 @@ from django.urls import path, include
 
 from . import views
 from .views import IRSendAPIView, StaffShiftBulkRequestAPIView, StaffShiftCopyWeekAPIView
-from .views_debug import AdminDebugPanelAPIView, LogLevelControlAPIView
+from .views_debug import AdminDebugPanelAPIView, LogLevelControlAPIView, LogTailAPIView, log_tail_stream
 from .views_dashboard import SensorDataAPIView, PIREventsAPIView, PIRStatusAPIView
 from .views_restaurant_dashboard import (
     DashboardLayoutAPIView,
@@ -39,10 +39,10 @@ from .views import TableCartAddAPI, TableCartUpdateAPI, TableCartRemoveAPI, Tabl
 # from .views_chat import AdminChatAPIView  # AI Chat一時無効化
 from .views_attendance import (
     AttendanceStampAPIView, AttendanceTOTPRefreshAPI, AttendanceDayStatusAPI,
-    AttendanceDayStatusHTMLView,
+    AttendanceDayStatusHTMLView, AttendanceBoardEventsAPI, attendance_board_event_stream,
     AttendancePINStampAPIView, QRStampAPIView, ManualStampAPIView,
 )
-from .views_pos import POSOrderAPIView, POSOrderItemAPIView, POSCheckoutAPIView, KitchenOrderStatusAPI, KitchenOrdersHTMLView, KitchenOrderCompleteAPI, KitchenOrderUncompleteAPI
+from .views_pos import POSOrderAPIView, POSOrderItemAPIView, POSCheckoutAPIView, KitchenOrderStatusAPI, KitchenOrdersHTMLView, KitchenOrderCompleteAPI, KitchenOrderUncompleteAPI, KitchenEventsAPI, kitchen_event_stream
 from .views_performance_dashboard import AttendancePerformanceAPIView
 from .views_analytics import VisitorCountAPIView, VisitorHeatmapAPIView, ConversionAnalyticsAPIView
 from .views_ai_recommend import AIRecommendationAPIView, AITrainModelAPIView, AIModelStatusAPIView
@@ -75,6 +75,8 @@ urlpatterns = [
     # Debug APIs
     path('debug/panel/', AdminDebugPanelAPIView.as_view(), name='debug_panel_api'),
     path('debug/log-level/', LogLevelControlAPIView.as_view(), name='log_level_api'),
+    path('debug/logs/', LogTailAPIView.as_view(), name='debug_log_tail_api'),
+    path('debug/logs/stream/', log_tail_stream, name='debug_log_tail_stream'),
 
     # Sensor Dashboard APIs
     path('iot/sensors/data/', SensorDataAPIView.as_view(), name='sensor_data_api'),
@@ -144,6 +146,8 @@ urlpatterns = [
     path('attendance/totp/refresh/', AttendanceTOTPRefreshAPI.as_view(), name='attendance_totp_refresh'),
     path('attendance/day-status/', AttendanceDayStatusAPI.as_view(), name='attendance_day_status'),
     path('attendance/day-status-html/', AttendanceDayStatusHTMLView.as_view(), name='attendance_day_status_html'),
+    path('attendance/board-events/', AttendanceBoardEventsAPI.as_view(), name='attendance_board_events'),
+    path('attendance/board-events/stream/', attendance_board_event_stream, name='attendance_board_event_stream'),
 
     # PIN打刻API
     path('attendance/pin-stamp/', AttendancePINStampAPIView.as_view(), name='attendance_pin_stamp'),
@@ -164,6 +168,8 @@ urlpatterns = [
     path('pos/checkout/', POSCheckoutAPIView.as_view(), name='pos_checkout'),
     path('pos/order-item/<int:pk>/status/', KitchenOrderStatusAPI.as_view(), name='pos_order_item_status'),
     path('pos/kitchen-orders/', KitchenOrdersHTMLView.as_view(), name='pos_kitchen_orders_html'),
+    path('pos/kitchen-events/', KitchenEventsAPI.as_view(), name='pos_kitchen_events'),
+    path('pos/kitchen-events/stream/', kitchen_event_stream, name='pos_kitchen_event_stream'),
     path('pos/order/<int:pk>/complete/', KitchenOrderCompleteAPI.as_view(), name='pos_order_complete'),
     path('pos/order/<int:pk>/uncomplete/', KitchenOrderUncompleteAPI.as_view(), name='pos_order_uncomplete'),
 
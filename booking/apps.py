@@ -7,5 +7,9 @@ class BookingConfig(AppConfig):
     default_auto_field = 'django.db.models.AutoField'
     name = 'booking'
     verbose_name = _('登録情報メニュー')
-    
+
+    def ready(self):
+        from booking.signals import connect_signals
+        connect_signals()
+
 
@@ -1,6 +1,22 @@
-"""Custom encrypted model fields using Fernet symmetric encryption."""
+"""Custom encrypted model fields using Fernet symmetric encryption.
+
+Key material is handled by ``CryptoProvider``:
+
+- PBKDF2 derivation runs once per process per secret (``_derive_key`` is cached),
+  not on every field read/write.
+- Ciphertext is stored as ``<key_id>:<fernet token>``. The key id is a short
+  fingerprint of the derived key, so decryption picks the right key directly
+  instead of trying each candidate in turn.
+- Keys are derived from ``SECRET_KEY`` (current, used for encryption) and
+  ``SECRET_KEY_FALLBACKS`` (decrypt only), mirroring Django's own rotation
+  scheme. ``rotate_encrypted_fields`` re-encrypts rows still on an old key.
+- Values written before key ids were introduced (no prefix) are still read via
+  the current PBKDF2 key, then the legacy truncated-SECRET_KEY key.
+"""
 import base64
 import hashlib
+import threading
+from functools import lru_cache
 
 from cryptography.fernet import Fernet, InvalidToken
 from django.conf import settings
@@ -10,68 +26,164 @@ from django.utils.translation import gettext_lazy as _
 # Static salt for PBKDF2 key derivation — changing this invalidates all
 # encrypted data, so treat it as immutable once deployed.
 _KDF_SALT = b'NewFUHI-EncryptedCharField-v1'
+_KDF_ITERATIONS = 480_000
 
+KEY_ID_LENGTH = 8
+_KEY_ID_SEPARATOR = ':'
 
-def _get_fernet():
-    """Return a Fernet instance with a key derived via PBKDF2 from SECRET_KEY.
+
+@lru_cache(maxsize=8)
+def _derive_key(secret):
+    """Derive a base64 Fernet key from ``secret`` via PBKDF2 (cached per secret).
 
     Uses PBKDF2-HMAC-SHA256 with 480_000 iterations (OWASP 2024 recommendation)
-    and a static application-level salt. The resulting 32-byte key is base64-
-    encoded for Fernet.
+    and a static application-level salt.
     """
-    key_material = settings.SECRET_KEY.encode('utf-8')
     derived = hashlib.pbkdf2_hmac(
-        'sha256', key_material, _KDF_SALT, iterations=480_000, dklen=32,
+        'sha256', secret.encode('utf-8'), _KDF_SALT,
+        iterations=_KDF_ITERATIONS, dklen=32,
     )
-    fernet_key = base64.urlsafe_b64encode(derived)
-    return Fernet(fernet_key)
+    return base64.urlsafe_b64encode(derived)
+
+
+def _key_id(fernet_key):
+    return hashlib.sha256(fernet_key).hexdigest()[:KEY_ID_LENGTH]
+
+
+def _legacy_key(secret):
+    """Legacy (weak) key: SECRET_KEY truncated/padded to 32 bytes."""
+    return base64.urlsafe_b64encode(secret.encode('utf-8')[:32].ljust(32, b'\0'))
+
+
+class CryptoProvider:
+    """Key ring for one set of secrets: current key plus decrypt-only fallbacks."""
+
+    def __init__(self, secret, fallbacks=()):
+        current_key = _derive_key(secret)
+        self.current_key_id = _key_id(current_key)
+        self._current = Fernet(current_key)
+        self._fernets = {self.current_key_id: self._current}
+        for old_secret in fallbacks:
+            old_key = _derive_key(old_secret)
+            self._fernets.setdefault(_key_id(old_key), Fernet(old_key))
+        # Unprefixed (pre key-id) values: PBKDF2 keys first, then the legacy key
+        self._unprefixed = list(self._fernets.values()) + [
+            Fernet(_legacy_key(s)) for s in (secret, *fallbacks)
+        ]
+
+    # -- encrypt -----------------------------------------------------------
+
+    def encrypt(self, plaintext):
+        token = self._current.encrypt(plaintext.encode('utf-8')).decode('utf-8')
+        return f'{self.current_key_id}{_KEY_ID_SEPARATOR}{token}'
+
+    # -- decrypt -----------------------------------------------------------
 
+    @staticmethod
+    def split(value):
+        """Return ``(key_id, token)``; key_id is None for unprefixed values."""
+        prefix, sep, token = value.partition(_KEY_ID_SEPARATOR)
+        if sep and len(prefix) == KEY_ID_LENGTH:
+            return prefix, token
+        return None, value
 
-def _get_fernet_legacy():
-    """Legacy Fernet using the old (weak) key derivation.
+    def needs_rotation(self, value):
+        """True if ``value`` is not encrypted with the current key."""
+        if not value:
+            return False
+        key_id, _ = self.split(value)
+        return key_id != self.current_key_id
+
+    def decrypt(self, value):
+        """Decrypt one stored value. Returns it unchanged if it cannot be decrypted."""
+        if not value:
+            return value
+        key_id, token = self.split(value)
+        if key_id is not None:
+            fernet = self._fernets.get(key_id)
+            if fernet is None:
+                return value
+            try:
+                return fernet.decrypt(token.encode('utf-8')).decode('utf-8')
+            except InvalidToken:
+                return value
+        for fernet in self._unprefixed:
+            try:
+                return fernet.decrypt(token.encode('utf-8')).decode('utf-8')
+            except InvalidToken:
+                continue
+        # Unencrypted or corrupt: return raw value
+        return value
+
+    def decrypt_many(self, values):
+        """Decrypt a sequence of stored values, decrypting each distinct value once."""
+        cache = {}
+        result = []
+        for value in values:
+            if value not in cache:
+                cache[value] = self.decrypt(value)
+            result.append(cache[value])
+        return result
+
+
+_provider_lock = threading.Lock()
+_providers = {}
 
-    Kept only for reading data encrypted before the PBKDF2 migration.
+
+def get_crypto_provider():
+    """Return the process-wide CryptoProvider for the current SECRET_KEY set."""
+    secrets = (settings.SECRET_KEY, tuple(getattr(settings, 'SECRET_KEY_FALLBACKS', ())))
+    provider = _providers.get(secrets)
+    if provider is None:
+        with _provider_lock:
+            provider = _providers.get(secrets)
+            if provider is None:
+                provider = CryptoProvider(secrets[0], secrets[1])
+                _providers.clear()
+                _providers[secrets] = provider
+    return provider
+
+
+def decrypt_values(queryset, *field_names):
+    """Fetch ``field_names`` from ``queryset`` as ``{pk: {field: plaintext}}``.
+
+    Reads raw ciphertext in one query and decrypts it in a single batch, without
+    instantiating model objects (for list/export views).
     """
-    key_bytes = settings.SECRET_KEY.encode('utf-8')[:32].ljust(32, b'\0')
-    fernet_key = base64.urlsafe_b64encode(key_bytes)
-    return Fernet(fernet_key)
+    from django.db.models.functions import Cast
+
+    raw = {f'_raw_{name}': Cast(name, models.TextField()) for name in field_names}
+    rows = list(queryset.annotate(**raw).values_list('pk', *raw))
+    provider = get_crypto_provider()
+    columns = [provider.decrypt_many([row[i + 1] for row in rows]) for i in range(len(field_names))]
+    return {
+        row[0]: {name: columns[i][n] for i, name in enumerate(field_names)}
+        for n, row in enumerate(rows)
+    }
 
 
 class EncryptedCharField(models.CharField):
     """CharField that transparently encrypts/decrypts values in the DB.
 
-    Values are stored as Fernet-encrypted base64 strings.
+    Values are stored as ``<key_id>:<Fernet token>``.
     Reading returns plaintext. Blank/empty values pass through unencrypted.
 
-    Encryption always uses the new PBKDF2-derived key. Decryption tries the
-    new key first, then falls back to the legacy key for backward compatibility.
-    Data re-encrypted with the new key on next save.
+    Encryption always uses the current key. Decryption selects the key by key id;
+    unprefixed (older) values fall back to the PBKDF2 and legacy keys and are
+    re-encrypted with the current key on next save.
     """
 
     description = _('Encrypted text')
 
     def get_prep_value(self, value):
-        """Encrypt before saving to DB (always uses new PBKDF2 key)."""
+        """Encrypt before saving to DB (always uses the current key)."""
         value = super().get_prep_value(value)
         if not value:
             return value
-        fernet = _get_fernet()
-        return fernet.encrypt(value.encode('utf-8')).decode('utf-8')
+        return get_crypto_provider().encrypt(value)
 
     def from_db_value(self, value, expression, connection):
-        """Decrypt when reading from DB. Tries new key, then legacy key."""
+        """Decrypt when reading from DB."""
         if not value:
             return value
-        # Try new PBKDF2-derived key first
-        try:
-            return _get_fernet().decrypt(value.encode('utf-8')).decode('utf-8')
-        except InvalidToken:
-            pass
-        # Fall back to legacy key (pre-migration data)
-        try:
-            return _get_fernet_legacy().decrypt(
-                value.encode('utf-8'),
-            ).decode('utf-8')
-        except InvalidToken:
-            # If both fail, return raw value (unencrypted or corrupt)
-            return value
+        return get_crypto_provider().decrypt(value)
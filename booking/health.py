@@ -4,6 +4,7 @@ Health check views for deployment monitoring.
 Provides /healthz endpoint for AWS production deployment tracking.
 - Basic: GET /healthz → {"status": "ok"}
 - Detailed: GET /healthz?detail=1 → DB, Celery, Redis checks (staff only)
+  plus the cached security audit summary (checks are not re-run here)
 """
 import logging
 
@@ -67,6 +68,19 @@ def _check_redis() -> str:
         return "unavailable"
 
 
+def _security_summary() -> dict:
+    """Summarize the latest stored security audit results without running any check."""
+    try:
+        from booking.services.security_audit import report_summary
+        summary = report_summary()
+        last_run = summary["last_run"]
+        summary["last_run"] = last_run.isoformat() if last_run else None
+        return summary
+    except Exception as exc:
+        logger.warning("Health check: security summary failed: %s", exc)
+        return {"error": "unavailable"}
+
+
 @require_http_methods(["GET"])
 def healthz(request):
     """
@@ -111,6 +125,7 @@ def healthz(request):
         {
             "status": overall,
             "checks": checks,
+            "security": _security_summary(),
             "timestamp": timezone.now().isoformat(),
         },
         status=http_status,
@@ -0,0 +1,115 @@
+"""
+EncryptedCharField 復号コストのベンチマーク
+
+一時データ（トランザクションをロールバック）で SocialAccount を N 件作成し、
+以下を「旧方式（値ごとに PBKDF2 で鍵導出）」と「CryptoProvider（プロセス内キャッシュ）」で比較する。
+
+- 一覧クエリの評価（N 件 × access_token / refresh_token）
+- 管理画面 SocialAccount 一覧（changelist）のレンダリング
+
+Usage:
+    python manage.py benchmark_encrypted_fields [--rows 100] [--skip-legacy]
+"""
+import time
+from contextlib import contextmanager
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test import RequestFactory
+
+from booking import fields
+from booking.models import SocialAccount, Store
+
+
+class _Rollback(Exception):
+    pass
+
+
+@contextmanager
+def _uncached_provider():
+    """旧方式の再現: 値を読むたびに鍵導出からやり直す"""
+    def fresh_provider():
+        fields._derive_key.cache_clear()
+        return fields.CryptoProvider(
+            fields.settings.SECRET_KEY,
+            tuple(getattr(fields.settings, 'SECRET_KEY_FALLBACKS', ())),
+        )
+
+    with mock.patch.object(fields, 'get_crypto_provider', fresh_provider):
+        yield
+
+
+class Command(BaseCommand):
+    help = 'EncryptedCharField の復号コスト（旧方式 vs CryptoProvider）を計測します'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=100, help='作成する行数（デフォルト: 100）')
+        parser.add_argument(
+            '--skip-legacy', action='store_true',
+            help='旧方式の計測を省略する（1値あたり約0.25秒かかるため）',
+        )
+
+    def handle(self, *args, **options):
+        rows = options['rows']
+        results = {}
+        try:
+            with transaction.atomic():
+                self._seed(rows)
+                if not options['skip_legacy']:
+                    with _uncached_provider():
+                        results['legacy'] = self._measure(rows)
+                fields.get_crypto_provider()  # 鍵導出を計測から除外（プロセス起動時に1回）
+                results['provider'] = self._measure(rows)
+                raise _Rollback
+        except _Rollback:
+            pass
+
+        self.stdout.write(f'rows={rows} (encrypted values={rows * 2})')
+        for label, (list_seconds, admin_seconds) in results.items():
+            self.stdout.write(
+                f'{label:>9}: queryset {list_seconds * 1000:9.1f} ms   '
+                f'admin changelist {admin_seconds * 1000:9.1f} ms'
+            )
+        if 'legacy' in results:
+            speedup = results['legacy'][0] / max(results['provider'][0], 1e-9)
+            self.stdout.write(self.style.SUCCESS(f'queryset speedup: x{speedup:,.0f}'))
+
+    def _seed(self, rows):
+        store = Store.objects.create(
+            name='benchmark', address='-', business_hours='-', nearest_station='-',
+        )
+        # unique_together(store, platform) のため行ごとに店舗を分ける
+        stores = [store] + [
+            Store(name=f'benchmark-{i}', address='-', business_hours='-', nearest_station='-')
+            for i in range(1, rows)
+        ]
+        Store.objects.bulk_create(stores[1:])
+        stores = list(Store.objects.filter(name__startswith='benchmark').order_by('pk')[:rows])
+        SocialAccount.objects.bulk_create([
+            SocialAccount(
+                store=s, platform='x', account_name=f'bench{i}',
+                access_token=f'access-token-{i}', refresh_token=f'refresh-token-{i}',
+            )
+            for i, s in enumerate(stores)
+        ])
+        self._user = get_user_model().objects.create_superuser(
+            username='__benchmark_admin__', password=None, email='',
+        )
+
+    def _measure(self, rows):
+        started = time.perf_counter()
+        accounts = list(SocialAccount.objects.filter(store__name__startswith='benchmark'))
+        list_seconds = time.perf_counter() - started
+        assert len(accounts) == rows
+
+        from booking.admin_site import custom_site
+        model_admin = custom_site._registry[SocialAccount]
+        request = RequestFactory().get('/admin/booking/socialaccount/')
+        request.user = self._user
+        with mock.patch.object(model_admin, 'list_per_page', rows):
+            started = time.perf_counter()
+            model_admin.changelist_view(request).render()
+            admin_seconds = time.perf_counter() - started
+        return list_seconds, admin_seconds
@@ -0,0 +1,101 @@
+"""
+重いエンドポイントのクエリ予算・性能回帰チェック
+
+一時データ（トランザクションをロールバック）で 1/10/100 店舗規模のデータを作成し、
+空き状況・ダッシュボード・メニュー JSON・POS 決済・IoT 受信・シフト自動作成・給与計算を
+実行してクエリ数と所要時間を計測する（booking.services.query_budget）。
+
+- クエリ数がシナリオごとの予算を超える / 店舗数に比例して増える → 失敗
+- ベースライン JSON よりクエリ数が増える / 所要時間が --threshold 以上悪化 → 失敗
+
+SQLite でのみ実行できる（ローカル・CI で同じ条件で比較するため）。
+
+Usage:
+    python manage.py benchmark_query_budgets [--scales 1 10 100] [--repeat 5] [--threshold 0.5]
+    python manage.py benchmark_query_budgets --update-baseline
+    python manage.py benchmark_query_budgets --no-timing
+"""
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from booking.services import query_budget
+
+
+class _Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = 'シードデータで重いエンドポイントのクエリ予算と性能回帰を検査します（SQLite）'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--scales', type=int, nargs='+', default=list(query_budget.DEFAULT_SCALES),
+            help='店舗数（デフォルト: 1 10 100）',
+        )
+        parser.add_argument(
+            '--repeat', type=int, default=query_budget.DEFAULT_REPEAT,
+            help='シナリオごとの実行回数。所要時間は最小値を採る（デフォルト: 5）',
+        )
+        parser.add_argument(
+            '--baseline', default=str(query_budget.BASELINE_PATH), help='ベースライン JSON のパス',
+        )
+        parser.add_argument('--update-baseline', action='store_true', help='計測結果でベースラインを書き換える')
+        parser.add_argument(
+            '--threshold', type=float, default=query_budget.DEFAULT_THRESHOLD,
+            help='所要時間の許容悪化率（デフォルト: 0.5 = 50%%）',
+        )
+        parser.add_argument('--no-timing', action='store_true', help='所要時間を比較しない（クエリ数のみ）')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError('SQLite でのみ実行できます（DB_ENGINE を確認してください）')
+
+        scales = sorted(set(options['scales']))
+        results = {scale: self._measure(scale, options['repeat']) for scale in scales}
+
+        budgets = {scenario.name: scenario.budget for scenario in query_budget.SCENARIOS}
+        for name in budgets:
+            cells = '  '.join(
+                f'{scale:>3}: {rows[name]["queries"]:>3}q {rows[name]["ms"]:8.1f}ms'
+                for scale, rows in results.items()
+            )
+            self.stdout.write(f'{name:<28} budget={budgets[name]:<3} {cells}')
+
+        violations = query_budget.check(results)
+
+        if options['update_baseline']:
+            if violations:
+                raise CommandError('予算違反があるためベースラインを更新しません:\n' + '\n'.join(violations))
+            query_budget.save_baseline(results, options['baseline'])
+            self.stdout.write(self.style.SUCCESS(f'ベースラインを更新しました: {options["baseline"]}'))
+            return
+
+        baseline = query_budget.load_baseline(options['baseline'])
+        if not baseline:
+            self.stdout.write(self.style.WARNING('ベースラインがありません（--update-baseline で作成）'))
+        compare_options = {'threshold': options['threshold'], 'timing': not options['no_timing']}
+        regressions = query_budget.compare(results, baseline, **compare_options)
+        if regressions and not options['no_timing']:
+            # 一時的な負荷による誤検出を避けるため、もう一度計測して速い方で判定する
+            self.stdout.write('悪化を検出したため再計測します...')
+            for scale in scales:
+                for name, row in self._measure(scale, options['repeat']).items():
+                    results[scale][name]['ms'] = min(results[scale][name]['ms'], row['ms'])
+            regressions = query_budget.compare(results, baseline, **compare_options)
+        violations += regressions
+        if violations:
+            raise CommandError('性能回帰を検出しました:\n' + '\n'.join(violations))
+        self.stdout.write(self.style.SUCCESS('すべてのシナリオが予算内です'))
+
+    def _measure(self, scale, repeat):
+        try:
+            with transaction.atomic():
+                data = query_budget.seed(scale)
+                results = query_budget.measure(data, repeat=repeat)
+                raise _Rollback
+        except _Rollback:
+            pass
+        except query_budget.QueryBudgetError as e:
+            raise CommandError(str(e))
+        return results
@@ -0,0 +1,105 @@
+"""
+売上分析テキスト（SalesAnalysisEngine）のベンチマーク
+
+一時データ（トランザクションをロールバック）で1年分の注文を持つ店舗を作成し、
+6種類の分析テキストをすべて生成する時間とクエリ数を計測する。
+
+- cold: フレーム未キャッシュ（集計クエリ + NumPy 集計 + 全テキスト生成）
+- warm: キャッシュ済みフレームから全テキスト生成
+
+Usage:
+    python manage.py benchmark_sales_analysis [--days 365] [--orders-per-day 60] [--items-per-order 3]
+"""
+import random
+import time
+from datetime import timedelta
+
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from booking.models import Order, OrderItem, Product, Store
+from booking.services.sales_analysis_frame import frame_cache_key
+from booking.services.sales_analysis_text import SalesAnalysisEngine
+
+ANALYSIS_TYPES = ('sales_trend', 'menu_engineering', 'abc_analysis', 'forecast', 'heatmap', 'aov')
+
+
+class _Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = '1年分の注文で6種類の売上分析テキスト生成時間を計測します'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=365, help='注文を作成する日数（デフォルト: 365）')
+        parser.add_argument('--orders-per-day', type=int, default=60, help='1日あたりの注文数（デフォルト: 60）')
+        parser.add_argument('--items-per-order', type=int, default=3, help='1注文あたりの明細数（デフォルト: 3）')
+        parser.add_argument('--products', type=int, default=40, help='商品数（デフォルト: 40）')
+
+    def handle(self, *args, **options):
+        results = {}
+        try:
+            with transaction.atomic():
+                store, item_count = self._seed(options)
+                scope = {'order__store': store}
+                cache.delete(frame_cache_key(scope, {}, 90))
+                results['cold'] = self._measure(scope)
+                results['warm'] = self._measure(scope)
+                cache.delete(frame_cache_key(scope, {}, 90))
+                raise _Rollback
+        except _Rollback:
+            pass
+
+        self.stdout.write(f'order items={item_count} ({options["days"]} days)')
+        for label, (seconds, queries, per_type) in results.items():
+            breakdown = '  '.join(f'{t}={ms:.1f}' for t, ms in per_type.items())
+            self.stdout.write(f'{label:>5}: {seconds * 1000:8.1f} ms  queries={queries:<3} [{breakdown}] ms')
+
+    def _seed(self, options):
+        rng = random.Random(0)
+        store = Store.objects.create(
+            name='benchmark', address='-', business_hours='-', nearest_station='-',
+        )
+        products = Product.objects.bulk_create([
+            Product(
+                store=store, name=f'bench-{i}', sku=f'BENCH-{i:04d}',
+                price=300 + i * 50, margin_rate=rng.uniform(0.1, 0.7),
+            )
+            for i in range(options['products'])
+        ])
+
+        now = timezone.now()
+        orders, stamps = [], []
+        for day in range(options['days']):
+            for _ in range(options['orders_per_day']):
+                orders.append(Order(store=store, channel=rng.choice(('pos', 'table', 'ec'))))
+                stamps.append(now - timedelta(days=day, hours=rng.randint(0, 12), minutes=rng.randint(0, 59)))
+        Order.objects.bulk_create(orders, batch_size=2000)
+        # created_at は auto_now_add のため作成後に書き換える
+        for order, stamp in zip(orders, stamps):
+            order.created_at = stamp
+        Order.objects.bulk_update(orders, ['created_at'], batch_size=2000)
+
+        items = [
+            OrderItem(order=order, product=product, qty=rng.randint(1, 3), unit_price=product.price)
+            for order in orders
+            for product in rng.sample(products, options['items_per_order'])
+        ]
+        OrderItem.objects.bulk_create(items, batch_size=5000)
+        return store, len(items)
+
+    def _measure(self, scope):
+        engine = SalesAnalysisEngine()
+        per_type = {}
+        with CaptureQueriesContext(connection) as ctx:
+            started = time.perf_counter()
+            for analysis_type in ANALYSIS_TYPES:
+                t0 = time.perf_counter()
+                engine.analyze(analysis_type, scope, {})
+                per_type[analysis_type] = (time.perf_counter() - t0) * 1000
+            seconds = time.perf_counter() - started
+        return seconds, len(ctx.captured_queries), per_type
@@ -21,6 +21,14 @@ class Command(BaseCommand):
                 f'バックアップ完了: {history.backup_file}\n'
                 f'サイズ: {size_kb:.1f} KB / 所要時間: {history.duration_seconds:.1f}秒'
             ))
+            stats = history.stats
+            if stats.get('chunks'):
+                self.stdout.write(
+                    f'新規チャンク: {stats["new_chunks"]}/{stats["chunks"]} / '
+                    f'保存: {stats["stored_bytes"] / 1024:.1f} KB'
+                )
+            for stage, entry in stats.get('stages', {}).items():
+                self.stdout.write(f'  {stage}: {entry["bytes"] / 1024:.1f} KB, {entry["seconds"]:.2f}秒')
             if history.s3_uploaded:
                 self.stdout.write(f'S3: {history.s3_key}')
         else:
@@ -0,0 +1,93 @@
+"""
+MQTT から IoT イベントを取り込むワーカー
+
+デバイスが devices/<DEVICE_ID>/sensors に publish したセンサー値を購読し、
+マイクロバッチで IoTEvent に保存する（HTTP の /api/iot/events/ を経由しない）。
+メッセージは端末ごとの HMAC 署名で認証する（booking.services.iot_mqtt_ingest）。
+ブローカーへは TLS と認証情報（ユーザー名/パスワードまたはクライアント証明書）で接続し、
+どちらかが無い場合は --insecure を付けない限り起動しない。paho-mqtt が必要。
+
+Usage:
+    python manage.py ingest_iot_mqtt [--host localhost] [--port 1883] [--topic devices/+/sensors]
+        [--username USER] [--password PASS] [--tls] [--ca-certs CA] [--cert CERT --key KEY]
+        [--insecure] [--batch-size 200] [--flush-interval 2]
+"""
+import os
+import socket
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from booking.services.iot_mqtt_ingest import (
+    DEFAULT_BATCH_SIZE, DEFAULT_FLUSH_INTERVAL, DEFAULT_TOPIC, IoTIngestBridge, run_bridge,
+)
+
+
+def _setting(name, default):
+    return getattr(settings, name, None) or os.getenv(name) or default
+
+
+class Command(BaseCommand):
+    help = 'MQTT ブローカーを購読して IoT イベントをバッチ保存します'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default=_setting('IOT_MQTT_HOST', 'localhost'), help='ブローカーのホスト')
+        parser.add_argument('--port', type=int, default=int(_setting('IOT_MQTT_PORT', 1883)), help='ブローカーのポート')
+        parser.add_argument('--topic', default=DEFAULT_TOPIC, help=f'購読トピック（デフォルト: {DEFAULT_TOPIC}）')
+        parser.add_argument('--qos', type=int, choices=(0, 1), default=1, help='購読 QoS（デフォルト: 1）')
+        parser.add_argument('--username', default=_setting('IOT_MQTT_USERNAME', ''), help='ブローカーのユーザー名')
+        parser.add_argument('--password', default=_setting('IOT_MQTT_PASSWORD', ''), help='ブローカーのパスワード')
+        parser.add_argument('--tls', action='store_true', help='TLS で接続する')
+        parser.add_argument('--ca-certs', default=_setting('IOT_MQTT_CA_CERTS', None), help='CA 証明書のパス')
+        parser.add_argument('--cert', default=_setting('IOT_MQTT_CERT', None), help='クライアント証明書のパス')
+        parser.add_argument('--key', default=_setting('IOT_MQTT_KEY', None), help='クライアント秘密鍵のパス')
+        parser.add_argument('--insecure', action='store_true',
+                            help='TLS・認証情報なしの接続を許可する（ローカル検証用）')
+        parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE,
+                            help=f'1回に保存する最大件数（デフォルト: {DEFAULT_BATCH_SIZE}）')
+        parser.add_argument('--flush-interval', type=float, default=DEFAULT_FLUSH_INTERVAL,
+                            help=f'保存までの最大待ち秒数（デフォルト: {DEFAULT_FLUSH_INTERVAL}）')
+
+    def _client(self, options):
+        try:
+            import paho.mqtt.client as mqtt
+        except ImportError:
+            raise CommandError('paho-mqtt がインストールされていません（pip install paho-mqtt）')
+
+        client_id = f'django-ingest-{socket.gethostname()}-{os.getpid()}'
+        if hasattr(mqtt, 'CallbackAPIVersion'):  # paho-mqtt >= 2.0
+            client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2, client_id=client_id)
+        else:
+            client = mqtt.Client(client_id=client_id)
+        if options['username']:
+            client.username_pw_set(options['username'], options['password'] or None)
+        if options['tls']:
+            client.tls_set(ca_certs=options['ca_certs'], certfile=options['cert'], keyfile=options['key'])
+        client.reconnect_delay_set(min_delay=1, max_delay=60)
+        try:
+            client.connect(options['host'], options['port'], keepalive=60)
+        except OSError as e:
+            raise CommandError(f'MQTT ブローカーに接続できません: {e}')
+        return client
+
+    def _check_secure(self, options):
+        has_credentials = bool(options['username'] or (options['cert'] and options['key']))
+        if options['insecure'] or (options['tls'] and has_credentials):
+            return
+        raise CommandError(
+            'TLS（--tls）と認証情報（--username/--password または --cert/--key）が必要です。'
+            'ローカル検証で省略する場合は --insecure を付けてください'
+        )
+
+    def handle(self, *args, **options):
+        self._check_secure(options)
+        client = self._client(options)
+        bridge = IoTIngestBridge(batch_size=options['batch_size'], flush_interval=options['flush_interval'])
+        self.stdout.write(f"{options['host']}:{options['port']} の {options['topic']} を購読します（Ctrl+C で終了）")
+        try:
+            stats = run_bridge(client, bridge, topic=options['topic'], qos=options['qos'])
+        finally:
+            client.disconnect()
+        self.stdout.write(self.style.SUCCESS(
+            f"受信 {stats['received']}件 / 保存 {stats['stored']}件 / 破棄 {stats['rejected']}件"
+        ))
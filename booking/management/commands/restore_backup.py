@@ -0,0 +1,63 @@
+"""バックアップスナップショットの復元コマンド。
+
+チャンクと全体の SHA-256、SQLite の integrity_check で検証してから出力先に書き出す。
+稼働中の DB は上書きしない（--output に復元し、入れ替えは手動で行う）。
+
+Usage:
+    python manage.py restore_backup --list
+    python manage.py restore_backup latest --output /tmp/restore.sqlite3
+    python manage.py restore_backup newfuhi_backup_20261019_030000.sqlite3 --output /tmp/restore.sqlite3
+    python manage.py restore_backup latest --output /tmp/restore.sqlite3 --source s3
+"""
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = 'バックアップスナップショットを検証付きで復元'
+
+    def add_arguments(self, parser):
+        parser.add_argument('snapshot', nargs='?', default='latest',
+                            help='スナップショット名（既定: latest）')
+        parser.add_argument('--output', help='復元先のファイルパス')
+        parser.add_argument('--source', choices=['local', 's3'], default='local',
+                            help='復元元リポジトリ（既定: local）')
+        parser.add_argument('--bucket', help='S3バケット名（既定: バックアップ設定）')
+        parser.add_argument('--list', action='store_true', help='スナップショット一覧を表示')
+        parser.add_argument('--force', action='store_true', help='既存の出力先を上書き')
+
+    def handle(self, *args, **options):
+        from booking.services import backup_service
+        from booking.services.backup_repo import BackupVerifyError
+
+        if options['list']:
+            if options['source'] == 's3':
+                from booking.models import BackupConfig
+                repo = backup_service.s3_repository(options['bucket'] or BackupConfig.load().s3_bucket)
+            else:
+                repo = backup_service.local_repository()
+            for name in repo.list_snapshots():
+                self.stdout.write(name)
+            return
+
+        output = options['output']
+        if not output:
+            raise CommandError('--output を指定してください')
+        if os.path.exists(output) and not options['force']:
+            raise CommandError(f'{output} は既に存在します（上書きする場合は --force）')
+
+        self.stdout.write(f'{options["snapshot"]} を復元中...')
+        try:
+            manifest = backup_service.restore_backup(
+                options['snapshot'], output, source=options['source'], bucket=options['bucket'],
+            )
+        except FileNotFoundError as e:
+            raise CommandError(f'スナップショットが見つかりません: {e}')
+        except BackupVerifyError as e:
+            raise CommandError(f'検証に失敗しました: {e}')
+
+        self.stdout.write(self.style.SUCCESS(
+            f'復元完了: {manifest["name"]} → {output}\n'
+            f'サイズ: {manifest["size"] / 1024:.1f} KB / SHA-256: {manifest["sha256"]}'
+        ))
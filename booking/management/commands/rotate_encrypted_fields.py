@@ -0,0 +1,72 @@
+"""
+EncryptedCharField の鍵ローテーション
+
+SECRET_KEY を変更した後（旧キーは SECRET_KEY_FALLBACKS に残す）に実行し、
+旧キー・キーID無しで保存されている値を現行キーで再暗号化する。
+
+Usage:
+    python manage.py rotate_encrypted_fields [--dry-run] [--batch-size 500]
+"""
+from django.apps import apps
+from django.core.management.base import BaseCommand
+from django.db import models, transaction
+from django.db.models.functions import Cast
+
+from booking.fields import EncryptedCharField, get_crypto_provider
+
+
+class Command(BaseCommand):
+    help = '旧キーで暗号化された EncryptedCharField の値を現行キーで再暗号化します'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='実行せずに件数だけ表示')
+        parser.add_argument('--batch-size', type=int, default=500, help='bulk_update の単位')
+
+    def handle(self, *args, **options):
+        provider = get_crypto_provider()
+        total = 0
+        for model in apps.get_models():
+            encrypted = [
+                f.name for f in model._meta.concrete_fields if isinstance(f, EncryptedCharField)
+            ]
+            if not encrypted:
+                continue
+            count = self._rotate_model(model, encrypted, provider, options)
+            total += count
+            if count:
+                self.stdout.write(f'{model._meta.label}: {count}件')
+
+        verb = '対象' if options['dry_run'] else '再暗号化'
+        self.stdout.write(self.style.SUCCESS(f'{total}件を{verb}しました'))
+
+    def _rotate_model(self, model, field_names, provider, options):
+        raw = {f'_raw_{name}': Cast(name, models.TextField()) for name in field_names}
+        pending = []
+        undecryptable = 0
+        for row in model._base_manager.annotate(**raw).values_list('pk', *raw).iterator():
+            pk, values = row[0], row[1:]
+            if not any(provider.needs_rotation(v) for v in values):
+                continue
+            plaintexts = provider.decrypt_many(values)
+            if any(
+                p == v and provider.split(v)[0] is not None
+                for p, v in zip(plaintexts, values) if v
+            ):
+                undecryptable += 1  # 未知のキーID（フォールバック未設定）
+                continue
+            # 行内の暗号化フィールドはまとめて書き戻す（bulk_update は全フィールドを上書き）
+            pending.append(model(pk=pk, **dict(zip(field_names, plaintexts))))
+
+        if undecryptable:
+            self.stderr.write(
+                f'{model._meta.label}: {undecryptable}件は復号できないためスキップしました'
+            )
+        if options['dry_run'] or not pending:
+            return len(pending)
+
+        # bulk_update は get_prep_value を通るため現行キーで暗号化される
+        with transaction.atomic():
+            for start in range(0, len(pending), options['batch_size']):
+                batch = pending[start:start + options['batch_size']]
+                model._base_manager.bulk_update(batch, field_names)
+        return len(pending)
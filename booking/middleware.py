@@ -1,6 +1,8 @@
-"""セキュリティ監視ミドルウェア + 言語固定ミドルウェア + メンテナンスミドルウェア + AI保護"""
+"""セキュリティ監視ミドルウェア + 言語固定ミドルウェア + メンテナンスミドルウェア + AI保護 + 公開ページキャッシュ + クエリ計測"""
 import re
 import logging
+import time
+from contextlib import ExitStack
 
 from django.conf import settings
 from django.core.cache import cache
@@ -414,3 +416,132 @@ class SecurityAuditMiddleware:
                     logger.warning("SecurityAuditMiddleware: notification failed: %s", e)
         except Exception as e:
             logger.error('SecurityLog記録失敗: %s', e)
+
+
+# ---------------------------------------------------------------------------
+# Public Page Cache
+# ---------------------------------------------------------------------------
+
+class PublicPageCacheMiddleware:
+    """匿名ユーザー向け公開ページのフルページキャッシュ。
+
+    MIDDLEWARE の末尾（BotFilter / Maintenance / SecurityAudit より内側）に配置する。
+    ヒット時もボット遮断・メンテナンス・レート制限・CSP/セッション/CSRF 等の外側の
+    ミドルウェアは通常どおり適用され、ビューだけを省略する。
+    キャッシュ対象はサロゲートキーを宣言したビューのレスポンスのみ
+    （booking.services.page_cache 参照）。キーは (パス+許可したクエリ, 言語)。
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        from booking.services import page_cache
+
+        if not page_cache.is_enabled() or not self._is_cacheable_request(request):
+            return self.get_response(request)
+
+        path = page_cache.cache_path(request)
+        lang = getattr(request, 'LANGUAGE_CODE', None) or translation.get_language()
+        entry = page_cache.get_entry(path, lang)
+        if entry is not None:
+            return self._serve_hit(request, entry)
+
+        response = self.get_response(request)
+        if self._is_cacheable_response(request, response):
+            tags = page_cache.store_response(
+                path, lang, response, nonce=getattr(request, '_csp_nonce', None),
+            )
+            response['X-Page-Cache'] = 'MISS'
+            if page_cache.edge_headers_enabled():
+                page_cache.apply_edge_headers(response, tags)
+        return response
+
+    @staticmethod
+    def _is_cacheable_request(request):
+        from booking.services import page_cache
+
+        if request.method not in ('GET', 'HEAD'):
+            return False
+        if page_cache.is_excluded_path(request.path_info):
+            return False
+        # ログイン中（の可能性がある）ユーザーやフラッシュメッセージ保持者は対象外
+        if settings.SESSION_COOKIE_NAME in request.COOKIES or 'messages' in request.COOKIES:
+            return False
+        return True
+
+    @staticmethod
+    def _is_cacheable_response(request, response):
+        if response.status_code != 200 or response.streaming:
+            return False
+        if not getattr(response, '_surrogate_keys', None):
+            return False
+        user = getattr(request, 'user', None)
+        if user is not None and user.is_authenticated:
+            return False
+        # セッション・メッセージの Cookie は外側のミドルウェアが後で発行するため、ここで判定する
+        session = getattr(request, 'session', None)
+        if session is not None and session.modified:
+            return False
+        if getattr(getattr(request, '_messages', None), 'added_new', False):
+            return False
+        # CSRF 以外の Cookie を発行するレスポンスは共有不可
+        if any(name != settings.CSRF_COOKIE_NAME for name in response.cookies):
+            return False
+        cache_control = response.get('Cache-Control', '')
+        if 'private' in cache_control or 'no-store' in cache_control:
+            return False
+        return True
+
+    @staticmethod
+    def _serve_hit(request, entry):
+        from django.middleware.csrf import get_token
+        from booking.services import page_cache
+
+        # nonce は CSPMiddleware の request.csp_nonce を使い、ヘッダーと本文を一致させる
+        nonce_factory = (lambda: str(request.csp_nonce)) if hasattr(request, 'csp_nonce') else None
+        content, headers = page_cache.render_entry(entry, lambda: get_token(request), nonce_factory)
+        response = HttpResponse(content, status=entry['status'])
+        for key, value in headers.items():
+            response[key] = value
+        response['X-Page-Cache'] = 'HIT'
+        if page_cache.edge_headers_enabled():
+            page_cache.apply_edge_headers(response, entry['tags'])
+        return response
+
+
+# ---------------------------------------------------------------------------
+# Query Profile
+# ---------------------------------------------------------------------------
+
+class QueryProfileMiddleware:
+    """ビュー（URL名）ごとのクエリ数・DB時間・レイテンシをサンプリング計測する。
+
+    QUERY_PROFILE_ENABLED=True のときだけ動作し、サンプリング率で選ばれたリクエストだけ
+    全 DB 接続に execute wrapper を付ける（booking.services.query_profile 参照）。
+    公開ページキャッシュのヒットは URL 解決を通らない（resolver_match が無い）ため記録しない。
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        from booking.services import query_profile
+
+        if not query_profile.is_enabled() or not query_profile.should_sample():
+            return self.get_response(request)
+
+        from django.db import connections
+
+        recorder = query_profile.QueryRecorder()
+        started = time.perf_counter()
+        with ExitStack() as stack:
+            for conn in connections.all():
+                stack.enter_context(conn.execute_wrapper(recorder))
+            response = self.get_response(request)
+        elapsed = time.perf_counter() - started
+
+        match = getattr(request, 'resolver_match', None)
+        if match is not None:
+            query_profile.record(match.view_name or match.route, recorder, elapsed)
+        return response
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-19 04:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('booking', '0130_add_help_tour_auto_start'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='linemessagelog',
+            name='campaign_id',
+            field=models.CharField(blank=True, db_index=True, default='', max_length=64, verbose_name='キャンペーンID'),
+        ),
+    ]
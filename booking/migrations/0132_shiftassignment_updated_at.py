@@ -0,0 +1,20 @@
+# Generated by Django 4.2.30 on 2026-10-19 14:40
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('booking', '0131_linemessagelog_campaign_id'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='shiftassignment',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, db_index=True, default=django.utils.timezone.now, verbose_name='更新日時'),
+            preserve_default=False,
+        ),
+    ]
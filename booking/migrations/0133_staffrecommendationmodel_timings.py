@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-19 15:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('booking', '0132_shiftassignment_updated_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='staffrecommendationmodel',
+            name='timings',
+            field=models.JSONField(blank=True, default=dict, help_text='学習・推論の各フェーズの所要秒数（train / inference）', verbose_name='処理時間'),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 4.2.30 on 2026-10-19 05:47
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('booking', '0133_staffrecommendationmodel_timings'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SalesForecast',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('channel', models.CharField(blank=True, default='', help_text='空欄は全チャネル', max_length=20, verbose_name='注文チャネル')),
+                ('date', models.DateField(verbose_name='日付')),
+                ('predicted', models.IntegerField(verbose_name='予測売上')),
+                ('lower', models.IntegerField(verbose_name='下限')),
+                ('upper', models.IntegerField(verbose_name='上限')),
+                ('method', models.CharField(max_length=20, verbose_name='予測手法')),
+                ('generated_at', models.DateTimeField(verbose_name='生成日時')),
+                ('store', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='sales_forecasts', to='booking.store', verbose_name='店舗')),
+            ],
+            options={
+                'verbose_name': '売上予測',
+                'verbose_name_plural': '売上予測',
+                'ordering': ('store', 'channel', 'date'),
+                'unique_together': {('store', 'channel', 'date')},
+            },
+        ),
+    ]
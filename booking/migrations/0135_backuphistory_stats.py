@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-19 06:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('booking', '0134_salesforecast'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='backuphistory',
+            name='stats',
+            field=models.JSONField(blank=True, default=dict, help_text='段階ごとのスループット（stages）とチャンク数・新規チャンク数・保存バイト数', verbose_name='統計'),
+        ),
+    ]
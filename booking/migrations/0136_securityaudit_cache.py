@@ -0,0 +1,28 @@
+# Generated by Django 4.2.30 on 2026-10-19 06:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('booking', '0135_backuphistory_stats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='securityaudit',
+            name='duration_ms',
+            field=models.PositiveIntegerField(default=0, verbose_name='所要時間(ms)'),
+        ),
+        migrations.AddField(
+            model_name='securityaudit',
+            name='expires_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='有効期限'),
+        ),
+        migrations.AddField(
+            model_name='securityaudit',
+            name='fingerprint',
+            field=models.CharField(blank=True, default='', help_text='チェック入力のハッシュ。前回と同じなら再実行しない', max_length=64, verbose_name='入力フィンガープリント'),
+        ),
+    ]
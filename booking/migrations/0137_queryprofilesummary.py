@@ -0,0 +1,37 @@
+# Generated by Django 4.2.30 on 2026-10-19 06:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('booking', '0136_securityaudit_cache'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='QueryProfileSummary',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('view_name', models.CharField(max_length=200, verbose_name='ビュー名')),
+                ('period_start', models.DateTimeField(verbose_name='集計開始')),
+                ('requests', models.PositiveIntegerField(default=0, verbose_name='計測リクエスト数')),
+                ('queries', models.PositiveIntegerField(default=0, verbose_name='クエリ数合計')),
+                ('duplicate_queries', models.PositiveIntegerField(default=0, verbose_name='重複クエリ数合計')),
+                ('db_ms', models.FloatField(default=0, verbose_name='DB時間合計(ms)')),
+                ('total_ms', models.FloatField(default=0, verbose_name='処理時間合計(ms)')),
+                ('latency_histogram', models.JSONField(blank=True, default=list, verbose_name='レイテンシ分布')),
+                ('query_histogram', models.JSONField(blank=True, default=list, verbose_name='クエリ数分布')),
+                ('top_duplicates', models.JSONField(blank=True, default=list, help_text='[{"sql": 正規化SQL, "count": 回数}, ...]', verbose_name='重複クエリ上位')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='更新日時')),
+            ],
+            options={
+                'verbose_name': 'クエリプロファイル集計',
+                'verbose_name_plural': 'クエリプロファイル集計',
+                'ordering': ['-period_start', 'view_name'],
+                'indexes': [models.Index(fields=['period_start'], name='booking_que_period__c4bbb2_idx')],
+                'unique_together': {('view_name', 'period_start')},
+            },
+        ),
+    ]
@@ -0,0 +1,20 @@
+"""Clear secret_key audit fingerprints that were derived from the raw SECRET_KEY."""
+from django.db import migrations
+
+
+def clear_secret_key_fingerprints(apps, schema_editor):
+    SecurityAudit = apps.get_model('booking', 'SecurityAudit')
+    SecurityAudit.objects.filter(check_name='secret_key').exclude(fingerprint='').update(fingerprint='')
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ('booking', '0137_queryprofilesummary'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            clear_secret_key_fingerprints,
+            migrations.RunPython.noop,
+        ),
+    ]
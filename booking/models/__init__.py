@@ -112,11 +112,15 @@ from .security import (  # noqa: F401
 from .ml import (  # noqa: F401
     StaffRecommendationModel,
     StaffRecommendationResult,
+    SalesForecast,
 )
 
 # Error reporting
 from .error_reporting import ErrorReport  # noqa: F401
 
+# Performance
+from .performance import QueryProfileSummary  # noqa: F401
+
 # Theme
 from .theme import StoreTheme  # noqa: F401
 
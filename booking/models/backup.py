@@ -83,6 +83,10 @@ class BackupHistory(models.Model):
     s3_key = models.CharField(_('S3キー'), max_length=500, blank=True, default='')
     error_message = models.TextField(_('エラーメッセージ'), blank=True, default='')
     duration_seconds = models.FloatField(_('所要時間(秒)'), default=0)
+    stats = models.JSONField(
+        _('統計'), default=dict, blank=True,
+        help_text=_('段階ごとのスループット（stages）とチャンク数・新規チャンク数・保存バイト数'),
+    )
     started_at = models.DateTimeField(_('開始日時'), auto_now_add=True, db_index=True)
     completed_at = models.DateTimeField(_('完了日時'), null=True, blank=True)
 
@@ -360,10 +360,29 @@ class SystemConfig(models.Model):
 
     @classmethod
     def get(cls, key, default=''):
-        try:
-            return cls.objects.get(key=key).value
-        except cls.DoesNotExist:
-            return default
+        """キャッシュ経由で値を返す（booking.services.system_config）"""
+        from booking.services import system_config
+        return system_config.get(key, default)
+
+    @classmethod
+    def get_many(cls, keys, defaults=None):
+        from booking.services import system_config
+        return system_config.get_many(keys, defaults)
+
+    @classmethod
+    def get_bool(cls, key, default=False):
+        from booking.services import system_config
+        return system_config.get_bool(key, default)
+
+    @classmethod
+    def get_int(cls, key, default=0):
+        from booking.services import system_config
+        return system_config.get_int(key, default)
+
+    @classmethod
+    def get_json(cls, key, default=None):
+        from booking.services import system_config
+        return system_config.get_json(key, default)
 
     @classmethod
     def set(cls, key, value):
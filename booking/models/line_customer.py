@@ -78,6 +78,9 @@ class LineMessageLog(models.Model):
     sent_at = models.DateTimeField(_('送信日時'), auto_now_add=True)
     status = models.CharField(_('ステータス'), max_length=10, choices=STATUS_CHOICES, default='sent')
     error_detail = models.TextField(_('エラー詳細'), blank=True, default='')
+    campaign_id = models.CharField(
+        _('キャンペーンID'), max_length=64, blank=True, default='', db_index=True,
+    )
 
     class Meta:
         app_label = 'booking'
@@ -1,4 +1,4 @@
-"""機械学習モデル: StaffRecommendationModel, StaffRecommendationResult"""
+"""機械学習モデル: StaffRecommendationModel, StaffRecommendationResult, SalesForecast"""
 from django.db import models
 from django.utils.translation import gettext_lazy as _
 
@@ -14,6 +14,10 @@ class StaffRecommendationModel(models.Model):
     training_samples = models.IntegerField(_('学習サンプル数'), default=0)
     trained_at = models.DateTimeField(_('学習日時'), auto_now_add=True)
     is_active = models.BooleanField(_('有効'), default=True)
+    timings = models.JSONField(
+        _('処理時間'), default=dict, blank=True,
+        help_text=_('学習・推論の各フェーズの所要秒数（train / inference）'),
+    )
 
     class Meta:
         app_label = 'booking'
@@ -44,3 +48,25 @@ class StaffRecommendationResult(models.Model):
 
     def __str__(self):
         return f'{self.store.name} {self.date} {self.hour}時 推薦:{self.recommended_staff_count}人'
+
+
+class SalesForecast(models.Model):
+    """売上予測（夜間バッチで (店舗, チャネル) ごとに学習・保存）"""
+    store = models.ForeignKey('Store', verbose_name=_('店舗'), on_delete=models.CASCADE, related_name='sales_forecasts')
+    channel = models.CharField(_('注文チャネル'), max_length=20, blank=True, default='', help_text=_('空欄は全チャネル'))
+    date = models.DateField(_('日付'))
+    predicted = models.IntegerField(_('予測売上'))
+    lower = models.IntegerField(_('下限'))
+    upper = models.IntegerField(_('上限'))
+    method = models.CharField(_('予測手法'), max_length=20)
+    generated_at = models.DateTimeField(_('生成日時'))
+
+    class Meta:
+        app_label = 'booking'
+        verbose_name = _('売上予測')
+        verbose_name_plural = _('売上予測')
+        unique_together = ('store', 'channel', 'date')
+        ordering = ('store', 'channel', 'date')
+
+    def __str__(self):
+        return f'{self.store.name} {self.channel or "全チャネル"} {self.date} 予測:{self.predicted}'
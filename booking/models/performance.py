@@ -0,0 +1,34 @@
+"""パフォーマンス計測モデル: QueryProfileSummary"""
+from django.db import models
+from django.utils.translation import gettext_lazy as _
+
+
+class QueryProfileSummary(models.Model):
+    """ビュー（URL名）ごと・1時間ごとのクエリ数/レイテンシ集計（booking.services.query_profile）"""
+    view_name = models.CharField(_('ビュー名'), max_length=200)
+    period_start = models.DateTimeField(_('集計開始'))
+    requests = models.PositiveIntegerField(_('計測リクエスト数'), default=0)
+    queries = models.PositiveIntegerField(_('クエリ数合計'), default=0)
+    duplicate_queries = models.PositiveIntegerField(_('重複クエリ数合計'), default=0)
+    db_ms = models.FloatField(_('DB時間合計(ms)'), default=0)
+    total_ms = models.FloatField(_('処理時間合計(ms)'), default=0)
+    latency_histogram = models.JSONField(_('レイテンシ分布'), default=list, blank=True)
+    query_histogram = models.JSONField(_('クエリ数分布'), default=list, blank=True)
+    top_duplicates = models.JSONField(
+        _('重複クエリ上位'), default=list, blank=True,
+        help_text=_('[{"sql": 正規化SQL, "count": 回数}, ...]'),
+    )
+    updated_at = models.DateTimeField(_('更新日時'), auto_now=True)
+
+    class Meta:
+        app_label = 'booking'
+        verbose_name = _('クエリプロファイル集計')
+        verbose_name_plural = _('クエリプロファイル集計')
+        ordering = ['-period_start', 'view_name']
+        unique_together = ('view_name', 'period_start')
+        indexes = [
+            models.Index(fields=['period_start']),
+        ]
+
+    def __str__(self):
+        return f'{self.view_name} @ {self.period_start:%Y-%m-%d %H:00}'
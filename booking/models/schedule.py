@@ -9,6 +9,7 @@ import secrets
 import string
 import uuid
 import hashlib
+from functools import lru_cache
 from typing import Optional
 
 try:
@@ -17,6 +18,12 @@ except Exception:  # pragma: no cover
     Fernet = None
 
 
+@lru_cache(maxsize=4)
+def _fernet_for_key(key_bytes: bytes):
+    """鍵ごとに Fernet インスタンスを使い回す（大量配信時の復号コスト削減）。"""
+    return Fernet(key_bytes)
+
+
 class Schedule(models.Model):
     """予約スケジュール."""
     reservation_number = models.CharField(
@@ -197,7 +204,7 @@ class Schedule(models.Model):
         else:
             key_bytes = key
 
-        return Fernet(key_bytes)
+        return _fernet_for_key(key_bytes)
 
     @staticmethod
     def make_line_user_hash(line_user_id: str) -> str:
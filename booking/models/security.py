@@ -36,6 +36,10 @@ class SecurityAudit(models.Model):
     status = models.CharField(_('結果'), max_length=10, choices=STATUS_CHOICES)
     message = models.TextField(_('メッセージ'))
     recommendation = models.TextField(_('推奨事項'), blank=True, default='')
+    fingerprint = models.CharField(_('入力フィンガープリント'), max_length=64, blank=True, default='',
+                                   help_text=_('チェック入力のハッシュ。前回と同じなら再実行しない'))
+    duration_ms = models.PositiveIntegerField(_('所要時間(ms)'), default=0)
+    expires_at = models.DateTimeField(_('有効期限'), null=True, blank=True)
     created_at = models.DateTimeField(_('実行日時'), auto_now_add=True, db_index=True)
 
     class Meta:
@@ -111,6 +111,7 @@ class ShiftAssignment(models.Model):
     note = models.TextField(_('備考'), blank=True, default='')
     is_synced = models.BooleanField(_('Schedule同期済み'), default=False)
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(_('更新日時'), auto_now=True, db_index=True)
     is_demo = models.BooleanField(_('デモデータ'), default=False, db_index=True)
 
     class Meta:
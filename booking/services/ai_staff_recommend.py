@@ -1,14 +1,109 @@
-"""AIスタッフ推薦サービス - 機械学習によるシフト人員推薦"""
+"""AIスタッフ推薦サービス - 機械学習によるシフト人員推薦
+
+特徴量は 日付 x 時間帯 の NumPy 配列として2本の一括クエリ（VisitorCount / ShiftAssignment）から
+組み立てる。推論は対象日 x 24時間 を1回の predict で行い、結果は一括 upsert する。
+学習済みモデル（joblib）はモデルID単位でプロセス内にキャッシュする。
+各フェーズの所要時間は StaffRecommendationModel.timings に記録する。
+"""
 import logging
 import os
 import tempfile
+import time
 from datetime import date, timedelta
+from functools import lru_cache
 
+import numpy as np
 from django.conf import settings
 from django.utils import timezone
 
 logger = logging.getLogger(__name__)
 
+FEATURE_NAMES = ['day_of_week', 'hour', 'is_holiday', 'month', 'visitor_count', 'order_count']
+HOURS = 24
+MODEL_CACHE_SIZE = 16
+
+
+def _holidays():
+    return set(getattr(settings, 'PUBLIC_HOLIDAYS', []))
+
+
+def _date_columns(dates, holidays):
+    """日付ごとの (曜日, 休日フラグ, 月) 配列。"""
+    dow = np.array([d.weekday() for d in dates], dtype=np.int64)
+    holiday = np.array([1 if d in holidays or d.weekday() == 6 else 0 for d in dates], dtype=np.int64)
+    month = np.array([d.month for d in dates], dtype=np.int64)
+    return dow, holiday, month
+
+
+def _visitor_grid(store, dates):
+    """日付 x 時間帯 の (来客数, 注文数) 配列を1クエリで作る。"""
+    from booking.models import VisitorCount
+
+    index = {d: i for i, d in enumerate(dates)}
+    visitors = np.zeros((len(dates), HOURS), dtype=np.int64)
+    orders = np.zeros((len(dates), HOURS), dtype=np.int64)
+    if not dates:
+        return visitors, orders
+    rows = VisitorCount.objects.filter(
+        store=store, date__gte=dates[0], date__lte=dates[-1], hour__gte=0, hour__lt=HOURS,
+    ).values_list('date', 'hour', 'estimated_visitors', 'order_count')
+    for d, hour, est, cnt in rows:
+        i = index.get(d)
+        if i is not None:
+            visitors[i, hour] = est
+            orders[i, hour] = cnt
+    return visitors, orders
+
+
+def _staff_grid(store, dates):
+    """日付 x 時間帯 の出勤人数を1クエリで作る（シフト区間を差分配列で加算）。"""
+    from booking.models import ShiftAssignment
+
+    index = {d: i for i, d in enumerate(dates)}
+    diff = np.zeros((len(dates), HOURS + 1), dtype=np.int64)
+    if not dates:
+        return diff[:, :HOURS]
+    rows = [
+        (index[d], start, end)
+        for d, start, end in ShiftAssignment.objects.filter(
+            period__store=store, date__gte=dates[0], date__lte=dates[-1],
+        ).values_list('date', 'start_hour', 'end_hour')
+        if d in index and end > start
+    ]
+    if rows:
+        day, start, end = (np.array(col, dtype=np.int64) for col in zip(*rows))
+        np.add.at(diff, (day, np.clip(start, 0, HOURS)), 1)
+        np.add.at(diff, (day, np.clip(end, 0, HOURS)), -1)
+    return np.cumsum(diff, axis=1)[:, :HOURS]
+
+
+def _feature_rows(dates, visitors, orders, holidays):
+    """日付 x 時間帯 の全セルの特徴量（行は日付順・時間順）。"""
+    dow, holiday, month = _date_columns(dates, holidays)
+    n = len(dates)
+    return np.column_stack([
+        np.repeat(dow, HOURS),
+        np.tile(np.arange(HOURS), n),
+        np.repeat(holiday, HOURS),
+        np.repeat(month, HOURS),
+        visitors.reshape(-1),
+        orders.reshape(-1),
+    ]) if n else np.zeros((0, len(FEATURE_NAMES)), dtype=np.int64)
+
+
+def build_feature_arrays(store, lookback_days=90):
+    """学習用の特徴量 (X, y) を NumPy 配列で返す（シフトのある日付 x 時間帯のみ）。"""
+    today = date.today()
+    date_from = today - timedelta(days=lookback_days)
+    dates = [date_from + timedelta(days=i) for i in range(lookback_days + 1)]
+
+    staff = _staff_grid(store, dates)
+    visitors, orders = _visitor_grid(store, dates)
+    X = _feature_rows(dates, visitors, orders, _holidays())
+    y = staff.reshape(-1)
+    mask = y > 0
+    return X[mask], y[mask]
+
 
 def build_feature_matrix(store, lookback_days=90):
     """特徴量マトリクスを構築する
@@ -23,61 +118,25 @@ def build_feature_matrix(store, lookback_days=90):
 
     Target: actual staff count per hour
     """
-    from booking.models import VisitorCount, ShiftAssignment
+    X, y = build_feature_arrays(store, lookback_days)
+    return X.tolist(), y.tolist(), list(FEATURE_NAMES)
 
-    date_from = date.today() - timedelta(days=lookback_days)
 
-    # 祝日リスト
-    holidays = set()
-    public_holidays = getattr(settings, 'PUBLIC_HOLIDAYS', [])
-    for h in public_holidays:
-        holidays.add(h)
+@lru_cache(maxsize=MODEL_CACHE_SIZE)
+def _load_model(model_id, path):
+    import joblib
+    logger.info("Loading recommendation model %s from %s", model_id, path)
+    return joblib.load(path)
 
-    X = []
-    y = []
 
-    visitor_data = {}
-    for vc in VisitorCount.objects.filter(store=store, date__gte=date_from):
-        visitor_data[(vc.date, vc.hour)] = (vc.estimated_visitors, vc.order_count)
+def load_model(rec_model):
+    """StaffRecommendationModel の学習済みモデルを返す（モデルID単位でプロセス内キャッシュ）。"""
+    return _load_model(rec_model.pk, rec_model.model_file.path)
 
-    # 日付×時間帯ごとのスタッフ数を集計
-    staff_counts = {}
-    assignments = ShiftAssignment.objects.filter(
-        period__store=store,
-        date__gte=date_from,
-    )
-    for a in assignments:
-        start_h = a.start_hour
-        end_h = a.end_hour
-        for h in range(start_h, end_h):
-            key = (a.date, h)
-            staff_counts[key] = staff_counts.get(key, 0) + 1
-
-    # 特徴量構築
-    current = date_from
-    while current <= date.today():
-        for hour in range(24):
-            key = (current, hour)
-            if key not in staff_counts:
-                continue
-
-            visitors, orders = visitor_data.get(key, (0, 0))
-
-            features = [
-                current.weekday(),
-                hour,
-                1 if current in holidays or current.weekday() == 6 else 0,
-                current.month,
-                visitors,
-                orders,
-            ]
-            X.append(features)
-            y.append(staff_counts[key])
-
-        current += timedelta(days=1)
-
-    feature_names = ['day_of_week', 'hour', 'is_holiday', 'month', 'visitor_count', 'order_count']
-    return X, y, feature_names
+
+def _record_timings(rec_model, phase, timings):
+    rec_model.timings = {**(rec_model.timings or {}), phase: timings}
+    type(rec_model).objects.filter(pk=rec_model.pk).update(timings=rec_model.timings)
 
 
 def train_model(store):
@@ -88,25 +147,23 @@ def train_model(store):
     """
     from booking.models import StaffRecommendationModel
 
-    X, y, feature_names = build_feature_matrix(store)
+    timings = {}
+    started = time.perf_counter()
+    X_arr, y_arr = build_feature_arrays(store)
+    timings['features'] = time.perf_counter() - started
 
-    if len(X) < 10:
-        logger.warning("Not enough training data for store %s (got %d samples)", store.name, len(X))
+    if len(X_arr) < 10:
+        logger.warning("Not enough training data for store %s (got %d samples)", store.name, len(X_arr))
         return None
 
     try:
         from sklearn.ensemble import RandomForestRegressor, GradientBoostingRegressor
         from sklearn.model_selection import cross_val_score
-        from sklearn.metrics import mean_absolute_error
         import joblib
-        import numpy as np
     except ImportError:
         logger.error("scikit-learn or joblib not installed")
         return None
 
-    X_arr = np.array(X)
-    y_arr = np.array(y)
-
     # RandomForest vs GradientBoosting 比較
     models = {
         'random_forest': RandomForestRegressor(n_estimators=100, random_state=42, n_jobs=-1),
@@ -117,19 +174,24 @@ def train_model(store):
     best_mae = float('inf')
     best_type = 'random_forest'
 
+    started = time.perf_counter()
     for name, model in models.items():
-        scores = cross_val_score(model, X_arr, y_arr, cv=min(5, len(X)), scoring='neg_mean_absolute_error')
+        scores = cross_val_score(model, X_arr, y_arr, cv=min(5, len(X_arr)), scoring='neg_mean_absolute_error')
         mae = -scores.mean()
         logger.info("Model %s MAE: %.3f", name, mae)
         if mae < best_mae:
             best_mae = mae
             best_model = model
             best_type = name
+    timings['model_selection'] = time.perf_counter() - started
 
     # 全データで再学習
+    started = time.perf_counter()
     best_model.fit(X_arr, y_arr)
+    timings['fit'] = time.perf_counter() - started
 
     # モデルファイル保存
+    started = time.perf_counter()
     with tempfile.NamedTemporaryFile(suffix='.joblib', delete=False) as f:
         joblib.dump(best_model, f.name)
         temp_path = f.name
@@ -142,17 +204,19 @@ def train_model(store):
         rec_model = StaffRecommendationModel(
             store=store,
             model_type=best_type,
-            feature_names=feature_names,
+            feature_names=list(FEATURE_NAMES),
             accuracy_score=0,
             mae_score=best_mae,
-            training_samples=len(X),
+            training_samples=len(X_arr),
             is_active=True,
         )
         with open(temp_path, 'rb') as f:
             rec_model.model_file.save(f'model_{store.id}_{best_type}.joblib', File(f), save=True)
+        timings['save'] = time.perf_counter() - started
+        _record_timings(rec_model, 'train', timings)
 
         logger.info("Trained model for store %s: type=%s, MAE=%.3f, samples=%d",
-                    store.name, best_type, best_mae, len(X))
+                    store.name, best_type, best_mae, len(X_arr))
         return rec_model
     finally:
         if os.path.exists(temp_path):
@@ -167,9 +231,9 @@ def generate_recommendations(store, target_dates):
         target_dates: list of date objects
 
     Returns:
-        int: 作成したレコード数
+        int: 作成・更新したレコード数
     """
-    from booking.models import StaffRecommendationModel, StaffRecommendationResult, VisitorCount
+    from booking.models import StaffRecommendationModel, StaffRecommendationResult
 
     active_model = StaffRecommendationModel.objects.filter(
         store=store, is_active=True,
@@ -180,55 +244,55 @@ def generate_recommendations(store, target_dates):
         return 0
 
     try:
-        import joblib
-        import numpy as np
+        model = load_model(active_model)
     except ImportError:
         logger.error("joblib not installed")
         return 0
 
-    model = joblib.load(active_model.model_file.path)
-
-    holidays = set(getattr(settings, 'PUBLIC_HOLIDAYS', []))
-
-    count = 0
-    for target_date in target_dates:
-        # その日の来客データ（あれば）
-        visitor_data = {}
-        for vc in VisitorCount.objects.filter(store=store, date=target_date):
-            visitor_data[vc.hour] = (vc.estimated_visitors, vc.order_count)
-
-        for hour in range(24):
-            visitors, orders = visitor_data.get(hour, (0, 0))
-
-            features = np.array([[
-                target_date.weekday(),
-                hour,
-                1 if target_date in holidays or target_date.weekday() == 6 else 0,
-                target_date.month,
-                visitors,
-                orders,
-            ]])
-
-            prediction = model.predict(features)[0]
-            recommended = max(0, round(prediction))
-
-            # 特徴量重要度（RandomForest系のみ）
-            factors = {}
-            if hasattr(model, 'feature_importances_'):
-                for name, importance in zip(active_model.feature_names, model.feature_importances_):
-                    factors[name] = round(float(importance), 4)
-
-            StaffRecommendationResult.objects.update_or_create(
-                store=store,
-                date=target_date,
-                hour=hour,
-                defaults={
-                    'recommended_staff_count': recommended,
-                    'confidence': float(getattr(model, 'score', lambda X, y: 0)(features, [recommended])) if hasattr(model, 'oob_score_') else 0.0,
-                    'factors': factors,
-                },
-            )
-            count += 1
-
-    logger.info("Generated %d recommendations for store %s", count, store.name)
-    return count
+    dates = sorted(set(target_dates))
+    if not dates:
+        return 0
+
+    timings = {}
+    started = time.perf_counter()
+    visitors, orders = _visitor_grid(store, dates)
+    features = _feature_rows(dates, visitors, orders, _holidays())
+    timings['features'] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    recommended = np.maximum(0, np.rint(model.predict(features))).astype(np.int64)
+    timings['predict'] = time.perf_counter() - started
+
+    # 特徴量重要度（RandomForest系のみ）— モデル単位で1回だけ計算
+    factors = {}
+    if hasattr(model, 'feature_importances_'):
+        for name, importance in zip(active_model.feature_names, model.feature_importances_):
+            factors[name] = round(float(importance), 4)
+    confidence = float(model.oob_score_) if hasattr(model, 'oob_score_') else 0.0
+
+    started = time.perf_counter()
+    results = [
+        StaffRecommendationResult(
+            store=store,
+            date=d,
+            hour=hour,
+            recommended_staff_count=int(recommended[i * HOURS + hour]),
+            confidence=confidence,
+            factors=factors,
+        )
+        for i, d in enumerate(dates)
+        for hour in range(HOURS)
+    ]
+    StaffRecommendationResult.objects.bulk_create(
+        results,
+        update_conflicts=True,
+        unique_fields=['store', 'date', 'hour'],
+        update_fields=['recommended_staff_count', 'confidence', 'factors'],
+    )
+    timings['persist'] = time.perf_counter() - started
+    timings['rows'] = len(results)
+    timings['at'] = timezone.now().isoformat()
+    _record_timings(active_model, 'inference', timings)
+
+    logger.info("Generated %d recommendations for store %s", len(results), store.name)
+    return len(results)
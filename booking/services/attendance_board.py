@@ -0,0 +1,271 @@
+"""出退勤ボードのライブ状態 — スタッフごとの現在状態を共有キャッシュに保持する
+
+(店舗, 日付) ごとにスタッフ単位のエントリ（状態・当日の打刻・シフト終了時刻）を
+キャッシュ（本番は Redis）に保持する。新規打刻（post_save シグナル経由）は該当スタッフのエントリだけを更新し、
+live_events でボードへカード1枚分の差分を配信する。
+
+- エントリはスタッフ単位のキーに分けて保存し、別スタッフの同時打刻で更新が失われないようにする
+- キャッシュが無い・無効化された場合だけ当日の打刻から再構築する
+- シフト超過は保存済みのシフト終了時刻と現在時刻から表示時に計算する（クエリ不要）
+"""
+import logging
+from datetime import datetime, time as dt_time
+
+from django.core.cache import cache
+from django.db import transaction
+from django.template.loader import render_to_string
+from django.utils import timezone
+from django.utils.translation import gettext_lazy as _
+
+from booking.services import live_events
+
+logger = logging.getLogger(__name__)
+
+CACHE_PREFIX = 'attboard'
+BOARD_TTL = 60 * 60 * 36  # 日付がキーに入るので翌日分とは混ざらない
+OVERTIME_THRESHOLD_MINUTES = 30  # 30分以上超過で強調
+
+STATE_WORKING = 'working'
+STATE_BREAK = 'break'
+STATE_LEFT = 'left'
+STATE_ABSENT = 'absent'
+STATE_LABELS = {
+    STATE_WORKING: _('出勤中'),
+    STATE_BREAK: _('休憩中'),
+    STATE_LEFT: _('退勤済'),
+    STATE_ABSENT: _('未出勤'),
+}
+_STAMP_STATES = {
+    'clock_in': STATE_WORKING,
+    'clock_out': STATE_LEFT,
+    'break_start': STATE_BREAK,
+    'break_end': STATE_WORKING,
+}
+
+EVENT_STAFF = 'staff'
+EVENT_RESYNC = 'resync'
+
+
+def topic(store_id):
+    return f'attendance:{store_id}'
+
+
+def _version_key(store_id):
+    return f'{CACHE_PREFIX}:ver:{store_id}'
+
+
+def _board_prefix(store_id, day, demo, version):
+    return f'{CACHE_PREFIX}:{store_id}:{day.isoformat()}:{int(demo)}:{version}'
+
+
+def _index_key(prefix):
+    return f'{prefix}:index'
+
+
+def _entry_key(prefix, staff_id):
+    return f'{prefix}:staff:{staff_id}'
+
+
+def _demo_visible():
+    """デモモード ON ならデモ打刻もボードに含める。"""
+    from booking.services.demo_data_service import get_demo_exclusion
+    return not get_demo_exclusion()
+
+
+def _current_prefix(store_id, day, demo=None):
+    if demo is None:
+        demo = _demo_visible()
+    return _board_prefix(store_id, day, demo, cache.get(_version_key(store_id), 0))
+
+
+# ---------------------------------------------------------------------------
+# 状態の構築・更新
+# ---------------------------------------------------------------------------
+
+def _new_entry(staff_id, name):
+    return {
+        'staff_id': staff_id, 'name': name,
+        'state': STATE_ABSENT, 'stamps': [], 'shift_end': None,
+    }
+
+
+def _apply_stamp(entry, stamp_type, stamped_at):
+    entry['stamps'].append({'type': stamp_type, 'at': stamped_at})
+    entry['state'] = _STAMP_STATES.get(stamp_type, entry['state'])
+
+
+def _shift_end(end_time, end_hour):
+    if end_time:
+        return end_time
+    return dt_time(end_hour, 0) if end_hour < 24 else dt_time(23, 59)
+
+
+def build_board(store_id, day, demo):
+    """当日の打刻を1回だけ再生してエントリを作る（キャッシュ欠落時のみ）。"""
+    from booking.models import AttendanceStamp, ShiftAssignment, Staff
+
+    entries = {
+        sid: _new_entry(sid, name)
+        for sid, name in Staff.objects.filter(store_id=store_id).values_list('id', 'name')
+    }
+    stamps = AttendanceStamp.objects.filter(
+        staff__store_id=store_id, stamped_at__date=day, is_valid=True,
+    )
+    if not demo:
+        stamps = stamps.filter(is_demo=False)
+    for staff_id, stamp_type, stamped_at in (
+        stamps.order_by('stamped_at').values_list('staff_id', 'stamp_type', 'stamped_at')
+    ):
+        if staff_id in entries:
+            _apply_stamp(entries[staff_id], stamp_type, stamped_at)
+
+    # 複数シフトがある場合は最も遅い終了時刻を採用
+    for staff_id, end_time, end_hour in ShiftAssignment.objects.filter(
+        date=day, staff_id__in=entries.keys(),
+    ).values_list('staff_id', 'end_time', 'end_hour'):
+        end = _shift_end(end_time, end_hour)
+        entry = entries[staff_id]
+        if entry['shift_end'] is None or end > entry['shift_end']:
+            entry['shift_end'] = end
+    return list(entries.values())
+
+
+def get_board(store_id, day=None):
+    """ボードの全エントリ（スタッフの既定順）。キャッシュが欠けていれば再構築する。"""
+    day = day or timezone.localdate()
+    demo = _demo_visible()
+    prefix = _current_prefix(store_id, day, demo)
+    staff_ids = cache.get(_index_key(prefix))
+    if staff_ids is not None:
+        keys = [_entry_key(prefix, sid) for sid in staff_ids]
+        found = cache.get_many(keys)
+        if len(found) == len(keys):
+            return [found[k] for k in keys]
+
+    entries = build_board(store_id, day, demo)
+    values = {_entry_key(prefix, e['staff_id']): e for e in entries}
+    values[_index_key(prefix)] = [e['staff_id'] for e in entries]
+    cache.set_many(values, BOARD_TTL)
+    return entries
+
+
+def record_stamp(stamp):
+    """打刻をボードに反映し、カードの差分を配信する（トランザクション確定後）。"""
+    store_id = stamp.staff.store_id
+    staff_id = stamp.staff_id
+    stamp_type = stamp.stamp_type
+    stamped_at = stamp.stamped_at
+    is_demo = stamp.is_demo
+
+    def _record():
+        try:
+            entry = _update_entry(store_id, staff_id, stamp_type, stamped_at, is_demo)
+        except Exception as e:
+            logger.warning("attendance board update failed for staff %s: %s", staff_id, e)
+            invalidate(store_id)
+            return
+        if entry is not None:
+            live_events.publish(topic(store_id), EVENT_STAFF, staff_event_data(entry))
+
+    transaction.on_commit(_record)
+
+
+def _update_entry(store_id, staff_id, stamp_type, stamped_at, is_demo):
+    day = timezone.localdate(stamped_at)
+    if day != timezone.localdate():
+        return None
+    # デモ表示 ON/OFF 両方のボードに反映（デモ打刻は ON 側のみ）
+    for demo in (True, False):
+        if is_demo and not demo:
+            continue
+        key = _entry_key(_current_prefix(store_id, day, demo), staff_id)
+        entry = cache.get(key)
+        if entry is None:
+            continue  # 未構築のボードは次回表示時に DB から作られる
+        _apply_stamp(entry, stamp_type, stamped_at)
+        cache.set(key, entry, BOARD_TTL)
+
+    if is_demo and not _demo_visible():
+        return None
+    prefix = _current_prefix(store_id, day)
+    entry = cache.get(_entry_key(prefix, staff_id))
+    if entry is None:
+        entry = next((e for e in get_board(store_id, day) if e['staff_id'] == staff_id), None)
+    return entry
+
+
+def invalidate(store_id):
+    """店舗のボードを作り直させ、表示中の画面に全体の再取得を促す。"""
+    key = _version_key(store_id)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, 1, None)
+    except Exception as e:
+        logger.warning("attendance board invalidate failed for store %s: %s", store_id, e)
+    live_events.publish(topic(store_id), EVENT_RESYNC, {})
+
+
+# ---------------------------------------------------------------------------
+# 表示
+# ---------------------------------------------------------------------------
+
+def staff_info(entry, now=None, day=None):
+    """テンプレート用のスタッフ情報（シフト超過を現在時刻で判定）。"""
+    now = now or timezone.localtime(timezone.now())
+    day = day or now.date()
+    info = {
+        'staff': {'id': entry['staff_id'], 'name': entry['name']},
+        'state': entry['state'],
+        'status': STATE_LABELS[entry['state']],
+        'stamps': [
+            {'label': _stamp_label(s['type']), 'at': s['at']} for s in entry['stamps']
+        ],
+        'shift_end_time': entry['shift_end'],
+        'overtime': False,
+    }
+    if entry['shift_end'] and entry['state'] in (STATE_WORKING, STATE_BREAK):
+        shift_end_dt = timezone.make_aware(
+            datetime.combine(day, entry['shift_end']), timezone.get_current_timezone(),
+        )
+        overtime_minutes = (now - shift_end_dt).total_seconds() / 60
+        if overtime_minutes > OVERTIME_THRESHOLD_MINUTES:
+            info['overtime'] = True
+            info['overtime_minutes'] = int(overtime_minutes)
+    return info
+
+
+def _stamp_label(stamp_type):
+    from booking.models import AttendanceStamp
+    return dict(AttendanceStamp.STAMP_TYPE_CHOICES).get(stamp_type, stamp_type)
+
+
+def board_context(store_id, day=None):
+    """ボード表示用のコンテキスト（ゾーン別のスタッフ情報）。"""
+    now = timezone.localtime(timezone.now())
+    day = day or now.date()
+    entries = get_board(store_id, day) if store_id else []
+    infos = [staff_info(e, now, day) for e in entries]
+    zones = {state: [] for state in STATE_LABELS}
+    for info in infos:
+        zones[info['state']].append(info)
+    return {
+        'staff_status': {info['staff']['id']: info for info in infos},
+        'zone_working': zones[STATE_WORKING],
+        'zone_break': zones[STATE_BREAK],
+        'zone_absent': zones[STATE_ABSENT],
+        'zone_left': zones[STATE_LEFT],
+    }
+
+
+def render_staff_card(info):
+    return render_to_string('admin/booking/_attendance_staff_card.html', {'info': info})
+
+
+def staff_event_data(entry):
+    info = staff_info(entry)
+    return {
+        'staff_id': entry['staff_id'],
+        'state': entry['state'],
+        'html': render_staff_card(info),
+    }
@@ -2,11 +2,19 @@
 勤怠導出サービス
 
 ShiftAssignment（確定シフト）から WorkAttendance（勤怠記録）を自動生成する。
+
+導出は集合単位で行う: 対象期間の既存勤怠を1クエリで辞書に読み込み、メモリ上で
+勤務区分を計算して、新規は bulk_create・変化したものだけ bulk_update する。
+derive_attendance_incremental は前回実行以降に更新されたシフトだけを再計算する
+（店舗ごとのウォーターマークを SystemConfig に保持）。
 """
 import logging
 from datetime import date, time, datetime, timedelta
 
 from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
 
 logger = logging.getLogger(__name__)
 
@@ -23,6 +31,20 @@ BREAK_45 = 45
 # 法定労働時間（1日8時間）
 REGULAR_LIMIT_MINUTES = 480
 
+# 手動入力・修正済みの勤怠は上書きしない
+PROTECTED_SOURCES = ('manual', 'corrected')
+
+# シフトから導出する WorkAttendance のフィールド（bulk_update 対象）
+DERIVED_FIELDS = (
+    'clock_in', 'clock_out',
+    'regular_minutes', 'overtime_minutes', 'late_night_minutes', 'holiday_minutes', 'break_minutes',
+    'source', 'source_assignment',
+)
+
+WATERMARK_KEY = 'attendance_derive_watermark:{store_id}'
+# 実行中にコミットされた変更を取りこぼさないよう、ウォーターマークを少し巻き戻して保存する
+WATERMARK_OVERLAP = timedelta(minutes=5)
+
 
 def _calc_break_minutes(total_work_minutes: int) -> int:
     """法定休憩時間を計算する。"""
@@ -90,6 +112,79 @@ def _classify_work_hours(start_hour: int, end_hour: int, is_holiday: bool = Fals
     }
 
 
+def _derive_values(assignment):
+    """確定シフト1件から勤怠フィールドの値を計算する（DB アクセスなし）。"""
+    # 休日判定（簡易: 日曜 = 休日）
+    is_holiday = assignment.date.weekday() == 6  # Sunday
+
+    hours = _classify_work_hours(
+        assignment.start_hour,
+        assignment.end_hour,
+        is_holiday=is_holiday,
+    )
+
+    clock_in = time(assignment.start_hour, 0) if assignment.start_hour < 24 else None
+    clock_out_h = assignment.end_hour if assignment.end_hour < 24 else 0
+    clock_out = time(clock_out_h, 0)
+
+    return {
+        'clock_in': clock_in,
+        'clock_out': clock_out,
+        'regular_minutes': hours['regular_minutes'],
+        'overtime_minutes': hours['overtime_minutes'],
+        'late_night_minutes': hours['late_night_minutes'],
+        'holiday_minutes': hours['holiday_minutes'],
+        'break_minutes': hours['break_minutes'],
+        'source': 'shift',
+        'source_assignment_id': assignment.id,
+    }
+
+
+def _apply_derivation(assignments):
+    """確定シフトから勤怠を一括で作成・更新する。
+
+    Args:
+        assignments: (date, start_hour) 順の ShiftAssignment の列
+
+    Returns:
+        int: 作成・更新された勤怠レコード数（変化のないレコードは数えない）
+    """
+    from booking.models import WorkAttendance
+
+    # 同日に複数シフトがある場合は開始の遅いシフトで上書き（(staff, date) で一意）
+    latest = {(a.staff_id, a.date): a for a in assignments}
+    if not latest:
+        return 0
+
+    dates = [d for _, d in latest]
+    existing = {
+        (w.staff_id, w.date): w
+        for w in WorkAttendance.objects.filter(
+            staff_id__in={staff_id for staff_id, _ in latest},
+            date__gte=min(dates),
+            date__lte=max(dates),
+        )
+    }
+
+    to_create, to_update = [], []
+    for key, assignment in latest.items():
+        values = _derive_values(assignment)
+        attendance = existing.get(key)
+        if attendance is None:
+            to_create.append(WorkAttendance(staff_id=key[0], date=key[1], **values))
+        elif attendance.source in PROTECTED_SOURCES:
+            continue
+        elif any(getattr(attendance, name) != value for name, value in values.items()):
+            for name, value in values.items():
+                setattr(attendance, name, value)
+            to_update.append(attendance)
+
+    with transaction.atomic():
+        WorkAttendance.objects.bulk_create(to_create)
+        WorkAttendance.objects.bulk_update(to_update, DERIVED_FIELDS)
+    return len(to_create) + len(to_update)
+
+
 def derive_attendance_from_shifts(store, date_from: date, date_to: date):
     """確定シフト→勤怠レコード自動生成。
 
@@ -99,61 +194,66 @@ def derive_attendance_from_shifts(store, date_from: date, date_to: date):
         date_to: 終了日
 
     Returns:
-        int: 生成された勤怠レコード数
+        int: 生成・更新された勤怠レコード数
     """
-    from booking.models import ShiftAssignment, WorkAttendance
+    from booking.models import ShiftAssignment
 
     assignments = ShiftAssignment.objects.filter(
         period__store=store,
         date__gte=date_from,
         date__lte=date_to,
-    ).select_related('staff', 'period')
-
-    created_count = 0
+    ).order_by('date', 'start_hour')
 
-    with transaction.atomic():
-        for assignment in assignments:
-            # 既に勤怠レコードが存在する場合はスキップ（手動修正を優先）
-            existing = WorkAttendance.objects.filter(
-                staff=assignment.staff,
-                date=assignment.date,
-            ).first()
-
-            if existing and existing.source in ('manual', 'corrected'):
-                continue
-
-            # 休日判定（簡易: 日曜 = 休日）
-            is_holiday = assignment.date.weekday() == 6  # Sunday
-
-            hours = _classify_work_hours(
-                assignment.start_hour,
-                assignment.end_hour,
-                is_holiday=is_holiday,
-            )
-
-            clock_in = time(assignment.start_hour, 0) if assignment.start_hour < 24 else None
-            clock_out_h = assignment.end_hour if assignment.end_hour < 24 else 0
-            clock_out = time(clock_out_h, 0)
-
-            WorkAttendance.objects.update_or_create(
-                staff=assignment.staff,
-                date=assignment.date,
-                defaults={
-                    'clock_in': clock_in,
-                    'clock_out': clock_out,
-                    'regular_minutes': hours['regular_minutes'],
-                    'overtime_minutes': hours['overtime_minutes'],
-                    'late_night_minutes': hours['late_night_minutes'],
-                    'holiday_minutes': hours['holiday_minutes'],
-                    'break_minutes': hours['break_minutes'],
-                    'source': 'shift',
-                    'source_assignment': assignment,
-                },
-            )
-            created_count += 1
+    count = _apply_derivation(assignments)
 
     logger.info(
         "Derived %d attendance records for %s (%s ~ %s)",
-        created_count, store.name, date_from, date_to,
+        count, store.name, date_from, date_to,
+    )
+    return count
+
+
+def derive_attendance_incremental(store):
+    """前回実行以降に更新された確定シフトだけを勤怠に反映する。
+
+    対象は承認済み期間（period.status='approved'）の当日までのシフトのみ。
+    前回実行以降に当日を迎えたシフトも対象に含める。
+    初回（ウォーターマーク未設定）は当月1日以降のシフトを対象にする。
+    変更のあった (スタッフ, 日付) の全シフトを読み直すので、同日の別シフトとの上書き順は
+    全件導出と同じになる。
+
+    Returns:
+        int: 生成・更新された勤怠レコード数
+    """
+    from booking.models import ShiftAssignment, SystemConfig
+
+    key = WATERMARK_KEY.format(store_id=store.id)
+    started_at = timezone.now()
+    today = timezone.localdate()
+    since = parse_datetime(SystemConfig.get(key))
+
+    shifts = ShiftAssignment.objects.filter(
+        period__store=store, period__status='approved', date__lte=today,
+    )
+    if since is not None:
+        changed = shifts.filter(Q(updated_at__gt=since) | Q(date__gt=timezone.localdate(since)))
+    else:
+        changed = shifts.filter(date__gte=today.replace(day=1))
+    pairs = set(changed.values_list('staff_id', 'date'))
+
+    count = 0
+    if pairs:
+        dates = [d for _, d in pairs]
+        candidates = shifts.filter(
+            staff_id__in={staff_id for staff_id, _ in pairs},
+            date__gte=min(dates),
+            date__lte=max(dates),
+        ).order_by('date', 'start_hour')
+        count = _apply_derivation(a for a in candidates if (a.staff_id, a.date) in pairs)
+
+    SystemConfig.set(key, (started_at - WATERMARK_OVERLAP).isoformat())
+    logger.info(
+        "Derived %d attendance records for %s (%d changed staff-days since %s)",
+        count, store.name, len(pairs), since,
     )
-    return created_count
+    return count
@@ -0,0 +1,310 @@
+"""重複排除バックアップリポジトリ（チャンク分割・圧縮・パック）
+
+スナップショット（DB ファイル）をコンテンツ定義のチャンクに分け、前回までに保存済みの
+チャンクは参照だけを記録する。新しいチャンクだけを zlib で圧縮してパックにまとめて保存する。
+
+チャンク境界は DB のページ単位で、ページ内容のハッシュで決める（下位 CUT_BITS ビットが 0 の
+ページの後で切る。MIN/MAX_CHUNK_PAGES で長さを制限）。SQLite はページをその場で
+書き換えるので、変更されたページを含むチャンクだけが新しくなる。
+
+リポジトリ上のレイアウト（キーは BackupStorage 上の相対パス）:
+    packs/<sha[:2]>/<sha>.pack      圧縮済みチャンクを連結したもの（sha はパック内容のハッシュ）
+    snapshots/<name>.json.gz        マニフェスト（チャンクの並びと各チャンクの所在）
+
+マニフェストはそれ単体で復元できるよう、参照する全チャンクの所在を持つ。
+パックはマニフェストより先に保存するので、マニフェストが指すパックは必ず存在する。
+"""
+import gzip
+import hashlib
+import io
+import json
+import logging
+import time
+import zlib
+
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PAGE_SIZE = 4096
+MIN_CHUNK_PAGES = 4
+MAX_CHUNK_PAGES = 64
+CUT_BITS = 4  # 平均で MIN_CHUNK_PAGES + 2**CUT_BITS ページ程度
+PACK_TARGET_SIZE = 16 * 1024 * 1024
+COMPRESS_LEVEL = 6
+MANIFEST_VERSION = 1
+
+PACK_PREFIX = 'packs/'
+SNAPSHOT_PREFIX = 'snapshots/'
+SNAPSHOT_SUFFIX = '.json.gz'
+
+SQLITE_MAGIC = b'SQLite format 3\x00'
+
+
+class BackupVerifyError(Exception):
+    """復元データがマニフェストのハッシュと一致しない"""
+
+
+def sqlite_page_size(path):
+    """SQLite ファイルならヘッダのページサイズ、それ以外は DEFAULT_PAGE_SIZE。"""
+    with open(path, 'rb') as f:
+        header = f.read(100)
+    if not header.startswith(SQLITE_MAGIC):
+        return DEFAULT_PAGE_SIZE
+    size = int.from_bytes(header[16:18], 'big')
+    return 65536 if size == 1 else (size or DEFAULT_PAGE_SIZE)
+
+
+def iter_chunks(fileobj, page_size=DEFAULT_PAGE_SIZE):
+    """ページ内容で境界を決めたチャンク（bytes）を順に返す。"""
+    mask = (1 << CUT_BITS) - 1
+    pages = []
+    while True:
+        page = fileobj.read(page_size)
+        if not page:
+            break
+        pages.append(page)
+        if len(pages) < MIN_CHUNK_PAGES:
+            continue
+        digest = hashlib.blake2b(page, digest_size=8).digest()
+        if len(pages) >= MAX_CHUNK_PAGES or int.from_bytes(digest, 'little') & mask == 0:
+            yield b''.join(pages)
+            pages = []
+    if pages:
+        yield b''.join(pages)
+
+
+class StageStats:
+    """段階ごとの処理バイト数と所要時間"""
+
+    def __init__(self):
+        self.stages = {}
+
+    def add(self, stage, nbytes, seconds):
+        entry = self.stages.setdefault(stage, {'bytes': 0, 'seconds': 0.0})
+        entry['bytes'] += nbytes
+        entry['seconds'] += seconds
+
+    def as_dict(self):
+        result = {}
+        for stage, entry in self.stages.items():
+            seconds = entry['seconds']
+            result[stage] = {
+                'bytes': entry['bytes'],
+                'seconds': round(seconds, 3),
+                'mb_per_s': round(entry['bytes'] / 1024 / 1024 / seconds, 1) if seconds > 0 else None,
+            }
+        return result
+
+
+class _PackWriter:
+    """新しいチャンクを圧縮してパックにまとめ、PACK_TARGET_SIZE ごとに保存する"""
+
+    def __init__(self, storage, stats):
+        self.storage = storage
+        self.stats = stats
+        self.buffer = io.BytesIO()
+        self.pending = []  # (chunk_id, offset, length, raw_length)
+        self.locations = {}
+        self.stored_bytes = 0
+
+    def add(self, chunk_id, data):
+        started = time.perf_counter()
+        compressed = zlib.compress(data, COMPRESS_LEVEL)
+        self.stats.add('compress', len(data), time.perf_counter() - started)
+        self.pending.append((chunk_id, self.buffer.tell(), len(compressed), len(data)))
+        self.buffer.write(compressed)
+        if self.buffer.tell() >= PACK_TARGET_SIZE:
+            self.flush()
+
+    def flush(self):
+        size = self.buffer.tell()
+        if not size:
+            return
+        data = self.buffer.getbuffer()
+        key = pack_key(hashlib.sha256(data).hexdigest())
+        del data
+        started = time.perf_counter()
+        self.storage.write(key, self.buffer, size)
+        self.stats.add('store', size, time.perf_counter() - started)
+        for chunk_id, offset, length, raw_length in self.pending:
+            self.locations[chunk_id] = [key, offset, length, raw_length]
+        self.stored_bytes += size
+        self.buffer = io.BytesIO()
+        self.pending = []
+
+
+def pack_key(digest):
+    return f'{PACK_PREFIX}{digest[:2]}/{digest}.pack'
+
+
+def snapshot_key(name):
+    return f'{SNAPSHOT_PREFIX}{name}{SNAPSHOT_SUFFIX}'
+
+
+class Repository:
+    """BackupStorage 上のチャンクリポジトリ"""
+
+    def __init__(self, storage):
+        self.storage = storage
+
+    # -- スナップショット一覧・マニフェスト --------------------------------------
+
+    def list_snapshots(self):
+        """スナップショット名（古い順。名前にタイムスタンプを含める前提）"""
+        return sorted(
+            key[len(SNAPSHOT_PREFIX):-len(SNAPSHOT_SUFFIX)]
+            for key in self.storage.list(SNAPSHOT_PREFIX)
+            if key.endswith(SNAPSHOT_SUFFIX)
+        )
+
+    def load_manifest(self, name):
+        return json.loads(gzip.decompress(self.storage.read(snapshot_key(name))))
+
+    def _save_manifest(self, manifest):
+        data = gzip.compress(json.dumps(manifest, separators=(',', ':')).encode())
+        self.storage.write(snapshot_key(manifest['name']), io.BytesIO(data), len(data))
+        return len(data)
+
+    def load_index(self):
+        """保存済みの全チャンクの所在 {chunk_id: [pack, offset, length, raw_length]}"""
+        index = {}
+        for name in self.list_snapshots():
+            try:
+                index.update(self.load_manifest(name)['chunks'])
+            except Exception as e:
+                logger.warning('Skipping unreadable backup manifest %s: %s', name, e)
+        return index
+
+    # -- 保存 ------------------------------------------------------------------
+
+    def create_snapshot(self, name, path, stats=None):
+        """path のファイルをスナップショット name として保存し、マニフェストを返す。
+
+        manifest['summary'] にチャンク数・新規チャンク数・保存バイト数を入れる。
+        """
+        stats = stats or StageStats()
+        index = self.load_index()
+        writer = _PackWriter(self.storage, stats)
+        page_size = sqlite_page_size(path)
+        file_hash = hashlib.sha256()
+        order = []
+        chunks = {}
+        size = 0
+        new_chunks = 0
+
+        with open(path, 'rb') as f:
+            chunk_iter = iter_chunks(f, page_size)
+            while True:
+                started = time.perf_counter()
+                data = next(chunk_iter, None)
+                if data is None:
+                    break
+                file_hash.update(data)
+                chunk_id = hashlib.sha256(data).hexdigest()
+                stats.add('chunk', len(data), time.perf_counter() - started)
+                size += len(data)
+                order.append(chunk_id)
+                if chunk_id in index:
+                    chunks[chunk_id] = index[chunk_id]
+                elif chunk_id not in chunks:
+                    chunks[chunk_id] = None  # パック保存後に所在が決まる
+                    writer.add(chunk_id, data)
+                    new_chunks += 1
+        writer.flush()
+        for chunk_id, location in writer.locations.items():
+            chunks[chunk_id] = location
+
+        manifest = {
+            'version': MANIFEST_VERSION,
+            'name': name,
+            'created_at': timezone.now().isoformat(),
+            'size': size,
+            'sha256': file_hash.hexdigest(),
+            'page_size': page_size,
+            'order': order,
+            'chunks': chunks,
+        }
+        started = time.perf_counter()
+        manifest_bytes = self._save_manifest(manifest)
+        stats.add('store', manifest_bytes, time.perf_counter() - started)
+        manifest['summary'] = {
+            'chunks': len(order),
+            'new_chunks': new_chunks,
+            'stored_bytes': writer.stored_bytes + manifest_bytes,
+        }
+        return manifest
+
+    # -- 復元 ------------------------------------------------------------------
+
+    def restore(self, name, fileobj):
+        """スナップショットを fileobj に書き出し、チャンクと全体のハッシュを検証する。
+
+        Raises:
+            BackupVerifyError: ハッシュ・サイズが一致しない
+        """
+        manifest = self.load_manifest(name)
+        file_hash = hashlib.sha256()
+        pack_name, pack_data = None, None
+        for chunk_id in manifest['order']:
+            key, offset, length, raw_length = manifest['chunks'][chunk_id]
+            if key != pack_name:
+                # 連続するチャンクは同じパックにあることが多いので1つだけ保持する
+                pack_name, pack_data = key, self.storage.read(key)
+            try:
+                data = zlib.decompress(pack_data[offset:offset + length])
+            except zlib.error as e:
+                raise BackupVerifyError(f'chunk {chunk_id[:12]} in {key} is corrupt: {e}') from e
+            if len(data) != raw_length or hashlib.sha256(data).hexdigest() != chunk_id:
+                raise BackupVerifyError(f'chunk {chunk_id[:12]} in {key} does not match its hash')
+            file_hash.update(data)
+            fileobj.write(data)
+        if file_hash.hexdigest() != manifest['sha256']:
+            raise BackupVerifyError(f'snapshot {name} does not match its sha256')
+        return manifest
+
+    # -- 保持・掃除 ------------------------------------------------------------
+
+    def delete_snapshot(self, name):
+        self.storage.delete(snapshot_key(name))
+
+    def gc(self):
+        """どのマニフェストからも参照されないパックを削除し、削除数を返す。"""
+        referenced = set()
+        for name in self.list_snapshots():
+            manifest = self.load_manifest(name)
+            referenced.update(location[0] for location in manifest['chunks'].values())
+        removed = 0
+        for key in self.storage.list(PACK_PREFIX):
+            if key not in referenced:
+                self.storage.delete(key)
+                removed += 1
+        return removed
+
+
+def sync(source, dest, stats=None, since=None):
+    """source にあって dest に無いスナップショットを、参照するパックと一緒にコピーする。
+
+    パック → マニフェストの順に送るので、途中で失敗しても次回は残りだけを送る。
+    since より古い名前のスナップショット（送り先の保持期間切れ）は送らない。
+    コピーしたオブジェクト数を返す。
+    """
+    stats = stats or StageStats()
+    existing = set(dest.list())
+    repo = Repository(source)
+    names = [
+        name for name in repo.list_snapshots()
+        if (since is None or name >= since) and snapshot_key(name) not in existing
+    ]
+    packs = set()
+    for name in names:
+        packs.update(location[0] for location in repo.load_manifest(name)['chunks'].values())
+
+    copied = 0
+    for key in sorted(packs - existing) + [snapshot_key(name) for name in names]:
+        data = source.read(key)
+        started = time.perf_counter()
+        dest.write(key, io.BytesIO(data), len(data))
+        stats.add('upload', len(data), time.perf_counter() - started)
+        copied += 1
+    return copied
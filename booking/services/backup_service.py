@@ -1,20 +1,42 @@
-"""SQLite backup service — atomic backup with optional S3 upload."""
+"""SQLite backup service — atomic snapshot, deduplicated chunk repository, optional S3 sync.
+
+1. sqlite3.backup() で一貫したスナップショットを一時ファイルに作る
+2. backup_repo でチャンク分割し、新しいチャンクだけを圧縮してローカルリポジトリに保存
+3. S3 有効時はローカルリポジトリに無いオブジェクトだけを S3 へ送る（中断しても次回続きから）
+4. 保持ポリシー（ローカルはスナップショット数、S3 は日数）を適用し、参照されないパックを削除
+
+段階ごとのスループットは BackupHistory.stats に記録する。
+"""
 import logging
 import os
 import sqlite3
 import time
+from datetime import timedelta
 from pathlib import Path
 
 from django.conf import settings
 from django.utils import timezone
 
+from . import backup_repo
+from .backup_storage import LocalStorage, S3Storage
+
 logger = logging.getLogger(__name__)
 
 BACKUP_DIR = Path(settings.BASE_DIR) / 'backups'
+REPO_DIR = BACKUP_DIR / 'repo'
+S3_PREFIX = 'backups/repo/'
+
+
+def local_repository():
+    return backup_repo.Repository(LocalStorage(REPO_DIR))
+
+
+def s3_repository(bucket):
+    return backup_repo.Repository(S3Storage(bucket, prefix=S3_PREFIX))
 
 
 def create_backup(trigger='manual'):
-    """SQLiteデータベースのアトミックバックアップを作成する。
+    """SQLiteデータベースのスナップショットを重複排除リポジトリに保存する。
 
     Returns:
         BackupHistory instance
@@ -30,42 +52,57 @@ def create_backup(trigger='manual'):
     )
 
     start_time = time.monotonic()
+    stats = backup_repo.StageStats()
+    timestamp = timezone.now().strftime('%Y%m%d_%H%M%S')
+    filename = f'newfuhi_backup_{timestamp}.sqlite3'
+    snapshot_path = BACKUP_DIR / f'.{filename}.tmp'
     try:
-        timestamp = timezone.now().strftime('%Y%m%d_%H%M%S')
-        filename = f'newfuhi_backup_{timestamp}.sqlite3'
-        backup_path = BACKUP_DIR / filename
-
         db_path = settings.DATABASES['default']['NAME']
-        _perform_sqlite_backup(db_path, str(backup_path))
+        started = time.perf_counter()
+        _perform_sqlite_backup(db_path, str(snapshot_path))
+        file_size = snapshot_path.stat().st_size
+        stats.add('snapshot', file_size, time.perf_counter() - started)
 
-        file_size = backup_path.stat().st_size
-        duration = time.monotonic() - start_time
+        repo = local_repository()
+        manifest = repo.create_snapshot(filename, snapshot_path, stats)
+        summary = manifest['summary']
 
-        history.backup_file = str(backup_path)
+        history.backup_file = filename
         history.file_size_bytes = file_size
-        history.duration_seconds = round(duration, 2)
         history.status = 'success'
-        history.completed_at = timezone.now()
 
-        # S3アップロード
+        # S3へ未送信分を同期
         if config.s3_enabled:
-            s3_key = _upload_to_s3(backup_path, config.s3_bucket, filename)
+            s3_key = _sync_to_s3(repo, config.s3_bucket, filename, config.s3_retention_days, stats)
             if s3_key:
                 history.s3_uploaded = True
                 history.s3_key = s3_key
 
-        history.save()
-
-        # ローカル保持ポリシー適用
+        # 保持ポリシー適用
+        _apply_repository_retention(repo, config.local_retention_count)
         _apply_local_retention(config.local_retention_count)
+        if history.s3_uploaded:
+            _apply_s3_retention(config.s3_bucket, config.s3_retention_days)
+
+        duration = time.monotonic() - start_time
+        history.duration_seconds = round(duration, 2)
+        history.stats = {
+            'stages': stats.as_dict(),
+            'chunks': summary['chunks'],
+            'new_chunks': summary['new_chunks'],
+            'stored_bytes': summary['stored_bytes'],
+        }
+        history.completed_at = timezone.now()
+        history.save()
 
         # LINE通知
         if config.line_notify_enabled:
             _send_backup_notification(history)
 
         logger.info(
-            'Backup completed: %s (%.1f KB, %.2fs)',
-            filename, file_size / 1024, duration,
+            'Backup completed: %s (%.1f KB, %d/%d new chunks, %.1f KB stored, %.2fs)',
+            filename, file_size / 1024, summary['new_chunks'], summary['chunks'],
+            summary['stored_bytes'] / 1024, duration,
         )
         return history
 
@@ -74,6 +111,7 @@ def create_backup(trigger='manual'):
         history.status = 'failed'
         history.error_message = str(e)[:2000]
         history.duration_seconds = round(duration, 2)
+        history.stats = {'stages': stats.as_dict()}
         history.completed_at = timezone.now()
         history.save()
 
@@ -85,6 +123,55 @@ def create_backup(trigger='manual'):
             _send_backup_failure_notification(history)
 
         return history
+    finally:
+        snapshot_path.unlink(missing_ok=True)
+
+
+def restore_backup(name, dest_path, source='local', bucket=None):
+    """スナップショットを dest_path に復元して検証する（dest_path は新規作成）。
+
+    チャンク・全体のハッシュが一致しない場合は BackupVerifyError。
+    SQLite ファイルなら PRAGMA integrity_check も行う。
+
+    Returns:
+        manifest dict
+    """
+    if source == 's3':
+        from booking.models import BackupConfig
+        repo = s3_repository(bucket or BackupConfig.load().s3_bucket)
+    else:
+        repo = local_repository()
+    if name == 'latest':
+        snapshots = repo.list_snapshots()
+        if not snapshots:
+            raise FileNotFoundError('no backup snapshots')
+        name = snapshots[-1]
+
+    dest_path = Path(dest_path)
+    partial = dest_path.with_name(dest_path.name + '.part')
+    try:
+        with open(partial, 'wb') as f:
+            manifest = repo.restore(name, f)
+            f.flush()
+            os.fsync(f.fileno())
+        _verify_sqlite(partial)
+        os.replace(partial, dest_path)
+    finally:
+        partial.unlink(missing_ok=True)
+    return manifest
+
+
+def _verify_sqlite(path):
+    with open(path, 'rb') as f:
+        if not f.read(16).startswith(backup_repo.SQLITE_MAGIC):
+            return
+    conn = sqlite3.connect(f'file:{path}?mode=ro', uri=True)
+    try:
+        result = conn.execute('PRAGMA integrity_check').fetchone()[0]
+    finally:
+        conn.close()
+    if result != 'ok':
+        raise backup_repo.BackupVerifyError(f'integrity_check failed: {result}')
 
 
 def _perform_sqlite_backup(source_path, dest_path):
@@ -98,14 +185,21 @@ def _perform_sqlite_backup(source_path, dest_path):
         source_conn.close()
 
 
-def _upload_to_s3(backup_path, bucket, filename):
-    """S3にバックアップファイルをアップロード。boto3が無い場合はスキップ。"""
+def _s3_cutoff(retention_days):
+    """S3 の保持期間の境界（これより古い名前のスナップショットは S3 に置かない）"""
+    return (timezone.now() - timedelta(days=retention_days)).strftime('newfuhi_backup_%Y%m%d_%H%M%S')
+
+
+def _sync_to_s3(repo, bucket, filename, retention_days, stats):
+    """ローカルリポジトリの未送信スナップショットを S3 へ送る。boto3が無い場合はスキップ。
+
+    ローカルは個数、S3 は日数で保持するため、S3 の保持期間を過ぎたものは送り直さない。
+    """
     try:
-        import boto3
-        s3_key = f'backups/{filename}'
-        s3 = boto3.client('s3')
-        s3.upload_file(str(backup_path), bucket, s3_key)
-        logger.info('Uploaded to S3: s3://%s/%s', bucket, s3_key)
+        remote = s3_repository(bucket)
+        copied = backup_repo.sync(repo.storage, remote.storage, stats, since=_s3_cutoff(retention_days))
+        s3_key = S3_PREFIX + backup_repo.snapshot_key(filename)
+        logger.info('Synced to S3: s3://%s/%s (%d objects)', bucket, s3_key, copied)
         return s3_key
     except ImportError:
         logger.warning('boto3 not installed — S3 upload skipped')
@@ -115,8 +209,37 @@ def _upload_to_s3(backup_path, bucket, filename):
         return ''
 
 
+def _apply_repository_retention(repo, max_count):
+    """ローカルリポジトリのスナップショットを新しい順に max_count 個残し、不要なパックを削除。"""
+    try:
+        snapshots = repo.list_snapshots()
+        for name in snapshots[:-max_count] if max_count > 0 else []:
+            repo.delete_snapshot(name)
+            logger.info('Deleted old backup snapshot: %s', name)
+        removed = repo.gc()
+        if removed:
+            logger.info('Removed %d unreferenced backup packs', removed)
+    except Exception as e:
+        logger.warning('Backup retention failed: %s', e)
+
+
+def _apply_s3_retention(bucket, retention_days):
+    """S3上で retention_days より古いスナップショットを削除し、不要なパックを削除。"""
+    try:
+        remote = s3_repository(bucket)
+        cutoff = _s3_cutoff(retention_days)
+        snapshots = remote.list_snapshots()
+        # 最新のスナップショットは常に残す
+        for name in snapshots[:-1]:
+            if name < cutoff:
+                remote.delete_snapshot(name)
+        remote.gc()
+    except Exception as e:
+        logger.warning('S3 retention failed: %s', e)
+
+
 def _apply_local_retention(max_count):
-    """ローカルバックアップの保持数制限を適用。古いファイルから削除。"""
+    """リポジトリ導入前のフルコピー（newfuhi_backup_*.sqlite3）の保持数制限を適用。古いファイルから削除。"""
     if not BACKUP_DIR.exists():
         return
 
@@ -143,6 +266,11 @@ def _send_backup_notification(history):
             f'[バックアップ完了] {history.backup_file}\n'
             f'サイズ: {size_kb:.1f} KB / 所要時間: {history.duration_seconds:.1f}秒'
         )
+        if history.stats.get('chunks'):
+            msg += (
+                f'\n保存: {history.stats["stored_bytes"] / 1024:.1f} KB'
+                f'（新規チャンク {history.stats["new_chunks"]}/{history.stats["chunks"]}）'
+            )
         if history.s3_uploaded:
             msg += f'\nS3: {history.s3_key}'
         send_line_notify(msg)
@@ -0,0 +1,185 @@
+"""バックアップリポジトリの保存先（差し替え可能なストレージバックエンド）
+
+キーは 'packs/ab/<sha256>.pack' や 'snapshots/<name>.json.gz' のような相対パス。
+パックは内容ハッシュをキーにするので、同じキーへの書き込みは常に同じ内容になり、
+中断したアップロードを途中から再開してよい。
+
+- LocalStorage: ディレクトリに保存（開発・テスト用の代替、ローカルのリポジトリ本体）。
+  書き込み途中は '<key>.part' に追記し、完了後に rename する
+- S3Storage: PART_SIZE を超えるオブジェクトはマルチパートアップロード。
+  同じキーの未完了アップロードがあれば、アップロード済みのパートを飛ばして再開する
+"""
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+COPY_BUFFER = 1024 * 1024
+PART_SIZE = 8 * 1024 * 1024  # S3 の最小パートサイズは 5MB
+
+
+class BackupStorage:
+    """ストレージバックエンドのインターフェース"""
+
+    def exists(self, key):
+        raise NotImplementedError
+
+    def list(self, prefix=''):
+        """prefix で始まるキーの一覧"""
+        raise NotImplementedError
+
+    def read(self, key):
+        raise NotImplementedError
+
+    def write(self, key, fileobj, size):
+        """fileobj（seek 可能）の先頭から size バイトを key に保存する"""
+        raise NotImplementedError
+
+    def delete(self, key):
+        raise NotImplementedError
+
+
+class LocalStorage(BackupStorage):
+    def __init__(self, root):
+        self.root = os.fspath(root)
+
+    def __repr__(self):
+        return f'LocalStorage({self.root!r})'
+
+    def _path(self, key):
+        path = os.path.normpath(os.path.join(self.root, key))
+        if not path.startswith(os.path.normpath(self.root) + os.sep):
+            raise ValueError(f'invalid key: {key}')
+        return path
+
+    def exists(self, key):
+        return os.path.isfile(self._path(key))
+
+    def list(self, prefix=''):
+        keys = []
+        for dirpath, _dirs, files in os.walk(self.root):
+            for name in files:
+                if name.endswith('.part'):
+                    continue
+                key = os.path.relpath(os.path.join(dirpath, name), self.root).replace(os.sep, '/')
+                if key.startswith(prefix):
+                    keys.append(key)
+        return sorted(keys)
+
+    def read(self, key):
+        with open(self._path(key), 'rb') as f:
+            return f.read()
+
+    def write(self, key, fileobj, size):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        partial = path + '.part'
+        # 前回中断した分は書き込み済みなので続きから
+        done = os.path.getsize(partial) if os.path.exists(partial) else 0
+        if done > size:
+            done = 0
+        fileobj.seek(done)
+        with open(partial, 'ab' if done else 'wb') as out:
+            remaining = size - done
+            while remaining > 0:
+                data = fileobj.read(min(COPY_BUFFER, remaining))
+                if not data:
+                    raise IOError(f'unexpected end of data writing {key}')
+                out.write(data)
+                remaining -= len(data)
+            out.flush()
+            os.fsync(out.fileno())
+        os.replace(partial, path)
+
+    def delete(self, key):
+        try:
+            os.unlink(self._path(key))
+        except FileNotFoundError:
+            pass
+
+
+def _error_code(exc):
+    return getattr(exc, 'response', {}).get('Error', {}).get('Code', '')
+
+
+class S3Storage(BackupStorage):
+    def __init__(self, bucket, prefix='backups/repo/', client=None, part_size=PART_SIZE):
+        self.bucket = bucket
+        self.prefix = prefix
+        self.part_size = part_size
+        if client is None:
+            import boto3
+            client = boto3.client('s3')
+        self.client = client
+
+    def __repr__(self):
+        return f'S3Storage(s3://{self.bucket}/{self.prefix})'
+
+    def _key(self, key):
+        return self.prefix + key
+
+    def exists(self, key):
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=self._key(key))
+            return True
+        except Exception as e:
+            if _error_code(e) in ('404', 'NoSuchKey', 'NotFound'):
+                return False
+            raise
+
+    def list(self, prefix=''):
+        keys = []
+        kwargs = {'Bucket': self.bucket, 'Prefix': self._key(prefix)}
+        while True:
+            resp = self.client.list_objects_v2(**kwargs)
+            keys.extend(obj['Key'][len(self.prefix):] for obj in resp.get('Contents', []))
+            if not resp.get('IsTruncated'):
+                return sorted(keys)
+            kwargs['ContinuationToken'] = resp['NextContinuationToken']
+
+    def read(self, key):
+        return self.client.get_object(Bucket=self.bucket, Key=self._key(key))['Body'].read()
+
+    def delete(self, key):
+        self.client.delete_object(Bucket=self.bucket, Key=self._key(key))
+
+    def write(self, key, fileobj, size):
+        full_key = self._key(key)
+        if size <= self.part_size:
+            fileobj.seek(0)
+            self.client.put_object(Bucket=self.bucket, Key=full_key, Body=fileobj.read(size))
+            return
+
+        upload_id, uploaded = self._pending_upload(full_key)
+        if upload_id is None:
+            upload_id = self.client.create_multipart_upload(Bucket=self.bucket, Key=full_key)['UploadId']
+        parts = []
+        for number, offset in enumerate(range(0, size, self.part_size), start=1):
+            length = min(self.part_size, size - offset)
+            done = uploaded.get(number)
+            if done and done['Size'] == length:
+                etag = done['ETag']
+            else:
+                fileobj.seek(offset)
+                etag = self.client.upload_part(
+                    Bucket=self.bucket, Key=full_key, UploadId=upload_id,
+                    PartNumber=number, Body=fileobj.read(length),
+                )['ETag']
+            parts.append({'PartNumber': number, 'ETag': etag})
+        self.client.complete_multipart_upload(
+            Bucket=self.bucket, Key=full_key, UploadId=upload_id,
+            MultipartUpload={'Parts': parts},
+        )
+
+    def _pending_upload(self, full_key):
+        """同じキーの未完了マルチパートアップロード（upload_id, {part_number: part}）"""
+        resp = self.client.list_multipart_uploads(Bucket=self.bucket, Prefix=full_key)
+        for upload in resp.get('Uploads', []):
+            if upload['Key'] != full_key:
+                continue
+            upload_id = upload['UploadId']
+            parts = self.client.list_parts(Bucket=self.bucket, Key=full_key, UploadId=upload_id)
+            uploaded = {p['PartNumber']: p for p in parts.get('Parts', [])}
+            logger.info('Resuming multipart upload of %s (%d parts done)', full_key, len(uploaded))
+            return upload_id, uploaded
+        return None, {}
@@ -7,69 +7,100 @@ Detects anomalies and opportunities from store data:
 - Staffing imbalances
 - Menu performance shifts
 - Customer retention drops
+
+Each InsightRule declares the aggregate it needs. The engine runs that
+aggregate once for all target stores (one grouped query per rule), evaluates
+the rules in memory, skips findings that already have an open (unread)
+insight, and bulk-creates the rest.
 """
 import logging
-from collections import defaultdict
-from datetime import timedelta
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import Callable, Optional
 
-from django.db.models import Avg, Count, Sum, F
-from django.db.models.functions import TruncDate
+from django.db.models import Count, F, IntegerField, OuterRef, Q, Subquery, Sum
+from django.db.models.functions import Coalesce
 from django.utils import timezone
 
 from booking.models import (
-    BusinessInsight, Order, OrderItem, Product, Store,
+    BusinessInsight, OrderItem, Product, Store,
     ShiftAssignment, Schedule,
 )
 
 logger = logging.getLogger(__name__)
 
+# BusinessInsight.data に保存する重複判定キー
+INSIGHT_KEY_FIELD = 'insight_key'
+LOW_STOCK_LIMIT = 10
 
-def generate_insights(store=None):
-    """Generate insights for a store (or all stores if None).
 
-    Returns list of created BusinessInsight instances.
+@dataclass(frozen=True)
+class InsightFinding:
+    """ルールが検出した1件。key が同じ未読インサイトがあれば作成しない。"""
+    key: str
+    severity: str
+    title: str
+    message: str
+    data: dict = field(default_factory=dict)
+
+
+@dataclass(frozen=True)
+class InsightRule:
+    """インサイト判定ルール。
+
+    aggregate(store_ids, now) は全対象店舗分を1回のクエリで集計し {store_id: 集計値} を返す
+    （store_ids が None なら全店舗）。evaluate(集計値, now) は DB にアクセスせず
+    InsightFinding のリストを返す。
     """
-    stores = [store] if store else Store.objects.all()
-    created = []
-    for s in stores:
-        created.extend(_check_sales_drop(s))
-        created.extend(_check_low_stock(s))
-        created.extend(_check_staffing(s))
-        created.extend(_check_reservation_cancellations(s))
-    return created
+    name: str
+    category: str
+    aggregate: Callable[[Optional[list], datetime], dict]
+    evaluate: Callable[[object, datetime], list]
 
 
-def _check_sales_drop(store):
-    """Detect if recent sales are significantly below rolling average."""
-    now = timezone.now()
-    recent_end = now
+def _scoped(queryset, store_field, store_ids):
+    if store_ids is None:
+        return queryset.filter(**{f'{store_field}__isnull': False})
+    return queryset.filter(**{f'{store_field}__in': store_ids})
+
+
+# ---------------------------------------------------------------------------
+# Sales drop
+# ---------------------------------------------------------------------------
+
+def _aggregate_sales(store_ids, now):
     recent_start = now - timedelta(days=7)
     baseline_start = now - timedelta(days=37)
-    baseline_end = now - timedelta(days=7)
-
-    scope = {'order__store': store}
+    revenue = F('qty') * F('unit_price')
+    rows = (
+        _scoped(OrderItem.objects, 'order__store_id', store_ids)
+        .filter(order__created_at__gte=baseline_start, order__created_at__lt=now)
+        .values('order__store_id')
+        .annotate(
+            recent=Sum(revenue, filter=Q(order__created_at__gte=recent_start)),
+            baseline=Sum(revenue, filter=Q(order__created_at__lt=recent_start)),
+        )
+        .order_by()
+    )
+    return {
+        row['order__store_id']: (row['recent'] or 0, row['baseline'] or 0)
+        for row in rows
+    }
 
-    recent_rev = (
-        OrderItem.objects
-        .filter(order__created_at__gte=recent_start, order__created_at__lt=recent_end, **scope)
-        .aggregate(total=Sum(F('qty') * F('unit_price')))
-    )['total'] or 0
 
-    baseline_rev = (
-        OrderItem.objects
-        .filter(order__created_at__gte=baseline_start, order__created_at__lt=baseline_end, **scope)
-        .aggregate(total=Sum(F('qty') * F('unit_price')))
-    )['total'] or 0
+def _evaluate_sales_drop(revenue, now):
+    """Detect if recent sales are significantly below rolling average."""
+    recent_rev, baseline_rev = revenue
 
     # Normalize to weekly
     baseline_weekly = baseline_rev / 4.0 if baseline_rev > 0 else 0
 
     if baseline_weekly > 0 and recent_rev < baseline_weekly * 0.8:
         drop_pct = round((1 - recent_rev / baseline_weekly) * 100, 1)
-        insight = BusinessInsight.objects.create(
-            store=store,
-            category='sales',
-            severity='warning' if drop_pct < 30 else 'critical',
+        severity = 'warning' if drop_pct < 30 else 'critical'
+        return [InsightFinding(
+            key=f'sales_drop:{severity}',
+            severity=severity,
             title=f'売上が前月比 {drop_pct}% 減少',
             message=f'直近7日間の売上（{recent_rev:,}円）が過去30日平均（週{int(baseline_weekly):,}円）を{drop_pct}%下回っています。',
             data={
@@ -77,70 +108,89 @@ def _check_sales_drop(store):
                 'baseline_weekly': round(baseline_weekly),
                 'drop_pct': drop_pct,
             },
-        )
-        return [insight]
+        )]
     return []
 
 
-def _check_low_stock(store):
+# ---------------------------------------------------------------------------
+# Low stock
+# ---------------------------------------------------------------------------
+
+def _aggregate_low_stock(store_ids, now):
+    rows = (
+        _scoped(Product.objects, 'store_id', store_ids)
+        .filter(is_active=True, stock__lte=F('low_stock_threshold'))
+        .order_by('store_id', 'stock')
+        .values('store_id', 'id', 'name', 'stock', 'low_stock_threshold')
+    )
+    items = {}
+    for row in rows:
+        per_store = items.setdefault(row['store_id'], [])
+        if len(per_store) < LOW_STOCK_LIMIT:
+            per_store.append(row)
+    return items
+
+
+def _evaluate_low_stock(items, now):
     """Detect A-rank items with dangerously low stock."""
-    low_items = Product.objects.filter(
-        store=store,
-        is_active=True,
-        stock__lte=F('low_stock_threshold'),
-    ).order_by('stock')[:10]
-
-    insights = []
-    for item in low_items:
-        if item.stock <= 0:
+    findings = []
+    for item in items:
+        if item['stock'] <= 0:
             severity = 'critical'
-            title = f'在庫切れ: {item.name}'
+            title = f'在庫切れ: {item["name"]}'
         else:
             severity = 'warning'
-            title = f'在庫低下: {item.name} (残{item.stock})'
+            title = f'在庫低下: {item["name"]} (残{item["stock"]})'
 
-        insight = BusinessInsight.objects.create(
-            store=store,
-            category='inventory',
+        findings.append(InsightFinding(
+            key=f'low_stock:{item["id"]}:{severity}',
             severity=severity,
             title=title,
-            message=f'{item.name}の在庫が閾値({item.low_stock_threshold})を下回っています。残り{item.stock}個。',
+            message=f'{item["name"]}の在庫が閾値({item["low_stock_threshold"]})を下回っています。残り{item["stock"]}個。',
             data={
-                'product_id': item.id,
-                'product_name': item.name,
-                'stock': item.stock,
-                'threshold': item.low_stock_threshold,
+                'product_id': item['id'],
+                'product_name': item['name'],
+                'stock': item['stock'],
+                'threshold': item['low_stock_threshold'],
             },
-        )
-        insights.append(insight)
-    return insights
+        ))
+    return findings
 
 
-def _check_staffing(store):
-    """Detect potential understaffing based on reservations vs assignments."""
-    now = timezone.now()
-    next_week = now + timedelta(days=7)
+# ---------------------------------------------------------------------------
+# Staffing
+# ---------------------------------------------------------------------------
+
+def _count_subquery(queryset, store_field):
+    counts = (
+        queryset.filter(**{store_field: OuterRef('pk')})
+        .values(store_field).annotate(n=Count('pk')).values('n')
+    )
+    return Coalesce(Subquery(counts, output_field=IntegerField()), 0)
 
-    reservation_count = Schedule.objects.filter(
-        staff__store=store,
-        start__gte=now,
-        start__lt=next_week,
-        is_cancelled=False,
-        is_temporary=False,
-    ).count()
 
-    shift_count = ShiftAssignment.objects.filter(
-        period__store=store,
-        date__gte=now.date(),
-        date__lt=next_week.date(),
-    ).count()
+def _aggregate_staffing(store_ids, now):
+    next_week = now + timedelta(days=7)
+    reservations = Schedule.objects.filter(
+        start__gte=now, start__lt=next_week, is_cancelled=False, is_temporary=False,
+    )
+    shifts = ShiftAssignment.objects.filter(date__gte=now.date(), date__lt=next_week.date())
+    stores = Store.objects.all() if store_ids is None else Store.objects.filter(pk__in=store_ids)
+    rows = stores.annotate(
+        reservations=_count_subquery(reservations, 'staff__store'),
+        shifts=_count_subquery(shifts, 'period__store'),
+    ).values_list('pk', 'reservations', 'shifts')
+    return {pk: (reservation_count, shift_count) for pk, reservation_count, shift_count in rows}
+
 
+def _evaluate_staffing(counts, now):
+    """Detect potential understaffing based on reservations vs assignments."""
+    reservation_count, shift_count = counts
     if reservation_count > 0 and shift_count > 0:
         ratio = reservation_count / shift_count
         if ratio > 5:
-            insight = BusinessInsight.objects.create(
-                store=store,
-                category='staffing',
+            return [InsightFinding(
+                key='understaffed',
                 severity='warning',
                 title='来週の予約に対してスタッフ不足の可能性',
                 message=f'来週の予約{reservation_count}件に対してシフト{shift_count}枠。1シフトあたり{ratio:.1f}件の予約があります。',
@@ -149,29 +199,34 @@ def _check_staffing(store):
                     'shifts': shift_count,
                     'ratio': round(ratio, 1),
                 },
-            )
-            return [insight]
+            )]
     return []
 
 
-def _check_reservation_cancellations(store):
-    """Detect high cancellation rate."""
-    now = timezone.now()
+# ---------------------------------------------------------------------------
+# Reservation cancellations
+# ---------------------------------------------------------------------------
+
+def _aggregate_cancellations(store_ids, now):
     since = now - timedelta(days=14)
+    rows = (
+        _scoped(Schedule.objects, 'staff__store_id', store_ids)
+        .filter(start__gte=since)
+        .values('staff__store_id')
+        .annotate(total=Count('pk'), cancelled=Count('pk', filter=Q(is_cancelled=True)))
+        .order_by()
+    )
+    return {row['staff__store_id']: (row['total'], row['cancelled']) for row in rows}
 
-    total = Schedule.objects.filter(
-        staff__store=store, start__gte=since,
-    ).count()
-    cancelled = Schedule.objects.filter(
-        staff__store=store, start__gte=since, is_cancelled=True,
-    ).count()
 
+def _evaluate_cancellations(counts, now):
+    """Detect high cancellation rate."""
+    total, cancelled = counts
     if total >= 10:
         rate = cancelled / total
         if rate > 0.2:
-            insight = BusinessInsight.objects.create(
-                store=store,
-                category='customer',
+            return [InsightFinding(
+                key='cancellation_rate',
                 severity='warning',
                 title=f'キャンセル率が{round(rate*100)}%に上昇',
                 message=f'直近14日間で{total}件中{cancelled}件がキャンセル（{round(rate*100)}%）。',
@@ -180,6 +235,74 @@ def _check_reservation_cancellations(store):
                     'cancelled': cancelled,
                     'rate': round(rate, 4),
                 },
-            )
-            return [insight]
+            )]
     return []
+
+
+DEFAULT_INSIGHT_RULES = (
+    InsightRule('sales_drop', 'sales', _aggregate_sales, _evaluate_sales_drop),
+    InsightRule('low_stock', 'inventory', _aggregate_low_stock, _evaluate_low_stock),
+    InsightRule('staffing', 'staffing', _aggregate_staffing, _evaluate_staffing),
+    InsightRule('cancellations', 'customer', _aggregate_cancellations, _evaluate_cancellations),
+)
+
+
+# ---------------------------------------------------------------------------
+# Engine
+# ---------------------------------------------------------------------------
+
+def _open_insight_keys(store_ids):
+    """未読インサイトの (store_id, category, key) 集合。"""
+    rows = _scoped(BusinessInsight.objects, 'store_id', store_ids).filter(is_read=False)
+    return {
+        (store_id, category, key)
+        for store_id, category, key in rows.values_list(
+            'store_id', 'category', f'data__{INSIGHT_KEY_FIELD}',
+        )
+        if key
+    }
+
+
+def generate_insights(store=None, rules=None, now=None):
+    """Generate insights for a store (or all stores if None).
+
+    Args:
+        store: Store instance (None for all stores)
+        rules: InsightRule sequence (defaults to DEFAULT_INSIGHT_RULES)
+        now: evaluation time (defaults to timezone.now())
+
+    Returns list of created BusinessInsight instances.
+    """
+    rules = DEFAULT_INSIGHT_RULES if rules is None else rules
+    now = now or timezone.now()
+    store_ids = [store.pk] if store else None
+
+    open_keys = _open_insight_keys(store_ids)
+    new_insights = []
+    for rule in rules:
+        try:
+            aggregates = rule.aggregate(store_ids, now)
+        except Exception:
+            logger.exception('Insight rule %s failed to aggregate', rule.name)
+            continue
+        for store_id, value in aggregates.items():
+            for finding in rule.evaluate(value, now):
+                dedup_key = (store_id, rule.category, finding.key)
+                if dedup_key in open_keys:
+                    continue
+                open_keys.add(dedup_key)
+                new_insights.append(BusinessInsight(
+                    store_id=store_id,
+                    category=rule.category,
+                    severity=finding.severity,
+                    title=finding.title,
+                    message=finding.message,
+                    data={**finding.data, INSIGHT_KEY_FIELD: finding.key},
+                ))
+
+    created = BusinessInsight.objects.bulk_create(new_insights)
+    logger.info(
+        'Generated %d insights (%s, %d rules)',
+        len(created), f'store={store.pk}' if store else 'all stores', len(rules),
+    )
+    return created
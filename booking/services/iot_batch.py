@@ -0,0 +1,100 @@
+"""IoT バッチ送信エンベロープのデコード
+
+ファームウェア（MB_IoT_device_main/uplink.py）は溜まった計測値を1リクエストにまとめて送る:
+
+    Content-Type: application/x-iot-batch
+    X-Batch-Encoding: zlib            （圧縮時のみ）
+
+    {"v": 1, "device": "PICO001", "event_type": "sensor",
+     "fields": ["mq9", "light", ...], "scale": 100, "t0": 1700000000,
+     "rows": [[dt, d_mq9, d_light, ...], ...]}
+
+- dt は直前の行からの秒差（先頭行は t0 からの差）
+- 各値は scale 倍して整数化し、同じ列の直前の非 null 値との差分（初回は 0 との差）
+- null は欠測（差分の基準は変えない）
+"""
+import json
+import zlib
+
+BATCH_CONTENT_TYPE = 'application/x-iot-batch'
+BATCH_ENCODING_HEADER = 'X-Batch-Encoding'
+BATCH_VERSION = 1
+MAX_BATCH_ROWS = 500
+MAX_BATCH_BYTES = 256 * 1024
+
+
+class BatchDecodeError(ValueError):
+    """エンベロープが壊れている・上限を超えている"""
+
+
+def _inflate(body):
+    inflater = zlib.decompressobj()
+    try:
+        raw = inflater.decompress(body, MAX_BATCH_BYTES + 1)
+    except zlib.error as e:
+        raise BatchDecodeError(f'zlib: {e}')
+    if len(raw) > MAX_BATCH_BYTES or inflater.unconsumed_tail:
+        raise BatchDecodeError('batch too large')
+    return raw
+
+
+def _is_int(value):
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+def decode_batch(body, encoding=None):
+    """エンベロープをデコードする。
+
+    Returns:
+        dict: device, event_type, readings（ts と各 field を持つ dict のリスト、送信順）
+    """
+    if encoding:
+        if encoding.lower() != 'zlib':
+            raise BatchDecodeError(f'unsupported encoding: {encoding}')
+        body = _inflate(body)
+    elif len(body) > MAX_BATCH_BYTES:
+        raise BatchDecodeError('batch too large')
+
+    try:
+        envelope = json.loads(body)
+    except (ValueError, UnicodeDecodeError) as e:
+        raise BatchDecodeError(f'invalid json: {e}')
+    if not isinstance(envelope, dict) or envelope.get('v') != BATCH_VERSION:
+        raise BatchDecodeError('unsupported envelope version')
+
+    fields = envelope.get('fields')
+    rows = envelope.get('rows')
+    scale = envelope.get('scale', 1)
+    t0 = envelope.get('t0', 0)
+    if not isinstance(fields, list) or not all(isinstance(f, str) for f in fields):
+        raise BatchDecodeError('fields must be a list of names')
+    if not isinstance(rows, list):
+        raise BatchDecodeError('rows must be a list')
+    if len(rows) > MAX_BATCH_ROWS:
+        raise BatchDecodeError(f'too many rows (max {MAX_BATCH_ROWS})')
+    if not _is_int(scale) or scale <= 0 or not _is_int(t0):
+        raise BatchDecodeError('scale and t0 must be integers')
+
+    ts = t0
+    last = [0] * len(fields)
+    readings = []
+    for row in rows:
+        if not isinstance(row, list) or len(row) != len(fields) + 1 or not _is_int(row[0]):
+            raise BatchDecodeError('malformed row')
+        ts += row[0]
+        reading = {'ts': ts}
+        for i, delta in enumerate(row[1:]):
+            if delta is None:
+                reading[fields[i]] = None
+                continue
+            if not _is_int(delta):
+                raise BatchDecodeError('values must be integer deltas')
+            last[i] += delta
+            reading[fields[i]] = last[i] / scale
+        readings.append(reading)
+
+    return {
+        'device': envelope.get('device'),
+        'event_type': envelope.get('event_type', 'sensor'),
+        'readings': readings,
+    }
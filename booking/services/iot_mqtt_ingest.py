@@ -0,0 +1,209 @@
+"""MQTT 経由の IoT イベント取り込み（ingest_iot_mqtt コマンドの本体）
+
+ファームウェア（MB_IoT_device_main/main_aws_mqtt.py）が publish する署名付きセンサー値を受け取る:
+
+    topic:   devices/<DEVICE_ID>/sensors          （config.TOPIC_SENSOR）
+    payload: {"body": "<計測値の JSON 文字列>", "sig": "<body の HMAC-SHA256（16進）>"}
+    body:    {"device": "<DEVICE_ID>", "mq9": 1.2, "light": 300, "sound": 40, "pir": 1,
+              "temp": 22.5, "hum": 41.0, "ts": 1700000000}
+
+- 認証は端末ごとの HMAC（MB_IoT_device_main/signing.py）。鍵は API キーの SHA-256
+  （= IoTDevice.api_key_hash）で、API キー自体は MQTT に載せない。トピック上の DEVICE_ID を
+  IoTDevice.external_id として引き、その端末の api_key_hash で署名を検証する
+- 再送（リプレイ）対策として、端末ごとに前回受理した ts 以下のメッセージを捨てる。
+  端末時計が設定済み（ts が CLOCK_SET_AFTER 以降）なら MAX_MESSAGE_AGE 秒より古いものも捨てる
+- external_id → IoTDevice の解決結果は DEVICE_CACHE_TTL 秒キャッシュする
+- HTTP 送信（config.DJANGO_EVENTS_URL）も有効な端末は同じ値が二重に保存されるため、
+  MQTT 取り込みを使う端末では DJANGO_EVENTS_URL を空にする
+- 値の正規化・検証は views_iot_api._event_fields（_normalize_payload / _validate_sensor_value）
+- 受信メッセージは (端末, event_type) ごとに溜め、batch_size 件か flush_interval 秒で
+  save_event_batch により一括保存する（換気ルール・アラートはバッチごとに1回）
+
+クライアントは paho-mqtt 互換（on_connect / on_message / subscribe / loop）なら何でもよく、
+テストではプロセス内のブローカー代替を渡す。
+"""
+import hashlib
+import hmac
+import json
+import logging
+import time
+from collections import defaultdict
+
+from django.db import close_old_connections, connection
+
+from booking.models import IoTDevice
+from booking.views_iot_api import BATCH_EVENT_TYPES, save_event_batch
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TOPIC = 'devices/+/sensors'
+DEFAULT_BATCH_SIZE = 200
+DEFAULT_FLUSH_INTERVAL = 2.0
+DEVICE_CACHE_TTL = 60
+MAX_MESSAGE_BYTES = 16 * 1024
+MAX_MESSAGE_AGE = 10 * 60
+MAX_CLOCK_SKEW = 5 * 60
+CLOCK_SET_AFTER = 1600000000  # これより前の ts は端末時計が未設定（MB_IoT_device_main/django_api.py と同じ目安）
+RECONNECT_DELAY = 5
+
+
+def verify_signature(device, body, sig):
+    """body の HMAC-SHA256 を端末の api_key_hash を鍵として検証する。"""
+    if not device.api_key_hash or not isinstance(sig, str):
+        return False
+    expected = hmac.new(device.api_key_hash.encode(), body.encode('utf-8'), hashlib.sha256).hexdigest()
+    return hmac.compare_digest(expected, sig)
+
+
+def device_id_from_topic(topic):
+    """devices/<external_id>/sensors → external_id（形式が違えば None）。"""
+    parts = topic.split('/')
+    if len(parts) == 3 and parts[0] == 'devices' and parts[2] == 'sensors' and parts[1]:
+        return parts[1]
+    return None
+
+
+class IoTIngestBridge:
+    """MQTT メッセージを検証してマイクロバッチで IoTEvent に保存する。"""
+
+    def __init__(self, batch_size=DEFAULT_BATCH_SIZE, flush_interval=DEFAULT_FLUSH_INTERVAL, clock=None):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.clock = clock or time.monotonic
+        self.pending = defaultdict(list)  # (device_pk, event_type) -> [reading]
+        self.pending_count = 0
+        self.oldest = None
+        self.devices = {}
+        self._device_cache = {}  # external_id -> (device_pk or None, expires)
+        self._last_ts = {}  # device_pk -> 最後に受理した ts
+        self.stats = {'received': 0, 'stored': 0, 'rejected': 0, 'batches': 0}
+
+    # -- 受信 -----------------------------------------------------------------
+
+    def _device(self, external_id):
+        now = self.clock()
+        cached = self._device_cache.get(external_id)
+        if cached and cached[1] > now:
+            return self.devices.get(cached[0]) if cached[0] else None
+        device = IoTDevice.objects.filter(external_id=external_id).first()
+        if device:
+            self.devices[device.pk] = device
+        self._device_cache[external_id] = (device.pk if device else None, now + DEVICE_CACHE_TTL)
+        return device
+
+    def _reject(self, topic, reason):
+        self.stats['rejected'] += 1
+        logger.warning('MQTT ingest rejected message on %s: %s', topic, reason)
+        return False
+
+    def handle_message(self, topic, payload):
+        """1メッセージを検証してバッチに積む。受理したら True。"""
+        self.stats['received'] += 1
+        if len(payload) > MAX_MESSAGE_BYTES:
+            return self._reject(topic, 'message too large')
+        try:
+            envelope = json.loads(payload)
+        except (ValueError, UnicodeDecodeError):
+            return self._reject(topic, 'invalid json')
+        if not isinstance(envelope, dict) or not isinstance(envelope.get('body'), str):
+            return self._reject(topic, 'signed envelope is required')
+
+        external_id = device_id_from_topic(topic)
+        if external_id is None:
+            return self._reject(topic, 'unexpected topic')
+        device = self._device(external_id)
+        if device is None:
+            return self._reject(topic, 'device not found')
+        if not verify_signature(device, envelope['body'], envelope.get('sig')):
+            return self._reject(topic, 'invalid signature')
+
+        try:
+            data = json.loads(envelope['body'])
+        except ValueError:
+            return self._reject(topic, 'invalid json')
+        if not isinstance(data, dict):
+            return self._reject(topic, 'payload must be an object')
+        if data.get('device') not in (None, external_id):
+            return self._reject(topic, 'device does not match topic')
+        event_type = data.get('event_type', 'sensor')
+        if event_type not in BATCH_EVENT_TYPES:
+            return self._reject(topic, f'unsupported event_type {event_type!r}')
+        ts = data.get('ts')
+        if not isinstance(ts, (int, float)) or isinstance(ts, bool):
+            return self._reject(topic, 'ts is required')
+        if ts <= self._last_ts.get(device.pk, float('-inf')):
+            return self._reject(topic, 'replayed message')
+        if ts >= CLOCK_SET_AFTER and not -MAX_CLOCK_SKEW <= time.time() - ts <= MAX_MESSAGE_AGE:
+            return self._reject(topic, 'stale message')
+        self._last_ts[device.pk] = ts
+
+        reading = {k: v for k, v in data.items() if k not in ('device', 'event_type')}
+        self.pending[(device.pk, event_type)].append(reading)
+        self.pending_count += 1
+        if self.oldest is None:
+            self.oldest = self.clock()
+        if self.pending_count >= self.batch_size:
+            self.flush()
+        return True
+
+    def on_message(self, client, userdata, message):
+        """paho-mqtt の on_message コールバック。"""
+        self.handle_message(message.topic, message.payload)
+
+    # -- 保存 -----------------------------------------------------------------
+
+    def due(self):
+        return self.oldest is not None and self.clock() - self.oldest >= self.flush_interval
+
+    def flush(self):
+        """溜まったメッセージを (端末, event_type) ごとに一括保存する。保存件数を返す。"""
+        if not self.pending_count:
+            return 0
+        groups, self.pending = self.pending, defaultdict(list)
+        self.pending_count = 0
+        self.oldest = None
+
+        stored = 0
+        if not connection.in_atomic_block:
+            # 長時間動くワーカーなので、切れた・期限切れの DB 接続をここで張り直す
+            close_old_connections()
+        for (device_pk, event_type), readings in groups.items():
+            try:
+                stored += len(save_event_batch(self.devices[device_pk], event_type, readings))
+            except Exception:
+                logger.exception('MQTT ingest failed to store %d readings for device %s',
+                                  len(readings), device_pk)
+            self.stats['batches'] += 1
+        self.stats['stored'] += stored
+        return stored
+
+
+def run_bridge(client, bridge, topic=DEFAULT_TOPIC, qos=0, loop_timeout=0.5, max_loops=None):
+    """client のネットワークループを回しつつ期限の来たバッチを保存する。
+
+    max_loops 回で戻る（None なら KeyboardInterrupt まで）。終了時に残りを保存する。
+    """
+    def on_connect(client, userdata, *args):
+        # 再接続のたびに購読し直す
+        client.subscribe(topic, qos)
+
+    client.on_connect = on_connect
+    client.on_message = bridge.on_message
+    loops = 0
+    try:
+        while max_loops is None or loops < max_loops:
+            if client.loop(timeout=loop_timeout):
+                # 切断（paho の loop は 0 以外を返す）。再接続できるまで待つ
+                try:
+                    client.reconnect()
+                except OSError as e:
+                    logger.warning('MQTT reconnect failed: %s', e)
+                    time.sleep(RECONNECT_DELAY)
+            if bridge.due():
+                bridge.flush()
+            loops += 1
+    except KeyboardInterrupt:
+        pass
+    finally:
+        bridge.flush()
+    return bridge.stats
@@ -0,0 +1,89 @@
+"""キッチンディスプレイのイベント — 注文・明細の変更を注文単位の差分として配信する
+
+変更のあった注文カード1枚だけを発行時に1回レンダリングし、live_events で
+店舗のトピックに流す。各画面はカードを差し替えるだけで、全体の再クエリ・再描画はしない。
+"""
+import logging
+
+from django.db import transaction
+from django.template.loader import render_to_string
+from django.utils import timezone
+
+from booking.services import live_events
+
+logger = logging.getLogger(__name__)
+
+IN_STORE_CHANNELS = ('pos', 'table', 'reservation')
+CLOSED_ORDERS_LIMIT = 30
+EVENT_ORDER = 'order'
+
+
+def topic(store_id):
+    return f'kitchen:{store_id}'
+
+
+def kitchen_orders(store):
+    """キッチンに表示する (未完了注文, 本日の完了済み注文)。店内注文のみ（EC注文を除外）。"""
+    from booking.models import Order
+
+    if not store:
+        return [], []
+    base = (
+        Order.objects.filter(store=store, channel__in=IN_STORE_CHANNELS)
+        .select_related('table_seat').prefetch_related('items__product')
+    )
+    open_orders = base.filter(status=Order.STATUS_OPEN).order_by('created_at')
+    # 本日の完了済み注文（古い順＝完了順）
+    closed_orders = base.filter(
+        status=Order.STATUS_CLOSED, updated_at__date=timezone.now().date(),
+    ).order_by('updated_at')[:CLOSED_ORDERS_LIMIT]
+    return open_orders, closed_orders
+
+
+def render_order_card(order):
+    """注文カード1枚の HTML（未完了は左パネル、完了済みは右パネル用）。"""
+    from booking.models import Order
+
+    template = (
+        'admin/booking/_kitchen_order_card.html'
+        if order.status == Order.STATUS_OPEN
+        else 'admin/booking/_kitchen_closed_card.html'
+    )
+    return render_to_string(template, {'order': order})
+
+
+def build_order_event(order_id):
+    """注文1件の差分イベント（カード HTML 付き）。キッチン対象外なら None。"""
+    from booking.models import Order
+
+    order = (
+        Order.objects.filter(pk=order_id, channel__in=IN_STORE_CHANNELS)
+        .select_related('table_seat').prefetch_related('items__product')
+        .first()
+    )
+    if order is None:
+        return None, None
+    closed_today = timezone.localtime(order.updated_at).date() == timezone.now().date()
+    if order.status != Order.STATUS_OPEN and not closed_today:
+        html = ''  # 本日分以外の完了注文は表示対象外（画面からは削除）
+    else:
+        html = render_order_card(order)
+    return order.store_id, {
+        'order_id': order.id,
+        'status': order.status,
+        'html': html,
+    }
+
+
+def publish_order(order_id):
+    """注文の最新状態をトランザクション確定後に配信する。"""
+    def _publish():
+        try:
+            store_id, data = build_order_event(order_id)
+        except Exception as e:
+            logger.warning("kitchen event build failed for order %s: %s", order_id, e)
+            return
+        if data is not None:
+            live_events.publish(topic(store_id), EVENT_ORDER, data)
+
+    transaction.on_commit(_publish)
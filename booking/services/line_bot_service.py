@@ -1,21 +1,18 @@
 """LINE Messaging API 共通サービス"""
 import logging
 import time
-
-from django.conf import settings
+import uuid
 
 logger = logging.getLogger(__name__)
 
 
 def _get_messaging_api_client():
-    """v3 MessagingApi と ApiClient を返す（コンテキストマネージャ不使用）"""
-    from linebot.v3.messaging import MessagingApi, Configuration, ApiClient
-    access_token = getattr(settings, 'LINE_ACCESS_TOKEN', None)
-    if not access_token:
-        raise ValueError("LINE_ACCESS_TOKEN is not set")
-    config = Configuration(access_token=access_token)
-    api_client = ApiClient(config)
-    return MessagingApi(api_client), api_client
+    """v3 MessagingApi と ApiClient を返す。
+
+    プロセス共有のコネクションプールを使い回すため、呼び出し側で close() しないこと。
+    """
+    from booking.services.line_delivery import get_shared_messaging_api
+    return get_shared_messaging_api()
 
 
 def _decrypt_line_user_id(line_user_enc):
@@ -59,24 +56,23 @@ def push_text(line_user_enc, message, message_type='system', customer=None, max_
         _log_message(customer, message_type, message, status='failed', error_detail=str(e))
         return False
 
-    messaging_api, api_client = _get_messaging_api_client()
-    try:
-        for attempt in range(max_retries):
-            try:
-                messaging_api.push_message(PushMessageRequest(
-                    to=line_user_id,
-                    messages=[TextMessage(text=message)],
-                ))
-                _log_message(customer, message_type, message)
-                return True
-            except Exception as e:
-                logger.warning(
-                    "LINE push attempt %d/%d failed: %s", attempt + 1, max_retries, e,
-                )
-                if attempt < max_retries - 1:
-                    time.sleep(2 ** attempt)
-    finally:
-        api_client.close()
+    messaging_api, _ = _get_messaging_api_client()
+    # 再送時も同じ retry key を使い、LINE 側で二重配信を防ぐ
+    retry_key = str(uuid.uuid4())
+    for attempt in range(max_retries):
+        try:
+            messaging_api.push_message(PushMessageRequest(
+                to=line_user_id,
+                messages=[TextMessage(text=message)],
+            ), x_line_retry_key=retry_key)
+            _log_message(customer, message_type, message)
+            return True
+        except Exception as e:
+            logger.warning(
+                "LINE push attempt %d/%d failed: %s", attempt + 1, max_retries, e,
+            )
+            if attempt < max_retries - 1:
+                time.sleep(2 ** attempt)
 
     _log_message(customer, message_type, message, status='failed', error_detail='Max retries exceeded')
     return False
@@ -86,7 +82,7 @@ def reply_text(reply_token, message):
     """reply_token を使ってテキスト返信"""
     from linebot.v3.messaging import ReplyMessageRequest, TextMessage
 
-    messaging_api, api_client = _get_messaging_api_client()
+    messaging_api, _ = _get_messaging_api_client()
     try:
         messaging_api.reply_message(ReplyMessageRequest(
             reply_token=reply_token,
@@ -96,8 +92,6 @@ def reply_text(reply_token, message):
     except Exception as e:
         logger.error("LINE reply failed: %s", e)
         return False
-    finally:
-        api_client.close()
 
 
 def push_flex(line_user_enc, alt_text, flex_container, message_type='system', customer=None, max_retries=3):
@@ -111,24 +105,22 @@ def push_flex(line_user_enc, alt_text, flex_container, message_type='system', cu
         _log_message(customer, message_type, alt_text, status='failed', error_detail=str(e))
         return False
 
-    messaging_api, api_client = _get_messaging_api_client()
-    try:
-        for attempt in range(max_retries):
-            try:
-                messaging_api.push_message(PushMessageRequest(
-                    to=line_user_id,
-                    messages=[FlexMessage(alt_text=alt_text, contents=flex_container)],
-                ))
-                _log_message(customer, message_type, alt_text)
-                return True
-            except Exception as e:
-                logger.warning(
-                    "LINE flex push attempt %d/%d failed: %s", attempt + 1, max_retries, e,
-                )
-                if attempt < max_retries - 1:
-                    time.sleep(2 ** attempt)
-    finally:
-        api_client.close()
+    messaging_api, _ = _get_messaging_api_client()
+    retry_key = str(uuid.uuid4())
+    for attempt in range(max_retries):
+        try:
+            messaging_api.push_message(PushMessageRequest(
+                to=line_user_id,
+                messages=[FlexMessage(alt_text=alt_text, contents=flex_container)],
+            ), x_line_retry_key=retry_key)
+            _log_message(customer, message_type, alt_text)
+            return True
+        except Exception as e:
+            logger.warning(
+                "LINE flex push attempt %d/%d failed: %s", attempt + 1, max_retries, e,
+            )
+            if attempt < max_retries - 1:
+                time.sleep(2 ** attempt)
 
     _log_message(customer, message_type, alt_text, status='failed', error_detail='Max retries exceeded')
     return False
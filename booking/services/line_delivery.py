@@ -0,0 +1,462 @@
+"""LINE push 配信エンジン — 共有コネクションプール + トークンバケット + 非ブロッキング再送
+
+セグメント配信など大量 push 用。1通ごとに ApiClient を生成して time.sleep で再送する
+line_bot_service.push_text と異なり、以下の方針で送信する:
+
+- プロセス共有の MessagingApi（urllib3 コネクションプール）を使い回す
+- スレッドプールで並列送信し、送信開始はトークンバケットで LINE のレート制限内に抑える
+- 一時エラー（429 / 5xx / 通信エラー）は遅延キューに積み直し、ワーカーを眠らせない
+- 同一メッセージの再送には同じ X-Line-Retry-Key を付け、LINE 側で重複配信を防ぐ
+- 送信ログは最後に bulk_create でまとめて記録し、キャンペーン単位のレポートを返す
+
+send_campaign() は同一内容のメッセージを最大500宛先の multicast にまとめて送る。
+バッチの retry key はキャンペーンID・内容・宛先から決定的に生成するため、
+タスクを再実行しても LINE 側で重複配信にならない（retry key の有効期間は24時間）。
+"""
+import hashlib
+import heapq
+import logging
+import random
+import threading
+import time
+import uuid
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# LINE push API の上限は 2,000 req/s。安全側に倒したデフォルト値
+DEFAULT_RATE_PER_SEC = 1000
+DEFAULT_WORKERS = 8
+DEFAULT_POOL_SIZE = 10
+DEFAULT_MAX_RETRIES = 3
+BASE_BACKOFF_SECONDS = 1.0
+MAX_BACKOFF_SECONDS = 60.0
+LOG_BATCH_SIZE = 500
+# LINE multicast API の1リクエストあたり最大宛先数
+MULTICAST_MAX_RECIPIENTS = 500
+
+# 再送しても結果が変わらないステータス（宛先不正・ブロック等）は即失敗扱い
+_RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+# 同じ retry key で既に受理済み = 送信成功
+_ALREADY_ACCEPTED_STATUS = 409
+
+# 決定的 retry key 生成用の名前空間
+_RETRY_KEY_NAMESPACE = uuid.UUID('6f0b6c1e-2f4d-5a8e-9c3b-4d1a7e5f0b21')
+
+_shared_lock = threading.Lock()
+_shared_api = {}
+
+
+def get_shared_messaging_api():
+    """プロセス共有の (MessagingApi, ApiClient) を返す。アクセストークンごとに1つ。"""
+    from linebot.v3.messaging import ApiClient, Configuration, MessagingApi
+
+    access_token = getattr(settings, 'LINE_ACCESS_TOKEN', None)
+    if not access_token:
+        raise ValueError("LINE_ACCESS_TOKEN is not set")
+
+    with _shared_lock:
+        pair = _shared_api.get(access_token)
+        if pair is None:
+            # トークンローテーション時は古いクライアントを閉じて作り直す
+            for old_api, old_client in _shared_api.values():
+                old_client.close()
+            _shared_api.clear()
+            config = Configuration(access_token=access_token)
+            config.connection_pool_maxsize = getattr(
+                settings, 'LINE_PUSH_POOL_SIZE', DEFAULT_POOL_SIZE,
+            )
+            api_client = ApiClient(config)
+            pair = (MessagingApi(api_client), api_client)
+            _shared_api[access_token] = pair
+    return pair
+
+
+class TokenBucket:
+    """スレッドセーフなトークンバケット。acquire() は次のトークンまで待つ。"""
+
+    def __init__(self, rate, capacity=None, clock=time.monotonic, sleep=time.sleep):
+        self.rate = float(rate)
+        self.capacity = float(capacity if capacity is not None else max(1.0, rate))
+        self._tokens = self.capacity
+        self._clock = clock
+        self._sleep = sleep
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = self._clock()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def try_acquire(self):
+        """トークンを1つ取得できれば 0、できなければ必要な待ち秒数を返す。"""
+        with self._lock:
+            self._refill()
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return 0.0
+            return (1 - self._tokens) / self.rate
+
+    def acquire(self):
+        while True:
+            wait_seconds = self.try_acquire()
+            if not wait_seconds:
+                return
+            self._sleep(wait_seconds)
+
+
+@dataclass
+class OutboundMessage:
+    """送信単位（1宛先 × メッセージ列）"""
+    line_user_enc: str
+    messages: list
+    preview: str
+    message_type: str = 'system'
+    customer: object = None
+    retry_key: str = field(default_factory=lambda: str(uuid.uuid4()))
+    attempts: int = 0
+    line_user_id: str = ''
+    last_error: str = ''
+    ref: object = None  # 呼び出し側の識別子（Schedule.pk 等）
+
+
+@dataclass
+class MulticastBatch:
+    """送信単位（同一メッセージ × 最大500宛先）"""
+    items: list
+    messages: list
+    retry_key: str
+    attempts: int = 0
+    last_error: str = ''
+
+    @property
+    def line_user_ids(self):
+        return list(dict.fromkeys(item.line_user_id for item in self.items))
+
+
+@dataclass
+class DeliveryReport:
+    """キャンペーン単位の配信結果"""
+    campaign_id: str
+    total: int = 0
+    sent: int = 0
+    failed: int = 0
+    retried: int = 0
+    duration_seconds: float = 0.0
+    error_counts: dict = field(default_factory=dict)
+    failed_customer_ids: list = field(default_factory=list)
+
+    def as_dict(self):
+        return {
+            'campaign_id': self.campaign_id,
+            'total': self.total,
+            'sent': self.sent,
+            'failed': self.failed,
+            'retried': self.retried,
+            'duration_seconds': round(self.duration_seconds, 3),
+            'error_counts': dict(self.error_counts),
+            'failed_customer_ids': list(self.failed_customer_ids),
+        }
+
+
+def decrypt_line_user_ids(line_user_encs):
+    """暗号化 user_id をまとめて復号する。({enc: user_id}, {enc: エラー文字列}) を返す。"""
+    from booking.models.schedule import Schedule
+
+    decrypted, errors = {}, {}
+    fernet = None
+    for enc in dict.fromkeys(line_user_encs):
+        try:
+            if fernet is None:
+                fernet = Schedule._get_line_id_fernet()
+            decrypted[enc] = fernet.decrypt(enc.encode('utf-8')).decode('utf-8')
+        except Exception as e:
+            errors[enc] = str(e) or e.__class__.__name__
+    return decrypted, errors
+
+
+def _content_key(item):
+    payload = '\x1e'.join(m.to_json() for m in item.messages)
+    return (item.message_type, payload)
+
+
+def _batch_retry_key(campaign_id, content_digest, line_user_ids):
+    name = f'{campaign_id}:{content_digest}:{",".join(line_user_ids)}'
+    return str(uuid.uuid5(_RETRY_KEY_NAMESPACE, name))
+
+
+def build_multicast_batches(outbound, campaign_id):
+    """復号済みの OutboundMessage を内容ごとにまとめ、500宛先ずつの MulticastBatch にする。
+
+    宛先は user_id 順に並べるため、同じ入力からは同じバッチ・同じ retry key が得られる。
+    """
+    groups = {}
+    for item in outbound:
+        groups.setdefault(_content_key(item), []).append(item)
+
+    batches = []
+    for (message_type, payload), items in groups.items():
+        digest = hashlib.sha256(f'{message_type}:{payload}'.encode('utf-8')).hexdigest()[:16]
+        by_user = {}
+        for item in items:
+            by_user.setdefault(item.line_user_id, []).append(item)
+        user_ids = sorted(by_user)
+        for start in range(0, len(user_ids), MULTICAST_MAX_RECIPIENTS):
+            chunk = user_ids[start:start + MULTICAST_MAX_RECIPIENTS]
+            batches.append(MulticastBatch(
+                items=[item for uid in chunk for item in by_user[uid]],
+                messages=items[0].messages,
+                retry_key=_batch_retry_key(campaign_id, digest, chunk),
+            ))
+    return batches
+
+
+def _error_status(exc):
+    return getattr(exc, 'status', None)
+
+
+def _retry_after_seconds(exc):
+    headers = getattr(exc, 'headers', None) or {}
+    try:
+        value = headers.get('Retry-After') or headers.get('retry-after')
+        return float(value) if value else None
+    except (TypeError, ValueError, AttributeError):
+        return None
+
+
+class LineDeliveryEngine:
+    """スレッドプール + トークンバケットで push を並列送信するエンジン。"""
+
+    def __init__(self, rate_per_sec=None, workers=None, max_retries=DEFAULT_MAX_RETRIES,
+                 messaging_api=None, clock=time.monotonic, sleep=time.sleep):
+        self.rate_per_sec = rate_per_sec or getattr(
+            settings, 'LINE_PUSH_RATE_PER_SEC', DEFAULT_RATE_PER_SEC,
+        )
+        self.workers = workers or getattr(settings, 'LINE_PUSH_WORKERS', DEFAULT_WORKERS)
+        self.max_retries = max_retries
+        self._messaging_api = messaging_api
+        self._clock = clock
+        self._sleep = sleep
+        self.bucket = TokenBucket(self.rate_per_sec, clock=clock, sleep=sleep)
+
+    # -- 公開API ---------------------------------------------------------
+
+    def send(self, outbound, campaign_id=None):
+        """OutboundMessage のリストを1宛先ずつ push し DeliveryReport を返す。"""
+        report = DeliveryReport(campaign_id=campaign_id or uuid.uuid4().hex)
+        report.total = len(outbound)
+        logs = []
+        started = self._clock()
+
+        ready = self._decrypt(outbound, report, logs)
+        if ready:
+            def on_sent(item):
+                report.sent += 1
+                logs.append(self._log_entry(item, 'sent'))
+
+            def on_failed(item, error_key):
+                self._record_failure(report, logs, item, error_key)
+
+            api = self._messaging_api or get_shared_messaging_api()[0]
+            self._run(api, ready, self._push, on_sent, on_failed, report)
+
+        return self._finish(report, logs, started)
+
+    def send_campaign(self, outbound, campaign_id=None, on_batch_sent=None):
+        """同一内容のメッセージを multicast にまとめて送信し DeliveryReport を返す。
+
+        on_batch_sent: バッチ送信成功ごとに送信済み OutboundMessage.ref のリストで呼ばれる
+            （呼び出し元スレッドで実行されるため、ORM の一括更新をそのまま行える）
+        """
+        report = DeliveryReport(campaign_id=campaign_id or uuid.uuid4().hex)
+        report.total = len(outbound)
+        logs = []
+        started = self._clock()
+
+        ready = self._decrypt(outbound, report, logs)
+        batches = build_multicast_batches(ready, report.campaign_id)
+        if batches:
+            def on_sent(batch):
+                report.sent += len(batch.items)
+                logs.extend(self._log_entry(item, 'sent') for item in batch.items)
+                if on_batch_sent is not None:
+                    on_batch_sent([item.ref for item in batch.items])
+
+            def on_failed(batch, error_key):
+                for item in batch.items:
+                    item.last_error = batch.last_error
+                    self._record_failure(report, logs, item, error_key)
+
+            api = self._messaging_api or get_shared_messaging_api()[0]
+            self._run(api, batches, self._dispatch_batch, on_sent, on_failed, report)
+
+        return self._finish(report, logs, started)
+
+    # -- 送信ループ ------------------------------------------------------
+
+    def _decrypt(self, outbound, report, logs):
+        decrypted, errors = decrypt_line_user_ids(item.line_user_enc for item in outbound)
+        ready = []
+        for item in outbound:
+            if item.line_user_enc in decrypted:
+                item.line_user_id = decrypted[item.line_user_enc]
+                ready.append(item)
+            else:
+                item.last_error = f'decrypt: {errors[item.line_user_enc]}'
+                self._record_failure(report, logs, item, 'decrypt')
+        return ready
+
+    def _finish(self, report, logs, started):
+        report.duration_seconds = self._clock() - started
+        self._flush_logs(logs, report.campaign_id)
+        logger.info(
+            'LINE campaign %s: total=%d sent=%d failed=%d retried=%d (%.2fs)',
+            report.campaign_id, report.total, report.sent, report.failed,
+            report.retried, report.duration_seconds,
+        )
+        return report
+
+    def _run(self, api, items, dispatch, on_sent, on_failed, report):
+        pending = list(reversed(items))  # pop() で先頭から送る
+        delayed = []  # (due, seq, item)
+        seq = 0
+        in_flight = {}
+
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            while pending or delayed or in_flight:
+                now = self._clock()
+                while delayed and delayed[0][0] <= now:
+                    pending.append(heapq.heappop(delayed)[2])
+
+                while pending and len(in_flight) < self.workers * 2:
+                    self.bucket.acquire()
+                    item = pending.pop()
+                    item.attempts += 1
+                    in_flight[pool.submit(dispatch, api, item)] = item
+
+                if not in_flight:
+                    # 全件が再送待ち: 次の期限まで待つ
+                    if delayed:
+                        self._sleep(max(0.0, delayed[0][0] - self._clock()))
+                    continue
+
+                timeout = None
+                if delayed:
+                    timeout = max(0.0, delayed[0][0] - self._clock())
+                done, _ = wait(list(in_flight), timeout=timeout, return_when=FIRST_COMPLETED)
+                for future in done:
+                    item = in_flight.pop(future)
+                    error = future.exception()
+                    status = _error_status(error) if error is not None else None
+                    if error is None or status == _ALREADY_ACCEPTED_STATUS:
+                        on_sent(item)
+                        continue
+                    item.last_error = str(error)[:500]
+                    retryable = status is None or status in _RETRYABLE_STATUSES
+                    if retryable and item.attempts < self.max_retries:
+                        report.retried += 1
+                        seq += 1
+                        due = self._clock() + self._backoff(item.attempts, error)
+                        heapq.heappush(delayed, (due, seq, item))
+                        logger.warning(
+                            'LINE push retry scheduled (attempt %d/%d): %s',
+                            item.attempts, self.max_retries, error,
+                        )
+                    else:
+                        on_failed(item, str(status or 'error'))
+
+    @staticmethod
+    def _push(api, item):
+        from linebot.v3.messaging import PushMessageRequest
+        api.push_message(
+            PushMessageRequest(to=item.line_user_id, messages=item.messages),
+            x_line_retry_key=item.retry_key,
+        )
+
+    @staticmethod
+    def _dispatch_batch(api, batch):
+        from linebot.v3.messaging import MulticastRequest, PushMessageRequest
+        to = batch.line_user_ids
+        if len(to) == 1:
+            # 1宛先なら push（multicast よりレート上限が高い）
+            api.push_message(
+                PushMessageRequest(to=to[0], messages=batch.messages),
+                x_line_retry_key=batch.retry_key,
+            )
+        else:
+            api.multicast(
+                MulticastRequest(to=to, messages=batch.messages),
+                x_line_retry_key=batch.retry_key,
+            )
+
+    @staticmethod
+    def _backoff(attempt, error):
+        retry_after = _retry_after_seconds(error)
+        if retry_after is not None:
+            return min(retry_after, MAX_BACKOFF_SECONDS)
+        base = min(BASE_BACKOFF_SECONDS * (2 ** (attempt - 1)), MAX_BACKOFF_SECONDS)
+        return base + random.uniform(0, base / 2)
+
+    # -- ログ -------------------------------------------------------------
+
+    def _record_failure(self, report, logs, item, error_key):
+        report.failed += 1
+        report.error_counts[error_key] = report.error_counts.get(error_key, 0) + 1
+        if item.customer is not None:
+            report.failed_customer_ids.append(item.customer.pk)
+        logs.append(self._log_entry(item, 'failed'))
+
+    @staticmethod
+    def _log_entry(item, status):
+        from booking.models.line_customer import LineMessageLog
+        return LineMessageLog(
+            customer=item.customer,
+            message_type=item.message_type,
+            content_preview=item.preview[:200],
+            status=status,
+            error_detail=item.last_error if status == 'failed' else '',
+        )
+
+    @staticmethod
+    def _flush_logs(logs, campaign_id):
+        from booking.models.line_customer import LineMessageLog
+        for log in logs:
+            log.campaign_id = campaign_id
+        LineMessageLog.objects.bulk_create(logs, batch_size=LOG_BATCH_SIZE)
+
+
+def build_text_outbound(customers, message_text, message_type='segment'):
+    """LineCustomer 群からテキスト送信用の OutboundMessage リストを作る。"""
+    from linebot.v3.messaging import TextMessage
+    return [
+        OutboundMessage(
+            line_user_enc=customer.line_user_enc,
+            messages=[TextMessage(text=message_text)],
+            preview=message_text,
+            message_type=message_type,
+            customer=customer,
+        )
+        for customer in customers
+    ]
+
+
+def get_campaign_report(campaign_id):
+    """送信ログからキャンペーンの集計を再構成する（管理画面・再確認用）。"""
+    from django.db.models import Count
+    from booking.models.line_customer import LineMessageLog
+
+    rows = (
+        LineMessageLog.objects.filter(campaign_id=campaign_id)
+        .values('status').annotate(n=Count('id'))
+    )
+    counts = {row['status']: row['n'] for row in rows}
+    return {
+        'campaign_id': campaign_id,
+        'total': sum(counts.values()),
+        'sent': counts.get('sent', 0),
+        'failed': counts.get('failed', 0),
+    }
@@ -1,4 +1,9 @@
-"""LINE予約リマインダーサービス"""
+"""LINE予約リマインダーサービス
+
+対象予約の LineCustomer を1クエリで先読みし、配信エンジンの send_campaign() で
+同一文面を multicast にまとめて送る。送信済みフラグはバッチごとに1回の UPDATE で立てる。
+キャンペーンIDは対象日から決まるため、タスク再実行時も retry key が一致し二重送信されない。
+"""
 import logging
 from datetime import timedelta
 
@@ -7,14 +12,77 @@ from django.utils import timezone
 logger = logging.getLogger(__name__)
 
 
+def _send_reminders(schedules, build_message, flag_field, campaign_id):
+    """Schedule 群にリマインダーを送り、送信できた件数を返す。"""
+    from linebot.v3.messaging import TextMessage
+
+    from booking.models import Schedule
+    from booking.models.line_customer import LineCustomer
+    from booking.services.line_delivery import LineDeliveryEngine, OutboundMessage
+
+    schedules = list(schedules)
+    if not schedules:
+        return 0
+
+    # LineCustomerを紐づけてログに記録（ハッシュ → 顧客を一括取得）
+    hashes = {s.line_user_hash for s in schedules if s.line_user_hash}
+    customers = {
+        c.line_user_hash: c
+        for c in LineCustomer.objects.filter(line_user_hash__in=hashes)
+    } if hashes else {}
+
+    outbound = []
+    for schedule in schedules:
+        message = build_message(schedule)
+        outbound.append(OutboundMessage(
+            line_user_enc=schedule.line_user_enc,
+            messages=[TextMessage(text=message)],
+            preview=message,
+            message_type='reminder',
+            customer=customers.get(schedule.line_user_hash),
+            ref=schedule.pk,
+        ))
+
+    def mark_sent(schedule_ids):
+        Schedule.objects.filter(pk__in=schedule_ids).update(**{flag_field: True})
+
+    report = LineDeliveryEngine().send_campaign(
+        outbound, campaign_id=campaign_id, on_batch_sent=mark_sent,
+    )
+    return report.sent
+
+
+def _day_before_message(schedule):
+    local_start = timezone.localtime(schedule.start)
+    store_name = schedule.store.name if schedule.store else ''
+    return (
+        f'【明日のご予約リマインダー】\n\n'
+        f'日時: {local_start:%Y/%m/%d %H:%M}\n'
+        f'担当: {schedule.staff.name}\n'
+        f'店舗: {store_name}\n'
+        f'予約番号: {schedule.reservation_number}\n\n'
+        f'ご来店をお待ちしております。'
+    )
+
+
+def _same_day_message(schedule):
+    local_start = timezone.localtime(schedule.start)
+    store_name = schedule.store.name if schedule.store else ''
+    return (
+        f'【本日のご予約リマインダー】\n\n'
+        f'日時: {local_start:%H:%M}\n'
+        f'担当: {schedule.staff.name}\n'
+        f'店舗: {store_name}\n\n'
+        f'まもなくお時間です。ご来店をお待ちしております。'
+    )
+
+
 def send_day_before_reminders():
     """翌日の予約に前日リマインダーを送信（毎日18:00 JST実行）
 
     対象: 明日の予約で、reminder_sent_day_before=False, is_cancelled=False, is_temporary=False
     """
     from booking.models import Schedule
-    from booking.models.line_customer import LineCustomer
-    from booking.services.line_bot_service import push_text
 
     now = timezone.now()
     tomorrow_start = (now + timedelta(days=1)).replace(hour=0, minute=0, second=0, microsecond=0)
@@ -34,34 +102,10 @@ def send_day_before_reminders():
         .select_related('staff', 'store')
     )
 
-    sent_count = 0
-    for schedule in schedules:
-        local_start = timezone.localtime(schedule.start)
-        store_name = schedule.store.name if schedule.store else ''
-        message = (
-            f'【明日のご予約リマインダー】\n\n'
-            f'日時: {local_start:%Y/%m/%d %H:%M}\n'
-            f'担当: {schedule.staff.name}\n'
-            f'店舗: {store_name}\n'
-            f'予約番号: {schedule.reservation_number}\n\n'
-            f'ご来店をお待ちしております。'
-        )
-
-        # LineCustomerを紐づけてログに記録
-        customer = None
-        if schedule.line_user_hash:
-            customer = LineCustomer.objects.filter(
-                line_user_hash=schedule.line_user_hash,
-            ).first()
-
-        ok = push_text(
-            schedule.line_user_enc, message,
-            message_type='reminder', customer=customer,
-        )
-        if ok:
-            Schedule.objects.filter(pk=schedule.pk).update(reminder_sent_day_before=True)
-            sent_count += 1
-
+    sent_count = _send_reminders(
+        schedules, _day_before_message, 'reminder_sent_day_before',
+        campaign_id=f'reminder-day-before-{tomorrow_start:%Y%m%d}',
+    )
     logger.info('Day-before reminders sent: %d', sent_count)
     return sent_count
 
@@ -72,8 +116,6 @@ def send_same_day_reminders():
     対象: 2時間以内の予約で、reminder_sent_same_day=False, is_cancelled=False, is_temporary=False
     """
     from booking.models import Schedule
-    from booking.models.line_customer import LineCustomer
-    from booking.services.line_bot_service import push_text
 
     now = timezone.now()
     two_hours_later = now + timedelta(hours=2)
@@ -92,31 +134,9 @@ def send_same_day_reminders():
         .select_related('staff', 'store')
     )
 
-    sent_count = 0
-    for schedule in schedules:
-        local_start = timezone.localtime(schedule.start)
-        store_name = schedule.store.name if schedule.store else ''
-        message = (
-            f'【本日のご予約リマインダー】\n\n'
-            f'日時: {local_start:%H:%M}\n'
-            f'担当: {schedule.staff.name}\n'
-            f'店舗: {store_name}\n\n'
-            f'まもなくお時間です。ご来店をお待ちしております。'
-        )
-
-        customer = None
-        if schedule.line_user_hash:
-            customer = LineCustomer.objects.filter(
-                line_user_hash=schedule.line_user_hash,
-            ).first()
-
-        ok = push_text(
-            schedule.line_user_enc, message,
-            message_type='reminder', customer=customer,
-        )
-        if ok:
-            Schedule.objects.filter(pk=schedule.pk).update(reminder_sent_same_day=True)
-            sent_count += 1
-
+    sent_count = _send_reminders(
+        schedules, _same_day_message, 'reminder_sent_same_day',
+        campaign_id=f'reminder-same-day-{timezone.localdate(now):%Y%m%d}',
+    )
     logger.info('Same-day reminders sent: %d', sent_count)
     return sent_count
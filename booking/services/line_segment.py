@@ -1,48 +1,92 @@
 """LINEセグメント計算・配信サービス"""
 import logging
-from datetime import timedelta
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Callable
 
+from django.db import transaction
+from django.db.models import Case, CharField, Count, F, Max, Min, Q, Value, When
 from django.utils import timezone
 
 logger = logging.getLogger(__name__)
 
 
-def recompute_segments():
-    """全顧客のセグメントを再計算
+@dataclass(frozen=True)
+class SegmentRule:
+    """セグメント判定ルール。condition(now) が返す Q に一致した顧客を name に分類する。
 
-    ルール:
-    - vip: visit_count >= 5 or total_spent >= 30000
-    - regular: visit_count >= 2 and last_visit_at within 90 days
-    - dormant: last_visit_at > 90 days ago
-    - new: visit_count <= 1 (default)
+    ルールは並び順に評価され、最初に一致したものが採用される（SQL の CASE WHEN と同じ）。
     """
-    from booking.models.line_customer import LineCustomer
+    name: str
+    condition: Callable[[datetime], Q]
+
+
+DEFAULT_SEGMENT = 'new'
+DORMANT_DAYS = 90
+
+# - vip: visit_count >= 5 or total_spent >= 30000
+# - dormant: last_visit_at > 90 days ago
+# - regular: visit_count >= 2（90日以内に来店）
+# - new: それ以外（デフォルト）
+DEFAULT_SEGMENT_RULES = (
+    SegmentRule('vip', lambda now: Q(visit_count__gte=5) | Q(total_spent__gte=30000)),
+    SegmentRule('dormant', lambda now: Q(last_visit_at__lt=now - timedelta(days=DORMANT_DAYS))),
+    SegmentRule('regular', lambda now: Q(visit_count__gte=2)),
+)
+
+RECOMPUTE_CHUNK_SIZE = 10000
+
+
+def build_segment_case(rules=None, now=None, default=DEFAULT_SEGMENT):
+    """ルール列を SQL の CASE 式にコンパイルする"""
+    rules = DEFAULT_SEGMENT_RULES if rules is None else rules
+    now = now or timezone.now()
+    return Case(
+        *[When(rule.condition(now), then=Value(rule.name)) for rule in rules],
+        default=Value(default),
+        output_field=CharField(),
+    )
 
-    now = timezone.now()
-    cutoff_90 = now - timedelta(days=90)
 
-    customers = LineCustomer.objects.filter(is_friend=True)
-    updated = 0
+def recompute_segments(rules=None, now=None, chunk_size=RECOMPUTE_CHUNK_SIZE):
+    """友だち顧客のセグメントを SQL 上で一括再計算
 
-    for customer in customers.iterator():
-        new_segment = _compute_segment(customer, cutoff_90)
-        if customer.segment != new_segment:
-            LineCustomer.objects.filter(pk=customer.pk).update(segment=new_segment)
-            updated += 1
+    顧客を Python に読み込まず、CASE 式で UPDATE する。テーブルロックを短く保つため
+    主キー範囲 chunk_size 件ごとに1文ずつ実行する。
+
+    Args:
+        rules: SegmentRule のシーケンス（省略時は DEFAULT_SEGMENT_RULES）
+        now: 判定基準時刻（省略時は現在時刻）
+        chunk_size: 1回の UPDATE で対象とする主キー範囲の幅
 
-    logger.info('Segment recomputation: %d customers updated', updated)
-    return updated
+    Returns:
+        {'updated': 変更件数, 'counts': {segment: 件数},
+         'changes': {旧segment: {新segment: 件数}}}
+    """
+    from booking.models.line_customer import LineCustomer
 
+    segment_case = build_segment_case(rules, now)
+    friends = LineCustomer.objects.filter(is_friend=True)
+    bounds = friends.aggregate(lo=Min('pk'), hi=Max('pk'))
 
-def _compute_segment(customer, cutoff_90):
-    """単一顧客のセグメントを計算"""
-    if customer.visit_count >= 5 or customer.total_spent >= 30000:
-        return 'vip'
-    if customer.last_visit_at and customer.last_visit_at < cutoff_90:
-        return 'dormant'
-    if customer.visit_count >= 2:
-        return 'regular'
-    return 'new'
+    changes = {}
+    updated = 0
+    if bounds['lo'] is not None:
+        for lo in range(bounds['lo'], bounds['hi'] + 1, chunk_size):
+            chunk = friends.filter(pk__gte=lo, pk__lt=lo + chunk_size)
+            with transaction.atomic():
+                stale = chunk.annotate(new_segment=segment_case).exclude(segment=F('new_segment'))
+                for row in stale.values('segment', 'new_segment').annotate(n=Count('pk')).order_by():
+                    per_old = changes.setdefault(row['segment'], {})
+                    per_old[row['new_segment']] = per_old.get(row['new_segment'], 0) + row['n']
+                updated += chunk.exclude(segment=segment_case).update(segment=segment_case)
+
+    counts = {
+        row['segment']: row['n']
+        for row in friends.values('segment').annotate(n=Count('pk')).order_by()
+    }
+    logger.info('Segment recomputation: %d customers updated %s', updated, changes)
+    return {'updated': updated, 'counts': counts, 'changes': changes}
 
 
 def get_customers_by_segment(segment, store_id=None):
@@ -55,41 +99,25 @@ def get_customers_by_segment(segment, store_id=None):
     return qs
 
 
-def send_segment_message(customer_ids, message_text):
-    """指定顧客にメッセージを一括送信（レート制限付き）
+def send_segment_message(customer_ids, message_text, campaign_id=None):
+    """指定顧客にメッセージを一括送信（multicast 500件単位・配信エンジン経由）
 
     Args:
         customer_ids: LineCustomer IDのリスト
         message_text: 送信テキスト
+        campaign_id: キャンペーンID（省略時は自動採番）。同じIDで再実行すると
+            LINE 側の retry key 判定により送信済みバッチは再配信されない
 
     Returns:
-        {'sent': int, 'failed': int}
+        キャンペーンレポート dict（'sent' / 'failed' / 'retried' / 'campaign_id' 等）
     """
-    import time
     from booking.models.line_customer import LineCustomer
-    from booking.services.line_bot_service import push_text
+    from booking.services.line_delivery import LineDeliveryEngine, build_text_outbound
 
-    results = {'sent': 0, 'failed': 0}
     customers = LineCustomer.objects.filter(
         id__in=customer_ids, is_friend=True,
     ).exclude(line_user_enc='')
 
-    for i, customer in enumerate(customers):
-        ok = push_text(
-            customer.line_user_enc, message_text,
-            message_type='segment', customer=customer,
-        )
-        if ok:
-            results['sent'] += 1
-        else:
-            results['failed'] += 1
-
-        # レート制限: 1000msg/min ≈ 60ms/msg
-        if (i + 1) % 100 == 0:
-            time.sleep(6)
-
-    logger.info(
-        'Segment message sent: sent=%d, failed=%d',
-        results['sent'], results['failed'],
-    )
-    return results
+    outbound = build_text_outbound(customers, message_text, message_type='segment')
+    report = LineDeliveryEngine().send_campaign(outbound, campaign_id=campaign_id)
+    return report.as_dict()
@@ -0,0 +1,251 @@
+"""ライブイベントチャネル — キッチンディスプレイ等の画面へ差分をプッシュする
+
+イベントはトピック（例: 'kitchen:<store_id>'）ごとの連番付きで共有キャッシュに保存し、
+キャッシュが Redis の場合は pub/sub で待機中の接続を即座に起こす。
+画面は最後に受け取った連番を持ち、それより後のイベントだけを受け取る。
+
+- publish(): 連番を採番してイベントを保存・通知
+- events_since(): 指定連番より後のイベント（取りこぼし時は resync=True → 画面は全体を再取得）
+- wait_for_events(): 同期 Gunicorn ワーカー向けのロングポーリング
+- stream() / sse_response(): ASGI 向けの SSE（非同期ジェネレータとそのレスポンス）
+
+LocMemCache（ローカル開発）ではプロセス内でしか共有されないため、
+複数ワーカー構成では Redis を使うこと。
+"""
+import asyncio
+import json
+import logging
+import time
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+CACHE_PREFIX = 'live'
+EVENT_TTL = 60 * 10  # 10分（それ以上離脱した画面は resync）
+MAX_BACKLOG = 200  # 一度に返すイベントの上限（超えたら resync）
+POLL_INTERVAL = 0.5  # Redis pub/sub が使えない場合のキャッシュ確認間隔（秒）
+SSE_HEARTBEAT = 15  # 秒
+SSE_MAX_DURATION = 60 * 5  # 接続を定期的に張り直す（EventSource が Last-Event-ID で再接続）
+
+
+def _seq_key(topic):
+    return f'{CACHE_PREFIX}:seq:{topic}'
+
+
+def _event_key(topic, seq):
+    return f'{CACHE_PREFIX}:evt:{topic}:{seq}'
+
+
+def _channel(topic):
+    return f'{CACHE_PREFIX}:{topic}'
+
+
+def _redis_url():
+    """default キャッシュが Redis の場合のみその URL を返す。"""
+    conf = settings.CACHES.get('default', {})
+    if not conf.get('BACKEND', '').endswith('RedisCache'):
+        return None
+    location = conf.get('LOCATION')
+    if isinstance(location, (list, tuple)):
+        location = location[0] if location else None
+    return location
+
+
+@lru_cache(maxsize=1)
+def _redis_client(url):
+    import redis
+    return redis.Redis.from_url(url)
+
+
+def _get_redis():
+    url = _redis_url()
+    return _redis_client(url) if url else None
+
+
+# ---------------------------------------------------------------------------
+# 発行
+# ---------------------------------------------------------------------------
+
+def current_seq(topic):
+    try:
+        return int(cache.get(_seq_key(topic)) or 0)
+    except Exception as e:
+        logger.warning("live events: seq read failed for %s: %s", topic, e)
+        return 0
+
+
+def publish(topic, event_type, data):
+    """イベントを発行する。失敗しても呼び出し元の処理は止めない。
+
+    トランザクション内からは transaction.on_commit 経由で呼ぶこと
+    （ロールバックされた変更を画面に送らないため）。
+    """
+    try:
+        key = _seq_key(topic)
+        try:
+            seq = cache.incr(key)
+        except ValueError:
+            cache.add(key, 0, None)
+            seq = cache.incr(key)
+        event = {'seq': seq, 'type': event_type, 'data': data}
+        cache.set(_event_key(topic, seq), event, EVENT_TTL)
+    except Exception as e:
+        logger.warning("live events: publish failed for %s: %s", topic, e)
+        return None
+
+    client = _get_redis()
+    if client is not None:
+        try:
+            client.publish(_channel(topic), seq)
+        except Exception as e:
+            logger.warning("live events: redis publish failed for %s: %s", topic, e)
+    return event
+
+
+# ---------------------------------------------------------------------------
+# 購読
+# ---------------------------------------------------------------------------
+
+def events_since(topic, since):
+    """since より後のイベントを返す。
+
+    Returns:
+        (seq, events, resync)
+        resync=True のとき events は空。画面は全体を再取得して seq から再開する。
+    """
+    seq = current_seq(topic)
+    if since is None or since > seq:
+        # 初回、またはキャッシュ消去で連番が巻き戻った
+        return seq, [], since is not None
+    if since == seq:
+        return seq, [], False
+    if seq - since > MAX_BACKLOG:
+        return seq, [], True
+
+    keys = [_event_key(topic, n) for n in range(since + 1, seq + 1)]
+    try:
+        found = cache.get_many(keys)
+    except Exception as e:
+        logger.warning("live events: read failed for %s: %s", topic, e)
+        return seq, [], True
+    if len(found) != len(keys):
+        return seq, [], True  # 期限切れ・欠番
+    return seq, [found[k] for k in keys], False
+
+
+def wait_for_events(topic, since, timeout):
+    """ロングポーリング: イベントが来るか timeout 秒経つまで待つ。"""
+    deadline = time.monotonic() + max(0, timeout)
+    pubsub = None
+    client = _get_redis()
+    if client is not None:
+        try:
+            pubsub = client.pubsub(ignore_subscribe_messages=True)
+            pubsub.subscribe(_channel(topic))
+        except Exception as e:
+            logger.warning("live events: redis subscribe failed for %s: %s", topic, e)
+            pubsub = None
+    try:
+        while True:
+            # 購読開始後に確認するので、確認〜待機の間の発行も取りこぼさない
+            seq, events, resync = events_since(topic, since)
+            remaining = deadline - time.monotonic()
+            if events or resync or remaining <= 0:
+                return seq, events, resync
+            if pubsub is not None:
+                pubsub.get_message(timeout=min(remaining, SSE_HEARTBEAT))
+            else:
+                time.sleep(min(remaining, POLL_INTERVAL))
+    finally:
+        if pubsub is not None:
+            try:
+                pubsub.close()
+            except Exception:
+                pass
+
+
+def parse_since(value):
+    """?since= / Last-Event-ID の値を連番に変換する（不正値は None = 初回扱い）。"""
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def longpoll_payload(topic, since):
+    """ロングポーリング API のレスポンス dict。初回（since なし）は待たずに現在の連番を返す。"""
+    timeout = settings.LIVE_EVENTS_LONGPOLL_TIMEOUT if since is not None else 0
+    seq, events, resync = wait_for_events(topic, since, timeout)
+    return {'seq': seq, 'events': events, 'resync': resync}
+
+
+def format_sse(event_type, data, event_id=None):
+    lines = []
+    if event_id is not None:
+        lines.append(f'id: {event_id}')
+    lines.append(f'event: {event_type}')
+    lines.append(f'data: {json.dumps(data, ensure_ascii=False, default=str)}')
+    return '\n'.join(lines) + '\n\n'
+
+
+async def stream(topic, since, *, heartbeat=SSE_HEARTBEAT, max_duration=SSE_MAX_DURATION):
+    """SSE 形式の文字列を yield する非同期ジェネレータ（ASGI 専用）。"""
+    from asgiref.sync import sync_to_async
+
+    read = sync_to_async(events_since, thread_sensitive=False)
+    client = pubsub = None
+    url = _redis_url()
+    if url:
+        try:
+            import redis.asyncio as aioredis
+            client = aioredis.Redis.from_url(url)
+            pubsub = client.pubsub(ignore_subscribe_messages=True)
+            await pubsub.subscribe(_channel(topic))
+        except Exception as e:
+            logger.warning("live events: async redis subscribe failed for %s: %s", topic, e)
+            pubsub = None
+
+    loop = asyncio.get_running_loop()
+    started = last_sent = loop.time()
+    try:
+        if since is None:
+            since = (await read(topic, None))[0]
+            yield format_sse('hello', {'seq': since}, event_id=since)
+        while loop.time() - started < max_duration:
+            seq, events, resync = await read(topic, since)
+            if resync:
+                yield format_sse('resync', {'seq': seq}, event_id=seq)
+                since = seq
+                last_sent = loop.time()
+            for event in events:
+                yield format_sse(event['type'], event['data'], event_id=event['seq'])
+                since = event['seq']
+                last_sent = loop.time()
+            if loop.time() - last_sent >= heartbeat:
+                yield ': ping\n\n'
+                last_sent = loop.time()
+            if pubsub is not None:
+                await pubsub.get_message(timeout=heartbeat)
+            else:
+                await asyncio.sleep(POLL_INTERVAL)
+    finally:
+        for closable in (pubsub, client):
+            if closable is not None:
+                try:
+                    await closable.aclose()
+                except Exception:
+                    pass
+
+
+def sse_response(request, topic):
+    """topic の SSE ストリームレスポンス（Last-Event-ID または ?since= から再開）。"""
+    from django.http import StreamingHttpResponse
+
+    since = parse_since(request.headers.get('Last-Event-ID') or request.GET.get('since'))
+    response = StreamingHttpResponse(stream(topic, since), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
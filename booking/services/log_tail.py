@@ -0,0 +1,292 @@
+"""アプリケーションログの末尾読み取り・追記分の取得（デバッグパネル用）
+
+ファイル全体を読まずに、末尾からブロック単位で後ろ向きに読む。読み取り量は
+行数と TAIL_MAX_SCAN_BYTES、追記分は READ_MAX_BYTES で上限を決めるので、
+ログの大きさに関係なくメモリ・時間は一定。
+
+- tail(): 末尾 n 件（フィルタ適用後）とカーソル
+- read_since(): カーソル以降に追記された行と新しいカーソル
+- stream(): 追記分を SSE で流す非同期ジェネレータ（ASGI 専用）
+
+カーソルは "<inode>:<offset>"（ファイル終端のバイト位置）。RotatingFileHandler で
+ローテートされた場合（inode が変わる・サイズが縮む）は、旧ファイル（<path>.1）に
+残った分を読んでから新しいファイルの先頭へ移る。
+
+レコードはレベル名で始まる行（verbose 形式 "{levelname} {asctime} {module} ..."）から
+次のレコードまで。トレースバック等の継続行は直前のレコードに含めてフィルタする。
+"""
+import asyncio
+import os
+import re
+from dataclasses import dataclass
+
+from .live_events import SSE_HEARTBEAT, SSE_MAX_DURATION, format_sse
+
+BLOCK_SIZE = 8 * 1024
+TAIL_MAX_SCAN_BYTES = 2 * 1024 * 1024
+READ_MAX_BYTES = 256 * 1024
+MAX_LINE_CHARS = 4000
+DEFAULT_TAIL_LINES = 50
+
+SSE_POLL_INTERVAL = 1.0  # 追記の確認間隔（秒）
+
+LEVELS = {'DEBUG': 10, 'INFO': 20, 'WARNING': 30, 'ERROR': 40, 'CRITICAL': 50}
+_HEADER_RE = re.compile(
+    r'^(?P<level>DEBUG|INFO|WARNING|ERROR|CRITICAL)\b[\s:]*'
+    r'(?:\d{4}-\d\d-\d\d[ T]\d\d:\d\d:\d\d(?:[,.]\d+)?\s+)?'
+    r'(?P<logger>[\w.]+)?'
+)
+
+
+@dataclass(frozen=True)
+class LogFilter:
+    """level: 最小レベル、logger: モジュール名の前方一致、text: 大文字小文字を区別しない部分一致"""
+    level: str = ''
+    logger: str = ''
+    text: str = ''
+
+    @classmethod
+    def from_params(cls, params):
+        level = (params.get('level') or '').upper()
+        return cls(
+            level=level if level in LEVELS else '',
+            logger=(params.get('logger') or '').strip(),
+            text=(params.get('q') or '').strip(),
+        )
+
+    def __bool__(self):
+        return bool(self.level or self.logger or self.text)
+
+    def matches(self, header, record_text):
+        if self.level:
+            if header is None or LEVELS[header.group('level')] < LEVELS[self.level]:
+                return False
+        if self.logger:
+            name = header.group('logger') if header else None
+            if not name or not name.startswith(self.logger):
+                return False
+        if self.text and self.text.lower() not in record_text.lower():
+            return False
+        return True
+
+
+# ---------------------------------------------------------------------------
+# カーソル
+# ---------------------------------------------------------------------------
+
+def format_cursor(inode, offset):
+    return f'{inode}:{offset}'
+
+
+def parse_cursor(value):
+    """'<inode>:<offset>' → (inode, offset)。不正なら None。"""
+    try:
+        inode, offset = str(value).split(':', 1)
+        inode, offset = int(inode), int(offset)
+    except (TypeError, ValueError):
+        return None
+    if inode < 0 or offset < 0:
+        return None
+    return inode, offset
+
+
+# ---------------------------------------------------------------------------
+# 行・レコード
+# ---------------------------------------------------------------------------
+
+def _decode(raw):
+    line = raw.decode('utf-8', errors='replace').rstrip('\r\n')
+    if len(line) > MAX_LINE_CHARS:
+        line = line[:MAX_LINE_CHARS] + '…'
+    return line
+
+
+def _records(lines):
+    """行をレコード（見出し行のマッチ, 行リスト）にまとめる。先頭の継続行は見出し無し。"""
+    records = []
+    for line in lines:
+        header = _HEADER_RE.match(line)
+        if header or not records:
+            records.append((header, [line]))
+        else:
+            records[-1][1].append(line)
+    return records
+
+
+def filter_lines(lines, log_filter):
+    """フィルタに合うレコードの行だけを返す。"""
+    if not log_filter:
+        return list(lines)
+    kept = []
+    for header, record in _records(lines):
+        if log_filter.matches(header, '\n'.join(record)):
+            kept.extend(record)
+    return kept
+
+
+# ---------------------------------------------------------------------------
+# 読み取り
+# ---------------------------------------------------------------------------
+
+def _keep(records, log_filter):
+    if not log_filter:
+        return [line for _, record in records for line in record]
+    return [
+        line
+        for header, record in records if log_filter.matches(header, '\n'.join(record))
+        for line in record
+    ]
+
+
+def tail(path, lines=DEFAULT_TAIL_LINES, log_filter=None, max_scan_bytes=TAIL_MAX_SCAN_BYTES):
+    """末尾からブロック単位で後ろ向きに読み、フィルタ後の最後の lines 行とカーソルを返す。
+
+    書き込み途中の最終行（改行で終わっていない）は含めず、カーソルはその手前を指す。
+
+    Returns:
+        (list[str], cursor) — ファイルが無ければ ([], None)
+    """
+    log_filter = log_filter or LogFilter()
+    try:
+        f = open(path, 'rb')
+    except OSError:
+        return [], None
+    with f:
+        st = os.fstat(f.fileno())
+        end = st.st_size
+        pos = end
+        buf = b''
+        tail_end = None  # 最後の改行の直後
+        head = []  # 見出し行がまだ読めていない先頭の継続行
+        matched = []
+        while pos > 0 and end - pos < max_scan_bytes:
+            step = min(BLOCK_SIZE, pos)
+            pos -= step
+            f.seek(pos)
+            buf = f.read(step) + buf
+            if tail_end is None:
+                nl = buf.rfind(b'\n')
+                if nl < 0:
+                    continue
+                tail_end = pos + nl + 1
+                buf = buf[:nl]
+            # 先頭の行は途中から始まっている可能性があるので次のブロックまで保留
+            pieces = buf.split(b'\n')
+            buf = pieces.pop(0) if pos > 0 else b''
+            records = _records([_decode(raw) for raw in pieces] + head)
+            head = records.pop(0)[1] if records and records[0][0] is None else []
+            matched = _keep(records, log_filter) + matched
+            if len(matched) >= lines:
+                break
+        else:
+            # ファイル先頭（または走査上限）まで読んだ: 残った継続行も見出し無しのレコードとして扱う
+            matched = _keep([(None, head)], log_filter) + matched
+
+        if tail_end is None:
+            # 改行が無い（1行目を書き込み中）か、走査上限まで改行が無い長大な行
+            tail_end = 0 if pos == 0 else end
+        lines_out = matched[-lines:] if lines else []
+        return lines_out, format_cursor(st.st_ino, tail_end)
+
+
+def _read_from(f, offset, max_bytes):
+    """offset から最大 max_bytes 読み、完結した行と次の offset を返す。"""
+    f.seek(offset)
+    data = f.read(max_bytes)
+    cut = data.rfind(b'\n')
+    if cut < 0:
+        # 1行が max_bytes を超える場合は切って進める（停止しないため）
+        if len(data) >= max_bytes:
+            return [_decode(data)], offset + len(data)
+        return [], offset
+    data = data[:cut + 1]
+    return [_decode(raw) for raw in data.split(b'\n')[:-1]], offset + len(data)
+
+
+def _rotated_file(path, inode):
+    """inode がローテート後の <path>.1 と一致すればそのパス。"""
+    rotated = f'{path}.1'
+    try:
+        return rotated if os.stat(rotated).st_ino == inode else None
+    except OSError:
+        return None
+
+
+def read_since(path, cursor, log_filter=None, max_bytes=READ_MAX_BYTES):
+    """cursor 以降に追記された行を返す。
+
+    Returns:
+        (lines, new_cursor, rotated) — rotated はローテートを検出した場合 True
+    """
+    parsed = parse_cursor(cursor)
+    try:
+        f = open(path, 'rb')
+    except OSError:
+        return [], cursor, False
+    with f:
+        st = os.fstat(f.fileno())
+        if parsed is None:
+            return [], format_cursor(st.st_ino, st.st_size), False
+        inode, offset = parsed
+
+        if inode == st.st_ino and offset <= st.st_size:
+            raw_lines, offset = _read_from(f, offset, max_bytes)
+            return filter_lines(raw_lines, log_filter), format_cursor(inode, offset), False
+
+        # ローテート（または切り詰め）: 旧ファイルの残りを読んでから新しいファイルの先頭へ
+        raw_lines = []
+        rotated = _rotated_file(path, inode)
+        if rotated:
+            with open(rotated, 'rb') as old:
+                old_size = os.fstat(old.fileno()).st_size
+                old_lines, old_offset = _read_from(old, offset, max_bytes)
+                raw_lines.extend(old_lines)
+                if old_offset < old_size:
+                    # 旧ファイルが読み切れていなければ次回も旧ファイルから
+                    return filter_lines(raw_lines, log_filter), format_cursor(inode, old_offset), True
+        new_lines, new_offset = _read_from(f, 0, max_bytes)
+        raw_lines.extend(new_lines)
+        return filter_lines(raw_lines, log_filter), format_cursor(st.st_ino, new_offset), True
+
+
+# ---------------------------------------------------------------------------
+# SSE
+# ---------------------------------------------------------------------------
+
+async def stream(path, cursor, log_filter=None, *, poll_interval=SSE_POLL_INTERVAL,
+                 heartbeat=SSE_HEARTBEAT, max_duration=SSE_MAX_DURATION):
+    """追記された行を SSE 形式で yield する非同期ジェネレータ（ASGI 専用）。"""
+    from asgiref.sync import sync_to_async
+
+    read = sync_to_async(read_since, thread_sensitive=False)
+    loop = asyncio.get_running_loop()
+    started = last_sent = loop.time()
+    if parse_cursor(cursor) is None:
+        _, cursor = await sync_to_async(tail, thread_sensitive=False)(path, 0)
+        yield format_sse('hello', {'cursor': cursor}, event_id=cursor)
+    while loop.time() - started < max_duration:
+        lines, new_cursor, rotated = await read(path, cursor, log_filter)
+        if rotated:
+            yield format_sse('rotated', {'cursor': new_cursor}, event_id=new_cursor)
+            last_sent = loop.time()
+        if new_cursor != cursor and lines:
+            yield format_sse('lines', {'lines': lines, 'cursor': new_cursor}, event_id=new_cursor)
+            last_sent = loop.time()
+        if new_cursor != cursor:
+            cursor = new_cursor
+            continue  # まだ残りがあるかもしれないので待たずに読む
+        if loop.time() - last_sent >= heartbeat:
+            yield ': ping\n\n'
+            last_sent = loop.time()
+        await asyncio.sleep(poll_interval)
+
+
+def sse_response(request, path, log_filter=None):
+    """ログ追記分の SSE レスポンス（Last-Event-ID または ?cursor= から再開）。"""
+    from django.http import StreamingHttpResponse
+
+    cursor = request.headers.get('Last-Event-ID') or request.GET.get('cursor')
+    response = StreamingHttpResponse(stream(path, cursor, log_filter), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
@@ -0,0 +1,211 @@
+"""メニューカタログキャッシュ — (店舗, 言語) 単位で事前コンパイルした客側メニュー
+
+テーブルQRから開かれる客側メニューは、商品ごとに翻訳を引くと N+1 になる。
+カタログは次の3層でキャッシュする:
+
+1. 構成（カテゴリ・商品・翻訳・画像URL）: 翻訳を1回の prefetch で取得してコンパイル。
+   店舗ごとの世代番号で無効化（Product / ProductTranslation / Category の変更時）。
+2. 在庫マップ（商品ID → 在庫数）: 店舗単位。入出庫時は構成を作り直さず
+   在庫マップだけを差し替える（refresh_stock）。
+3. レンダリング済みペイロード: 構成 + 在庫を合成した dict と JSON バイト列。
+   (構成, 在庫) の組み合わせごとに1回だけシリアライズし、ETag を付与する。
+"""
+import hashlib
+import json
+import logging
+
+from django.core.cache import cache
+from django.db.models import Prefetch
+
+logger = logging.getLogger(__name__)
+
+CACHE_PREFIX = 'menucat'
+CATALOGUE_TTL = 60 * 60  # 1時間（変更時は世代番号で即時無効化）
+
+
+def _version_key(store_id):
+    return f'{CACHE_PREFIX}:ver:{store_id}'
+
+
+def _structure_key(store_id, lang, version):
+    return f'{CACHE_PREFIX}:struct:{store_id}:{lang}:{version}'
+
+
+def _stock_key(store_id):
+    return f'{CACHE_PREFIX}:stock:{store_id}'
+
+
+def _payload_key(store_id, lang, etag):
+    return f'{CACHE_PREFIX}:payload:{store_id}:{lang}:{etag}'
+
+
+def _digest(value):
+    return hashlib.sha1(value.encode('utf-8')).hexdigest()[:16]
+
+
+# ---------------------------------------------------------------------------
+# 無効化
+# ---------------------------------------------------------------------------
+
+def invalidate(store_id):
+    """店舗のカタログ構成の世代を進める（全言語が対象）。"""
+    key = _version_key(store_id)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, 1, None)
+    except Exception as e:
+        logger.warning("menu catalogue invalidate failed for store %s: %s", store_id, e)
+
+
+def refresh_stock(store_id):
+    """在庫マップを DB から再取得して差し替える（構成は作り直さない）。"""
+    from booking.models import Product
+
+    stock = dict(
+        Product.objects.filter(store_id=store_id, is_active=True)
+        .order_by().values_list('id', 'stock')
+    )
+    entry = {
+        'stock': stock,
+        'rev': _digest(json.dumps(sorted(stock.items()))),
+    }
+    try:
+        cache.set(_stock_key(store_id), entry, CATALOGUE_TTL)
+    except Exception as e:
+        logger.warning("menu catalogue stock refresh failed for store %s: %s", store_id, e)
+    return entry
+
+
+# ---------------------------------------------------------------------------
+# 構築
+# ---------------------------------------------------------------------------
+
+def product_display(product, lang, translation=None):
+    """商品1件の表示用 dict（translation 省略時は prefetch 済みの翻訳から選ぶ）。"""
+    if translation is None:
+        # build_structure() は対象言語だけを lang_translations に prefetch する
+        lang_translations = getattr(product, 'lang_translations', None)
+        if lang_translations is not None:
+            translation = lang_translations[0] if lang_translations else None
+        else:
+            translation = next(
+                (t for t in product.translations.all() if t.lang == lang), None,
+            )
+    return {
+        "id": product.id,
+        "sku": product.sku,
+        "name": translation.name if translation else product.name,
+        "description": translation.description if translation else product.description,
+        "price": product.price,
+        "stock": product.stock,
+        "is_sold_out": (product.stock <= 0),
+        "category_id": product.category_id,
+        "image_url": product.image.url if product.image else "",
+    }
+
+
+def build_structure(store, lang):
+    """カテゴリ・商品・翻訳を1回の prefetch で取得し、キャッシュ可能な dict にする。"""
+    from booking.models import Category, Product, ProductTranslation
+
+    categories = [
+        {"id": c.id, "name": c.name}
+        for c in Category.objects.filter(store=store).order_by("sort_order", "name")
+    ]
+    products = (
+        Product.objects.filter(store=store, is_active=True)
+        .prefetch_related(Prefetch(
+            'translations',
+            queryset=ProductTranslation.objects.filter(lang=lang),
+            to_attr='lang_translations',
+        ))
+    )
+    items = []
+    for product in products:
+        item = product_display(product, lang)
+        item["popularity"] = product.popularity
+        items.append(item)
+
+    structure = {
+        "store": {"id": store.id, "name": store.name},
+        "lang": lang,
+        "categories": categories,
+        "products": items,
+    }
+    structure["digest"] = _digest(json.dumps(structure, sort_keys=True, default=str))
+    return structure
+
+
+def _get_structure(store, lang):
+    version = cache.get(_version_key(store.id), 0)
+    key = _structure_key(store.id, lang, version)
+    structure = cache.get(key)
+    if structure is None:
+        structure = build_structure(store, lang)
+        cache.set(key, structure, CATALOGUE_TTL)
+    return structure
+
+
+def _get_stock(store_id):
+    entry = cache.get(_stock_key(store_id))
+    if entry is None:
+        entry = refresh_stock(store_id)
+    return entry
+
+
+def _render(structure, stock_entry):
+    stock = stock_entry['stock']
+    products = []
+    for item in structure["products"]:
+        current = stock.get(item["id"], item["stock"])
+        product = {k: v for k, v in item.items() if k != "popularity"}
+        product["stock"] = current
+        product["is_sold_out"] = current <= 0
+        products.append(product)
+    return {
+        "store": structure["store"],
+        "lang": structure["lang"],
+        "categories": structure["categories"],
+        "products": products,
+    }
+
+
+# ---------------------------------------------------------------------------
+# 取得
+# ---------------------------------------------------------------------------
+
+def get_catalogue(store, lang):
+    """店舗・言語のカタログを返す。
+
+    Returns:
+        {'etag': str, 'data': dict, 'body': bytes}
+        data は CustomerMenuJsonAPIView のレスポンス形式、body はその JSON。
+    """
+    from rest_framework.renderers import JSONRenderer
+
+    structure = _get_structure(store, lang)
+    stock_entry = _get_stock(store.id)
+    etag = f'"{_digest(structure["digest"] + stock_entry["rev"])}"'
+
+    key = _payload_key(store.id, lang, etag)
+    payload = cache.get(key)
+    if payload is None:
+        data = _render(structure, stock_entry)
+        payload = {'etag': etag, 'data': data, 'body': JSONRenderer().render(data)}
+        cache.set(key, payload, CATALOGUE_TTL)
+    return payload
+
+
+def get_alternatives(store, lang, product_id, category_id, limit=5):
+    """売切商品の代替候補（同カテゴリ・在庫あり・人気順）をカタログから返す。"""
+    structure = _get_structure(store, lang)
+    stock = _get_stock(store.id)['stock']
+    candidates = [
+        item for item in structure["products"]
+        if item["id"] != product_id
+        and stock.get(item["id"], item["stock"]) > 0
+        and (not category_id or item["category_id"] == category_id)
+    ]
+    candidates.sort(key=lambda item: (-item["popularity"], item["price"]))
+    return _render({**structure, "products": candidates[:limit]}, {'stock': stock})["products"]
@@ -0,0 +1,184 @@
+"""注文明細の一括確定サービス — テーブル注文・客側メニュー注文・POS 決済で共通
+
+明細数に関係なく一定のクエリ数で確定する:
+
+1. 対象商品を id 順に1クエリで select_for_update（デッドロック回避のため順序固定）
+2. 在庫をメモリ上で検証
+3. StockMovement / OrderItem を bulk_create
+4. 在庫を CASE 式の UPDATE 1文で減算
+5. 在庫閾値割れがあれば通知タスクを1回だけ起動
+"""
+import logging
+from dataclasses import dataclass, field
+
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, When
+
+logger = logging.getLogger(__name__)
+
+
+class OrderCommitError(Exception):
+    """注文を確定できない（商品なし・在庫不足）。確定処理はロールバックされる。"""
+
+    NOT_FOUND = 'not_found'
+    INSUFFICIENT_STOCK = 'insufficient_stock'
+
+    def __init__(self, code, message, product=None, product_ids=None):
+        super().__init__(message)
+        self.code = code
+        self.product = product
+        self.product_ids = product_ids or []
+
+
+@dataclass
+class OrderCommitResult:
+    products: dict = field(default_factory=dict)  # product_id -> Product（更新後の在庫を反映済み）
+    items: list = field(default_factory=list)
+    movements: list = field(default_factory=list)
+    skipped_product_ids: list = field(default_factory=list)
+    low_stock_product_ids: list = field(default_factory=list)
+
+
+def normalize_lines(lines):
+    """(product_id, qty) の列を {product_id: 合計数量} にまとめる（数量0以下・不正値は除外）。"""
+    normalized = {}
+    for pid, qty in lines:
+        try:
+            qty = int(qty)
+        except (TypeError, ValueError):
+            continue
+        if not pid or qty <= 0:
+            continue
+        normalized[pid] = normalized.get(pid, 0) + qty
+    return normalized
+
+
+def commit_order_lines(
+    order,
+    quantities,
+    *,
+    note,
+    staff=None,
+    create_items=True,
+    products_queryset=None,
+    skip_missing=False,
+    allow_shortage=False,
+    notify_low_stock=False,
+):
+    """注文の在庫引当と明細作成をまとめて行う。
+
+    Args:
+        order: 対象の Order
+        quantities: {product_id: qty}
+        note: StockMovement のメモ
+        staff: StockMovement.by_staff
+        create_items: False なら OrderItem を作らない（POS のように明細が既にある場合）
+        products_queryset: ロック対象の絞り込み（省略時は order.store の公開商品）
+        skip_missing: 見つからない商品を無視する（False なら OrderCommitError）
+        allow_shortage: 在庫不足の商品は引当せずに続行する（False なら OrderCommitError）
+        notify_low_stock: 閾値割れ時に check_low_stock_and_notify を1回起動する
+
+    Raises:
+        OrderCommitError: 商品なし・在庫不足（呼び出し側のトランザクションごと巻き戻すこと）
+    """
+    from booking.models import OrderItem, Product, StockMovement
+
+    result = OrderCommitResult()
+    if not quantities:
+        return result
+
+    if products_queryset is None:
+        products_queryset = Product.objects.filter(store_id=order.store_id, is_active=True)
+
+    with transaction.atomic():
+        locked = list(
+            products_queryset.select_for_update()
+            .filter(id__in=quantities.keys())
+            .order_by('id')
+        )
+        products = {p.id: p for p in locked}
+
+        missing = [pid for pid in sorted(quantities, key=str) if _lookup(products, pid) is None]
+        if missing and not skip_missing:
+            raise OrderCommitError(
+                OrderCommitError.NOT_FOUND, f'product not found: {missing}', product_ids=missing,
+            )
+        result.skipped_product_ids.extend(missing)
+
+        deductions = {}
+        for product in locked:
+            qty = _quantity_for(quantities, product.id)
+            if int(product.stock) - qty < 0:
+                if not allow_shortage:
+                    raise OrderCommitError(
+                        OrderCommitError.INSUFFICIENT_STOCK,
+                        f'insufficient stock: {product.sku}', product=product,
+                    )
+                result.skipped_product_ids.append(product.id)
+                continue
+            deductions[product.id] = qty
+
+        if deductions:
+            result.movements = StockMovement.objects.bulk_create([
+                StockMovement(
+                    store_id=products[pid].store_id,
+                    product=products[pid],
+                    movement_type=StockMovement.TYPE_OUT,
+                    qty=qty,
+                    by_staff=staff,
+                    note=note,
+                )
+                for pid, qty in deductions.items()
+            ])
+            Product.objects.filter(pk__in=deductions.keys()).update(stock=Case(
+                *[When(pk=pid, then=F('stock') - qty) for pid, qty in deductions.items()],
+                output_field=IntegerField(),
+            ))
+            for pid, qty in deductions.items():
+                products[pid].stock = int(products[pid].stock) - qty
+
+        if create_items:
+            order_products = [p for p in locked if p.id in deductions]
+            result.items = OrderItem.objects.bulk_create([
+                OrderItem(
+                    order=order,
+                    product=product,
+                    qty=_quantity_for(quantities, product.id),
+                    unit_price=product.price,
+                    status=OrderItem.STATUS_ORDERED,
+                )
+                for product in order_products
+            ])
+
+        result.products = products
+        result.low_stock_product_ids = [
+            pid for pid in deductions
+            if products[pid].low_stock_threshold is not None
+            and products[pid].stock <= products[pid].low_stock_threshold
+        ]
+
+        if deductions:
+            # bulk_create はシグナルを発行しないため、客側メニューの在庫をコミット後に更新
+            from booking.services import menu_catalogue
+            store_ids = {products[pid].store_id for pid in deductions}
+            transaction.on_commit(lambda: [menu_catalogue.refresh_stock(s) for s in store_ids])
+
+        if notify_low_stock and result.low_stock_product_ids:
+            from booking.tasks import check_low_stock_and_notify
+            check_low_stock_and_notify.delay()
+
+    return result
+
+
+def _lookup(products, pid):
+    try:
+        return products.get(int(pid))
+    except (TypeError, ValueError):
+        return None
+
+
+def _quantity_for(quantities, product_id):
+    """quantities のキーが str / int どちらでも数量を引けるようにする。"""
+    if product_id in quantities:
+        return int(quantities[product_id])
+    return int(quantities.get(str(product_id), 0))
@@ -0,0 +1,213 @@
+"""公開ページのフルページキャッシュ — サロゲートキーによる精密パージ付き
+
+匿名ユーザーの GET に対するレンダリング結果を (パス + CACHE_KEY_PARAMS, 言語) 単位でキャッシュする。
+各エントリには 'store:1' / 'notice' / 'page:3' のようなサロゲートキーを付与し、
+キーごとの世代番号をエントリ保存時点の値と比較することで、パージを O(1) で行う。
+
+ビュー側は SurrogateKeyMixin / surrogate_keys デコレータで自身が依存する
+サロゲートキーを宣言する。キーを宣言していないレスポンスはキャッシュしない（オプトイン）。
+"""
+import hashlib
+import logging
+import re
+import secrets
+from functools import wraps
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+CACHE_PREFIX = 'pagecache'
+DEFAULT_TTL = 300  # 5分
+DEFAULT_EDGE_TTL = 60  # エッジ (Nginx) 側は精密パージできないため短めにする
+
+# 全公開ページが base.html 経由で依存するキー（サイト設定・テーマ・サイドバー）
+IMPLICIT_KEYS = ('site', 'theme')
+
+# 保存時にリクエスト固有値を差し替えるプレースホルダ
+NONCE_PLACEHOLDER = '__PAGECACHE_CSP_NONCE__'
+CSRF_PLACEHOLDER = '__PAGECACHE_CSRF_TOKEN__'
+
+_CSRF_INPUT_RE = re.compile(r'name="csrfmiddlewaretoken" value="([^"]+)"')
+
+# キャッシュしないパスのプレフィックス（言語プレフィックスを除いた path_info で判定）
+_EXCLUDED_PREFIXES = (
+    '/admin/', '/api/', '/i18n/', '/line/', '/t/', '/embed/',
+    '/coiney_webhook/', '/healthz', '/mypage/', '/shop/', '/cancel/',
+)
+# ページ内容を変えるクエリパラメータ。これ以外（utm_* 等）はキャッシュキーに含めない
+# store_id は context_processors._resolve_current_store が店舗（テーマ）の判定に使う
+CACHE_KEY_PARAMS = ('page', 'store_id')
+# 保存対象から外すヘッダー（リクエストごとに再計算される）
+_DROP_HEADERS = ('set-cookie', 'x-page-cache', 'vary')
+
+
+def is_enabled():
+    return getattr(settings, 'PAGE_CACHE_ENABLED', False)
+
+
+def get_ttl():
+    return getattr(settings, 'PAGE_CACHE_TTL', DEFAULT_TTL)
+
+
+def edge_headers_enabled():
+    return getattr(settings, 'PAGE_CACHE_EDGE_HEADERS', False)
+
+
+def _tag_cache_key(tag):
+    return f'{CACHE_PREFIX}:tag:{tag}'
+
+
+def _entry_cache_key(path, lang):
+    digest = hashlib.sha256(path.encode('utf-8')).hexdigest()[:32]
+    return f'{CACHE_PREFIX}:page:{lang}:{digest}'
+
+
+def cache_path(request):
+    """キャッシュキー用のパス（CACHE_KEY_PARAMS のクエリだけを順序を揃えて付ける）。"""
+    params = [(name, value) for name in CACHE_KEY_PARAMS for value in request.GET.getlist(name)]
+    return f'{request.path}?{urlencode(params)}' if params else request.path
+
+
+def is_excluded_path(path):
+    from django.utils import translation
+    lang = translation.get_language_from_path(path)
+    if lang:
+        path = path[len(lang) + 1:] or '/'
+    return path.startswith(_EXCLUDED_PREFIXES)
+
+
+# ---------------------------------------------------------------------------
+# サロゲートキー宣言
+# ---------------------------------------------------------------------------
+
+def tag_response(response, *keys):
+    """レスポンスにサロゲートキーを付与する（既存キーとマージ）。"""
+    existing = getattr(response, '_surrogate_keys', set())
+    response._surrogate_keys = set(existing) | {str(k) for k in keys if k}
+    return response
+
+
+def surrogate_keys(*keys):
+    """関数ビュー用デコレータ。固定のサロゲートキーを付与する。"""
+    def decorator(view_func):
+        @wraps(view_func)
+        def _wrapped(request, *args, **kwargs):
+            response = view_func(request, *args, **kwargs)
+            return tag_response(response, *keys)
+        return _wrapped
+    return decorator
+
+
+class SurrogateKeyMixin:
+    """クラスベースビュー用。surrogate_keys 属性または get_surrogate_keys() でキーを宣言する。"""
+    surrogate_keys = ()
+
+    def get_surrogate_keys(self):
+        return list(self.surrogate_keys)
+
+    def dispatch(self, request, *args, **kwargs):
+        response = super().dispatch(request, *args, **kwargs)
+        if response.status_code == 200:
+            tag_response(response, *self.get_surrogate_keys())
+        return response
+
+
+# ---------------------------------------------------------------------------
+# パージ
+# ---------------------------------------------------------------------------
+
+def purge(*keys):
+    """サロゲートキーの世代を進め、そのキーを持つ全エントリを無効化する。"""
+    for key in keys:
+        if not key:
+            continue
+        tag_key = _tag_cache_key(key)
+        try:
+            cache.incr(tag_key)
+        except ValueError:
+            # 未登録のキー: 新しい世代で初期化（既存エントリは世代 None で保存されている）
+            cache.set(tag_key, 1, None)
+        except Exception as e:
+            logger.warning("page cache purge failed for %s: %s", key, e)
+
+
+def _current_versions(tags):
+    keys = {_tag_cache_key(t): t for t in tags}
+    found = cache.get_many(list(keys))
+    return {tag: found.get(cache_key, 0) for cache_key, tag in keys.items()}
+
+
+# ---------------------------------------------------------------------------
+# 保存・取得
+# ---------------------------------------------------------------------------
+
+def store_response(path, lang, response, nonce=None):
+    """レスポンスを正規化してキャッシュに保存する。保存したサロゲートキーを返す。"""
+    tags = set(getattr(response, '_surrogate_keys', set())) | set(IMPLICIT_KEYS)
+    content = response.content.decode(response.charset or 'utf-8')
+    headers = {
+        k: v for k, v in response.items()
+        if k.lower() not in _DROP_HEADERS
+    }
+
+    # CSP nonce は本文とヘッダーの両方をプレースホルダ化し、ヒット時に再発行する
+    if nonce:
+        content = content.replace(nonce, NONCE_PLACEHOLDER)
+        headers = {k: v.replace(nonce, NONCE_PLACEHOLDER) for k, v in headers.items()}
+
+    # CSRF トークン（同一レンダリング内では同じ値）をプレースホルダ化
+    for token in set(_CSRF_INPUT_RE.findall(content)):
+        content = content.replace(token, CSRF_PLACEHOLDER)
+
+    entry = {
+        'status': response.status_code,
+        'content': content,
+        'headers': headers,
+        'tags': _current_versions(tags),
+    }
+    try:
+        cache.set(_entry_cache_key(path, lang), entry, get_ttl())
+    except Exception as e:
+        logger.warning("page cache store failed for %s: %s", path, e)
+    return tags
+
+
+def get_entry(path, lang):
+    """有効なエントリを返す。いずれかのサロゲートキーがパージ済みなら None。"""
+    try:
+        entry = cache.get(_entry_cache_key(path, lang))
+        if entry is None:
+            return None
+        if _current_versions(entry['tags']) != entry['tags']:
+            return None
+    except Exception as e:
+        logger.warning("page cache lookup failed for %s: %s", path, e)
+        return None
+    return entry
+
+
+def render_entry(entry, csrf_token_factory, nonce_factory=None):
+    """エントリからレスポンス本文・ヘッダーを復元する。
+
+    csrf_token_factory はプレースホルダが含まれる場合のみ呼ばれる。
+    nonce_factory 省略時は新しい nonce を生成する。
+    """
+    nonce = (nonce_factory or (lambda: secrets.token_urlsafe(16)))()
+    content = entry['content'].replace(NONCE_PLACEHOLDER, nonce)
+    if CSRF_PLACEHOLDER in content:
+        content = content.replace(CSRF_PLACEHOLDER, csrf_token_factory())
+    headers = {
+        k: v.replace(NONCE_PLACEHOLDER, nonce) for k, v in entry['headers'].items()
+    }
+    return content, headers
+
+
+def apply_edge_headers(response, tags):
+    """Nginx proxy_cache 互換のヘッダーを付与する（PAGE_CACHE_EDGE_HEADERS=True 時）。"""
+    ttl = getattr(settings, 'PAGE_CACHE_EDGE_TTL', DEFAULT_EDGE_TTL)
+    response['X-Accel-Expires'] = str(ttl)
+    response['Surrogate-Key'] = ' '.join(sorted(tags))
+    return response
@@ -8,13 +8,21 @@
 4. 源泉徴収税計算（課税対象額から月額表参照）
 5. 住民税加算（固定月額）
 6. PayrollEntry + PayrollDeduction レコード生成
+
+期間一括計算（calculate_payroll_batch）は勤怠を全スタッフ分まとめて1クエリで集計し、
+メモリ上で計算した結果を1トランザクションで一括保存する（集計/計算/保存の所要時間を返す）。
+calculate_payroll_for_staff はスタッフ1名分のバッチとして動く。
 """
 import logging
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
 from datetime import date
 from decimal import Decimal, ROUND_DOWN
 
 from django.db import transaction
-from django.db.models import Sum
+from django.db.models import Count, Sum
+from django.utils import timezone
 
 logger = logging.getLogger(__name__)
 
@@ -246,47 +254,77 @@ def _calc_social_insurance(contract, salary_structure, gross_pay, birth_date=Non
     }
 
 
-def calculate_payroll_for_staff(period, staff, contract, salary_structure):
-    """個別スタッフの給与計算を行い PayrollEntry + PayrollDeduction を生成する。
+_HOURS_QUANT = Decimal('0.01')
+
+# PayrollEntry の計算結果フィールド（bulk_update 対象）
+ENTRY_FIELDS = (
+    'contract', 'total_work_days',
+    'total_regular_hours', 'total_overtime_hours', 'total_late_night_hours', 'total_holiday_hours',
+    'base_pay', 'overtime_pay', 'late_night_pay', 'holiday_pay', 'allowances',
+    'gross_pay', 'total_deductions', 'net_pay',
+)
+
+_EMPTY_TOTALS = {
+    'total_regular': 0, 'total_overtime': 0, 'total_late_night': 0, 'total_holiday': 0,
+    'work_days': 0,
+}
 
-    Args:
-        period: PayrollPeriod instance
-        staff: Staff instance
-        contract: EmploymentContract instance
-        salary_structure: SalaryStructure instance
+
+@dataclass
+class PayrollBatchResult:
+    entries: list = field(default_factory=list)
+    failed: list = field(default_factory=list)  # 計算に失敗した Staff
+    timings: dict = field(default_factory=dict)  # フェーズ名 -> 秒
+
+    def timing_summary(self):
+        labels = {'aggregate': '集計', 'compute': '計算', 'persist': '保存'}
+        return ' / '.join(
+            f'{labels.get(name, name)} {seconds * 1000:.0f}ms' for name, seconds in self.timings.items()
+        )
+
+
+def aggregate_attendance(period, staff_ids):
+    """期間内の WorkAttendance をスタッフごとに1クエリで集計する。
 
     Returns:
-        PayrollEntry instance (saved)
+        {staff_id: {'total_regular', 'total_overtime', 'total_late_night', 'total_holiday', 'work_days'}}
     """
-    from booking.models import WorkAttendance, PayrollEntry, PayrollDeduction
-
-    # 1. 期間内の WorkAttendance 集計
-    attendances = WorkAttendance.objects.filter(
-        staff=staff,
-        date__gte=period.period_start,
-        date__lte=period.period_end,
-    )
+    from booking.models import WorkAttendance
 
-    agg = attendances.aggregate(
-        total_regular=Sum('regular_minutes'),
-        total_overtime=Sum('overtime_minutes'),
-        total_late_night=Sum('late_night_minutes'),
-        total_holiday=Sum('holiday_minutes'),
+    rows = (
+        WorkAttendance.objects.filter(
+            staff_id__in=staff_ids,
+            date__gte=period.period_start,
+            date__lte=period.period_end,
+        )
+        .values('staff_id')
+        .annotate(
+            total_regular=Sum('regular_minutes'),
+            total_overtime=Sum('overtime_minutes'),
+            total_late_night=Sum('late_night_minutes'),
+            total_holiday=Sum('holiday_minutes'),
+            work_days=Count('id'),
+        )
+        .order_by()
     )
+    return {
+        row.pop('staff_id'): {k: v or 0 for k, v in row.items()}
+        for row in rows
+    }
 
-    regular_min = agg['total_regular'] or 0
-    overtime_min = agg['total_overtime'] or 0
-    late_night_min = agg['total_late_night'] or 0
-    holiday_min = agg['total_holiday'] or 0
 
-    work_days = attendances.count()
+def compute_payroll(period, contract, salary_structure, totals):
+    """集計済み勤怠から給与を計算する（DB アクセスなし）。
 
-    regular_hours = Decimal(regular_min) / 60
-    overtime_hours = Decimal(overtime_min) / 60
-    late_night_hours = Decimal(late_night_min) / 60
-    holiday_hours = Decimal(holiday_min) / 60
+    Returns:
+        (entry_fields: dict, deduction_rows: list of (deduction_type, amount, is_employer_only))
+    """
+    regular_hours = Decimal(totals['total_regular']) / 60
+    overtime_hours = Decimal(totals['total_overtime']) / 60
+    late_night_hours = Decimal(totals['total_late_night']) / 60
+    holiday_hours = Decimal(totals['total_holiday']) / 60
 
-    # 2. 総支給額計算
+    # 総支給額計算
     if contract.pay_type == 'hourly':
         rate = Decimal(contract.hourly_rate)
         base_pay = int(rate * regular_hours)
@@ -304,15 +342,14 @@ def calculate_payroll_for_staff(period, staff, contract, salary_structure):
     allowances = contract.commute_allowance + contract.housing_allowance + contract.family_allowance
     gross_pay = base_pay + overtime_pay + late_night_pay + holiday_pay + allowances
 
-    # 3. 社会保険料計算
-    target_date = period.period_end
+    # 社会保険料計算
     insurance = _calc_social_insurance(
         contract, salary_structure, gross_pay,
         birth_date=contract.birth_date,
-        target_date=target_date,
+        target_date=period.period_end,
     )
 
-    # 4. 源泉徴収税（課税対象額 = 総支給 - 社会保険料（従業員負担分）- 非課税通勤手当）
+    # 源泉徴収税（課税対象額 = 総支給 - 社会保険料（従業員負担分）- 非課税通勤手当）
     employee_insurance = (
         insurance['pension'] + insurance['health_insurance'] +
         insurance['employment_insurance'] + insurance['long_term_care']
@@ -322,75 +359,168 @@ def calculate_payroll_for_staff(period, staff, contract, salary_structure):
     taxable_amount = max(0, gross_pay - employee_insurance - non_taxable_commute)
     income_tax = lookup_withholding_tax(taxable_amount)
 
-    # 5. 住民税
+    # 住民税
     resident_tax = contract.resident_tax_monthly
 
-    # 6. 控除合計 & 差引支給額
+    # 控除合計 & 差引支給額
     total_deductions = employee_insurance + income_tax + resident_tax
     net_pay = gross_pay - total_deductions
 
-    # レコード生成
+    entry_fields = {
+        'contract': contract,
+        'total_work_days': totals['work_days'],
+        'total_regular_hours': regular_hours.quantize(_HOURS_QUANT, rounding=ROUND_DOWN),
+        'total_overtime_hours': overtime_hours.quantize(_HOURS_QUANT, rounding=ROUND_DOWN),
+        'total_late_night_hours': late_night_hours.quantize(_HOURS_QUANT, rounding=ROUND_DOWN),
+        'total_holiday_hours': holiday_hours.quantize(_HOURS_QUANT, rounding=ROUND_DOWN),
+        'base_pay': base_pay,
+        'overtime_pay': overtime_pay,
+        'late_night_pay': late_night_pay,
+        'holiday_pay': holiday_pay,
+        'allowances': allowances,
+        'gross_pay': gross_pay,
+        'total_deductions': total_deductions,
+        'net_pay': net_pay,
+    }
+
+    deduction_rows = [
+        ('income_tax', income_tax, False),
+        ('resident_tax', resident_tax, False),
+        ('pension', insurance['pension'], False),
+        ('health_insurance', insurance['health_insurance'], False),
+        ('employment_insurance', insurance['employment_insurance'], False),
+    ]
+    if insurance['long_term_care'] > 0:
+        deduction_rows.append(('long_term_care', insurance['long_term_care'], False))
+    # 労災保険は事業主のみ
+    if insurance['workers_comp'] > 0:
+        deduction_rows.append(('workers_comp', insurance['workers_comp'], True))
+
+    return entry_fields, deduction_rows
+
+
+def calculate_payroll_batch(period, assignments, salary_structure, *, raise_errors=False):
+    """複数スタッフの給与をまとめて計算・保存する。
+
+    1. 勤怠集計: 全スタッフ分を GROUP BY で1クエリ
+    2. 計算: メモリ上（スタッフ単位の失敗はログに残して除外）
+    3. 保存: 1トランザクションで PayrollEntry を一括作成/更新し、控除を削除→bulk_create
+
+    Args:
+        period: PayrollPeriod instance
+        assignments: (Staff, EmploymentContract) の列
+        salary_structure: SalaryStructure instance
+        raise_errors: True ならスタッフ単位の計算エラーをそのまま送出する
+
+    Returns:
+        PayrollBatchResult
+    """
+    from booking.models import PayrollEntry, PayrollDeduction
+
+    result = PayrollBatchResult()
+    # 同一スタッフが複数回渡された場合は後勝ち（unique_together(period, staff)）
+    by_staff = {staff.id: (staff, contract) for staff, contract in assignments}
+
+    started = time.perf_counter()
+    totals_by_staff = aggregate_attendance(period, list(by_staff))
+    result.timings['aggregate'] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    computed = {}
+    for staff_id, (staff, contract) in by_staff.items():
+        try:
+            computed[staff_id] = compute_payroll(
+                period, contract, salary_structure, totals_by_staff.get(staff_id, _EMPTY_TOTALS),
+            )
+        except Exception:
+            if raise_errors:
+                raise
+            logger.exception("Failed to calculate payroll for %s", staff.name)
+            result.failed.append(staff)
+    result.timings['compute'] = time.perf_counter() - started
+
+    started = time.perf_counter()
     with transaction.atomic():
-        entry, created = PayrollEntry.objects.update_or_create(
-            period=period,
-            staff=staff,
-            defaults={
-                'contract': contract,
-                'total_work_days': work_days,
-                'total_regular_hours': regular_hours.quantize(Decimal('0.01'), rounding=ROUND_DOWN),
-                'total_overtime_hours': overtime_hours.quantize(Decimal('0.01'), rounding=ROUND_DOWN),
-                'total_late_night_hours': late_night_hours.quantize(Decimal('0.01'), rounding=ROUND_DOWN),
-                'total_holiday_hours': holiday_hours.quantize(Decimal('0.01'), rounding=ROUND_DOWN),
-                'base_pay': base_pay,
-                'overtime_pay': overtime_pay,
-                'late_night_pay': late_night_pay,
-                'holiday_pay': holiday_pay,
-                'allowances': allowances,
-                'gross_pay': gross_pay,
-                'total_deductions': total_deductions,
-                'net_pay': net_pay,
-            }
-        )
+        existing = {
+            e.staff_id: e
+            for e in PayrollEntry.objects.select_for_update().filter(
+                period=period, staff_id__in=computed.keys(),
+            )
+        }
+        now = timezone.now()
+        to_create, to_update = [], []
+        for staff_id, (entry_fields, _rows) in computed.items():
+            staff = by_staff[staff_id][0]
+            entry = existing.get(staff_id)
+            if entry is None:
+                entry = PayrollEntry(period=period, staff=staff, **entry_fields)
+                to_create.append(entry)
+            else:
+                for name, value in entry_fields.items():
+                    setattr(entry, name, value)
+                entry.staff = staff
+                entry.updated_at = now  # bulk_update は auto_now を更新しない
+                to_update.append(entry)
+            result.entries.append(entry)
+
+        if to_create:
+            PayrollEntry.objects.bulk_create(to_create)
+        if to_update:
+            PayrollEntry.objects.bulk_update(to_update, [*ENTRY_FIELDS, 'updated_at'])
 
         # 既存の控除を削除して再作成
-        entry.deductions.all().delete()
-
-        deduction_rows = [
-            ('income_tax', income_tax, False),
-            ('resident_tax', resident_tax, False),
-            ('pension', insurance['pension'], False),
-            ('health_insurance', insurance['health_insurance'], False),
-            ('employment_insurance', insurance['employment_insurance'], False),
-        ]
-        if insurance['long_term_care'] > 0:
-            deduction_rows.append(('long_term_care', insurance['long_term_care'], False))
-        # 労災保険は事業主のみ
-        if insurance['workers_comp'] > 0:
-            deduction_rows.append(('workers_comp', insurance['workers_comp'], True))
-
-        for dtype, amount, employer_only in deduction_rows:
-            PayrollDeduction.objects.create(
+        PayrollDeduction.objects.filter(entry__in=to_update).delete()
+        PayrollDeduction.objects.bulk_create([
+            PayrollDeduction(
                 entry=entry,
                 deduction_type=dtype,
                 amount=amount,
                 is_employer_only=employer_only,
             )
+            for entry in result.entries
+            for dtype, amount, employer_only in computed[entry.staff_id][1]
+        ])
+    result.timings['persist'] = time.perf_counter() - started
 
     logger.info(
-        "Payroll calculated: %s %s gross=%d net=%d",
-        staff.name, period.year_month, gross_pay, net_pay,
+        "Payroll batch: %s %s entries=%d failed=%d (%s)",
+        period.store_id, period.year_month, len(result.entries), len(result.failed),
+        result.timing_summary(),
     )
-    return entry
+    return result
 
 
-def calculate_payroll_for_period(period):
-    """給与計算期間内の全スタッフの給与を一括計算する。
+def calculate_payroll_for_staff(period, staff, contract, salary_structure):
+    """個別スタッフの給与計算を行い PayrollEntry + PayrollDeduction を生成する。
 
     Args:
         period: PayrollPeriod instance
+        staff: Staff instance
+        contract: EmploymentContract instance
+        salary_structure: SalaryStructure instance
 
     Returns:
-        list of PayrollEntry instances
+        PayrollEntry instance (saved)
+    """
+    result = calculate_payroll_batch(period, [(staff, contract)], salary_structure, raise_errors=True)
+    entry = result.entries[0]
+    logger.info(
+        "Payroll calculated: %s %s gross=%d net=%d",
+        staff.name, period.year_month, entry.gross_pay, entry.net_pay,
+    )
+    return entry
+
+
+@contextmanager
+def period_calculation(period):
+    """期間一括計算の前後処理。
+
+    有効な雇用契約の (Staff, EmploymentContract) の列と SalaryStructure を渡し、
+    期間の状態を calculating → confirmed に進める（計算が例外で終わった場合は calculating のまま）。
+
+    Usage:
+        with period_calculation(period) as (assignments, salary_structure):
+            result = calculate_payroll_batch(period, assignments, salary_structure)
     """
     from booking.models import EmploymentContract, SalaryStructure
 
@@ -408,15 +538,24 @@ def calculate_payroll_for_period(period):
     period.status = 'calculating'
     period.save(update_fields=['status'])
 
-    entries = []
-    for contract in contracts:
-        try:
-            entry = calculate_payroll_for_staff(period, contract.staff, contract, salary_structure)
-            entries.append(entry)
-        except Exception:
-            logger.exception("Failed to calculate payroll for %s", contract.staff.name)
+    yield [(contract.staff, contract) for contract in contracts], salary_structure
 
     period.status = 'confirmed'
     period.save(update_fields=['status'])
 
-    return entries
+
+def calculate_payroll_for_period(period):
+    """給与計算期間内の全スタッフの給与を一括計算する。
+
+    フェーズ別所要時間や失敗したスタッフが必要な場合は period_calculation と
+    calculate_payroll_batch を直接使う。
+
+    Args:
+        period: PayrollPeriod instance
+
+    Returns:
+        list of PayrollEntry instances
+    """
+    with period_calculation(period) as (assignments, salary_structure):
+        result = calculate_payroll_batch(period, assignments, salary_structure)
+    return result.entries
@@ -0,0 +1,378 @@
+"""
+クエリ予算（query budget）による性能回帰チェック
+
+シード済みの一時データ（1/10/100 店舗規模）に対して重いエンドポイントを実行し、
+- シナリオごとのクエリ数が予算以内であること
+- 店舗数を増やしてもクエリ数が増えないこと（N+1 の検出）
+- 所要時間・クエリ数がベースライン JSON から閾値以上悪化していないこと
+を検査する。データは呼び出し側のトランザクションでロールバックする前提。
+
+benchmark_query_budgets コマンドと tests/test_query_budgets.py から利用する。
+"""
+import hashlib
+import json
+import time
+import uuid
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta
+from datetime import time as dt_time
+from pathlib import Path
+from typing import Callable
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+BASELINE_PATH = Path(settings.BASE_DIR) / 'tests' / 'query_budget_baseline.json'
+DEFAULT_SCALES = (1, 10, 100)
+DEFAULT_REPEAT = 5
+DEFAULT_THRESHOLD = 0.5
+# これ未満の悪化（ms）は計測誤差として扱う
+MIN_REGRESSION_MS = 10.0
+
+BENCH_API_KEY = 'bench-iot-api-key'
+STAFF_PER_STORE = 4
+PRODUCTS_PER_STORE = 12
+ORDERS_PER_STORE = 30
+ITEMS_PER_ORDER = 3
+SHIFT_DAYS = 10
+
+# 計測中は他のキャッシュ・計測ミドルウェアの影響を受けないようにする
+ISOLATED_SETTINGS = {
+    'CACHES': {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'query-budget',
+        },
+    },
+    'PAGE_CACHE_ENABLED': False,
+    'QUERY_PROFILE_ENABLED': False,
+}
+
+
+class QueryBudgetError(Exception):
+    """シナリオが正常に応答しなかった"""
+
+
+@dataclass
+class BenchData:
+    """seed() が作成したデータへの参照"""
+    stores: list
+    admin: object
+    staff: object
+    device: object
+    shift_period: object
+    payroll_period: object
+    category: object
+    products: list
+
+    @property
+    def store(self):
+        return self.stores[0]
+
+
+@dataclass(frozen=True)
+class Scenario:
+    """計測対象。prepare(client, data) が計測区間で呼ぶ関数を返す"""
+    name: str
+    budget: int
+    prepare: Callable
+
+
+# ==============================
+# シードデータ
+# ==============================
+
+def seed(scale):
+    """scale 店舗分のベンチマーク用データを一括作成する。"""
+    from booking.models import (
+        Category, EmploymentContract, IoTDevice, Order, OrderItem, PayrollPeriod, Product,
+        SalaryStructure, Schedule, ShiftPeriod, ShiftRequest, SiteSettings, Staff, Store,
+        StoreScheduleConfig, WorkAttendance,
+    )
+    User = get_user_model()
+    run = uuid.uuid4().hex[:6]
+    now = timezone.now()
+    today = timezone.localdate()
+    next_month = (today.replace(day=1) + timedelta(days=32)).replace(day=1)
+    last_month_end = today.replace(day=1) - timedelta(days=1)
+    last_month = last_month_end.replace(day=1)
+
+    stores = Store.objects.bulk_create([
+        Store(name=f'bench-{i}', address='-', business_hours='9:00-21:00', nearest_station='-')
+        for i in range(scale)
+    ])
+    StoreScheduleConfig.objects.bulk_create([
+        StoreScheduleConfig(store=store, open_hour=9, close_hour=21, slot_duration=60)
+        for store in stores
+    ])
+    SalaryStructure.objects.bulk_create([SalaryStructure(store=store) for store in stores])
+
+    users = User.objects.bulk_create([
+        User(username=f'bench-{run}-{i}-{j}', password='!')
+        for i in range(scale) for j in range(STAFF_PER_STORE)
+    ])
+    staff = Staff.objects.bulk_create([
+        Staff(name=user.username, store=stores[n // STAFF_PER_STORE], user=user, staff_type='fortune_teller')
+        for n, user in enumerate(users)
+    ])
+
+    categories = Category.objects.bulk_create([Category(store=store, name='bench') for store in stores])
+    products = Product.objects.bulk_create([
+        Product(
+            store=store, category=category, sku=f'BENCH-{store.pk}-{i}', name=f'bench-{i}',
+            price=300 + i * 50, stock=1000, is_active=True,
+        )
+        for store, category in zip(stores, categories)
+        for i in range(PRODUCTS_PER_STORE)
+    ])
+
+    orders, stamps = [], []
+    for store in stores:
+        for n in range(ORDERS_PER_STORE):
+            orders.append(Order(store=store, status=Order.STATUS_CLOSED, payment_status='paid', channel='pos'))
+            stamps.append(now - timedelta(days=n % 14, hours=n % 9))
+    Order.objects.bulk_create(orders, batch_size=2000)
+    # created_at は auto_now_add のため作成後に書き換える
+    for order, stamp in zip(orders, stamps):
+        order.created_at = stamp
+    Order.objects.bulk_update(orders, ['created_at'], batch_size=2000)
+    OrderItem.objects.bulk_create([
+        OrderItem(
+            order=order, product=product, qty=1 + k, unit_price=product.price,
+            status=OrderItem.STATUS_CLOSED,
+        )
+        for n, order in enumerate(orders)
+        for k, product in enumerate(
+            products[(n // ORDERS_PER_STORE) * PRODUCTS_PER_STORE:][n % 4:n % 4 + ITEMS_PER_ORDER]
+        )
+    ], batch_size=5000)
+
+    # cancel_token は save() で採番されるため bulk_create では明示する
+    day_start = timezone.make_aware(datetime.combine(today, dt_time(10)))
+    Schedule.objects.bulk_create([
+        Schedule(
+            staff=member, store=member.store, start=day_start + timedelta(hours=h),
+            end=day_start + timedelta(hours=h + 1), is_temporary=False,
+            customer_name='bench', price=3000, cancel_token=uuid.uuid4().hex[:8].upper(),
+        )
+        for member in staff for h in (0, 3)
+    ], batch_size=2000)
+
+    api_key_hash = hashlib.sha256(BENCH_API_KEY.encode()).hexdigest()
+    devices = IoTDevice.objects.bulk_create([
+        IoTDevice(
+            name='bench', store=store, device_type='multi', external_id=f'bench-{run}-{store.pk}',
+            api_key_hash=api_key_hash, api_key_prefix=BENCH_API_KEY[:8],
+        )
+        for store in stores
+    ])
+
+    shift_periods = ShiftPeriod.objects.bulk_create([
+        ShiftPeriod(store=store, year_month=next_month, status='open') for store in stores
+    ])
+    period_by_store = {period.store_id: period for period in shift_periods}
+    ShiftRequest.objects.bulk_create([
+        ShiftRequest(
+            period=period_by_store[member.store_id], staff=member, date=next_month + timedelta(days=d),
+            start_hour=9 + (n % 2) * 4, end_hour=17 + (n % 2) * 4,
+            preference='preferred' if n % 2 else 'available',
+        )
+        for n, member in enumerate(staff) for d in range(SHIFT_DAYS)
+    ], batch_size=2000)
+
+    EmploymentContract.objects.bulk_create([
+        EmploymentContract(
+            staff=member, employment_type='part_time', pay_type='hourly', hourly_rate=1200,
+            standard_monthly_remuneration=200000, birth_date=date(1990, 5, 15), is_active=True,
+        )
+        for member in staff
+    ], batch_size=2000)
+    WorkAttendance.objects.bulk_create([
+        WorkAttendance(
+            staff=member, date=last_month + timedelta(days=d), clock_in=dt_time(9), clock_out=dt_time(17),
+            regular_minutes=420, overtime_minutes=0, break_minutes=60, source='shift',
+        )
+        for member in staff for d in range(SHIFT_DAYS)
+    ], batch_size=2000)
+    payroll_periods = PayrollPeriod.objects.bulk_create([
+        PayrollPeriod(
+            store=store, year_month=last_month.strftime('%Y-%m'),
+            period_start=last_month, period_end=last_month_end, status='draft',
+        )
+        for store in stores
+    ])
+
+    # シングルトンの初回作成（INSERT）を計測に含めない（load() は前回のロールバック前の値をキャッシュから返しうる）
+    SiteSettings.objects.get_or_create(pk=1)
+    admin = User(username=f'bench-admin-{run}', is_staff=True, is_superuser=True)
+    admin.set_unusable_password()
+    admin.save()
+
+    return BenchData(
+        stores=stores, admin=admin, staff=staff[0], device=devices[0],
+        shift_period=shift_periods[0], payroll_period=payroll_periods[0],
+        category=categories[0], products=products[:PRODUCTS_PER_STORE],
+    )
+
+
+# ==============================
+# シナリオ
+# ==============================
+
+def _get(url, **extra):
+    def prepare(client, data):
+        path = url(data) if callable(url) else url
+        return lambda: client.get(path, **extra)
+    return prepare
+
+
+def _prepare_pos_checkout(client, data):
+    from booking.models import Order, OrderItem
+    order = Order.objects.create(store=data.store, status=Order.STATUS_OPEN, channel='pos')
+    OrderItem.objects.bulk_create([
+        OrderItem(order=order, product=product, qty=1, unit_price=product.price)
+        for product in data.products[:ITEMS_PER_ORDER]
+    ])
+    body = json.dumps({'order_id': order.pk, 'cash_received': 10000})
+    return lambda: client.post('/api/pos/checkout/', body, content_type='application/json')
+
+
+def _prepare_iot_ingest(client, data):
+    body = json.dumps({
+        'device': data.device.external_id,
+        'event_type': 'sensor_reading',
+        'payload': {'mq9': 120, 'light': 300, 'sound': 40, 'temp': 22.5, 'hum': 45},
+    })
+    return lambda: client.post(
+        '/api/iot/events/', body, content_type='application/json', HTTP_X_API_KEY=BENCH_API_KEY,
+    )
+
+
+def _prepare_auto_schedule(client, data):
+    body = json.dumps({'period_id': data.shift_period.pk})
+    url = f"{reverse('booking_api:shift_api:shift_auto_schedule')}?store_id={data.store.pk}"
+    return lambda: client.post(url, body, content_type='application/json')
+
+
+def _prepare_payroll(client, data):
+    from booking.services.payroll_calculator import calculate_payroll_for_period
+    return lambda: calculate_payroll_for_period(data.payroll_period)
+
+
+def _today_calendar_url(data):
+    today = timezone.localdate()
+    return reverse('booking:date_first_calendar_day', args=[today.year, today.month, today.day])
+
+
+SCENARIOS = (
+    Scenario('availability_by_date', 15, _get(_today_calendar_url)),
+    Scenario('availability_staff_calendar', 17, _get(
+        lambda data: reverse('booking:staff_calendar', args=[data.staff.pk]),
+    )),
+    Scenario('dashboard_sales', 6, _get('/api/dashboard/sales/?period=daily&days=30')),
+    Scenario('dashboard_reservations', 8, _get('/api/dashboard/reservations/')),
+    Scenario('dashboard_shift_summary', 8, _get('/api/dashboard/shift-summary/')),
+    Scenario('menu_json', 10, _get(
+        lambda data: f"{reverse('booking_api:customer_menu_json')}?store_id={data.store.pk}&lang=ja",
+    )),
+    Scenario('pos_checkout', 22, _prepare_pos_checkout),
+    Scenario('iot_ingest', 10, _prepare_iot_ingest),
+    Scenario('shift_auto_schedule', 70, _prepare_auto_schedule),
+    Scenario('payroll_period', 14, _prepare_payroll),
+)
+
+
+# ==============================
+# 計測
+# ==============================
+
+def measure(data, scenarios=SCENARIOS, repeat=DEFAULT_REPEAT):
+    """各シナリオを repeat 回実行し {name: {'queries': 最大値, 'ms': 最小値}} を返す。
+
+    所要時間は他プロセスの影響を受けにくい最小値（best of N）を採る。
+    """
+    client = Client(HTTP_USER_AGENT='query-budget-benchmark')
+    client.force_login(data.admin)
+    results = {}
+    with override_settings(**ISOLATED_SETTINGS):
+        for scenario in scenarios:
+            counts, timings = [], []
+            for _ in range(repeat):
+                cache.clear()
+                action = scenario.prepare(client, data)
+                with CaptureQueriesContext(connection) as ctx:
+                    started = time.perf_counter()
+                    response = action()
+                    elapsed = time.perf_counter() - started
+                status = getattr(response, 'status_code', 200)
+                if status >= 400:
+                    raise QueryBudgetError(f'{scenario.name}: HTTP {status}')
+                counts.append(len(ctx.captured_queries))
+                timings.append(elapsed * 1000)
+            results[scenario.name] = {
+                'queries': max(counts),
+                'ms': round(min(timings), 2),
+            }
+        cache.clear()
+    return results
+
+
+def check(results, scenarios=SCENARIOS):
+    """予算超過とスケール依存（N+1）を検出し、違反メッセージのリストを返す。
+
+    results は {scale: measure() の戻り値}。
+    """
+    budgets = {scenario.name: scenario.budget for scenario in scenarios}
+    violations = []
+    scales = sorted(results)
+    for scale in scales:
+        for name, row in results[scale].items():
+            if row['queries'] > budgets[name]:
+                violations.append(f'{name} @ {scale} stores: {row["queries"]} queries > budget {budgets[name]}')
+    smallest = scales[0] if scales else None
+    for scale in scales[1:]:
+        for name, row in results[scale].items():
+            base = results[smallest][name]['queries']
+            if row['queries'] > base:
+                violations.append(
+                    f'{name}: queries grow with store count ({base} @ {smallest} → {row["queries"]} @ {scale})'
+                )
+    return violations
+
+
+def compare(results, baseline, threshold=DEFAULT_THRESHOLD, timing=True):
+    """ベースラインに対する悪化（クエリ数増加・所要時間が threshold 超の増加）を返す。"""
+    regressions = []
+    for scale, rows in results.items():
+        base_rows = baseline.get(str(scale), {})
+        for name, row in rows.items():
+            base = base_rows.get(name)
+            if not base:
+                continue
+            if row['queries'] > base['queries']:
+                regressions.append(f'{name} @ {scale} stores: queries {base["queries"]} → {row["queries"]}')
+            limit = base['ms'] * (1 + threshold)
+            if timing and row['ms'] > limit and row['ms'] - base['ms'] >= MIN_REGRESSION_MS:
+                regressions.append(
+                    f'{name} @ {scale} stores: {base["ms"]:.1f} ms → {row["ms"]:.1f} ms '
+                    f'(+{(row["ms"] / base["ms"] - 1) * 100:.0f}%)'
+                )
+    return regressions
+
+
+def load_baseline(path=BASELINE_PATH):
+    path = Path(path)
+    if not path.exists():
+        return {}
+    return json.loads(path.read_text(encoding='utf-8'))
+
+
+def save_baseline(results, path=BASELINE_PATH):
+    data = {str(scale): rows for scale, rows in sorted(results.items())}
+    Path(path).write_text(json.dumps(data, indent=2, sort_keys=True) + '\n', encoding='utf-8')
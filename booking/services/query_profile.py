@@ -0,0 +1,333 @@
+"""ビューごとのクエリ数・レイテンシ計測（オプトイン・サンプリング）
+
+QueryProfileMiddleware がサンプリングしたリクエストについて、DB の execute wrapper で
+クエリ数・DB 時間・正規化 SQL（フィンガープリント）を数え、解決した URL 名ごとに記録する。
+
+- 記録先は共有キャッシュ上の WINDOW_SECONDS ごとのカウンタ（cache.incr のみなのでワーカー間で安全）。
+  レイテンシとクエリ数はヒストグラム（固定バケット）で持つ
+- flush()（Celery beat で定期実行）が締まったウィンドウを QueryProfileSummary（1時間単位）に加算する
+- regression_report(): 直近 RECENT_HOURS と、その前 BASELINE_DAYS の比較（デバッグパネル用）
+
+有効化は settings.QUERY_PROFILE_ENABLED、サンプリング率は SystemConfig の
+'query_profile_sample_rate'（未設定なら settings.QUERY_PROFILE_SAMPLE_RATE）。
+同じ SQL（リテラルを除いて同一）が1リクエスト内で2回以上実行されたものを重複（N+1 の兆候）とする。
+"""
+import hashlib
+import logging
+import random
+import re
+import time
+from collections import Counter
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+CACHE_PREFIX = 'qprof'
+WINDOW_SECONDS = 300
+WINDOW_TTL = 60 * 60 * 6  # flush が止まっていても数時間分は残す
+RETENTION_DAYS = 30
+TOP_DUPLICATES = 10
+RECENT_HOURS = 24
+REPORT_LIMIT = 15
+BASELINE_DAYS = 7
+
+# ヒストグラムのバケット上限（最後のバケットは上限なし）
+LATENCY_BUCKETS_MS = (10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+QUERY_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200)
+
+_COUNTERS = ('n', 'queries', 'dups', 'db_us', 'total_us')
+
+_STRING_RE = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_RE = re.compile(r'\b\d+(?:\.\d+)?\b')
+_IN_LIST_RE = re.compile(r'\bIN\s*\((?:\s*(?:%s|\?)\s*,?)+\)', re.IGNORECASE)
+_SPACE_RE = re.compile(r'\s+')
+
+
+def is_enabled():
+    return getattr(settings, 'QUERY_PROFILE_ENABLED', False)
+
+
+def sample_rate():
+    from booking.models import SystemConfig
+    default = getattr(settings, 'QUERY_PROFILE_SAMPLE_RATE', 0.0)
+    try:
+        value = SystemConfig.get('query_profile_sample_rate', '')
+        rate = float(value) if value != '' else float(default)
+    except (TypeError, ValueError):
+        rate = float(default)
+    return min(max(rate, 0.0), 1.0)
+
+
+def should_sample():
+    rate = sample_rate()
+    return rate > 0 and (rate >= 1 or random.random() < rate)
+
+
+def fingerprint(sql):
+    """リテラルとプレースホルダの個数を除いた SQL（同じ形のクエリが同じ値になる）"""
+    sql = _STRING_RE.sub('?', sql)
+    sql = _NUMBER_RE.sub('?', sql)
+    sql = _IN_LIST_RE.sub('IN (...)', sql)
+    return _SPACE_RE.sub(' ', sql).strip()
+
+
+def _bucket(value, bounds):
+    for i, bound in enumerate(bounds):
+        if value <= bound:
+            return i
+    return len(bounds)
+
+
+def percentile(histogram, bounds, q):
+    """ヒストグラムから q 分位点のバケット上限を返す（最後のバケットは None = 上限超え）"""
+    total = sum(histogram)
+    if not total:
+        return 0
+    threshold = total * q
+    running = 0
+    for i, count in enumerate(histogram):
+        running += count
+        if running >= threshold:
+            return bounds[i] if i < len(bounds) else None
+    return None
+
+
+# ---------------------------------------------------------------------------
+# 計測
+# ---------------------------------------------------------------------------
+
+class QueryRecorder:
+    """connection.execute_wrapper に渡すクエリ記録"""
+
+    def __init__(self):
+        self.count = 0
+        self.db_seconds = 0.0
+        self.fingerprints = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_seconds += time.perf_counter() - started
+            self.count += 1
+            self.fingerprints[fingerprint(sql)] += 1
+
+    def duplicates(self):
+        """{fingerprint: 回数}（2回以上実行されたもの）"""
+        return {fp: count for fp, count in self.fingerprints.items() if count > 1}
+
+
+def _window(ts):
+    return int(ts // WINDOW_SECONDS)
+
+
+def _key(window, view_name, field):
+    digest = hashlib.sha1(view_name.encode()).hexdigest()[:16]
+    return f'{CACHE_PREFIX}:{window}:{digest}:{field}'
+
+
+def _views_key(window):
+    return f'{CACHE_PREFIX}:{window}:views'
+
+
+def _incr(key, delta=1):
+    try:
+        cache.incr(key, delta)
+    except ValueError:
+        if not cache.add(key, delta, WINDOW_TTL):
+            cache.incr(key, delta)
+
+
+def record(view_name, recorder, total_seconds, now=None):
+    """1リクエスト分の計測結果をキャッシュ上の現在ウィンドウに加算する。失敗しても例外は出さない。"""
+    window = _window(now if now is not None else time.time())
+    duplicates = recorder.duplicates()
+    try:
+        _incr(_key(window, view_name, 'n'))
+        _incr(_key(window, view_name, 'queries'), recorder.count)
+        _incr(_key(window, view_name, 'dups'), sum(count - 1 for count in duplicates.values()))
+        _incr(_key(window, view_name, 'db_us'), int(recorder.db_seconds * 1_000_000))
+        _incr(_key(window, view_name, 'total_us'), int(total_seconds * 1_000_000))
+        _incr(_key(window, view_name, f'lat{_bucket(total_seconds * 1000, LATENCY_BUCKETS_MS)}'))
+        _incr(_key(window, view_name, f'qc{_bucket(recorder.count, QUERY_BUCKETS)}'))
+
+        # 以下は get/set なので同時更新で取りこぼすことがある（件数は上のカウンタが正）
+        views_key = _views_key(window)
+        views = cache.get(views_key) or []
+        if view_name not in views:
+            cache.set(views_key, views + [view_name], WINDOW_TTL)
+        if duplicates:
+            dup_key = _key(window, view_name, 'dupsql')
+            counts = cache.get(dup_key) or {}
+            for fp, count in duplicates.items():
+                counts[fp] = counts.get(fp, 0) + count - 1
+            top = sorted(counts.items(), key=lambda item: -item[1])[:TOP_DUPLICATES * 2]
+            cache.set(dup_key, dict(top), WINDOW_TTL)
+    except Exception as e:
+        logger.warning('query profile: record failed for %s: %s', view_name, e)
+
+
+# ---------------------------------------------------------------------------
+# 集計の書き出し
+# ---------------------------------------------------------------------------
+
+def _read_window(window, view_name):
+    fields = list(_COUNTERS)
+    fields += [f'lat{i}' for i in range(len(LATENCY_BUCKETS_MS) + 1)]
+    fields += [f'qc{i}' for i in range(len(QUERY_BUCKETS) + 1)]
+    keys = {_key(window, view_name, field): field for field in fields + ['dupsql']}
+    raw = cache.get_many(list(keys))
+    values = {keys[key]: value for key, value in raw.items()}
+    cache.delete_many(list(keys))
+    return {
+        'n': values.get('n', 0),
+        'queries': values.get('queries', 0),
+        'dups': values.get('dups', 0),
+        'db_ms': values.get('db_us', 0) / 1000,
+        'total_ms': values.get('total_us', 0) / 1000,
+        'lat': [values.get(f'lat{i}', 0) for i in range(len(LATENCY_BUCKETS_MS) + 1)],
+        'qc': [values.get(f'qc{i}', 0) for i in range(len(QUERY_BUCKETS) + 1)],
+        'dupsql': values.get('dupsql') or {},
+    }
+
+
+def _add_lists(a, b):
+    if len(a) < len(b):
+        a = list(a) + [0] * (len(b) - len(a))
+    return [x + (b[i] if i < len(b) else 0) for i, x in enumerate(a)]
+
+
+def _merge_duplicates(existing, counts):
+    merged = {row['sql']: row['count'] for row in existing}
+    for sql, count in counts.items():
+        merged[sql] = merged.get(sql, 0) + count
+    top = sorted(merged.items(), key=lambda item: -item[1])[:TOP_DUPLICATES]
+    return [{'sql': sql, 'count': count} for sql, count in top]
+
+
+def flush(now=None):
+    """締まったウィンドウを QueryProfileSummary に加算し、古い集計を削除する。
+
+    Returns:
+        int: 書き出したビュー×ウィンドウの数
+    """
+    from django.db import transaction
+    from booking.models import QueryProfileSummary
+
+    now_ts = now if now is not None else time.time()
+    current = _window(now_ts)
+    oldest = _window(now_ts - WINDOW_TTL)
+    flushed = 0
+    known = None
+    for window in range(oldest, current):
+        # 同時に実行された flush と二重に加算しない
+        if not cache.add(f'{CACHE_PREFIX}:{window}:flushed', 1, WINDOW_TTL):
+            continue
+        views = cache.get(_views_key(window)) or []
+        if not views:
+            continue
+        # ビュー一覧は取りこぼしうるので、過去に記録のあるビューも読む
+        if known is None:
+            known = set(QueryProfileSummary.objects.values_list('view_name', flat=True).distinct())
+        views = list(dict.fromkeys(views + sorted(known)))
+        ts = window * WINDOW_SECONDS
+        period_start = datetime.fromtimestamp(ts - ts % 3600, tz=dt_timezone.utc)
+        for view_name in views:
+            data = _read_window(window, view_name)
+            if not data['n']:
+                continue
+            with transaction.atomic():
+                summary, _ = QueryProfileSummary.objects.select_for_update().get_or_create(
+                    view_name=view_name[:200], period_start=period_start,
+                )
+                summary.requests += data['n']
+                summary.queries += data['queries']
+                summary.duplicate_queries += data['dups']
+                summary.db_ms += data['db_ms']
+                summary.total_ms += data['total_ms']
+                summary.latency_histogram = _add_lists(summary.latency_histogram, data['lat'])
+                summary.query_histogram = _add_lists(summary.query_histogram, data['qc'])
+                summary.top_duplicates = _merge_duplicates(summary.top_duplicates, data['dupsql'])
+                summary.save()
+            flushed += 1
+        cache.delete(_views_key(window))
+
+    cutoff = datetime.fromtimestamp(now_ts, tz=dt_timezone.utc) - timedelta(days=RETENTION_DAYS)
+    QueryProfileSummary.objects.filter(period_start__lt=cutoff).delete()
+    return flushed
+
+
+# ---------------------------------------------------------------------------
+# レポート
+# ---------------------------------------------------------------------------
+
+def _aggregate(rows):
+    stats = {}
+    for row in rows:
+        entry = stats.setdefault(row.view_name, {
+            'requests': 0, 'queries': 0, 'duplicate_queries': 0, 'db_ms': 0.0, 'total_ms': 0.0,
+            'latency_histogram': [], 'top_duplicates': [],
+        })
+        entry['requests'] += row.requests
+        entry['queries'] += row.queries
+        entry['duplicate_queries'] += row.duplicate_queries
+        entry['db_ms'] += row.db_ms
+        entry['total_ms'] += row.total_ms
+        entry['latency_histogram'] = _add_lists(entry['latency_histogram'], row.latency_histogram)
+        entry['top_duplicates'] = _merge_duplicates(
+            entry['top_duplicates'], {d['sql']: d['count'] for d in row.top_duplicates},
+        )
+    for entry in stats.values():
+        n = entry['requests'] or 1
+        entry['avg_queries'] = round(entry['queries'] / n, 1)
+        entry['avg_duplicates'] = round(entry['duplicate_queries'] / n, 1)
+        entry['avg_db_ms'] = round(entry['db_ms'] / n, 1)
+        entry['avg_ms'] = round(entry['total_ms'] / n, 1)
+        entry['p95_ms'] = percentile(entry['latency_histogram'], LATENCY_BUCKETS_MS, 0.95)
+    return stats
+
+
+def regression_report(limit=REPORT_LIMIT, now=None):
+    """直近 RECENT_HOURS の上位ビュー（ベースラインからの悪化が大きい順）
+
+    Returns:
+        list[dict]: view_name, requests, avg_queries, avg_duplicates, avg_db_ms, avg_ms, p95_ms,
+            baseline_avg_ms, baseline_avg_queries, change（平均レイテンシの倍率。ベースライン無しは None）,
+            top_duplicates
+    """
+    from booking.models import QueryProfileSummary
+
+    now = now or timezone.now()
+    recent_start = now - timedelta(hours=RECENT_HOURS)
+    baseline_start = recent_start - timedelta(days=BASELINE_DAYS)
+    rows = list(QueryProfileSummary.objects.filter(period_start__gte=baseline_start))
+    recent = _aggregate(r for r in rows if r.period_start >= recent_start)
+    baseline = _aggregate(r for r in rows if r.period_start < recent_start)
+
+    report = []
+    for view_name, entry in recent.items():
+        base = baseline.get(view_name)
+        change = None
+        if base and base['avg_ms']:
+            change = round(entry['avg_ms'] / base['avg_ms'], 2)
+        report.append({
+            'view_name': view_name,
+            'requests': entry['requests'],
+            'avg_queries': entry['avg_queries'],
+            'avg_duplicates': entry['avg_duplicates'],
+            'avg_db_ms': entry['avg_db_ms'],
+            'avg_ms': entry['avg_ms'],
+            'p95_ms': entry['p95_ms'],
+            'baseline_avg_ms': base['avg_ms'] if base else None,
+            'baseline_avg_queries': base['avg_queries'] if base else None,
+            'change': change,
+            'top_duplicates': entry['top_duplicates'][:3],
+        })
+    # 悪化倍率 → 平均クエリ数の順（ベースラインが無いビューは倍率 1 とみなす）
+    report.sort(key=lambda r: (-(r['change'] or 1.0), -r['avg_queries']))
+    return report[:limit]
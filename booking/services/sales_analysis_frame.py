@@ -0,0 +1,205 @@
+"""Shared in-memory sales dataset for the analysis handlers.
+
+One frame covers a (scope, channel filter, window) combination: the current
+window (``window_days`` up to now) and the preceding window of the same length
+for period-over-period comparison. Order items are read once as plain columns
+(no per-row SQL date functions) and bucketed with NumPy into daily revenue,
+per-product totals, the weekday x hour revenue matrix and order counts, so
+every analysis type reads the same data instead of re-scanning OrderItem.
+
+Frames are cached for FRAME_CACHE_TTL seconds so the six analysis texts of a
+dashboard load share one build.
+"""
+import hashlib
+import logging
+from datetime import date, timedelta
+
+import numpy as np
+from django.core.cache import cache
+from django.utils import timezone
+
+from booking.models import OrderItem, Product
+
+logger = logging.getLogger(__name__)
+
+FRAME_CACHE_TTL = 60
+DEFAULT_WINDOW_DAYS = 90
+# ExtractWeekDay と同じ曜日番号（1=日曜 … 7=土曜）
+WEEKDAYS = tuple(range(1, 8))
+EPOCH_DATE = date(1970, 1, 1)
+
+
+def _key_part(value):
+    if hasattr(value, 'pk'):
+        return f'pk={value.pk}'
+    if isinstance(value, (list, tuple, set, frozenset)):
+        return '[' + ','.join(sorted(_key_part(v) for v in value)) + ']'
+    return repr(value)
+
+
+def frame_cache_key(scope, channel_filter, window_days):
+    parts = [f'{k}={_key_part(v)}' for k, v in sorted({**scope, **(channel_filter or {})}.items())]
+    digest = hashlib.md5('&'.join(parts).encode(), usedforsecurity=False).hexdigest()
+    return f'sales_frame:{window_days}:{digest}'
+
+
+class SalesAnalysisFrame:
+    """集計済みの売上データ（NumPy 配列）。
+
+    Attributes:
+        since / prev_since: 現期間・前期間の開始時刻
+        day_dates: 現期間の日付（日別売上の添字 → date）
+        daily_revenue: 現期間の日別売上
+        products: 商品ごとの dict（product_id, product__name, product__margin_rate）
+        product_qty / product_revenue: 現期間の商品別数量・売上（products と同じ並び）
+        heatmap_revenue / heatmap_rows: 現期間の曜日(1-7) x 時(0-23) の売上・明細行数
+        revenue_total / order_count: {'current': n, 'previous': n}
+    """
+
+    def __init__(self, since, prev_since, columns, product_info):
+        """
+        Args:
+            columns: 明細ごとの配列 dict（order_id, ts=エポック秒, local_ts=現地時刻のエポック秒（整数）,
+                product_id, qty, unit_price）
+            product_info: {product_id: (name, margin_rate)}
+        """
+        self.since = since
+        self.prev_since = prev_since
+        local_since = timezone.localtime(since).date()
+
+        revenue = columns['qty'] * columns['unit_price']
+        cur = columns['ts'] >= since.timestamp()
+        local_days = columns['local_ts'] // 86400
+        since_day = (local_since - EPOCH_DATE).days
+
+        product_ids, product_idx = np.unique(columns['product_id'], return_inverse=True)
+        n_products = len(product_ids)
+        self.products = [
+            {
+                'product_id': int(pid),
+                'product__name': product_info.get(int(pid), ('', 0.0))[0],
+                'product__margin_rate': product_info.get(int(pid), ('', 0.0))[1],
+            }
+            for pid in product_ids
+        ]
+
+        self.revenue_total = {
+            'current': int(revenue[cur].sum()),
+            'previous': int(revenue[~cur].sum()),
+        }
+        self.order_count = {
+            'current': int(np.unique(columns['order_id'][cur]).size),
+            'previous': int(np.unique(columns['order_id'][~cur]).size),
+        }
+
+        idx = product_idx[cur]
+        self.product_qty = np.bincount(idx, weights=columns['qty'][cur], minlength=n_products).astype(np.int64)
+        self.product_revenue = np.bincount(idx, weights=revenue[cur], minlength=n_products).astype(np.int64)
+        self.product_sold = np.bincount(idx, minlength=n_products) > 0
+
+        # 1970-01-01 は木曜（weekday()=3）
+        weekday = (local_days[cur] + 3) % 7  # 月=0
+        django_weekday = (weekday + 1) % 7 + 1  # 日=1
+        hour = (columns['local_ts'][cur] % 86400) // 3600
+        cell = (django_weekday - 1) * 24 + hour
+        self.heatmap_revenue = np.bincount(cell, weights=revenue[cur], minlength=7 * 24).astype(np.int64).reshape(7, 24)
+        self.heatmap_rows = np.bincount(cell, minlength=7 * 24).reshape(7, 24)
+
+        day_idx = local_days[cur] - since_day
+        n_days = int(day_idx.max()) + 1 if day_idx.size else 0
+        self.day_dates = [local_since + timedelta(days=d) for d in range(n_days)]
+        self.daily_revenue = np.bincount(day_idx, weights=revenue[cur], minlength=n_days).astype(np.int64)
+        self.daily_rows = np.bincount(day_idx, minlength=n_days)
+
+    # -- 派生データ --------------------------------------------------------
+
+    def weekday_revenue(self):
+        """現期間の {曜日番号: 売上}（明細のある曜日のみ）。"""
+        totals = self.heatmap_revenue.sum(axis=1)
+        present = self.heatmap_rows.sum(axis=1) > 0
+        return {wd: int(totals[wd - 1]) for wd in WEEKDAYS if present[wd - 1]}
+
+    def hour_revenue(self):
+        """現期間の {時: 売上}（明細のある時間帯のみ）。"""
+        totals = self.heatmap_revenue.sum(axis=0)
+        present = self.heatmap_rows.sum(axis=0) > 0
+        return {h: int(totals[h]) for h in range(24) if present[h]}
+
+    def product_stats(self):
+        """現期間に販売のあった商品の集計（qty_sold, revenue 付き）。"""
+        return [
+            {**product, 'qty_sold': int(self.product_qty[i]), 'revenue': int(self.product_revenue[i])}
+            for i, product in enumerate(self.products)
+            if self.product_sold[i]
+        ]
+
+    def daily_history(self):
+        """現期間の (date, revenue) リスト（売上のある日のみ、日付順）。"""
+        return [
+            (self.day_dates[d], int(self.daily_revenue[d]))
+            for d in np.flatnonzero(self.daily_rows)
+        ]
+
+
+def _local_timestamps(created, ts, since, now):
+    """UTC エポック秒を現地時刻のエポック秒にする。
+
+    期間中に UTC オフセットが変わらなければ（日本時間など）一律に加算し、
+    夏時間の切り替えを含む場合だけ明細ごとに変換する。
+    """
+    tz = timezone.get_current_timezone()
+    offset = timezone.localtime(since, tz).utcoffset()
+    if offset == timezone.localtime(now, tz).utcoffset():
+        return ts + int(offset.total_seconds())
+    return np.fromiter(
+        (timezone.localtime(dt, tz).utcoffset().total_seconds() for dt in created),
+        dtype=np.int64, count=len(created),
+    ) + ts
+
+
+def build_analysis_frame(scope, channel_filter=None, window_days=DEFAULT_WINDOW_DAYS, now=None):
+    """明細を1回だけ読み込み、NumPy で集計して SalesAnalysisFrame を作る。"""
+    now = now or timezone.now()
+    since = now - timedelta(days=window_days)
+    prev_since = since - timedelta(days=window_days)
+
+    filters = {'order__created_at__gte': prev_since, **scope}
+    if channel_filter:
+        filters.update(channel_filter)
+    rows = list(
+        OrderItem.objects.filter(**filters)
+        .values_list('order_id', 'order__created_at', 'product_id', 'qty', 'unit_price')
+    )
+
+    if rows:
+        order_ids, created, product_ids, qty, unit_price = zip(*rows)
+    else:
+        order_ids = created = product_ids = qty = unit_price = ()
+    ts = np.fromiter((dt.timestamp() for dt in created), dtype=np.float64, count=len(created))
+    columns = {
+        'order_id': np.array(order_ids, dtype=np.int64),
+        'ts': ts,
+        'local_ts': _local_timestamps(created, np.floor(ts).astype(np.int64), since, now),
+        'product_id': np.array(product_ids, dtype=np.int64),
+        'qty': np.array(qty, dtype=np.int64),
+        'unit_price': np.array(unit_price, dtype=np.int64),
+    }
+    product_info = {
+        pid: (name, margin_rate)
+        for pid, name, margin_rate in Product.objects.filter(pk__in=set(product_ids))
+        .values_list('pk', 'name', 'margin_rate')
+    } if product_ids else {}
+    return SalesAnalysisFrame(since, prev_since, columns, product_info)
+
+
+def get_analysis_frame(scope, channel_filter=None, window_days=DEFAULT_WINDOW_DAYS):
+    """キャッシュ済みのフレームを返す（無ければ作成して FRAME_CACHE_TTL 秒保持）。"""
+    key = frame_cache_key(scope, channel_filter, window_days)
+    frame = cache.get(key)
+    if frame is None:
+        frame = build_analysis_frame(scope, channel_filter, window_days)
+        try:
+            cache.set(key, frame, FRAME_CACHE_TTL)
+        except Exception as e:
+            logger.warning('sales analysis frame cache set failed: %s', e)
+    return frame
@@ -3,16 +3,17 @@
 Generates analysis summaries, findings, recommendations, and scores
 entirely locally — no external API calls. Uses DB data + statistical
 computation + template-based text generation.
+
+All analysis types read one SalesAnalysisFrame per (scope, channel, window)
+(see sales_analysis_frame), so generating every text for a store scans
+OrderItem once.
 """
 import logging
 from collections import defaultdict
-from datetime import timedelta
-
-from django.db.models import Sum, F, Count, Avg
-from django.db.models.functions import TruncDate, TruncWeek, ExtractHour, ExtractWeekDay
-from django.utils import timezone
 
-from booking.models import OrderItem
+from booking.services.sales_analysis_frame import (
+    DEFAULT_WINDOW_DAYS, frame_cache_key, get_analysis_frame,
+)
 
 logger = logging.getLogger(__name__)
 
@@ -45,18 +46,19 @@ def _grade(metric_key, value):
     return 'D'
 
 
-def _build_filters(scope, channel_filter, since):
-    """Build combined filter kwargs."""
-    filters = {'order__created_at__gte': since}
-    filters.update(scope)
-    if channel_filter:
-        filters.update(channel_filter)
-    return filters
-
-
 class SalesAnalysisEngine:
     """Local analysis engine: DB → stats → text generation."""
 
+    def __init__(self):
+        self._frames = {}
+
+    def _frame(self, scope, ch_filter):
+        """同一インスタンス内では同じフレームを使い回す（キャッシュが無効でも1回だけ集計）。"""
+        key = frame_cache_key(scope, ch_filter, DEFAULT_WINDOW_DAYS)
+        if key not in self._frames:
+            self._frames[key] = get_analysis_frame(scope, ch_filter, DEFAULT_WINDOW_DAYS)
+        return self._frames[key]
+
     def analyze(self, analysis_type, store_scope, channel_filter):
         """Run analysis and return structured result.
 
@@ -74,35 +76,12 @@ class SalesAnalysisEngine:
         return handler(store_scope, channel_filter)
 
     def _analyze_sales_trend(self, scope, ch_filter):
-        now = timezone.now()
-        since = now - timedelta(days=90)
-        prev_since = since - timedelta(days=90)
-        filters = _build_filters(scope, ch_filter, since)
-        prev_filters = _build_filters(scope, ch_filter, prev_since)
-        prev_filters['order__created_at__lt'] = since
-
-        # Current period revenue
-        current = (
-            OrderItem.objects.filter(**filters)
-            .aggregate(total=Sum(F('qty') * F('unit_price')))
-        )
-        current_total = current['total'] or 0
-
-        # Previous period revenue
-        prev = (
-            OrderItem.objects.filter(**prev_filters)
-            .aggregate(total=Sum(F('qty') * F('unit_price')))
-        )
-        prev_total = prev['total'] or 0
+        frame = self._frame(scope, ch_filter)
+        current_total = frame.revenue_total['current']
+        prev_total = frame.revenue_total['previous']
 
         # Weekly pattern
-        weekly = (
-            OrderItem.objects.filter(**filters)
-            .annotate(weekday=ExtractWeekDay('order__created_at'))
-            .values('weekday')
-            .annotate(revenue=Sum(F('qty') * F('unit_price')))
-        )
-        weekday_rev = {w['weekday']: w['revenue'] or 0 for w in weekly}
+        weekday_rev = frame.weekday_revenue()
         weekday_names = {1: '日', 2: '月', 3: '火', 4: '水', 5: '木', 6: '金', 7: '土'}
 
         growth_pct = ((current_total - prev_total) / prev_total * 100) if prev_total > 0 else 0
@@ -137,18 +116,7 @@ class SalesAnalysisEngine:
         }
 
     def _analyze_menu_engineering(self, scope, ch_filter):
-        since = timezone.now() - timedelta(days=90)
-        filters = _build_filters(scope, ch_filter, since)
-
-        stats = list(
-            OrderItem.objects.filter(**filters)
-            .values('product_id', 'product__name', 'product__margin_rate')
-            .annotate(
-                qty_sold=Sum('qty'),
-                revenue=Sum(F('qty') * F('unit_price')),
-            )
-            .order_by('-qty_sold')
-        )
+        stats = sorted(self._frame(scope, ch_filter).product_stats(), key=lambda s: -s['qty_sold'])
 
         if not stats:
             return {
@@ -208,15 +176,7 @@ class SalesAnalysisEngine:
         }
 
     def _analyze_abc_analysis(self, scope, ch_filter):
-        since = timezone.now() - timedelta(days=90)
-        filters = _build_filters(scope, ch_filter, since)
-
-        stats = list(
-            OrderItem.objects.filter(**filters)
-            .values('product_id', 'product__name')
-            .annotate(revenue=Sum(F('qty') * F('unit_price')))
-            .order_by('-revenue')
-        )
+        stats = sorted(self._frame(scope, ch_filter).product_stats(), key=lambda s: -s['revenue'])
 
         if not stats:
             return {
@@ -266,7 +226,10 @@ class SalesAnalysisEngine:
 
     def _analyze_forecast(self, scope, ch_filter):
         from booking.services.sales_forecast import generate_forecast
-        result = generate_forecast(scope, forecast_days=14, channel_filter=ch_filter)
+        result = generate_forecast(
+            scope, forecast_days=14, history_days=DEFAULT_WINDOW_DAYS, channel_filter=ch_filter,
+            historical=self._frame(scope, ch_filter).daily_history(), use_prophet=False,
+        )
         historical = result.get('historical', [])
         forecast = result.get('forecast', [])
 
@@ -310,30 +273,16 @@ class SalesAnalysisEngine:
         }
 
     def _analyze_heatmap(self, scope, ch_filter):
-        since = timezone.now() - timedelta(days=90)
-        filters = _build_filters(scope, ch_filter, since)
-
-        data = list(
-            OrderItem.objects.filter(**filters)
-            .annotate(
-                weekday=ExtractWeekDay('order__created_at'),
-                hour=ExtractHour('order__created_at'),
-            )
-            .values('weekday', 'hour')
-            .annotate(revenue=Sum(F('qty') * F('unit_price')))
-            .order_by('weekday', 'hour')
-        )
+        frame = self._frame(scope, ch_filter)
+        hour_totals = frame.hour_revenue()
 
-        if not data:
+        if not hour_totals:
             return {
                 'summary': 'データ不足のため分析できません',
                 'findings': [], 'recommendations': [], 'score': '-',
             }
 
-        total_revenue = sum(d['revenue'] or 0 for d in data)
-        hour_totals = defaultdict(int)
-        for d in data:
-            hour_totals[d['hour']] += d['revenue'] or 0
+        total_revenue = sum(hour_totals.values())
 
         # Find peak hours (top 3)
         sorted_hours = sorted(hour_totals.items(), key=lambda x: -x[1])
@@ -367,27 +316,15 @@ class SalesAnalysisEngine:
         }
 
     def _analyze_aov(self, scope, ch_filter):
-        now = timezone.now()
-        since = now - timedelta(days=90)
-        prev_since = since - timedelta(days=90)
-        filters = _build_filters(scope, ch_filter, since)
-        prev_filters = _build_filters(scope, ch_filter, prev_since)
-        prev_filters['order__created_at__lt'] = since
-
-        current = (
-            OrderItem.objects.filter(**filters)
-            .aggregate(
-                total_revenue=Sum(F('qty') * F('unit_price')),
-                order_count=Count('order_id', distinct=True),
-            )
-        )
-        prev = (
-            OrderItem.objects.filter(**prev_filters)
-            .aggregate(
-                total_revenue=Sum(F('qty') * F('unit_price')),
-                order_count=Count('order_id', distinct=True),
-            )
-        )
+        frame = self._frame(scope, ch_filter)
+        current = {
+            'total_revenue': frame.revenue_total['current'],
+            'order_count': frame.order_count['current'],
+        }
+        prev = {
+            'total_revenue': frame.revenue_total['previous'],
+            'order_count': frame.order_count['previous'],
+        }
 
         current_aov = (
             round((current['total_revenue'] or 0) / current['order_count'])
@@ -2,19 +2,38 @@
 
 Uses moving average with weekday coefficients as default method.
 If `prophet` is installed, uses Prophet for seasonal/holiday-aware predictions.
+
+Prophet is only fitted off-request: the nightly ``refresh_sales_forecasts``
+task fits one model per (store, channel) and stores the rows in
+SalesForecast. ``get_forecast`` (used by the dashboard API) serves those rows
+and falls back to the NumPy moving-average model for requests the nightly job
+does not cover (multi-channel filters, all stores, longer horizons). Results
+are cached under a per-store data version that advances whenever orders
+change or the nightly job writes new rows.
 """
 import logging
-from collections import defaultdict
-from datetime import date, timedelta
+from datetime import timedelta
 
+import numpy as np
+from django.core.cache import cache
 from django.db.models import Sum, F
 from django.db.models.functions import TruncDate
 from django.utils import timezone
 
-from booking.models import OrderItem
+from booking.models import OrderItem, SalesForecast
 
 logger = logging.getLogger(__name__)
 
+CACHE_PREFIX = 'salesfc'
+RESULT_CACHE_TTL = 60 * 10
+DEFAULT_HISTORY_DAYS = 90
+# 夜間バッチの学習期間と保存する予測日数（API の上限 90 日をカバー）
+NIGHTLY_HISTORY_DAYS = 365
+FORECAST_HORIZON_DAYS = 90
+# これより古い保存済み予測は使わない（夜間バッチが止まっている場合）
+STORED_FORECAST_MAX_AGE = timedelta(days=2)
+ALL_CHANNELS = ''
+
 
 def _get_historical_daily(since, scope, channel_filter=None):
     """Return list of (date, revenue) sorted by date."""
@@ -38,64 +57,50 @@ def _moving_average_forecast(historical, forecast_days=14):
     1. Compute average daily revenue for last 28 days
     2. Compute weekday coefficients (Mon=0..Sun=6) from historical data
     3. Forecast = avg_daily * weekday_coefficient
+
+    Days without sales inside the baseline count as zero revenue.
     """
     if not historical:
         return []
 
-    # Fill gaps in historical data
     first_date = historical[0][0]
     last_date = historical[-1][0]
-    date_map = {d: rev for d, rev in historical}
 
     # Use last 28 days for baseline
-    baseline_start = last_date - timedelta(days=27)
-    if baseline_start < first_date:
-        baseline_start = first_date
-
-    # Weekday buckets
-    weekday_totals = defaultdict(float)
-    weekday_counts = defaultdict(int)
-    overall_total = 0
-    overall_count = 0
-
-    current = baseline_start
-    while current <= last_date:
-        rev = date_map.get(current, 0)
-        dow = current.weekday()
-        weekday_totals[dow] += rev
-        weekday_counts[dow] += 1
-        overall_total += rev
-        overall_count += 1
-        current += timedelta(days=1)
-
-    avg_daily = overall_total / overall_count if overall_count else 0
+    baseline_start = max(first_date, last_date - timedelta(days=27))
+    n_days = (last_date - baseline_start).days + 1
+
+    offsets = np.array([(d - baseline_start).days for d, _ in historical], dtype=np.int64)
+    values = np.array([rev for _, rev in historical], dtype=np.float64)
+    in_baseline = offsets >= 0
+    revenue = np.zeros(n_days)
+    revenue[offsets[in_baseline]] = values[in_baseline]
 
     # Weekday coefficients
-    weekday_coef = {}
-    for dow in range(7):
-        if weekday_counts[dow] > 0:
-            dow_avg = weekday_totals[dow] / weekday_counts[dow]
-            weekday_coef[dow] = dow_avg / avg_daily if avg_daily > 0 else 1.0
-        else:
-            weekday_coef[dow] = 1.0
-
-    # Generate forecast
-    forecast = []
-    for i in range(1, forecast_days + 1):
-        forecast_date = last_date + timedelta(days=i)
-        dow = forecast_date.weekday()
-        predicted = avg_daily * weekday_coef[dow]
-        # Confidence interval: ±30% as rough estimate
-        lower = max(0, predicted * 0.7)
-        upper = predicted * 1.3
-        forecast.append({
-            'date': forecast_date.isoformat(),
-            'predicted': round(predicted),
-            'lower': round(lower),
-            'upper': round(upper),
-        })
-
-    return forecast
+    weekdays = (baseline_start.weekday() + np.arange(n_days)) % 7
+    weekday_totals = np.bincount(weekdays, weights=revenue, minlength=7)
+    weekday_counts = np.bincount(weekdays, minlength=7)
+    avg_daily = revenue.mean()
+    weekday_coef = np.ones(7)
+    if avg_daily > 0:
+        present = weekday_counts > 0
+        weekday_coef[present] = weekday_totals[present] / weekday_counts[present] / avg_daily
+
+    # Generate forecast; confidence interval: ±30% as rough estimate
+    steps = np.arange(1, forecast_days + 1)
+    predicted = avg_daily * weekday_coef[(last_date.weekday() + steps) % 7]
+    lower = np.maximum(0, predicted * 0.7)
+    upper = predicted * 1.3
+
+    return [
+        {
+            'date': (last_date + timedelta(days=int(i))).isoformat(),
+            'predicted': round(float(p)),
+            'lower': round(float(lo)),
+            'upper': round(float(hi)),
+        }
+        for i, p, lo, hi in zip(steps, predicted, lower, upper)
+    ]
 
 
 def _try_prophet_forecast(historical, forecast_days=14):
@@ -150,7 +155,8 @@ def _try_prophet_forecast(historical, forecast_days=14):
         return None
 
 
-def generate_forecast(scope, forecast_days=14, history_days=90, channel_filter=None):
+def generate_forecast(scope, forecast_days=14, history_days=DEFAULT_HISTORY_DAYS, channel_filter=None,
+                      historical=None, use_prophet=True):
     """Generate sales forecast.
 
     Args:
@@ -158,12 +164,16 @@ def generate_forecast(scope, forecast_days=14, history_days=90, channel_filter=N
         forecast_days: number of days to forecast
         history_days: number of days of history to use
         channel_filter: optional dict of channel filter kwargs
+        historical: precomputed list of (date, revenue) for the history window
+            (e.g. from SalesAnalysisFrame.daily_history); skips the query
+        use_prophet: False skips Prophet (request-time callers)
 
     Returns:
         dict with 'historical', 'forecast', 'method' keys
     """
-    since = timezone.now() - timedelta(days=history_days)
-    historical = _get_historical_daily(since, scope, channel_filter=channel_filter)
+    if historical is None:
+        since = timezone.now() - timedelta(days=history_days)
+        historical = _get_historical_daily(since, scope, channel_filter=channel_filter)
 
     historical_list = [
         {'date': d.isoformat(), 'revenue': rev}
@@ -171,7 +181,7 @@ def generate_forecast(scope, forecast_days=14, history_days=90, channel_filter=N
     ]
 
     # Try Prophet first
-    forecast = _try_prophet_forecast(historical, forecast_days)
+    forecast = _try_prophet_forecast(historical, forecast_days) if use_prophet else None
     method = 'prophet'
 
     # Fallback to moving average
@@ -184,3 +194,174 @@ def generate_forecast(scope, forecast_days=14, history_days=90, channel_filter=N
         'forecast': forecast,
         'method': method,
     }
+
+
+# ---------------------------------------------------------------------------
+# データバージョン（注文の変更・夜間バッチで進める）
+# ---------------------------------------------------------------------------
+
+def _version_key(store_id):
+    return f'{CACHE_PREFIX}:ver:{store_id or "all"}'
+
+
+def data_version(store_id=None):
+    """店舗（None は全店舗）の売上データのバージョン。"""
+    return cache.get(_version_key(store_id), 0)
+
+
+def bump_data_version(store_id):
+    """店舗と全店舗のバージョンを進め、キャッシュ済みの予測を無効化する。"""
+    for key in (_version_key(store_id), _version_key(None)):
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, 1, None)
+        except Exception as e:
+            logger.warning("sales forecast version bump failed for %s: %s", key, e)
+
+
+# ---------------------------------------------------------------------------
+# 夜間バッチ: (店舗, チャネル) ごとに学習して保存
+# ---------------------------------------------------------------------------
+
+def _channel_histories(store, since):
+    """{channel: [(date, revenue), ...]}（'' は全チャネル合計）を1クエリで集計する。"""
+    rows = (
+        OrderItem.objects
+        .filter(order__store=store, order__created_at__gte=since)
+        .annotate(d=TruncDate('order__created_at'))
+        .values('d', 'order__channel')
+        .annotate(revenue=Sum(F('qty') * F('unit_price')))
+        .order_by('d')
+    )
+    histories = {ALL_CHANNELS: {}}
+    for row in rows:
+        revenue = row['revenue'] or 0
+        histories.setdefault(row['order__channel'], {})[row['d']] = revenue
+        totals = histories[ALL_CHANNELS]
+        totals[row['d']] = totals.get(row['d'], 0) + revenue
+    return {channel: sorted(daily.items()) for channel, daily in histories.items()}
+
+
+def refresh_store_forecasts(store, horizon=FORECAST_HORIZON_DAYS, history_days=NIGHTLY_HISTORY_DAYS):
+    """店舗の全チャネル・チャネル別の予測を作成して SalesForecast に保存する。
+
+    Returns:
+        int: 保存した行数
+    """
+    now = timezone.now()
+    histories = _channel_histories(store, now - timedelta(days=history_days))
+
+    rows = []
+    for channel, historical in histories.items():
+        forecast = _try_prophet_forecast(historical, horizon)
+        method = 'prophet'
+        if forecast is None:
+            forecast = _moving_average_forecast(historical, horizon)
+            method = 'moving_average'
+        rows.extend(
+            SalesForecast(
+                store=store, channel=channel, date=item['date'],
+                predicted=item['predicted'], lower=item['lower'], upper=item['upper'],
+                method=method, generated_at=now,
+            )
+            for item in forecast
+        )
+
+    SalesForecast.objects.bulk_create(
+        rows,
+        update_conflicts=True,
+        unique_fields=['store', 'channel', 'date'],
+        update_fields=['predicted', 'lower', 'upper', 'method', 'generated_at'],
+    )
+    # 今回作られなかった行（過去日・データの無くなったチャネル）は削除
+    SalesForecast.objects.filter(store=store, generated_at__lt=now).delete()
+    bump_data_version(store.pk)
+    logger.info("Stored %d sales forecast rows for store %s (%d channels)", len(rows), store.pk, len(histories))
+    return len(rows)
+
+
+# ---------------------------------------------------------------------------
+# リクエスト時: 保存済み予測 → NumPy 移動平均（データバージョンでキャッシュ）
+# ---------------------------------------------------------------------------
+
+def _stored_channel(store, channel_filter):
+    """保存済み予測で応答できる場合はそのチャネル（'' は全チャネル）、できなければ None。"""
+    if store is None:
+        return None
+    if not channel_filter:
+        return ALL_CHANNELS
+    channels = channel_filter.get('order__channel__in')
+    if len(channel_filter) == 1 and channels and len(channels) == 1:
+        return channels[0]
+    return None
+
+
+def _stored_forecast(store, channel, forecast_days):
+    rows = list(
+        SalesForecast.objects.filter(
+            store=store, channel=channel,
+            date__gte=timezone.localdate(),
+            generated_at__gte=timezone.now() - STORED_FORECAST_MAX_AGE,
+        ).order_by('date').values('date', 'predicted', 'lower', 'upper', 'method')[:forecast_days]
+    )
+    if len(rows) < forecast_days:
+        return None, None
+    forecast = [
+        {'date': r['date'].isoformat(), 'predicted': r['predicted'], 'lower': r['lower'], 'upper': r['upper']}
+        for r in rows
+    ]
+    return forecast, rows[0]['method']
+
+
+def _result_cache_key(store, forecast_days, history_days, channel_filter):
+    store_id = store.pk if store else None
+    parts = [
+        f'{k}={",".join(sorted(v)) if isinstance(v, (list, tuple, set)) else v}'
+        for k, v in sorted((channel_filter or {}).items())
+    ]
+    return (
+        f'{CACHE_PREFIX}:result:{store_id or "all"}:{data_version(store_id)}:'
+        f'{forecast_days}:{history_days}:{"&".join(parts)}'
+    )
+
+
+def get_forecast(store, forecast_days=14, channel_filter=None, history_days=DEFAULT_HISTORY_DAYS):
+    """ダッシュボード用の売上予測（Prophet はリクエスト中に学習しない）。
+
+    Args:
+        store: Store instance (None for all stores)
+
+    Returns:
+        dict with 'historical', 'forecast', 'method' keys
+    """
+    key = _result_cache_key(store, forecast_days, history_days, channel_filter)
+    result = cache.get(key)
+    if result is not None:
+        return result
+
+    scope = {'order__store': store} if store else {}
+    since = timezone.now() - timedelta(days=history_days)
+    historical = _get_historical_daily(since, scope, channel_filter=channel_filter)
+
+    forecast = method = None
+    channel = _stored_channel(store, channel_filter)
+    if channel is not None and historical:
+        forecast, method = _stored_forecast(store, channel, forecast_days)
+    if forecast is None:
+        result = generate_forecast(
+            scope, forecast_days=forecast_days, channel_filter=channel_filter,
+            historical=historical, use_prophet=False,
+        )
+    else:
+        result = {
+            'historical': [{'date': d.isoformat(), 'revenue': rev} for d, rev in historical],
+            'forecast': forecast,
+            'method': method,
+        }
+
+    try:
+        cache.set(key, result, RESULT_CACHE_TTL)
+    except Exception as e:
+        logger.warning('sales forecast cache set failed: %s', e)
+    return result
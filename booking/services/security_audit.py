@@ -0,0 +1,715 @@
+"""セキュリティ自己診断（チェック登録・並列実行・結果キャッシュ）
+
+チェックは @register で登録し、依存関係（depends_on）・タイムアウト・TTL・入力（inputs）を宣言する。
+
+- run_audit(): 依存関係の順に、独立したチェックをスレッドで並列実行する。
+  全体の所要時間はおおむね最も遅いチェック1つ分になる
+- 結果はチェックごとに SecurityAudit に保存する（fingerprint・expires_at 付き）
+- 再実行時は、入力のフィンガープリントが前回と同じで TTL 内のチェックは実行せず前回結果を使う。
+  依存先を再実行したチェックは自分も再実行する
+- latest_report(): チェックごとの最新結果（管理画面・ヘルスチェックはこれを読むだけで実行しない）
+
+DB を読むチェック（uses_db=True）は呼び出し元スレッドで実行する（別スレッドの接続からは
+呼び出し元のトランザクション内のデータが見えないため）。タイムアウトはスレッド実行のチェックのみ。
+チェックのロジックを変えたら CHECKS_VERSION を上げる（全チェックのキャッシュが無効になる）。
+"""
+import hashlib
+import json
+import logging
+import os
+import time
+import uuid
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass
+from datetime import timedelta
+from typing import Callable, Optional
+
+import django
+from django.conf import settings
+from django.db.models import Max
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+CHECKS_VERSION = 1
+DEFAULT_TIMEOUT = 10.0  # 秒
+DEFAULT_TTL = 60 * 60 * 24  # 秒
+SETTINGS_TTL = 60 * 60 * 24 * 7  # 設定値はフィンガープリントで変化を検出するので長め
+
+
+@dataclass(frozen=True)
+class SecurityCheck:
+    name: str
+    category: str
+    fn: Callable
+    inputs: Optional[Callable] = None
+    depends_on: tuple = ()
+    timeout: float = DEFAULT_TIMEOUT
+    ttl: int = DEFAULT_TTL
+    uses_db: bool = False
+
+
+REGISTRY = {}
+
+
+def register(name, category, *, inputs=None, depends_on=(), timeout=DEFAULT_TIMEOUT, ttl=DEFAULT_TTL,
+             uses_db=False):
+    """チェック関数を登録する。
+
+    inputs: 結果を左右する値を返す関数（JSON 化できる値）。None なら TTL でのみ再実行。
+        フィンガープリントは DB に保存されるため、秘密値そのものではなく判定に使う派生値を返すこと
+    depends_on: 先に実行するチェック名。チェック関数は deps={name: result} を受け取る
+    """
+    def decorator(fn):
+        for dep in depends_on:
+            if dep not in REGISTRY:
+                raise ValueError(f'{name}: unknown dependency {dep}')
+        REGISTRY[name] = SecurityCheck(name, category, fn, inputs, tuple(depends_on), timeout, ttl, uses_db)
+        return fn
+    return decorator
+
+
+# ---------------------------------------------------------------------------
+# 実行
+# ---------------------------------------------------------------------------
+
+def _select(names=None, category=None):
+    """対象チェック名（依存先を含む）を登録順で返す。"""
+    wanted = [
+        name for name, check in REGISTRY.items()
+        if (names is None or name in names) and (category is None or check.category == category)
+    ]
+    selected = set()
+    stack = list(wanted)
+    while stack:
+        name = stack.pop()
+        if name not in selected:
+            selected.add(name)
+            stack.extend(REGISTRY[name].depends_on)
+    # 登録時に依存先が先に登録されていることを確認済みなので、登録順は依存順になっている
+    return [name for name in REGISTRY if name in selected]
+
+
+def _fingerprint(check, dep_prints):
+    if check.inputs is None:
+        inputs = None
+    else:
+        try:
+            inputs = check.inputs()
+        except Exception as e:
+            logger.warning('security check %s: inputs failed: %s', check.name, e)
+            return ''
+    payload = {'version': CHECKS_VERSION, 'inputs': inputs, 'deps': dep_prints}
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def _error_result(check, message):
+    return {
+        'check_name': check.name,
+        'category': check.category,
+        'severity': 'low',
+        'status': 'warn',
+        'message': message,
+        'recommendation': 'チェックを再実行し、失敗が続く場合は原因を確認してください',
+    }
+
+
+def _execute(check, deps):
+    """チェックを実行して (result, 所要ミリ秒, キャッシュ可否) を返す。"""
+    started = time.perf_counter()
+    try:
+        result = check.fn(deps) if check.depends_on else check.fn()
+        cacheable = True
+    except Exception as e:
+        logger.exception('security check %s failed', check.name)
+        result = _error_result(check, f'チェック実行エラー: {e}')
+        cacheable = False
+    result.setdefault('check_name', check.name)
+    result.setdefault('category', check.category)
+    return result, int((time.perf_counter() - started) * 1000), cacheable
+
+
+def _cached_result(row):
+    return {
+        'check_name': row.check_name,
+        'category': row.category,
+        'severity': row.severity,
+        'status': row.status,
+        'message': row.message,
+        'recommendation': row.recommendation,
+    }
+
+
+def _latest_rows(names):
+    from booking.models import SecurityAudit
+
+    ids = (
+        SecurityAudit.objects.filter(check_name__in=names)
+        .values('check_name').annotate(last_id=Max('id')).values_list('last_id', flat=True)
+    )
+    return {row.check_name: row for row in SecurityAudit.objects.filter(id__in=list(ids))}
+
+
+def run_audit(names=None, category=None, force=False, max_workers=None):
+    """チェックを実行（または前回結果を再利用）し、結果を保存して返す。
+
+    Returns:
+        dict: run_id, results（登録順。各結果に cached / duration_ms）, executed, cached, wall_ms
+    """
+    from booking.models import SecurityAudit
+
+    wall_started = time.perf_counter()
+    run_id = uuid.uuid4()
+    order = _select(names, category)
+    now = timezone.now()
+    rows = {} if force else _latest_rows(order)
+
+    prints = {}
+    results = {}
+    to_run = []
+    for name in order:
+        check = REGISTRY[name]
+        prints[name] = _fingerprint(check, [prints[dep] for dep in check.depends_on])
+        row = rows.get(name)
+        fresh = (
+            row is not None and prints[name] and row.fingerprint == prints[name]
+            and row.expires_at is not None and row.expires_at > now
+            and not any(dep in to_run for dep in check.depends_on)
+        )
+        if fresh:
+            results[name] = dict(_cached_result(row), cached=True, duration_ms=row.duration_ms)
+        else:
+            to_run.append(name)
+
+    executed = {}  # name -> (result, duration_ms, cacheable)
+    pending = list(to_run)
+    futures = {}
+    pool = ThreadPoolExecutor(max_workers=max_workers or max(1, len(to_run)), thread_name_prefix='security-audit')
+    try:
+        while pending or futures:
+            ready = [n for n in pending if all(dep in results for dep in REGISTRY[n].depends_on)]
+            for name in ready:
+                pending.remove(name)
+                check = REGISTRY[name]
+                deps = {dep: results[dep] for dep in check.depends_on}
+                if check.uses_db:
+                    continue
+                futures[pool.submit(_execute, check, deps)] = (name, time.monotonic() + check.timeout)
+            # DB チェックは呼び出し元スレッドで（スレッド実行のチェックはその間も進む）
+            for name in ready:
+                check = REGISTRY[name]
+                if check.uses_db:
+                    executed[name] = _execute(check, {dep: results[dep] for dep in check.depends_on})
+                    results[name] = executed[name][0]
+            if any(REGISTRY[name].uses_db for name in ready):
+                continue
+            if not futures:
+                if pending:
+                    raise RuntimeError(f'unresolvable security check dependencies: {pending}')
+                break
+
+            timeout = max(0.0, min(deadline for _, deadline in futures.values()) - time.monotonic())
+            done, _ = wait(futures, timeout=timeout, return_when=FIRST_COMPLETED)
+            for future in done:
+                name, _ = futures.pop(future)
+                executed[name] = future.result()
+                results[name] = executed[name][0]
+            for future, (name, deadline) in list(futures.items()):
+                if deadline <= time.monotonic():
+                    # 実行中のスレッドは止められないので結果を捨てる
+                    del futures[future]
+                    check = REGISTRY[name]
+                    executed[name] = (_error_result(check, f'タイムアウト（{check.timeout:.0f}秒）'),
+                                      int(check.timeout * 1000), False)
+                    results[name] = executed[name][0]
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    now = timezone.now()
+    audit_objects = []
+    for name, (result, duration_ms, cacheable) in executed.items():
+        check = REGISTRY[name]
+        audit_objects.append(SecurityAudit(
+            run_id=run_id,
+            check_name=result['check_name'],
+            category=result['category'],
+            severity=result['severity'],
+            status=result['status'],
+            message=result['message'],
+            recommendation=result.get('recommendation', ''),
+            fingerprint=prints[name] if cacheable else '',
+            duration_ms=duration_ms,
+            expires_at=now + timedelta(seconds=check.ttl) if cacheable else now,
+        ))
+        results[name] = dict(result, cached=False, duration_ms=duration_ms)
+    SecurityAudit.objects.bulk_create(audit_objects)
+
+    return {
+        'run_id': run_id,
+        'results': [results[name] for name in order],
+        'executed': len(executed),
+        'cached': len(order) - len(executed),
+        'wall_ms': int((time.perf_counter() - wall_started) * 1000),
+    }
+
+
+def latest_report(now=None):
+    """チェックごとの最新結果（実行はしない）。
+
+    Returns:
+        list[dict]: 登録順。各要素に created_at / expires_at / stale（TTL 切れ）を含む。未実行のチェックは含まない
+    """
+    now = now or timezone.now()
+    rows = _latest_rows(list(REGISTRY))
+    report = []
+    for name in REGISTRY:
+        row = rows.get(name)
+        if row is None:
+            continue
+        report.append(dict(
+            _cached_result(row),
+            run_id=row.run_id,
+            duration_ms=row.duration_ms,
+            created_at=row.created_at,
+            expires_at=row.expires_at,
+            stale=row.expires_at is None or row.expires_at <= now,
+        ))
+    return report
+
+
+def report_summary(report=None):
+    """{'fail', 'warn', 'pass', 'missing', 'stale', 'last_run'} の件数と最終実行日時"""
+    report = latest_report() if report is None else report
+    summary = {'fail': 0, 'warn': 0, 'pass': 0, 'stale': 0}
+    for row in report:
+        summary[row['status']] += 1
+        summary['stale'] += row['stale']
+    summary['missing'] = len(REGISTRY) - len(report)
+    summary['last_run'] = max((row['created_at'] for row in report), default=None)
+    return summary
+
+
+# ==============================
+# 12 checks
+# ==============================
+
+@register('debug_mode', 'django_settings', inputs=lambda: settings.DEBUG, ttl=SETTINGS_TTL)
+def check_debug_mode():
+    if settings.DEBUG:
+        return {
+            'check_name': 'debug_mode',
+            'category': 'django_settings',
+            'severity': 'critical',
+            'status': 'fail',
+            'message': 'DEBUG=True が本番環境で有効です',
+            'recommendation': 'settings.py で DEBUG=False に設定してください',
+        }
+    return {
+        'check_name': 'debug_mode',
+        'category': 'django_settings',
+        'severity': 'info',
+        'status': 'pass',
+        'message': 'DEBUG=False（正常）',
+    }
+
+
+WEAK_SECRET_KEY_WORDS = ('django-insecure-', 'changeme', 'secret', 'password', 'your-secret-key')
+
+
+def _secret_key_traits():
+    """SECRET_KEY の判定に使う派生値（鍵そのものやそのハッシュは含めない）"""
+    key = settings.SECRET_KEY
+    return {
+        'length': len(key),
+        'weak_word': any(w in key.lower() for w in WEAK_SECRET_KEY_WORDS),
+    }
+
+
+@register('secret_key', 'django_settings', inputs=_secret_key_traits, ttl=SETTINGS_TTL)
+def check_secret_key():
+    traits = _secret_key_traits()
+    is_weak = traits['weak_word'] or traits['length'] < 32
+    if is_weak:
+        return {
+            'check_name': 'secret_key',
+            'category': 'django_settings',
+            'severity': 'critical',
+            'status': 'fail',
+            'message': 'SECRET_KEYが弱い、または短すぎます',
+            'recommendation': '50文字以上のランダムな文字列を設定してください',
+        }
+    return {
+        'check_name': 'secret_key',
+        'category': 'django_settings',
+        'severity': 'info',
+        'status': 'pass',
+        'message': 'SECRET_KEYは適切な強度です',
+    }
+
+
+@register('allowed_hosts', 'django_settings',
+          inputs=lambda: list(getattr(settings, 'ALLOWED_HOSTS', [])), ttl=SETTINGS_TTL)
+def check_allowed_hosts():
+    hosts = getattr(settings, 'ALLOWED_HOSTS', [])
+    if '*' in hosts:
+        return {
+            'check_name': 'allowed_hosts',
+            'category': 'django_settings',
+            'severity': 'high',
+            'status': 'fail',
+            'message': 'ALLOWED_HOSTSに"*"が含まれています',
+            'recommendation': '具体的なホスト名のみを指定してください',
+        }
+    if not hosts:
+        return {
+            'check_name': 'allowed_hosts',
+            'category': 'django_settings',
+            'severity': 'medium',
+            'status': 'warn',
+            'message': 'ALLOWED_HOSTSが空です',
+            'recommendation': '許可するホスト名を設定してください',
+        }
+    return {
+        'check_name': 'allowed_hosts',
+        'category': 'django_settings',
+        'severity': 'info',
+        'status': 'pass',
+        'message': f'ALLOWED_HOSTS: {", ".join(hosts)}',
+    }
+
+
+@register('hsts_ssl', 'django_settings', ttl=SETTINGS_TTL, inputs=lambda: (
+    getattr(settings, 'SECURE_HSTS_SECONDS', 0), getattr(settings, 'SECURE_SSL_REDIRECT', False),
+))
+def check_hsts_ssl():
+    hsts = getattr(settings, 'SECURE_HSTS_SECONDS', 0)
+    ssl_redirect = getattr(settings, 'SECURE_SSL_REDIRECT', False)
+
+    issues = []
+    if not hsts:
+        issues.append('SECURE_HSTS_SECONDS未設定')
+    if not ssl_redirect:
+        issues.append('SECURE_SSL_REDIRECT未設定')
+
+    if issues:
+        return {
+            'check_name': 'hsts_ssl',
+            'category': 'django_settings',
+            'severity': 'medium',
+            'status': 'warn',
+            'message': '; '.join(issues),
+            'recommendation': 'SECURE_HSTS_SECONDS=31536000, SECURE_SSL_REDIRECT=True を推奨',
+        }
+    return {
+        'check_name': 'hsts_ssl',
+        'category': 'django_settings',
+        'severity': 'info',
+        'status': 'pass',
+        'message': f'HSTS={hsts}秒, SSL_REDIRECT=有効',
+    }
+
+
+@register('cookie_security', 'django_settings', depends_on=('debug_mode',), ttl=SETTINGS_TTL, inputs=lambda: (
+    getattr(settings, 'SESSION_COOKIE_SECURE', False), getattr(settings, 'CSRF_COOKIE_SECURE', False),
+))
+def check_cookie_security(deps):
+    session_secure = getattr(settings, 'SESSION_COOKIE_SECURE', False)
+    csrf_secure = getattr(settings, 'CSRF_COOKIE_SECURE', False)
+    production = deps['debug_mode']['status'] == 'pass'
+
+    issues = []
+    if not session_secure:
+        issues.append('SESSION_COOKIE_SECURE=False')
+    if not csrf_secure:
+        issues.append('CSRF_COOKIE_SECURE=False')
+
+    if issues:
+        return {
+            'check_name': 'cookie_security',
+            'category': 'django_settings',
+            'severity': 'high' if production else 'medium',
+            'status': 'warn',
+            'message': '; '.join(issues),
+            'recommendation': '本番ではSecureフラグをTrueに設定してください',
+        }
+    return {
+        'check_name': 'cookie_security',
+        'category': 'django_settings',
+        'severity': 'info',
+        'status': 'pass',
+        'message': 'セッション/CSRFクッキーのSecureフラグ有効',
+    }
+
+
+@register('xframe_options', 'django_settings',
+          inputs=lambda: getattr(settings, 'X_FRAME_OPTIONS', None), ttl=SETTINGS_TTL)
+def check_xframe_options():
+    xframe = getattr(settings, 'X_FRAME_OPTIONS', None)
+    if not xframe:
+        return {
+            'check_name': 'xframe_options',
+            'category': 'django_settings',
+            'severity': 'medium',
+            'status': 'warn',
+            'message': 'X_FRAME_OPTIONS未設定',
+            'recommendation': 'X_FRAME_OPTIONS="DENY" を推奨',
+        }
+    return {
+        'check_name': 'xframe_options',
+        'category': 'django_settings',
+        'severity': 'info',
+        'status': 'pass',
+        'message': f'X_FRAME_OPTIONS={xframe}',
+    }
+
+
+# DB の内容には安価な変更検出手段が無いので TTL で再実行する
+@register('payment_keys_encrypted', 'credentials', ttl=60 * 60, uses_db=True)
+def check_payment_keys_encrypted():
+    from booking.models import PaymentMethod
+    try:
+        plaintext_count = 0
+        for pm in PaymentMethod.objects.all():
+            if pm.api_key and not pm.api_key.startswith('gAAAAA'):
+                plaintext_count += 1
+            if pm.api_secret and not pm.api_secret.startswith('gAAAAA'):
+                plaintext_count += 1
+
+        if plaintext_count > 0:
+            return {
+                'check_name': 'payment_keys_encrypted',
+                'category': 'credentials',
+                'severity': 'critical',
+                'status': 'fail',
+                'message': f'{plaintext_count}件のAPI鍵が平文で保存されている可能性があります',
+                'recommendation': 'Fernet暗号化を使用してAPI鍵を保護してください',
+            }
+        return {
+            'check_name': 'payment_keys_encrypted',
+            'category': 'credentials',
+            'severity': 'info',
+            'status': 'pass',
+            'message': 'PaymentMethodのAPI鍵は暗号化されているか、未設定です',
+        }
+    except Exception as e:
+        return {
+            'check_name': 'payment_keys_encrypted',
+            'category': 'credentials',
+            'severity': 'info',
+            'status': 'pass',
+            'message': f'PaymentMethodテーブル確認不可: {e}',
+        }
+
+
+@register('public_endpoints', 'endpoints', inputs=lambda: (
+    settings.ROOT_URLCONF, list(settings.INSTALLED_APPS),
+))
+def check_public_endpoints():
+    from django.urls import get_resolver
+    try:
+        resolver = get_resolver()
+        patterns = _collect_url_patterns(resolver)
+        return {
+            'check_name': 'public_endpoints',
+            'category': 'endpoints',
+            'severity': 'info',
+            'status': 'pass',
+            'message': f'URL登録数: {len(patterns)}パターン',
+            'recommendation': '定期的に認証なしエンドポイントを確認してください',
+        }
+    except Exception as e:
+        return {
+            'check_name': 'public_endpoints',
+            'category': 'endpoints',
+            'severity': 'info',
+            'status': 'pass',
+            'message': f'URLパターン取得不可: {e}',
+        }
+
+
+def _collect_url_patterns(resolver, prefix=''):
+    patterns = []
+    for pattern in resolver.url_patterns:
+        if hasattr(pattern, 'url_patterns'):
+            pat = prefix + str(getattr(pattern.pattern, '_route', str(pattern.pattern)))
+            patterns.extend(_collect_url_patterns(pattern, pat))
+        else:
+            pat = prefix + str(getattr(pattern.pattern, '_route', str(pattern.pattern)))
+            patterns.append(pat)
+    return patterns
+
+
+@register('django_version', 'dependencies', inputs=django.get_version, ttl=SETTINGS_TTL)
+def check_django_version():
+    version = django.get_version()
+    major, minor = int(version.split('.')[0]), int(version.split('.')[1])
+
+    if major < 4:
+        return {
+            'check_name': 'django_version',
+            'category': 'dependencies',
+            'severity': 'high',
+            'status': 'fail',
+            'message': f'Django {version} はサポート終了の可能性があります',
+            'recommendation': 'Django 4.2 LTS以降にアップグレードしてください',
+        }
+    if major == 4 and minor < 2:
+        return {
+            'check_name': 'django_version',
+            'category': 'dependencies',
+            'severity': 'medium',
+            'status': 'warn',
+            'message': f'Django {version} は最新のLTSではありません',
+            'recommendation': 'Django 4.2 LTS以降にアップグレードを推奨',
+        }
+    return {
+        'check_name': 'django_version',
+        'category': 'dependencies',
+        'severity': 'info',
+        'status': 'pass',
+        'message': f'Django {version}',
+    }
+
+
+ENV_FILES = ['.env', '.env.local', '.env.production', '.env.staging']
+
+
+def _env_file_stats():
+    base_dir = getattr(settings, 'BASE_DIR', '')
+    stats = {}
+    for fname in ENV_FILES:
+        try:
+            st = os.stat(os.path.join(base_dir, fname))
+            stats[fname] = (st.st_mode, st.st_ino)
+        except OSError:
+            stats[fname] = None
+    return stats
+
+
+@register('env_file_permissions', 'infrastructure', inputs=_env_file_stats)
+def check_env_file_permissions():
+    base_dir = getattr(settings, 'BASE_DIR', '')
+    issues = []
+
+    for fname in ENV_FILES:
+        fpath = os.path.join(base_dir, fname)
+        if os.path.exists(fpath):
+            mode = oct(os.stat(fpath).st_mode)[-3:]
+            if mode not in ('600', '400', '640'):
+                issues.append(f'{fname}: 権限 {mode}（推奨: 600）')
+
+    if issues:
+        return {
+            'check_name': 'env_file_permissions',
+            'category': 'infrastructure',
+            'severity': 'medium',
+            'status': 'warn',
+            'message': '; '.join(issues),
+            'recommendation': 'chmod 600 .env* で権限を制限してください',
+        }
+    return {
+        'check_name': 'env_file_permissions',
+        'category': 'infrastructure',
+        'severity': 'info',
+        'status': 'pass',
+        'message': '.envファイルの権限は適切です',
+    }
+
+
+# 外部（S3）の状態なので TTL で再実行する
+@register('backup_freshness', 'infrastructure', timeout=30.0, ttl=60 * 60)
+def check_backup_freshness():
+    try:
+        import boto3
+        from datetime import datetime, timezone as tz
+
+        s3 = boto3.client('s3')
+        buckets = s3.list_buckets().get('Buckets', [])
+        backup_buckets = [b for b in buckets if 'backup' in b['Name'].lower()]
+
+        if not backup_buckets:
+            return {
+                'check_name': 'backup_freshness',
+                'category': 'infrastructure',
+                'severity': 'medium',
+                'status': 'warn',
+                'message': 'バックアップ用S3バケットが見つかりません',
+                'recommendation': 'S3バックアップの設定を確認してください',
+            }
+
+        now = datetime.now(tz.utc)
+        stale_buckets = []
+        for bucket in backup_buckets:
+            try:
+                objects = s3.list_objects_v2(Bucket=bucket['Name'], MaxKeys=1)
+                if 'Contents' in objects:
+                    last_modified = objects['Contents'][0]['LastModified']
+                    age_hours = (now - last_modified).total_seconds() / 3600
+                    if age_hours > 48:
+                        stale_buckets.append(f"{bucket['Name']} (最終更新: {age_hours:.0f}時間前)")
+            except Exception:
+                stale_buckets.append(f"{bucket['Name']} (確認不可)")
+
+        if stale_buckets:
+            return {
+                'check_name': 'backup_freshness',
+                'category': 'infrastructure',
+                'severity': 'high',
+                'status': 'warn',
+                'message': f'古いバックアップ: {"; ".join(stale_buckets)}',
+                'recommendation': 'バックアップジョブが正常に動作しているか確認してください',
+            }
+        return {
+            'check_name': 'backup_freshness',
+            'category': 'infrastructure',
+            'severity': 'info',
+            'status': 'pass',
+            'message': 'S3バックアップは48時間以内に更新されています',
+        }
+    except ImportError:
+        return {
+            'check_name': 'backup_freshness',
+            'category': 'infrastructure',
+            'severity': 'low',
+            'status': 'warn',
+            'message': 'boto3が未インストールのためS3バックアップ確認をスキップ',
+            'recommendation': 'pip install boto3 でインストールしてください',
+        }
+    except Exception as e:
+        return {
+            'check_name': 'backup_freshness',
+            'category': 'infrastructure',
+            'severity': 'low',
+            'status': 'warn',
+            'message': f'S3バックアップ確認失敗: {e}',
+            'recommendation': 'AWS認証情報を確認してください',
+        }
+
+
+@register('middleware_check', 'django_settings',
+          inputs=lambda: list(getattr(settings, 'MIDDLEWARE', [])), ttl=SETTINGS_TTL)
+def check_middleware():
+    middleware = getattr(settings, 'MIDDLEWARE', [])
+    required = [
+        'django.middleware.security.SecurityMiddleware',
+        'django.middleware.csrf.CsrfViewMiddleware',
+        'django.contrib.auth.middleware.AuthenticationMiddleware',
+    ]
+    missing = [m.split('.')[-1] for m in required if m not in middleware]
+
+    if missing:
+        return {
+            'check_name': 'middleware_check',
+            'category': 'django_settings',
+            'severity': 'high',
+            'status': 'fail',
+            'message': f'必須ミドルウェア不足: {", ".join(missing)}',
+            'recommendation': '必須のセキュリティミドルウェアを有効にしてください',
+        }
+    return {
+        'check_name': 'middleware_check',
+        'category': 'django_settings',
+        'severity': 'info',
+        'status': 'pass',
+        'message': '必須セキュリティミドルウェアはすべて有効です',
+    }
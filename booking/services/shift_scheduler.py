@@ -84,10 +84,21 @@ def _build_req_map(store, period):
     month = period.year_month.month
     _, last_day = monthrange(year, month)
 
+    # get_required_counts() と同じ規則を、日付ごとのクエリ無しで適用する
+    overrides = defaultdict(dict)
+    for o in ShiftStaffRequirementOverride.objects.filter(
+        store=store,
+        date__range=(datetime.date(year, month, 1), datetime.date(year, month, last_day)),
+    ):
+        overrides[o.date][o.staff_type] = o.required_count
+    defaults = defaultdict(dict)
+    for d in ShiftStaffRequirement.objects.filter(store=store):
+        defaults[d.day_of_week][d.staff_type] = d.required_count
+
     req_map = {}
     for day in range(1, last_day + 1):
         d = datetime.date(year, month, day)
-        counts = get_required_counts(store, d)
+        counts = overrides.get(d) or dict(defaults.get(d.weekday(), {}))
         if counts:
             req_map[d] = counts
     return req_map
@@ -118,7 +129,8 @@ def auto_schedule(period):
     coverage_map = build_coverage_map()
 
     with transaction.atomic():
-        period.assignments.all().delete()
+        # 削除シグナル（キャッシュ無効化）が行ごとに staff を引かないよう先に取得しておく
+        period.assignments.prefetch_related('staff').delete()
 
         assigned_slots = defaultdict(set)
 
@@ -293,7 +305,8 @@ def sync_assignments_to_schedule(period):
             current += duration
 
         assignment.is_synced = True
-        assignment.save(update_fields=['is_synced'])
+        # updated_at も更新し、承認を勤怠の差分導出（derive_attendance_incremental）に拾わせる
+        assignment.save(update_fields=['is_synced', 'updated_at'])
 
     period.status = 'approved'
     period.save(update_fields=['status'])
@@ -384,7 +397,8 @@ def revert_scheduled(period, reason='', reverted_by=None):
 
     with transaction.atomic():
         deleted_count = period.assignments.count()
-        period.assignments.all().delete()
+        # 削除シグナル（キャッシュ無効化）が行ごとに staff を引かないよう先に取得しておく
+        period.assignments.prefetch_related('staff').delete()
 
         period.status = 'open'
         period.save(update_fields=['status'])
@@ -0,0 +1,194 @@
+"""SystemConfig の読み取りキャッシュ
+
+SystemConfig は小さなキー/値テーブルなので、全行を1つのスナップショット（dict）として
+2層でキャッシュする:
+
+1. 共有キャッシュ（django.core.cache）: 世代番号ごとのスナップショット
+2. プロセス内: スナップショットと型変換済みの値（bool/int/json は1回だけパース）。
+   共有キャッシュの世代番号は LOCAL_CHECK_INTERVAL 秒ごとに確認する
+
+保存・削除時は signals.invalidate_system_config がコミット後に世代番号を進め、
+保存したプロセスのローカル層は即時に捨てる（他のワーカーも LOCAL_CHECK_INTERVAL 秒以内に追従）。
+トランザクション内の読み取りはキャッシュを使わず DB を読む（未コミット値をキャッシュしないため）。
+"""
+import json
+import logging
+import time
+
+from django.core.cache import cache
+from django.db import connection
+
+logger = logging.getLogger(__name__)
+
+CACHE_PREFIX = 'syscfg'
+SNAPSHOT_TTL = 60 * 60  # 世代番号で即時無効化するので長め
+LOCAL_CHECK_INTERVAL = 1.0
+
+TRUE_VALUES = frozenset({'true', '1', 'yes', 'on'})
+FALSE_VALUES = frozenset({'false', '0', 'no', 'off', ''})
+
+_MISSING = object()
+
+
+class _LocalSnapshot:
+    def __init__(self, version, values, checked_until):
+        self.version = version
+        self.values = values
+        self.checked_until = checked_until
+        self.typed = {}
+
+
+# プロセス内の層（差し替えのみで更新するのでスレッド間で共有してよい）
+_local = None
+
+
+def _version_key():
+    return f'{CACHE_PREFIX}:ver'
+
+
+def _snapshot_key(version):
+    return f'{CACHE_PREFIX}:all:{version}'
+
+
+# ---------------------------------------------------------------------------
+# 無効化
+# ---------------------------------------------------------------------------
+
+def clear_local():
+    """このプロセスのローカル層を捨てる。"""
+    global _local
+    _local = None
+
+
+def bump_version():
+    """スナップショットの世代を進める（全プロセスのキャッシュが無効になる）。"""
+    clear_local()
+    key = _version_key()
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, 1, None)
+    except Exception as e:
+        logger.warning("system config invalidate failed: %s", e)
+
+
+# ---------------------------------------------------------------------------
+# 読み取り
+# ---------------------------------------------------------------------------
+
+def _load_from_db():
+    from booking.models import SystemConfig
+    return dict(SystemConfig.objects.values_list('key', 'value'))
+
+
+def _shared_version():
+    try:
+        return cache.get(_version_key(), 0)
+    except Exception as e:
+        logger.warning("system config version read failed: %s", e)
+        return None
+
+
+def _shared_snapshot(version):
+    key = _snapshot_key(version)
+    try:
+        values = cache.get(key)
+    except Exception as e:
+        logger.warning("system config cache get failed: %s", e)
+        values = None
+    if values is None:
+        values = _load_from_db()
+        try:
+            cache.set(key, values, SNAPSHOT_TTL)
+        except Exception as e:
+            logger.warning("system config cache set failed: %s", e)
+    return values
+
+
+def _current():
+    """有効なローカルスナップショット（必要なら共有キャッシュ・DB から取り直す）。"""
+    global _local
+    now = time.monotonic()
+    local = _local
+    if local is not None and now < local.checked_until:
+        return local
+
+    version = _shared_version()
+    if version is None:
+        # 共有キャッシュが使えない場合はローカル層だけで短時間保持する
+        local = _LocalSnapshot(None, _load_from_db(), now + LOCAL_CHECK_INTERVAL)
+    elif local is not None and local.version == version:
+        local.checked_until = now + LOCAL_CHECK_INTERVAL
+    else:
+        local = _LocalSnapshot(version, _shared_snapshot(version), now + LOCAL_CHECK_INTERVAL)
+    _local = local
+    return local
+
+
+def snapshot():
+    """全設定の dict（キャッシュ済み）。トランザクション内では DB を直接読む。"""
+    if connection.in_atomic_block:
+        return _load_from_db()
+    return _current().values
+
+
+def get(key, default=''):
+    return snapshot().get(key, default)
+
+
+def get_many(keys, defaults=None):
+    """複数キーを1回のスナップショット参照で返す（{key: value}、無いキーは defaults か ''）。"""
+    values = snapshot()
+    defaults = defaults or {}
+    return {key: values.get(key, defaults.get(key, '')) for key in keys}
+
+
+def _typed(key, kind, parse, default):
+    if connection.in_atomic_block:
+        values = _load_from_db()
+        return parse(values[key], default) if key in values else default
+
+    local = _current()
+    if key not in local.values:
+        return default
+    parsed = local.typed.get((key, kind), _MISSING)
+    if parsed is _MISSING:
+        parsed = local.typed[(key, kind)] = parse(local.values[key], _MISSING)
+    return default if parsed is _MISSING else parsed
+
+
+def _parse_bool(raw, default):
+    value = raw.strip().lower()
+    if value in TRUE_VALUES:
+        return True
+    if value in FALSE_VALUES:
+        return False
+    return default
+
+
+def _parse_int(raw, default):
+    try:
+        return int(raw.strip())
+    except ValueError:
+        return default
+
+
+def _parse_json(raw, default):
+    try:
+        return json.loads(raw)
+    except ValueError:
+        return default
+
+
+def get_bool(key, default=False):
+    """'true'/'1'/'yes'/'on' → True、'false'/'0'/'no'/'off'/'' → False、それ以外は default。"""
+    return _typed(key, 'bool', _parse_bool, default)
+
+
+def get_int(key, default=0):
+    return _typed(key, 'int', _parse_int, default)
+
+
+def get_json(key, default=None):
+    """JSON としてパースした値（パース済みオブジェクトは共有されるので変更しないこと）。"""
+    return _typed(key, 'json', _parse_json, default)
@@ -0,0 +1,207 @@
+"""booking シグナルハンドラ — モデル変更時のキャッシュ無効化
+
+BookingConfig.ready() から connect_signals() で接続する。
+"""
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+
+from booking.services import attendance_board, menu_catalogue, page_cache, sales_forecast, system_config
+
+
+# ---------------------------------------------------------------------------
+# 公開ページキャッシュ: モデル → サロゲートキー
+# ---------------------------------------------------------------------------
+
+def _store_keys(instance):
+    return [f'store:{instance.pk}', 'stores']
+
+
+def _staff_keys(instance):
+    return [f'store:{instance.store_id}', 'stores']
+
+
+def _staff_store_id(instance):
+    """instance.staff の主店舗ID（ロード済みの staff があればクエリしない）"""
+    from booking.models import Staff
+
+    if instance._meta.get_field('staff').is_cached(instance):
+        return instance.staff.store_id
+    return Staff.objects.filter(pk=instance.staff_id).values_list('store_id', flat=True).first()
+
+
+def _shift_assignment_keys(instance):
+    # 当日シフトでスタッフ一覧の表示店舗が変わる（主店舗と出勤店舗の両方）
+    home_store_id = _staff_store_id(instance)
+    keys = [f'store:{home_store_id}'] if home_store_id else []
+    if instance.store_id:
+        keys.append(f'store:{instance.store_id}')
+    return keys
+
+
+def _store_child_keys(instance):
+    return [f'store:{instance.store_id}'] if instance.store_id else ['stores']
+
+
+def _custom_page_keys(instance):
+    return [f'page:{instance.pk}']
+
+
+def _store_theme_keys(instance):
+    return [f'store:{instance.store_id}', 'theme']
+
+
+def _site_keys(instance):
+    return ['site']
+
+
+def _notice_keys(instance):
+    return ['notice']
+
+
+PAGE_CACHE_PURGE_MAP = {
+    'Store': _store_keys,
+    'Staff': _staff_keys,
+    'ShiftAssignment': _shift_assignment_keys,
+    'StoreScheduleConfig': _store_child_keys,
+    'PageLayout': _store_child_keys,
+    'CustomPage': _custom_page_keys,
+    'StoreTheme': _store_theme_keys,
+    'Notice': _notice_keys,
+    'SiteSettings': _site_keys,
+    'HeroBanner': _site_keys,
+    'HomepageCustomBlock': _site_keys,
+    'Company': _site_keys,
+    'Media': _site_keys,
+    'ExternalLink': _site_keys,
+}
+
+
+def purge_page_cache(sender, instance, **kwargs):
+    """保存・削除されたインスタンスに対応するサロゲートキーをパージする。"""
+    if kwargs.get('raw') or sender._meta.app_label != 'booking':
+        return
+    # プロキシモデル（AdminSidebarSettings 等）経由の保存も実体モデル名で判定
+    key_func = PAGE_CACHE_PURGE_MAP.get(sender._meta.concrete_model.__name__)
+    if key_func is None:
+        return
+    page_cache.purge(*key_func(instance))
+
+
+# ---------------------------------------------------------------------------
+# メニューカタログ: 構成変更は世代を進め、在庫のみの変更は在庫マップを差し替える
+# ---------------------------------------------------------------------------
+
+# これらのフィールドだけの保存は在庫変更として扱う
+_STOCK_ONLY_FIELDS = {'stock', 'updated_at', 'last_low_stock_notified_at', 'low_stock_threshold'}
+
+
+def _menu_store_id(sender, instance):
+    name = sender.__name__
+    if name in ('Product', 'Category', 'StockMovement'):
+        return instance.store_id
+    if name == 'ProductTranslation':
+        from booking.models import Product
+        return Product.objects.filter(pk=instance.product_id).values_list('store_id', flat=True).first()
+    return None
+
+
+def invalidate_menu_catalogue(sender, instance, **kwargs):
+    """カタログのキャッシュをコミット後に更新する（未コミットの値で再構築しないため）。"""
+    if kwargs.get('raw') or sender._meta.app_label != 'booking':
+        return
+    name = sender.__name__
+    if name not in ('Product', 'ProductTranslation', 'Category', 'StockMovement'):
+        return
+    store_id = _menu_store_id(sender, instance)
+    if not store_id:
+        return
+
+    update_fields = kwargs.get('update_fields')
+    stock_only = name == 'StockMovement' or (
+        name == 'Product' and update_fields and set(update_fields) <= _STOCK_ONLY_FIELDS
+    )
+    if stock_only:
+        transaction.on_commit(lambda: menu_catalogue.refresh_stock(store_id))
+    else:
+        def _invalidate():
+            menu_catalogue.invalidate(store_id)
+            menu_catalogue.refresh_stock(store_id)
+        transaction.on_commit(_invalidate)
+
+
+# ---------------------------------------------------------------------------
+# 出退勤ボード: 新規打刻は差分更新、それ以外の変更（スタッフ・シフト・打刻の修正/無効化）は再構築
+# ---------------------------------------------------------------------------
+
+def _attendance_store_id(sender, instance):
+    name = sender.__name__
+    if name == 'Staff':
+        return instance.store_id
+    if name in ('AttendanceStamp', 'ShiftAssignment'):
+        return _staff_store_id(instance)
+    return None
+
+
+def invalidate_attendance_board(sender, instance, **kwargs):
+    """新規打刻は record_stamp() で差分更新（作成元を問わない）、それ以外の変更は再構築させる。"""
+    if kwargs.get('raw') or sender._meta.app_label != 'booking':
+        return
+    if sender.__name__ not in ('Staff', 'AttendanceStamp', 'ShiftAssignment'):
+        return
+    if sender.__name__ == 'AttendanceStamp' and kwargs.get('created'):
+        # 反映はトランザクション確定後（record_stamp 内で on_commit）
+        attendance_board.record_stamp(instance)
+        return
+    if sender.__name__ == 'Staff' and kwargs.get('update_fields') and (
+        'name' not in kwargs['update_fields'] and 'store' not in kwargs['update_fields']
+    ):
+        return
+    store_id = _attendance_store_id(sender, instance)
+    if store_id:
+        transaction.on_commit(lambda: attendance_board.invalidate(store_id))
+
+
+# ---------------------------------------------------------------------------
+# 売上予測: 注文・明細の変更で店舗のデータバージョンを進める
+# ---------------------------------------------------------------------------
+
+def _order_store_id(sender, instance):
+    if sender.__name__ == 'Order':
+        return instance.store_id
+    # 明細は通常 order をキャッシュ済み（未取得なら店舗IDだけ引く）
+    if sender.order.is_cached(instance):
+        return instance.order.store_id
+    from booking.models import Order
+    return Order.objects.filter(pk=instance.order_id).values_list('store_id', flat=True).first()
+
+
+def invalidate_sales_forecast(sender, instance, **kwargs):
+    """キャッシュ済みの予測をコミット後に無効化する。"""
+    if kwargs.get('raw') or sender._meta.app_label != 'booking':
+        return
+    if sender.__name__ not in ('Order', 'OrderItem'):
+        return
+    store_id = _order_store_id(sender, instance)
+    if store_id:
+        transaction.on_commit(lambda: sales_forecast.bump_data_version(store_id))
+
+
+def invalidate_system_config(sender, instance, **kwargs):
+    """SystemConfig の変更をコミット後に全プロセスのキャッシュへ反映する。"""
+    if kwargs.get('raw') or sender._meta.app_label != 'booking' or sender.__name__ != 'SystemConfig':
+        return
+    system_config.clear_local()
+    transaction.on_commit(system_config.bump_version)
+
+
+def connect_signals():
+    post_save.connect(purge_page_cache, dispatch_uid='booking_page_cache_purge_save')
+    post_delete.connect(purge_page_cache, dispatch_uid='booking_page_cache_purge_delete')
+    post_save.connect(invalidate_menu_catalogue, dispatch_uid='booking_menu_catalogue_save')
+    post_delete.connect(invalidate_menu_catalogue, dispatch_uid='booking_menu_catalogue_delete')
+    post_save.connect(invalidate_attendance_board, dispatch_uid='booking_attendance_board_save')
+    post_delete.connect(invalidate_attendance_board, dispatch_uid='booking_attendance_board_delete')
+    post_save.connect(invalidate_sales_forecast, dispatch_uid='booking_sales_forecast_save')
+    post_delete.connect(invalidate_sales_forecast, dispatch_uid='booking_sales_forecast_delete')
+    post_save.connect(invalidate_system_config, dispatch_uid='booking_system_config_save')
+    post_delete.connect(invalidate_system_config, dispatch_uid='booking_system_config_delete')
@@ -399,17 +399,56 @@ def recompute_customer_segments():
     if not SiteSettings.load().line_segment_enabled:
         return
     from booking.services.line_segment import recompute_segments
-    recompute_segments()
+    return recompute_segments()
 
 
 @shared_task
-def task_send_segment_message(customer_ids, message_text):
-    """セグメント配信タスク"""
+def generate_business_insights():
+    """毎朝: 全店舗のビジネスインサイトを一括生成"""
+    from booking.services.insight_engine import generate_insights
+    return len(generate_insights())
+
+
+@shared_task
+def derive_attendance_incremental():
+    """15分毎: 前回以降に更新された確定シフトを勤怠に反映（ATTENDANCE_AUTO_DERIVE_ENABLED 時のみ）"""
+    from booking.models import Store
+    from booking.services.attendance_service import derive_attendance_incremental as _derive
+
+    if not getattr(settings, 'ATTENDANCE_AUTO_DERIVE_ENABLED', False):
+        return 0
+    total = 0
+    for store in Store.objects.all():
+        try:
+            total += _derive(store)
+        except Exception:
+            logger.exception('Attendance derivation failed for store %s', store.id)
+    return total
+
+
+@shared_task
+def refresh_sales_forecasts():
+    """毎晩: 店舗 x チャネルごとに売上予測を学習し SalesForecast に保存"""
+    from booking.models import Store
+    from booking.services.sales_forecast import refresh_store_forecasts
+
+    total = 0
+    for store in Store.objects.all():
+        try:
+            total += refresh_store_forecasts(store)
+        except Exception:
+            logger.exception('Sales forecast refresh failed for store %s', store.id)
+    return total
+
+
+@shared_task
+def task_send_segment_message(customer_ids, message_text, campaign_id=None):
+    """セグメント配信タスク（キャンペーンレポートを返す）"""
     from booking.models import SiteSettings
     if not SiteSettings.load().line_segment_enabled:
-        return
+        return None
     from booking.services.line_segment import send_segment_message
-    send_segment_message(customer_ids, message_text)
+    return send_segment_message(customer_ids, message_text, campaign_id=campaign_id)
 
 
 @shared_task
@@ -449,4 +488,16 @@ def run_scheduled_backup():
 
     from booking.services.backup_service import create_backup
     create_backup(trigger='scheduled')
-    logger.info('Scheduled backup completed')
\ No newline at end of file
+    logger.info('Scheduled backup completed')
+
+
+@shared_task
+def flush_query_profiles():
+    """5分毎: ビュー別クエリ計測のキャッシュ集計を QueryProfileSummary に書き出す"""
+    from booking.services import query_profile
+
+    if not query_profile.is_enabled():
+        return 0
+    flushed = query_profile.flush()
+    logger.info('Query profiles flushed: %d', flushed)
+    return flushed
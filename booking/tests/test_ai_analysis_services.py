@@ -353,6 +353,107 @@ class TestForecastAPI(AIAnalysisTestBase):
         self.assertEqual(resp.status_code, 403)
 
 
+class TestStoredSalesForecast(AIAnalysisTestBase):
+    """Nightly per-(store, channel) forecasts and the cached request path."""
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_authenticate(user=self.admin_user)
+        for i in range(30):
+            order = _make_order_with_items(
+                self.store, [(self.product_a, 1, 3000)],
+                channel='ec' if i % 3 == 0 else 'pos', days_ago=i + 1,
+            )
+            Order.objects.filter(pk=order.pk).update(created_at=timezone.now() - timedelta(days=i + 1))
+
+    def test_moving_average_weekday_coefficients(self):
+        from datetime import date
+        from booking.services.sales_forecast import _moving_average_forecast
+        start = date(2026, 1, 5)  # Monday
+        historical = [
+            (start + timedelta(days=i), 2000 if i % 7 == 0 else 1000)
+            for i in range(28)
+            if i % 7 != 6  # Sundays have no sales
+        ]
+        forecast = _moving_average_forecast(historical, forecast_days=7)
+        # baseline: 27 days (ends Saturday), Sundays count as zero
+        avg = (4 * 2000 + 20 * 1000) / 27
+        self.assertEqual(forecast[0]['date'], '2026-02-01')
+        self.assertEqual(forecast[0]['predicted'], 0)  # Sunday
+        self.assertEqual(forecast[1]['predicted'], round(avg * (2000 / avg)))  # Monday
+        self.assertEqual(forecast[2]['predicted'], 1000)
+        self.assertEqual(forecast[2]['lower'], 700)
+        self.assertEqual(forecast[2]['upper'], 1300)
+
+    def test_refresh_stores_rows_per_channel(self):
+        from booking.models import SalesForecast
+        from booking.services.sales_forecast import refresh_store_forecasts
+        count = refresh_store_forecasts(self.store, horizon=10)
+        self.assertEqual(count, 30)
+        self.assertEqual(
+            set(SalesForecast.objects.filter(store=self.store).values_list('channel', flat=True)),
+            {'', 'pos', 'ec'},
+        )
+        # 再実行で置き換わる（重複しない）
+        self.assertEqual(refresh_store_forecasts(self.store, horizon=5), 15)
+        self.assertEqual(SalesForecast.objects.filter(store=self.store).count(), 15)
+
+    def test_api_serves_stored_forecast_without_fitting(self):
+        from booking.models import SalesForecast
+        today = timezone.localdate()
+        SalesForecast.objects.bulk_create([
+            SalesForecast(
+                store=self.store, channel='pos', date=today + timedelta(days=i),
+                predicted=5000 + i, lower=4000, upper=6000, method='prophet',
+                generated_at=timezone.now(),
+            )
+            for i in range(14)
+        ])
+        user = User.objects.create_user(username='forecast_staff', password='pw')
+        Staff.objects.create(name='予測スタッフ', store=self.store, user=user)
+        self.client.force_authenticate(user=user)
+        with patch('booking.services.sales_forecast._try_prophet_forecast') as fit:
+            resp = self.client.get(reverse('booking_api:sales_forecast_api'), {'channel': 'pos'})
+            data = resp.json()
+            self.assertEqual(data['method'], 'prophet')
+            self.assertEqual(data['forecast'][0]['predicted'], 5000)
+            self.assertEqual(len(data['forecast']), 14)
+            self.assertTrue(data['historical'])
+
+            # 複数チャネルは保存済み予測が無いので移動平均
+            resp = self.client.get(reverse('booking_api:sales_forecast_api'), {'channel': 'pos,ec'})
+            self.assertEqual(resp.json()['method'], 'moving_average')
+        fit.assert_not_called()
+
+    def test_stale_stored_forecast_is_ignored(self):
+        from booking.models import SalesForecast
+        from booking.services.sales_forecast import get_forecast
+        SalesForecast.objects.bulk_create([
+            SalesForecast(
+                store=self.store, channel='', date=timezone.localdate() + timedelta(days=i),
+                predicted=1, lower=0, upper=2, method='prophet',
+                generated_at=timezone.now() - timedelta(days=5),
+            )
+            for i in range(14)
+        ])
+        self.assertEqual(get_forecast(self.store)['method'], 'moving_average')
+
+    @override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+    def test_result_cached_until_data_version_changes(self):
+        from django.core.cache import cache
+        from booking.services.sales_forecast import get_forecast
+        cache.clear()
+        first = get_forecast(self.store, forecast_days=7)
+        with self.assertNumQueries(0):
+            self.assertEqual(get_forecast(self.store, forecast_days=7), first)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            _make_order_with_items(self.store, [(self.product_a, 10, 3000)], days_ago=0)
+        refreshed = get_forecast(self.store, forecast_days=7)
+        self.assertGreater(refreshed['historical'][-1]['revenue'], first['historical'][-1]['revenue'])
+        cache.clear()
+
+
 # ── 6. AI Analysis Text Integration Tests ──
 
 class TestAIAnalysisTextIntegration(AIAnalysisTestBase):
@@ -1,4 +1,5 @@
 """Tests for backup service — SQLite backup and retention policy."""
+import tempfile
 from pathlib import Path
 from unittest.mock import patch, MagicMock
 
@@ -39,6 +40,14 @@ class BackupConfigTest(TestCase):
 class BackupServiceTest(TestCase):
     """Test backup creation (mocked sqlite3.backup for in-memory test DB)."""
 
+    def setUp(self):
+        # チャンクリポジトリは一時ディレクトリに作る
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        patcher = patch('booking.services.backup_service.REPO_DIR', Path(tmp.name) / 'repo')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
     @patch('booking.services.backup_service._perform_sqlite_backup')
     @patch('booking.services.backup_service._send_backup_notification')
     def test_create_backup_success(self, mock_notify, mock_backup):
@@ -327,6 +327,64 @@ class TestSalesAnalysisEngine(SalesAnalysisTestBase):
         self.assertEqual(_grade('growth_rate', -10.0), 'D')
 
 
+class TestSalesAnalysisFrame(SalesAnalysisTestBase):
+    """Shared analysis frame used by every analysis type."""
+
+    ANALYSIS_TYPES = ('sales_trend', 'menu_engineering', 'abc_analysis', 'forecast', 'heatmap', 'aov')
+
+    def _order(self, product, channel, qty, unit_price, days_ago):
+        order = _make_order_with_item(self.store, product, channel, qty, unit_price)
+        # created_at は auto_now_add なので作成後に更新する
+        Order.objects.filter(pk=order.pk).update(created_at=timezone.now() - timedelta(days=days_ago))
+
+    def setUp(self):
+        super().setUp()
+        for i in range(10):
+            self._order(self.product_a, 'pos', 2, 2000, days_ago=i + 1)
+        self._order(self.product_b, 'ec', 1, 800, days_ago=3)
+        # 前期間（90〜180日前）
+        self._order(self.product_a, 'pos', 1, 2000, days_ago=100)
+        # 対象外（180日より前）
+        self._order(self.product_a, 'pos', 1, 2000, days_ago=200)
+
+    def test_frame_totals(self):
+        from booking.services.sales_analysis_frame import build_analysis_frame
+        frame = build_analysis_frame({'order__store': self.store})
+
+        self.assertEqual(frame.revenue_total, {'current': 10 * 4000 + 800, 'previous': 2000})
+        self.assertEqual(frame.order_count, {'current': 11, 'previous': 1})
+        stats = {s['product__name']: s for s in frame.product_stats()}
+        self.assertEqual(stats['A商品']['qty_sold'], 20)
+        self.assertEqual(stats['B商品']['revenue'], 800)
+        self.assertEqual(sum(frame.weekday_revenue().values()), 40800)
+        self.assertEqual(int(frame.heatmap_revenue.sum()), 40800)
+        self.assertEqual(sum(rev for _, rev in frame.daily_history()), 40800)
+        self.assertEqual(len(frame.daily_history()), 10)
+
+    def test_channel_filter_is_part_of_frame(self):
+        from booking.services.sales_analysis_frame import build_analysis_frame
+        frame = build_analysis_frame({'order__store': self.store}, {'order__channel__in': ['ec']})
+        self.assertEqual(frame.revenue_total['current'], 800)
+        self.assertEqual([s['product__name'] for s in frame.product_stats()], ['B商品'])
+
+    def test_all_analyses_share_one_frame(self):
+        from booking.services.sales_analysis_text import SalesAnalysisEngine
+        engine = SalesAnalysisEngine()
+        with self.assertNumQueries(2):
+            results = [engine.analyze(t, {'order__store': self.store}, {}) for t in self.ANALYSIS_TYPES]
+        self.assertTrue(all(r['score'] != '-' for r in results))
+
+    @override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+    def test_frame_is_cached_across_engines(self):
+        from django.core.cache import cache
+        from booking.services.sales_analysis_text import SalesAnalysisEngine
+        cache.clear()
+        SalesAnalysisEngine().analyze('aov', {'order__store': self.store}, {})
+        with self.assertNumQueries(0):
+            SalesAnalysisEngine().analyze('heatmap', {'order__store': self.store}, {})
+        cache.clear()
+
+
 # ── 5. DashboardLayoutAPIView auth tests ──
 
 class TestDashboardLayoutAuth(SalesAnalysisTestBase):
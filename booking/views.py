@@ -45,6 +45,7 @@ from booking.models import (
     ShiftPeriod,
 )
 from booking.serializers import UserSerializer
+from booking.services.page_cache import SurrogateKeyMixin
 
 logger = logging.getLogger(__name__)
 
@@ -113,8 +114,9 @@ class Index(generic.RedirectView):
     pattern_name = 'booking:booking_top'
 
 
-class HelpView(generic.TemplateView):
+class HelpView(SurrogateKeyMixin, generic.TemplateView):
     template_name = 'booking/help.html'
+    surrogate_keys = ('site',)
 
 
 def LINETimerView(request, user_id):
@@ -154,9 +156,10 @@ def get_reservation(request, pk):
 
 # ===== Booking top / listing views =====
 
-class BookingTopPage(generic.TemplateView):
+class BookingTopPage(SurrogateKeyMixin, generic.TemplateView):
     """トップページ: 3つの入口 (店舗/占い師/日付)"""
     template_name = 'booking/booking_top.html'
+    surrogate_keys = ('stores', 'notice')
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
@@ -220,8 +223,9 @@ class BookingTopPage(generic.TemplateView):
         return context
 
 
-class AllFortuneTellerList(generic.ListView):
+class AllFortuneTellerList(SurrogateKeyMixin, generic.ListView):
     """全店舗横断の占い師一覧 (staff_type='fortune_teller' のみ)"""
+    surrogate_keys = ('stores',)
     model = Staff
     template_name = 'booking/all_fortune_tellers.html'
     context_object_name = 'fortune_tellers'
@@ -260,7 +264,7 @@ class DateFirstCalendar(generic.TemplateView):
             # 全占い師のスケジュールをバルク取得して N+1 回避
             fortune_tellers = Staff.objects.filter(
                 staff_type='fortune_teller'
-            ).select_related('store')
+            ).select_related('store', 'store__schedule_config')
 
             # 選択日の既存予約を一括取得
             booked = Schedule.objects.filter(
@@ -295,21 +299,28 @@ class DateFirstCalendar(generic.TemplateView):
         return context
 
 
-class StoreList(generic.ListView):
+class StoreList(SurrogateKeyMixin, generic.ListView):
     model = Store
     ordering = 'name'
+    surrogate_keys = ('stores',)
 
 
-class StoreAccessView(generic.DetailView):
+class StoreAccessView(SurrogateKeyMixin, generic.DetailView):
     model = Store
     template_name = 'booking/store_access.html'
     context_object_name = 'store'
 
+    def get_surrogate_keys(self):
+        return [f'store:{self.kwargs["pk"]}']
 
-class StaffList(generic.ListView):
+
+class StaffList(SurrogateKeyMixin, generic.ListView):
     model = Staff
     ordering = 'name'
 
+    def get_surrogate_keys(self):
+        return [f'store:{self.kwargs["pk"]}']
+
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         context['store'] = self.store
@@ -504,18 +515,21 @@ class BookingChannelChoice(generic.TemplateView):
 
 # ===== Static pages =====
 
-class PrivacyPolicyView(generic.TemplateView):
+class PrivacyPolicyView(SurrogateKeyMixin, generic.TemplateView):
     template_name = 'booking/privacy_policy.html'
+    surrogate_keys = ('site',)
 
 
-class TokushohoView(generic.TemplateView):
+class TokushohoView(SurrogateKeyMixin, generic.TemplateView):
     template_name = 'booking/tokushoho.html'
+    surrogate_keys = ('site',)
 
 
 # ===== Notice views =====
 
-class NoticeListView(generic.ListView):
+class NoticeListView(SurrogateKeyMixin, generic.ListView):
     """公開済みお知らせの一覧ページ"""
+    surrogate_keys = ('notice',)
     model = Notice
     template_name = 'booking/notice_list.html'
     context_object_name = 'notices'
@@ -525,8 +539,9 @@ class NoticeListView(generic.ListView):
         return Notice.objects.filter(is_published=True).order_by('-updated_at')
 
 
-class NoticeDetailView(generic.DetailView):
+class NoticeDetailView(SurrogateKeyMixin, generic.DetailView):
     """お知らせ詳細ページ（slug ベース）"""
+    surrogate_keys = ('notice',)
     model = Notice
     template_name = 'booking/notice_detail.html'
     context_object_name = 'notice'
@@ -3,9 +3,12 @@ import json
 import logging
 import base64
 from io import BytesIO
-from datetime import date, timedelta
+from datetime import date
 
+from asgiref.sync import sync_to_async
+from django.conf import settings
 from django.contrib.auth.mixins import LoginRequiredMixin
+from django.core.handlers.asgi import ASGIRequest
 from django.http import JsonResponse, HttpResponse
 from django.utils.decorators import method_decorator
 from django.views import View
@@ -18,45 +21,13 @@ from django.utils.translation import gettext as _
 from booking.views_restaurant_dashboard import AdminSidebarMixin
 from booking.models import (
     Store, Staff, AttendanceTOTPConfig, AttendanceStamp, WorkAttendance,
-    ShiftAssignment,
 )
+from booking.services import attendance_board, live_events
 from booking.services.demo_data_service import get_demo_exclusion
 
 logger = logging.getLogger(__name__)
 
 
-def _enrich_overtime_info(staff_status, store, today):
-    """シフト終了時刻を超過して出勤中のスタッフに overtime フラグを付与する"""
-    from datetime import datetime, time as dt_time
-    now = timezone.localtime(timezone.now())
-
-    # 今日のシフトを取得
-    shifts = ShiftAssignment.objects.filter(
-        date=today,
-        staff_id__in=staff_status.keys(),
-    ).select_related('staff')
-
-    shift_end_map = {}  # staff_id -> end_time
-    for sa in shifts:
-        end = sa.end_time or dt_time(sa.end_hour, 0)
-        # 複数シフトがある場合は最も遅い終了時刻を採用
-        if sa.staff_id not in shift_end_map or end > shift_end_map[sa.staff_id]:
-            shift_end_map[sa.staff_id] = end
-
-    for staff_id, info in staff_status.items():
-        info['shift_end_time'] = shift_end_map.get(staff_id)
-        info['overtime'] = False
-        if info['shift_end_time'] and info['status'] in (_('出勤中'), _('休憩中')):
-            shift_end_dt = timezone.make_aware(
-                datetime.combine(today, info['shift_end_time']),
-                timezone.get_current_timezone(),
-            )
-            overtime_minutes = (now - shift_end_dt).total_seconds() / 60
-            if overtime_minutes > 30:  # 30分以上超過で強調
-                info['overtime'] = True
-                info['overtime_minutes'] = int(overtime_minutes)
-
-
 def _get_user_store(request):
     if request.user.is_superuser:
         store_id = request.GET.get('store_id') or request.POST.get('store_id')
@@ -91,60 +62,20 @@ class AttendanceBoardView(AdminSidebarMixin, TemplateView):
     def get_context_data(self, **kwargs):
         ctx = super().get_context_data(**kwargs)
         store = _get_user_store(self.request)
-        today = date.today()
+        today = timezone.localdate()
 
-        staffs = Staff.objects.filter(store=store) if store else Staff.objects.none()
-        stamps_today = AttendanceStamp.objects.filter(
-            staff__store=store,
-            stamped_at__date=today,
-            is_valid=True,
-            **get_demo_exclusion(),
-        ).select_related('staff').order_by('stamped_at') if store else []
-
-        # スタッフごとのステータス構築
-        staff_status = {}
-        for s in staffs:
-            staff_status[s.id] = {'staff': s, 'status': _('未出勤'), 'stamps': []}
-        for stamp in stamps_today:
-            if stamp.staff_id in staff_status:
-                staff_status[stamp.staff_id]['stamps'].append(stamp)
-                if stamp.stamp_type == 'clock_in':
-                    staff_status[stamp.staff_id]['status'] = _('出勤中')
-                elif stamp.stamp_type == 'clock_out':
-                    staff_status[stamp.staff_id]['status'] = _('退勤済')
-                elif stamp.stamp_type == 'break_start':
-                    staff_status[stamp.staff_id]['status'] = _('休憩中')
-                elif stamp.stamp_type == 'break_end':
-                    staff_status[stamp.staff_id]['status'] = _('出勤中')
-
-        # シフト超過情報を付与
-        _enrich_overtime_info(staff_status, store, today)
-
-        # ステータス別にグループ分け
-        zone_working = []
-        zone_break = []
-        zone_absent = []
-        zone_left = []
-        for info in staff_status.values():
-            if info['status'] == _('出勤中'):
-                zone_working.append(info)
-            elif info['status'] == _('休憩中'):
-                zone_break.append(info)
-            elif info['status'] == _('退勤済'):
-                zone_left.append(info)
-            else:
-                zone_absent.append(info)
+        # 一覧より先に連番を読む（取得中の打刻はイベントで受け取る）
+        event_seq = live_events.current_seq(attendance_board.topic(store.id)) if store else 0
+        board = attendance_board.board_context(store.id if store else None, today)
 
         ctx.update({
             'title': _('出退勤ボード'),
             'has_permission': True,
             'store': store,
-            'staff_status': staff_status,
-            'zone_working': zone_working,
-            'zone_break': zone_break,
-            'zone_absent': zone_absent,
-            'zone_left': zone_left,
             'today': today,
+            'event_seq': event_seq,
+            'event_transport': settings.LIVE_EVENTS_TRANSPORT,
+            **board,
         })
         return ctx
 
@@ -432,55 +363,46 @@ class AttendanceDayStatusAPI(LoginRequiredMixin, View):
 
 
 class AttendanceDayStatusHTMLView(LoginRequiredMixin, View):
-    """HTMX用: 出退勤ボードのゾーンHTMLフラグメントを返す"""
+    """出退勤ボードのゾーンHTMLフラグメント（初期表示・resync・シフト超過の再判定用）
+
+    ライブ状態から描画するため当日の打刻は再集計しない。
+    X-Attendance-Seq ヘッダの連番以降の変更はイベントで受け取る。
+    """
 
     def get(self, request):
         store = _get_user_store(request)
-        today = date.today()
+        event_seq = live_events.current_seq(attendance_board.topic(store.id)) if store else 0
+        board = attendance_board.board_context(store.id if store else None)
+        response = render(request, 'admin/booking/_attendance_board_zones.html', board)
+        response['X-Attendance-Seq'] = str(event_seq)
+        return response
 
-        staffs = Staff.objects.filter(store=store) if store else Staff.objects.none()
-        stamps_today = AttendanceStamp.objects.filter(
-            staff__store=store,
-            stamped_at__date=today,
-            is_valid=True,
-            **get_demo_exclusion(),
-        ).select_related('staff').order_by('stamped_at') if store else []
 
-        staff_status = {}
-        for s in staffs:
-            staff_status[s.id] = {'staff': s, 'status': _('未出勤'), 'stamps': []}
-        for stamp in stamps_today:
-            if stamp.staff_id in staff_status:
-                staff_status[stamp.staff_id]['stamps'].append(stamp)
-                if stamp.stamp_type == 'clock_in':
-                    staff_status[stamp.staff_id]['status'] = _('出勤中')
-                elif stamp.stamp_type == 'clock_out':
-                    staff_status[stamp.staff_id]['status'] = _('退勤済')
-                elif stamp.stamp_type == 'break_start':
-                    staff_status[stamp.staff_id]['status'] = _('休憩中')
-                elif stamp.stamp_type == 'break_end':
-                    staff_status[stamp.staff_id]['status'] = _('出勤中')
-
-        # シフト超過情報を付与
-        _enrich_overtime_info(staff_status, store, today)
-
-        zone_working, zone_break, zone_absent, zone_left = [], [], [], []
-        for info in staff_status.values():
-            if info['status'] == _('出勤中'):
-                zone_working.append(info)
-            elif info['status'] == _('休憩中'):
-                zone_break.append(info)
-            elif info['status'] == _('退勤済'):
-                zone_left.append(info)
-            else:
-                zone_absent.append(info)
-
-        return render(request, 'admin/booking/_attendance_board_zones.html', {
-            'zone_working': zone_working,
-            'zone_break': zone_break,
-            'zone_absent': zone_absent,
-            'zone_left': zone_left,
-        })
+class AttendanceBoardEventsAPI(LoginRequiredMixin, View):
+    """出退勤ボードのイベント（ロングポーリング、同期ワーカー向け）
+
+    GET ?since=<seq> → {"seq", "events", "resync"}
+    """
+
+    def get(self, request):
+        store = _get_user_store(request)
+        if not store:
+            return JsonResponse({'error': 'Store not found'}, status=404)
+        since = live_events.parse_since(request.GET.get('since'))
+        return JsonResponse(live_events.longpoll_payload(attendance_board.topic(store.id), since))
+
+
+async def attendance_board_event_stream(request):
+    """出退勤ボードの SSE ストリーム（ASGI 専用、Last-Event-ID で再開）"""
+    if not isinstance(request, ASGIRequest):
+        return JsonResponse({'error': 'SSE requires ASGI; use long-polling'}, status=501)
+    is_authenticated = await sync_to_async(lambda: request.user.is_authenticated)()
+    if not is_authenticated:
+        return JsonResponse({'error': 'Authentication required'}, status=401)
+    store = await sync_to_async(_get_user_store)(request)
+    if not store:
+        return JsonResponse({'error': 'Store not found'}, status=404)
+    return live_events.sse_response(request, attendance_board.topic(store.id))
 
 
 class AttendanceStampPageView(View):
@@ -193,11 +193,11 @@ class SalesForecastAPIView(DashboardAuthMixin, APIView):
             return err
 
         forecast_days = _clamp_int(request.GET.get('days'), 14, hi=90)
-        scope = self.build_scope(store, 'order__store')
         channel_filter = _parse_channel_filter(request)
 
-        from .services.sales_forecast import generate_forecast
-        result = generate_forecast(scope, forecast_days=forecast_days, channel_filter=channel_filter)
+        # 夜間バッチの保存済み予測を返す（無ければ NumPy 移動平均。Prophet はここで学習しない）
+        from .services.sales_forecast import get_forecast
+        result = get_forecast(store, forecast_days=forecast_days, channel_filter=channel_filter)
         return Response(result)
 
 
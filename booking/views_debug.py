@@ -1,9 +1,10 @@
 # booking/views_debug.py
 import json
 import logging
-import os
 
+from asgiref.sync import sync_to_async
 from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
 from django.http import JsonResponse
 from django.utils import timezone
 from django.views.generic import TemplateView
@@ -16,6 +17,7 @@ from django.utils.translation import gettext as _
 
 from .views_restaurant_dashboard import AdminSidebarMixin
 from .models import IoTDevice, IoTEvent, Staff, SystemConfig
+from .services import log_tail, query_profile
 
 logger = logging.getLogger(__name__)
 
@@ -59,17 +61,18 @@ class AdminDebugPanelView(AdminSidebarMixin, TemplateView):
         ctx['current_log_level'] = SystemConfig.get('log_level', settings.LOG_LEVEL)
         ctx['log_levels'] = ['DEBUG', 'INFO', 'WARNING', 'ERROR', 'CRITICAL']
 
-        # Error log tail (last 50 lines)
-        log_file = getattr(settings, 'LOG_FILE', '')
-        log_lines = []
-        if log_file and os.path.exists(log_file):
-            try:
-                with open(log_file, 'r') as f:
-                    all_lines = f.readlines()
-                    log_lines = all_lines[-50:]
-            except (OSError, UnicodeDecodeError):
-                log_lines = [_('(ログファイル読み取りエラー)')]
+        # Error log tail（末尾から読むのでログの大きさに依存しない）
+        log_filter = log_tail.LogFilter.from_params(self.request.GET)
+        log_lines, log_cursor = log_tail.tail(getattr(settings, 'LOG_FILE', ''), log_tail.DEFAULT_TAIL_LINES, log_filter)
         ctx['log_lines'] = log_lines
+        ctx['log_cursor'] = log_cursor or ''
+        ctx['log_filter'] = log_filter
+        ctx['event_transport'] = settings.LIVE_EVENTS_TRANSPORT
+
+        # ビュー別クエリ数・レイテンシ（直近24時間、ベースラインからの悪化順）
+        ctx['query_profile_enabled'] = query_profile.is_enabled()
+        ctx['query_profile_sample_rate'] = query_profile.sample_rate()
+        ctx['query_profile_report'] = query_profile.regression_report()
 
         ctx['title'] = _('デバッグパネル')
         ctx['has_permission'] = True
@@ -156,6 +159,39 @@ class LogLevelControlAPIView(APIView):
         return Response({'log_level': level, 'applied': True})
 
 
+class LogTailAPIView(APIView):
+    """Log tail polling API (sync workers).
+
+    GET ?cursor=<inode:offset>&level=&logger=&q=
+      cursor 無し → 末尾 DEFAULT_TAIL_LINES 行、有り → それ以降の追記分
+      → {"lines", "cursor", "rotated"}
+    """
+
+    def get(self, request):
+        if not _is_developer_or_superuser(request.user):
+            return Response({'detail': 'forbidden'}, status=status.HTTP_403_FORBIDDEN)
+        log_file = getattr(settings, 'LOG_FILE', '')
+        log_filter = log_tail.LogFilter.from_params(request.GET)
+        cursor = request.GET.get('cursor')
+        if log_tail.parse_cursor(cursor) is None:
+            lines, cursor = log_tail.tail(log_file, log_tail.DEFAULT_TAIL_LINES, log_filter)
+            rotated = False
+        else:
+            lines, cursor, rotated = log_tail.read_since(log_file, cursor, log_filter)
+        return Response({'lines': lines, 'cursor': cursor, 'rotated': rotated})
+
+
+async def log_tail_stream(request):
+    """ログ追記分の SSE ストリーム（ASGI 専用、Last-Event-ID で再開）"""
+    if not isinstance(request, ASGIRequest):
+        return JsonResponse({'error': 'SSE requires ASGI; use polling'}, status=501)
+    allowed = await sync_to_async(_is_developer_or_superuser)(request.user)
+    if not allowed:
+        return JsonResponse({'detail': 'forbidden'}, status=403)
+    log_filter = log_tail.LogFilter.from_params(request.GET)
+    return log_tail.sse_response(request, getattr(settings, 'LOG_FILE', ''), log_filter)
+
+
 class IoTDeviceDebugView(AdminSidebarMixin, TemplateView):
     """Individual IoT device debug view."""
     template_name = 'admin/booking/iot_device_debug.html'
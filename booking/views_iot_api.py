@@ -3,9 +3,11 @@ IoTMQ9GraphView, IoTSensorDashboardView, and helper functions."""
 import json
 import logging
 import time
+from datetime import timedelta
 from typing import Optional, Dict, Any, Tuple
 
 from django.conf import settings
+from django.db import transaction
 from django.utils import timezone
 from django.views import generic
 from django.contrib.auth.mixins import LoginRequiredMixin
@@ -21,6 +23,9 @@ from linebot.v3.messaging import PushMessageRequest, TextMessage as LineTextMess
 
 from booking.admin_site import custom_site
 from booking.models import IoTDevice, IoTEvent, IRCode
+from booking.services.iot_batch import (
+    BATCH_CONTENT_TYPE, BATCH_ENCODING_HEADER, BatchDecodeError, decode_batch,
+)
 
 logger = logging.getLogger(__name__)
 
@@ -185,7 +190,135 @@ class IoTDeviceThrottle(SimpleRateThrottle):
         }
 
 
+def _pir_to_bool(pir_raw: Any) -> Optional[bool]:
+    if pir_raw is None:
+        return None
+    if isinstance(pir_raw, bool):
+        return pir_raw
+    if isinstance(pir_raw, (int, float)):
+        return bool(pir_raw)
+    if isinstance(pir_raw, str) and pir_raw.lower() in ('true', '1', 'false', '0'):
+        return pir_raw.lower() in ('true', '1')
+    return None
+
+
+def _event_fields(request_data: Dict[str, Any]) -> Dict[str, Any]:
+    """Build IoTEvent field values (payload JSON + validated sensor columns) from one reading."""
+    incoming_payload = request_data.get("payload", None)
+    payload_raw_dict, sensors_dict = _normalize_payload(incoming_payload)
+
+    sensor_keys = ["mq9", "light", "sound", "temp", "hum", "ts"]
+    payload_dict = {}
+
+    for key in sensor_keys:
+        value = _pick_value(request_data, sensors_dict, payload_raw_dict, key)
+        payload_dict[key] = value
+
+    if payload_dict["mq9"] is None:
+        mq9_alt = request_data.get("mq9_value")
+        if mq9_alt is not None:
+            payload_dict["mq9"] = mq9_alt
+
+    mq9_value = _validate_sensor_value(_to_float_or_none(payload_dict["mq9"]), 'mq9')
+    light_value = _validate_sensor_value(_to_float_or_none(payload_dict.get("light")), 'light')
+    sound_value = _validate_sensor_value(_to_float_or_none(payload_dict.get("sound")), 'sound')
+
+    # Validate temp/hum before storing in payload JSON
+    for key in ('temp', 'hum'):
+        raw_val = _to_float_or_none(payload_dict.get(key))
+        payload_dict[key] = _validate_sensor_value(raw_val, key)
+
+    pir_raw = _pick_value(request_data, sensors_dict, payload_raw_dict, "pir")
+
+    return {
+        'payload': json.dumps(payload_dict, ensure_ascii=False),
+        'mq9_value': mq9_value,
+        'light_value': light_value,
+        'sound_value': sound_value,
+        'pir_triggered': _pir_to_bool(pir_raw),
+    }
+
+
+def _send_mq9_alert(device, mq9_value: Optional[float]) -> None:
+    if not (device.alert_enabled and device.alert_line_user_id):
+        return
+    mq9_val = mq9_value or 'N/A'
+    threshold = device.mq9_threshold or 500
+    alert_message = (
+        f'\u26a0\ufe0f ガス検知アラート\n'
+        f'デバイス: {device.name}\n'
+        f'MQ-9値: {mq9_val} (閾値: {threshold})\n'
+        f'店舗: {device.store.name}'
+    )
+    _send_line_push_with_retry(device.alert_line_user_id, alert_message, device.external_id)
+
+
+def _apply_ventilation(device, mq9_value: Optional[float]) -> None:
+    if mq9_value is None:
+        return
+    from .ventilation_control import check_ventilation_rules
+    try:
+        check_ventilation_rules(device, mq9_value)
+    except Exception as vent_err:
+        logger.warning(f"Ventilation check failed: {vent_err}")
+
+
+# バッチ送信で受け付けるイベント種別（IR 学習などの単発イベントは従来の JSON 送信）
+BATCH_EVENT_TYPES = {'sensor', 'sensor_reading', 'heartbeat', 'mq9_alarm'}
+# 端末時計の ts を受信日時として採用する範囲（外れたら受信時刻）
+BATCH_TS_MAX_AGE = 7 * 24 * 3600
+BATCH_TS_MAX_SKEW = 5 * 60
+
+
+def _reading_time(ts: Any, now):
+    """端末の ts（エポック秒）を受信日時に変換。時計未同期などで範囲外なら None。"""
+    if not isinstance(ts, (int, float)) or isinstance(ts, bool):
+        return None
+    delta = now.timestamp() - ts
+    if -BATCH_TS_MAX_SKEW <= delta <= BATCH_TS_MAX_AGE:
+        return now - timedelta(seconds=delta)
+    return None
+
+
+def save_event_batch(device, event_type: str, readings) -> list:
+    """Bulk-insert readings for one device; ventilation rules and alerts run once per batch.
+
+    readings: list of request-data-shaped dicts (sensor keys, optional payload/ts).
+    Returns the created IoTEvent list (in input order).
+    """
+    now = timezone.now()
+    events = []
+    stamped = []
+    for reading in readings:
+        evt = IoTEvent(device=device, event_type=event_type, **_event_fields(reading))
+        events.append(evt)
+        stamped.append(_reading_time(reading.get('ts'), now))
+    if not events:
+        return []
+
+    with transaction.atomic():
+        IoTEvent.objects.bulk_create(events)
+        # created_at は auto_now_add のため、端末の計測時刻は作成後に反映する
+        backdated = []
+        for evt, at in zip(events, stamped):
+            if at is not None and evt.pk:
+                evt.created_at = at
+                backdated.append(evt)
+        if backdated:
+            IoTEvent.objects.bulk_update(backdated, ['created_at'])
+        device.last_seen_at = now
+        device.save(update_fields=["last_seen_at"])
+
+    # バッチ内の最大値で1回だけ判定する（途中のスパイクを見逃さない）
+    peak_mq9 = max((evt.mq9_value for evt in events if evt.mq9_value is not None), default=None)
+    _apply_ventilation(device, peak_mq9)
+    if event_type == "mq9_alarm":
+        _send_mq9_alert(device, peak_mq9)
+    return events
+
+
 class IoTEventAPIView(APIView):
+    """POST /api/iot/events/ — 1件（JSON）またはバッチ（application/x-iot-batch）の計測値を受信"""
     authentication_classes = []
     permission_classes = []
     throttle_classes = [IoTDeviceThrottle]
@@ -195,6 +328,9 @@ class IoTEventAPIView(APIView):
         if not api_key:
             return Response({"detail": "X-API-KEY header is required"}, status=status.HTTP_400_BAD_REQUEST)
 
+        if request.content_type.split(';')[0].strip().lower() == BATCH_CONTENT_TYPE:
+            return self._post_batch(request, api_key)
+
         device_name = request.data.get("device")
         if not device_name:
             return Response({"detail": "device is required"}, status=status.HTTP_400_BAD_REQUEST)
@@ -208,73 +344,16 @@ class IoTEventAPIView(APIView):
         event_type = request.data.get("event_type", "sensor")
         if event_type not in ALLOWED_EVENT_TYPES:
             return Response({"detail": "invalid event_type"}, status=status.HTTP_400_BAD_REQUEST)
-        incoming_payload = request.data.get("payload", None)
-
-        payload_raw_dict, sensors_dict = _normalize_payload(incoming_payload)
-
-        sensor_keys = ["mq9", "light", "sound", "temp", "hum", "ts"]
-        payload_dict = {}
-
-        for key in sensor_keys:
-            value = _pick_value(request.data, sensors_dict, payload_raw_dict, key)
-            payload_dict[key] = value
-
-        if payload_dict["mq9"] is None:
-            mq9_alt = request.data.get("mq9_value")
-            if mq9_alt is not None:
-                payload_dict["mq9"] = mq9_alt
-
-        mq9_value = _validate_sensor_value(_to_float_or_none(payload_dict["mq9"]), 'mq9')
-        light_value = _validate_sensor_value(_to_float_or_none(payload_dict.get("light")), 'light')
-        sound_value = _validate_sensor_value(_to_float_or_none(payload_dict.get("sound")), 'sound')
-
-        # Validate temp/hum before storing in payload JSON
-        for key in ('temp', 'hum'):
-            raw_val = _to_float_or_none(payload_dict.get(key))
-            payload_dict[key] = _validate_sensor_value(raw_val, key)
-
-        pir_raw = _pick_value(request.data, sensors_dict, payload_raw_dict, "pir")
-        pir_triggered = None
-        if pir_raw is not None:
-            if isinstance(pir_raw, bool):
-                pir_triggered = pir_raw
-            elif isinstance(pir_raw, (int, float)):
-                pir_triggered = bool(pir_raw)
-            elif isinstance(pir_raw, str) and pir_raw.lower() in ('true', '1', 'false', '0'):
-                pir_triggered = pir_raw.lower() in ('true', '1')
-            else:
-                pir_triggered = None
-
-        evt = IoTEvent.objects.create(
-            device=device,
-            event_type=event_type,
-            payload=json.dumps(payload_dict, ensure_ascii=False),
-            mq9_value=mq9_value,
-            light_value=light_value,
-            sound_value=sound_value,
-            pir_triggered=pir_triggered,
-        )
+
+        evt = IoTEvent.objects.create(device=device, event_type=event_type, **_event_fields(request.data))
 
         device.last_seen_at = timezone.now()
         device.save(update_fields=["last_seen_at"])
 
-        if mq9_value is not None:
-            from .ventilation_control import check_ventilation_rules
-            try:
-                check_ventilation_rules(device, mq9_value)
-            except Exception as vent_err:
-                logger.warning(f"Ventilation check failed: {vent_err}")
-
-        if event_type == "mq9_alarm" and device.alert_enabled and device.alert_line_user_id:
-            mq9_val = mq9_value or 'N/A'
-            threshold = device.mq9_threshold or 500
-            alert_message = (
-                f'\u26a0\ufe0f ガス検知アラート\n'
-                f'デバイス: {device.name}\n'
-                f'MQ-9値: {mq9_val} (閾値: {threshold})\n'
-                f'店舗: {device.store.name}'
-            )
-            _send_line_push_with_retry(device.alert_line_user_id, alert_message, device.external_id)
+        _apply_ventilation(device, evt.mq9_value)
+
+        if event_type == "mq9_alarm":
+            _send_mq9_alert(device, evt.mq9_value)
 
         if event_type == "ir_learned":
             try:
@@ -299,6 +378,33 @@ class IoTEventAPIView(APIView):
             "event_type": evt.event_type
         }, status=status.HTTP_201_CREATED)
 
+    def _post_batch(self, request, api_key):
+        try:
+            batch = decode_batch(request.body, request.headers.get(BATCH_ENCODING_HEADER))
+        except BatchDecodeError as e:
+            return Response({"detail": f"invalid batch: {e}"}, status=status.HTTP_400_BAD_REQUEST)
+
+        device_name = batch['device']
+        if not device_name:
+            return Response({"detail": "device is required"}, status=status.HTTP_400_BAD_REQUEST)
+
+        api_key_hash = IoTDevice.hash_api_key(api_key)
+        try:
+            device = IoTDevice.objects.get(api_key_hash=api_key_hash, external_id=device_name)
+        except IoTDevice.DoesNotExist:
+            return Response({"detail": "device not found"}, status=status.HTTP_404_NOT_FOUND)
+
+        event_type = batch['event_type']
+        if event_type not in BATCH_EVENT_TYPES:
+            return Response({"detail": "invalid event_type"}, status=status.HTTP_400_BAD_REQUEST)
+
+        events = save_event_batch(device, event_type, batch['readings'])
+        return Response({
+            "device": device.external_id,
+            "event_type": event_type,
+            "count": len(events),
+        }, status=status.HTTP_201_CREATED)
+
 
 class IoTConfigAPIView(APIView):
     authentication_classes = []
@@ -70,16 +70,27 @@ class LineSegmentSendView(View):
         if not customer_ids:
             return JsonResponse({'error': '対象顧客がいません'}, status=400)
 
-        # Celeryタスクで非同期送信
+        # Celeryタスクで非同期送信（結果はキャンペーンIDで参照）
+        import uuid
         from booking.tasks import task_send_segment_message
-        task_send_segment_message.delay(customer_ids, message_text)
+        campaign_id = uuid.uuid4().hex
+        task_send_segment_message.delay(customer_ids, message_text, campaign_id=campaign_id)
 
         return JsonResponse({
             'success': True,
             'message': f'{len(customer_ids)}件の配信を開始しました',
+            'campaign_id': campaign_id,
         })
 
 
+class LineCampaignReportView(View):
+    """セグメント配信のキャンペーン別送信結果API"""
+
+    def get(self, request, campaign_id):
+        from booking.services.line_delivery import get_campaign_report
+        return JsonResponse(get_campaign_report(campaign_id))
+
+
 class LinePendingView(View):
     """仮予約確認管理画面"""
 
@@ -6,6 +6,7 @@ from django.contrib.auth.mixins import LoginRequiredMixin
 from django.core.exceptions import PermissionDenied
 from django.db import transaction
 from django.db.models import F
+from django.http import HttpResponse, HttpResponseNotModified
 from django.shortcuts import get_object_or_404
 from django.views import generic
 
@@ -14,9 +15,11 @@ from rest_framework.response import Response
 from rest_framework.views import APIView
 
 from booking.models import (
-    Store, Staff, Product, Category, ProductTranslation,
+    Store, Staff, Product,
     Order, OrderItem, StockMovement,
 )
+from booking.services import kitchen_events, menu_catalogue
+from booking.services.order_commit import OrderCommitError, commit_order_lines, normalize_lines
 
 logger = logging.getLogger(__name__)
 
@@ -30,21 +33,6 @@ def _resolve_lang(request, store: Store) -> str:
     return store_lang or "ja"
 
 
-def _product_display(product: Product, lang: str) -> dict:
-    tr = product.translations.filter(lang=lang).first()
-    return {
-        "id": product.id,
-        "sku": product.sku,
-        "name": tr.name if tr else product.name,
-        "description": tr.description if tr else product.description,
-        "price": product.price,
-        "stock": product.stock,
-        "is_sold_out": (product.stock <= 0),
-        "category_id": product.category_id,
-        "image_url": product.image.url if product.image else "",
-    }
-
-
 class CustomerMenuView(generic.TemplateView):
     """客側メニュー（テンプレ）"""
     template_name = "booking/customer_menu.html"
@@ -53,21 +41,19 @@ class CustomerMenuView(generic.TemplateView):
         ctx = super().get_context_data(**kwargs)
         store = get_object_or_404(Store, pk=self.kwargs["store_id"])
         lang = _resolve_lang(self.request, store)
-
-        categories = Category.objects.filter(store=store).order_by("sort_order", "name")
-        products = Product.objects.filter(store=store, is_active=True).select_related("category")
+        catalogue = menu_catalogue.get_catalogue(store, lang)["data"]
 
         ctx.update({
             "store": store,
             "lang": lang,
-            "categories": categories,
-            "products": [_product_display(p, lang) for p in products],
+            "categories": catalogue["categories"],
+            "products": catalogue["products"],
         })
         return ctx
 
 
 class CustomerMenuJsonAPIView(APIView):
-    """客側メニュー（JSON）"""
+    """客側メニュー（JSON）: カタログキャッシュから配信、If-None-Match で 304"""
     authentication_classes = []
     permission_classes = []
 
@@ -78,16 +64,17 @@ class CustomerMenuJsonAPIView(APIView):
 
         store = get_object_or_404(Store, pk=store_id)
         lang = _resolve_lang(request, store)
+        catalogue = menu_catalogue.get_catalogue(store, lang)
 
-        categories = Category.objects.filter(store=store).order_by("sort_order", "name")
-        products = Product.objects.filter(store=store, is_active=True).select_related("category")
-
-        return Response({
-            "store": {"id": store.id, "name": store.name},
-            "lang": lang,
-            "categories": [{"id": c.id, "name": c.name} for c in categories],
-            "products": [_product_display(p, lang) for p in products],
-        })
+        if_none_match = request.META.get("HTTP_IF_NONE_MATCH", "")
+        if catalogue["etag"] in [tag.strip() for tag in if_none_match.split(",")]:
+            response = HttpResponseNotModified()
+        else:
+            response = HttpResponse(catalogue["body"], content_type="application/json")
+        response["ETag"] = catalogue["etag"]
+        # 毎回再検証させる（在庫変動を即時反映しつつ本文の再送を省く）
+        response["Cache-Control"] = "no-cache"
+        return response
 
 
 class ProductAlternativesAPIView(APIView):
@@ -100,16 +87,14 @@ class ProductAlternativesAPIView(APIView):
         if not product_id:
             return Response({"detail": "product_id is required"}, status=status.HTTP_400_BAD_REQUEST)
 
-        product = get_object_or_404(Product, pk=product_id)
+        product = get_object_or_404(Product.objects.select_related("store"), pk=product_id)
         store = product.store
         lang = _resolve_lang(request, store)
 
-        qs = Product.objects.filter(store=store, is_active=True, stock__gt=0)
-        if product.category_id:
-            qs = qs.filter(category_id=product.category_id)
-
-        qs = qs.exclude(id=product.id).order_by("-popularity", "price")[:5]
-        return Response({"alternatives": [_product_display(p, lang) for p in qs]})
+        alternatives = menu_catalogue.get_alternatives(
+            store, lang, product.id, product.category_id,
+        )
+        return Response({"alternatives": alternatives})
 
 
 class OrderCreateAPIView(APIView):
@@ -163,71 +148,25 @@ class OrderCreateAPIView(APIView):
         schedule = get_object_or_404(Schedule, pk=schedule_id) if schedule_id else None
         customer_hash = schedule.line_user_hash if (schedule and schedule.line_user_hash) else None
 
-        normalized = {}
-        for it in items:
-            pid = it.get("product_id")
-            try:
-                qty = int(it.get("qty", 1))
-            except (TypeError, ValueError):
-                qty = 0
-            if not pid or qty <= 0:
-                continue
-            normalized[pid] = normalized.get(pid, 0) + qty
-
+        normalized = normalize_lines((it.get("product_id"), it.get("qty", 1)) for it in items)
         if not normalized:
             return Response({"detail": "items are invalid"}, status=status.HTTP_400_BAD_REQUEST)
 
-        product_ids = sorted(normalized.keys())
-
-        with transaction.atomic():
-            order = Order.objects.create(
-                store=store,
-                schedule=schedule,
-                customer_line_user_hash=customer_hash,
-                status=Order.STATUS_OPEN,
-                channel='reservation',
-            )
-
-            locked_products = list(
-                Product.objects.select_for_update()
-                .filter(store=store, is_active=True, id__in=product_ids)
-                .order_by("id")
-            )
-            product_map = {p.id: p for p in locked_products}
-
-            missing = [pid for pid in product_ids if pid not in product_map]
-            if missing:
-                return Response({"detail": f"product not found: {missing}"}, status=status.HTTP_404_NOT_FOUND)
-
-            for pid in product_ids:
-                p = product_map[pid]
-                qty = normalized[pid]
-                if int(p.stock) - int(qty) < 0:
-                    return Response({"detail": f"insufficient stock: {p.sku}"}, status=status.HTTP_409_CONFLICT)
-
-            for pid in product_ids:
-                p = product_map[pid]
-                qty = normalized[pid]
-
-                StockMovement.objects.create(
+        try:
+            with transaction.atomic():
+                order = Order.objects.create(
                     store=store,
-                    product=p,
-                    movement_type=StockMovement.TYPE_OUT,
-                    qty=qty,
-                    by_staff=None,
-                    note=f"order#{order.id}",
-                )
-
-                Product.objects.filter(pk=p.pk).update(stock=F('stock') - abs(int(qty)))
-                p.refresh_from_db(fields=['stock'])
-
-                OrderItem.objects.create(
-                    order=order,
-                    product=p,
-                    qty=qty,
-                    unit_price=p.price,
-                    status=OrderItem.STATUS_ORDERED,
+                    schedule=schedule,
+                    customer_line_user_hash=customer_hash,
+                    status=Order.STATUS_OPEN,
+                    channel='reservation',
                 )
+                commit_order_lines(order, normalized, note=f"order#{order.id}")
+                kitchen_events.publish_order(order.id)
+        except OrderCommitError as e:
+            if e.code == OrderCommitError.NOT_FOUND:
+                return Response({"detail": str(e)}, status=status.HTTP_404_NOT_FOUND)
+            return Response({"detail": str(e)}, status=status.HTTP_409_CONFLICT)
 
         return Response({"order_id": order.id}, status=status.HTTP_201_CREATED)
 
@@ -7,6 +7,7 @@ from django.utils import timezone
 from django.views import View
 
 from booking.models import Store, CustomPage, PageTemplate, StoreTheme, SavedBlock
+from booking.services.page_cache import tag_response
 
 
 class PageBuilderListView(View):
@@ -286,7 +287,8 @@ class CustomPageView(View):
             if page.layout == 'full_width'
             else 'booking/custom_page.html'
         )
-        return render(request, template, {
+        response = render(request, template, {
             'page': page,
             'store': page.store,
         })
+        return tag_response(response, f'page:{page.pk}', f'store:{page.store_id}')
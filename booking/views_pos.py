@@ -3,7 +3,10 @@ import json
 import logging
 from datetime import datetime
 
+from asgiref.sync import sync_to_async
+from django.conf import settings
 from django.contrib.auth.mixins import LoginRequiredMixin
+from django.core.handlers.asgi import ASGIRequest
 from django.db import transaction
 from django.http import JsonResponse, HttpResponse
 from django.views import View
@@ -17,10 +20,10 @@ from booking.views_restaurant_dashboard import AdminSidebarMixin
 from booking.models import (
     Store, Staff, Product, Category, Order, OrderItem,
     PaymentMethod, POSTransaction, TableSeat,
-    StockMovement, apply_stock_movement,
     TaxServiceCharge,
 )
-from booking.tasks import check_low_stock_and_notify
+from booking.services import kitchen_events, live_events
+from booking.services.order_commit import commit_order_lines, normalize_lines
 
 logger = logging.getLogger(__name__)
 
@@ -124,6 +127,7 @@ class POSOrderAPIView(LoginRequiredMixin, View):
             status=Order.STATUS_OPEN,
             channel='pos',
         )
+        kitchen_events.publish_order(order.id)
         return JsonResponse({'id': order.id, 'table_label': order.table_label}, status=201)
 
 
@@ -154,6 +158,7 @@ class POSOrderItemAPIView(LoginRequiredMixin, View):
                 qty=data.get('qty', 1),
                 unit_price=product.price,
             )
+        kitchen_events.publish_order(order.id)
 
         return JsonResponse({
             'id': item.id,
@@ -174,11 +179,13 @@ class POSOrderItemAPIView(LoginRequiredMixin, View):
         if 'status' in data:
             item.status = data['status']
         item.save()
+        kitchen_events.publish_order(item.order_id)
         return JsonResponse({'id': item.id, 'qty': item.qty, 'status': item.status})
 
     def delete(self, request, pk=None):
         item = get_object_or_404(OrderItem, pk=pk)
         item.delete()
+        kitchen_events.publish_order(item.order_id)
         return HttpResponse('', status=204)
 
 
@@ -251,31 +258,20 @@ class POSCheckoutAPIView(LoginRequiredMixin, View):
             order.tax_amount = tax
             order.save(update_fields=['status', 'payment_status', 'tax_amount'])
 
-            # 在庫連動（商品を排他ロックして更新）
-            for item in items:
-                try:
-                    product = Product.objects.select_for_update().get(pk=item.product_id)
-                    StockMovement.objects.create(
-                        store=order.store,
-                        product=product,
-                        movement_type=StockMovement.TYPE_OUT,
-                        qty=item.qty,
-                        by_staff=staff,
-                        note=f'POS決済 #{receipt_number}',
-                    )
-                    apply_stock_movement(product, StockMovement.TYPE_OUT, item.qty)
-                    # リアルタイム在庫アラート: 閾値以下なら即時通知をトリガー
-                    product.refresh_from_db(fields=['stock', 'low_stock_threshold'])
-                    if (
-                        product.low_stock_threshold is not None
-                        and product.stock <= product.low_stock_threshold
-                    ):
-                        check_low_stock_and_notify.delay()
-                except ValueError:
-                    pass  # 在庫不足でもPOS決済は通す
-
-                item.status = OrderItem.STATUS_CLOSED
-                item.save(update_fields=['status'])
+            # 在庫連動（商品を一括ロックして更新、在庫不足でもPOS決済は通す）
+            commit_order_lines(
+                order,
+                normalize_lines((item.product_id, item.qty) for item in items),
+                note=f'POS決済 #{receipt_number}',
+                staff=staff,
+                create_items=False,
+                products_queryset=Product.objects.all(),
+                skip_missing=True,
+                allow_shortage=True,
+                notify_low_stock=True,
+            )
+            order.items.update(status=OrderItem.STATUS_CLOSED)
+            kitchen_events.publish_order(order.id)
 
         return JsonResponse({
             'receipt_number': receipt_number,
@@ -318,21 +314,9 @@ class KitchenDisplayView(AdminSidebarMixin, TemplateView):
     def get_context_data(self, **kwargs):
         ctx = super().get_context_data(**kwargs)
         store = _get_user_store(self.request)
-        today = timezone.now().date()
-
-        # 店内注文のみ（EC注文を除外）
-        in_store_channels = ['pos', 'table', 'reservation']
-        open_orders = Order.objects.filter(
-            store=store, status=Order.STATUS_OPEN,
-            channel__in=in_store_channels,
-        ).select_related('table_seat').prefetch_related('items__product').order_by('created_at') if store else []
-
-        # 本日の完了済み注文（古い順＝完了順・店内のみ）
-        closed_orders = Order.objects.filter(
-            store=store, status=Order.STATUS_CLOSED,
-            channel__in=in_store_channels,
-            updated_at__date=today,
-        ).select_related('table_seat').prefetch_related('items__product').order_by('updated_at')[:30] if store else []
+        # 一覧取得より先に連番を読む（取得中の変更はイベントで受け取る）
+        event_seq = live_events.current_seq(kitchen_events.topic(store.id)) if store else 0
+        open_orders, closed_orders = kitchen_events.kitchen_orders(store)
 
         ctx.update({
             'title': _('キッチンディスプレイ'),
@@ -340,29 +324,22 @@ class KitchenDisplayView(AdminSidebarMixin, TemplateView):
             'store': store,
             'open_orders': open_orders,
             'closed_orders': closed_orders,
+            'event_seq': event_seq,
+            'event_transport': settings.LIVE_EVENTS_TRANSPORT,
         })
         return ctx
 
 
 class KitchenOrdersHTMLView(View):
-    """キッチンディスプレイ用 HTML フラグメント（HTMX auto-refresh 向け）"""
+    """キッチンディスプレイ用 HTML フラグメント（初期表示・resync 用）
+
+    X-Kitchen-Seq ヘッダの連番以降の変更はイベントで受け取る。
+    """
 
     def get(self, request):
         store = _get_user_store(request)
-        today = timezone.now().date()
-
-        # 店内注文のみ（EC注文を除外）
-        in_store_channels = ['pos', 'table', 'reservation']
-        open_orders = Order.objects.filter(
-            store=store, status=Order.STATUS_OPEN,
-            channel__in=in_store_channels,
-        ).select_related('table_seat').prefetch_related('items__product').order_by('created_at') if store else []
-
-        closed_orders = Order.objects.filter(
-            store=store, status=Order.STATUS_CLOSED,
-            channel__in=in_store_channels,
-            updated_at__date=today,
-        ).select_related('table_seat').prefetch_related('items__product').order_by('updated_at')[:30] if store else []
+        event_seq = live_events.current_seq(kitchen_events.topic(store.id)) if store else 0
+        open_orders, closed_orders = kitchen_events.kitchen_orders(store)
 
         html = render_to_string(
             'admin/booking/_kitchen_orders_fragment.html',
@@ -373,7 +350,38 @@ class KitchenOrdersHTMLView(View):
             },
             request=request,
         )
-        return HttpResponse(html)
+        response = HttpResponse(html)
+        response['X-Kitchen-Seq'] = str(event_seq)
+        return response
+
+
+class KitchenEventsAPI(LoginRequiredMixin, View):
+    """キッチンイベントのロングポーリング（同期ワーカー向け）
+
+    GET ?since=<seq> → {"seq", "events", "resync"}
+    変更が無ければ LIVE_EVENTS_LONGPOLL_TIMEOUT 秒まで待って空で返す。
+    """
+
+    def get(self, request):
+        store = _get_user_store(request)
+        if not store:
+            return JsonResponse({'error': 'Store not found'}, status=404)
+        since = live_events.parse_since(request.GET.get('since'))
+        return JsonResponse(live_events.longpoll_payload(kitchen_events.topic(store.id), since))
+
+
+async def kitchen_event_stream(request):
+    """キッチンイベントの SSE ストリーム（ASGI 専用、Last-Event-ID で再開）"""
+    if not isinstance(request, ASGIRequest):
+        return JsonResponse({'error': 'SSE requires ASGI; use long-polling'}, status=501)
+    is_authenticated = await sync_to_async(lambda: request.user.is_authenticated)()
+    if not is_authenticated:
+        return JsonResponse({'error': 'Authentication required'}, status=401)
+    store = await sync_to_async(_get_user_store)(request)
+    if not store:
+        return JsonResponse({'error': 'Store not found'}, status=404)
+
+    return live_events.sse_response(request, kitchen_events.topic(store.id))
 
 
 class KitchenOrderStatusAPI(LoginRequiredMixin, View):
@@ -390,6 +398,7 @@ class KitchenOrderStatusAPI(LoginRequiredMixin, View):
         if new_status in [s[0] for s in OrderItem.STATUS_CHOICES]:
             item.status = new_status
             item.save(update_fields=['status'])
+            kitchen_events.publish_order(item.order_id)
             return JsonResponse({'id': item.id, 'status': item.status})
         return JsonResponse({'error': 'Invalid status'}, status=400)
 
@@ -401,6 +410,7 @@ class KitchenOrderCompleteAPI(LoginRequiredMixin, View):
         order = get_object_or_404(Order, pk=pk)
         order.status = Order.STATUS_CLOSED
         order.save(update_fields=['status'])
+        kitchen_events.publish_order(order.id)
         return JsonResponse({
             'id': order.id,
             'status': order.status,
@@ -425,6 +435,7 @@ class KitchenOrderUncompleteAPI(LoginRequiredMixin, View):
         order.save(update_fields=['status'])
         # 全アイテムをSERVED（提供完了押下前の状態）に戻す
         order.items.update(status=OrderItem.STATUS_SERVED)
+        kitchen_events.publish_order(order.id)
         return JsonResponse({
             'id': order.id,
             'status': order.status,
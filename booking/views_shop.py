@@ -44,7 +44,8 @@ def _is_placeholder_image(product) -> bool:
 
 
 def _product_display(product, lang: str) -> dict:
-    tr = product.translations.filter(lang=lang).first()
+    # translations は呼び出し側で prefetch 済み（商品ごとのクエリを発行しない）
+    tr = next((t for t in product.translations.all() if t.lang == lang), None)
     return {
         "id": product.id,
         "sku": product.sku,
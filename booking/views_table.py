@@ -6,7 +6,6 @@ import logging
 from django.conf import settings
 from django.contrib import messages
 from django.db import transaction
-from django.db.models import F
 from django.shortcuts import get_object_or_404, redirect, render
 from django.urls import reverse
 from django.views import View
@@ -16,9 +15,11 @@ from rest_framework.response import Response
 from rest_framework.views import APIView
 
 from booking.models import (
-    Product, Category, Order, OrderItem, StockMovement,
+    Product, Category, Order,
     TableSeat, PaymentMethod,
 )
+from booking.services import kitchen_events
+from booking.services.order_commit import OrderCommitError, commit_order_lines, normalize_lines
 
 logger = logging.getLogger(__name__)
 
@@ -140,51 +141,24 @@ class TableOrderView(View):
         if not normalized:
             return redirect('table:table_cart', table_id=table_id)
 
-        product_ids = sorted(normalized.keys())
-
-        with transaction.atomic():
-            order = Order.objects.create(
-                store=store,
-                table_seat=seat,
-                table_label=seat.label,
-                status=Order.STATUS_OPEN,
-                channel='table',
-            )
-
-            locked_products = list(
-                Product.objects.select_for_update()
-                .filter(store=store, is_active=True, id__in=product_ids)
-                .order_by("id")
-            )
-            product_map = {p.id: p for p in locked_products}
-
-            for pid in product_ids:
-                p = product_map.get(pid)
-                if not p:
-                    continue
-                qty = normalized[pid]
-
-                if int(p.stock) - int(qty) < 0:
-                    messages.error(request, f'{p.name} の在庫が不足しています。')
-                    return redirect('table:table_cart', table_id=table_id)
-
-                StockMovement.objects.create(
+        try:
+            with transaction.atomic():
+                order = Order.objects.create(
                     store=store,
-                    product=p,
-                    movement_type=StockMovement.TYPE_OUT,
-                    qty=qty,
-                    note=f'table order#{order.id} seat:{seat.label}',
+                    table_seat=seat,
+                    table_label=seat.label,
+                    status=Order.STATUS_OPEN,
+                    channel='table',
                 )
-                Product.objects.filter(pk=p.pk).update(stock=F('stock') - abs(int(qty)))
-                p.refresh_from_db(fields=['stock'])
-
-                OrderItem.objects.create(
-                    order=order,
-                    product=p,
-                    qty=qty,
-                    unit_price=p.price,
-                    status=OrderItem.STATUS_ORDERED,
+                commit_order_lines(
+                    order, normalized,
+                    note=f'table order#{order.id} seat:{seat.label}',
+                    skip_missing=True,
                 )
+                kitchen_events.publish_order(order.id)
+        except OrderCommitError as e:
+            messages.error(request, f'{e.product.name} の在庫が不足しています。')
+            return redirect('table:table_cart', table_id=table_id)
 
         orders_key = _get_table_orders_key(table_id)
         order_ids = request.session.get(orders_key, [])
@@ -421,69 +395,27 @@ class TableOrderCreateAPI(APIView):
         if not items or len(items) > 50:
             return Response({"detail": "items must be 1-50"}, status=status.HTTP_400_BAD_REQUEST)
 
-        normalized = {}
-        for it in items:
-            pid = it.get("product_id")
-            try:
-                qty = int(it.get("qty", 1))
-            except (TypeError, ValueError):
-                qty = 0
-            if not pid or qty <= 0:
-                continue
-            normalized[pid] = normalized.get(pid, 0) + qty
-
+        normalized = normalize_lines((it.get("product_id"), it.get("qty", 1)) for it in items)
         if not normalized:
             return Response({"detail": "items are invalid"}, status=status.HTTP_400_BAD_REQUEST)
 
-        product_ids = sorted(normalized.keys())
-
-        with transaction.atomic():
-            order = Order.objects.create(
-                store=store,
-                table_seat=seat,
-                table_label=seat.label,
-                status=Order.STATUS_OPEN,
-                channel='table',
-            )
-
-            locked_products = list(
-                Product.objects.select_for_update()
-                .filter(store=store, is_active=True, id__in=product_ids)
-                .order_by("id")
-            )
-            product_map = {p.id: p for p in locked_products}
-
-            missing = [pid for pid in product_ids if pid not in product_map]
-            if missing:
-                return Response({"detail": f"product not found: {missing}"}, status=status.HTTP_404_NOT_FOUND)
-
-            for pid in product_ids:
-                p = product_map[pid]
-                qty = normalized[pid]
-                if int(p.stock) - int(qty) < 0:
-                    return Response({"detail": f"insufficient stock: {p.sku}"}, status=status.HTTP_409_CONFLICT)
-
-            for pid in product_ids:
-                p = product_map[pid]
-                qty = normalized[pid]
-
-                StockMovement.objects.create(
+        try:
+            with transaction.atomic():
+                order = Order.objects.create(
                     store=store,
-                    product=p,
-                    movement_type=StockMovement.TYPE_OUT,
-                    qty=qty,
-                    note=f'table order#{order.id} seat:{seat.label}',
+                    table_seat=seat,
+                    table_label=seat.label,
+                    status=Order.STATUS_OPEN,
+                    channel='table',
                 )
-                Product.objects.filter(pk=p.pk).update(stock=F('stock') - abs(int(qty)))
-                p.refresh_from_db(fields=['stock'])
-
-                OrderItem.objects.create(
-                    order=order,
-                    product=p,
-                    qty=qty,
-                    unit_price=p.price,
-                    status=OrderItem.STATUS_ORDERED,
+                commit_order_lines(
+                    order, normalized, note=f'table order#{order.id} seat:{seat.label}',
                 )
+                kitchen_events.publish_order(order.id)
+        except OrderCommitError as e:
+            if e.code == OrderCommitError.NOT_FOUND:
+                return Response({"detail": str(e)}, status=status.HTTP_404_NOT_FOUND)
+            return Response({"detail": str(e)}, status=status.HTTP_409_CONFLICT)
 
         return Response({"order_id": order.id}, status=status.HTTP_201_CREATED)
 
@@ -81,6 +81,21 @@ app.conf.beat_schedule = {
         "task": "booking.tasks.recompute_customer_segments",
         "schedule": crontab(hour=4, minute=30),  # 毎日04:30
     },
+    # ビジネスインサイト生成（毎日 07:00、全店舗まとめて）
+    "generate-business-insights": {
+        "task": "booking.tasks.generate_business_insights",
+        "schedule": crontab(hour=7, minute=0),
+    },
+    # 売上予測の学習・保存（毎日 02:30、店舗 x チャネル）
+    "refresh-sales-forecasts": {
+        "task": "booking.tasks.refresh_sales_forecasts",
+        "schedule": crontab(hour=2, minute=30),
+    },
+    # 確定シフト→勤怠の差分導出（15分毎、ATTENDANCE_AUTO_DERIVE_ENABLED=True のときのみ実行）
+    "derive-attendance-incremental": {
+        "task": "booking.tasks.derive_attendance_incremental",
+        "schedule": crontab(minute='*/15'),
+    },
     # デモデータ自動生成（30分毎）
     "generate-live-demo-data": {
         "task": "booking.tasks.generate_live_demo_data_task",
@@ -91,6 +106,11 @@ app.conf.beat_schedule = {
         "task": "booking.tasks.run_scheduled_backup",
         "schedule": 60.0,
     },
+    # ビュー別クエリ計測の集計書き出し（5分毎、QUERY_PROFILE_ENABLED 時のみ）
+    "flush-query-profiles": {
+        "task": "booking.tasks.flush_query_profiles",
+        "schedule": crontab(minute='*/5'),
+    },
 }
 
 # 互換のため明示（settings.py 側で CELERY_TASK_SERIALIZER などを設定しているなら不要）
@@ -165,13 +165,14 @@ def generate_html():
         ('recompute_customer_segments', '毎日04:30', 'LINE顧客セグメント日次再計算'),
         ('generate_live_demo_data_task', '30分ごと', 'デモモード有効時に当日デモデータ自動生成'),
         ('run_scheduled_backup', '毎分', 'BackupConfig間隔に基づくバックアップ実行判定'),
+        ('flush_query_profiles', '5分ごと', 'ビュー別クエリ計測の集計をQueryProfileSummaryへ書き出し'),
     ]
 
     # 管理コマンド一覧
     commands = [
         ('bootstrap_admin_staff', '--username, --store_id, --manager, --developer', '管理者スタッフの初期作成/更新'),
         ('cancel_expired_temp_bookings', '(引数なし)', '15分超の仮予約を自動キャンセル'),
-        ('security_audit', '--json, --verbose, --category', 'セキュリティ自己診断実行(12チェック)'),
+        ('security_audit', '--json, --verbose, --category, --force, --workers', 'セキュリティ自己診断実行(12チェック)'),
         ('cleanup_security_logs', '--days (default: 90)', '古いセキュリティログを削除'),
         ('check_aws_costs', '--threshold, --json, --region', 'AWSコスト監視(EC2/S3/EBS/EIP/RDS)'),
         ('seed_mock_data', '(引数なし)', 'モックデータ生成(is_demo=Trueでマーク)'),
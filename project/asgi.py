@@ -0,0 +1,24 @@
+"""
+ASGI config for project project.
+
+It exposes the ASGI callable as a module-level variable named ``application``.
+
+Used for long-lived connections such as the kitchen display event stream
+(``/api/pos/kitchen-events/stream/``). Set ``LIVE_EVENTS_TRANSPORT=sse`` when
+serving through this entry point, e.g.::
+
+    gunicorn project.asgi:application -k uvicorn.workers.UvicornWorker
+
+The regular sync Gunicorn deployment (project/wsgi.py) uses long-polling.
+
+For more information on this file, see
+https://docs.djangoproject.com/en/4.2/howto/deployment/asgi/
+"""
+
+import os
+
+from django.core.asgi import get_asgi_application
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'project.settings')
+
+application = get_asgi_application()
@@ -70,6 +70,7 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     "django.middleware.security.SecurityMiddleware",
+    "booking.middleware.QueryProfileMiddleware",
     "booking.middleware.AdminCSPRelaxMiddleware",
     "csp.middleware.CSPMiddleware",
     "booking.middleware.BotFilterMiddleware",
@@ -85,6 +86,8 @@ MIDDLEWARE = [
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
     "booking.middleware.SecurityAuditMiddleware",
     "axes.middleware.AxesMiddleware",
+    # ヒット時もボット遮断・メンテナンス・レート制限を通すため最も内側に置く
+    "booking.middleware.PublicPageCacheMiddleware",
 ]
 
 X_FRAME_OPTIONS = "DENY"
@@ -300,6 +303,40 @@ PASSWORD_HASHERS = [
 # ====================================
 SITE_BASE_URL = os.getenv("SITE_BASE_URL", "https://timebaibai.com")
 
+# ====================================
+# Public page cache (匿名GETのフルページキャッシュ)
+# PAGE_CACHE_EDGE_HEADERS=True で X-Accel-Expires / Surrogate-Key を付与し、
+# Nginx proxy_cache でヒットさせる（エッジ側は精密パージ不可のため短TTL）。
+# エッジキャッシュは CSP nonce / CSRF トークンを差し替えられない点に注意。
+# ====================================
+PAGE_CACHE_ENABLED = env_bool("PAGE_CACHE_ENABLED", False)
+PAGE_CACHE_TTL = env_int("PAGE_CACHE_TTL", 300)
+PAGE_CACHE_EDGE_HEADERS = env_bool("PAGE_CACHE_EDGE_HEADERS", False)
+PAGE_CACHE_EDGE_TTL = env_int("PAGE_CACHE_EDGE_TTL", 60)
+
+# ====================================
+# Live events (キッチンディスプレイ等への差分プッシュ)
+# LIVE_EVENTS_TRANSPORT="sse" は ASGI (project/asgi.py) で配信する場合のみ。
+# 同期 Gunicorn ワーカーでは "longpoll"（LIVE_EVENTS_LONGPOLL_TIMEOUT は worker timeout 未満に）。
+# ====================================
+LIVE_EVENTS_TRANSPORT = os.getenv("LIVE_EVENTS_TRANSPORT", "longpoll")
+LIVE_EVENTS_LONGPOLL_TIMEOUT = env_int("LIVE_EVENTS_LONGPOLL_TIMEOUT", 20)
+
+# ====================================
+# Query profile (ビューごとのクエリ数・レイテンシ計測、オプトイン)
+# QUERY_PROFILE_SAMPLE_RATE は 0〜1。SystemConfig "query_profile_sample_rate" で実行中に上書きできる。
+# 集計は booking.tasks.flush_query_profiles が5分ごとに QueryProfileSummary へ書き出す。
+# ====================================
+QUERY_PROFILE_ENABLED = env_bool("QUERY_PROFILE_ENABLED", False)
+QUERY_PROFILE_SAMPLE_RATE = float(os.getenv("QUERY_PROFILE_SAMPLE_RATE", "0.05"))
+
+# ====================================
+# Attendance auto derivation (確定シフト→勤怠の差分導出、オプトイン)
+# True のとき booking.tasks.derive_attendance_incremental が15分ごとに
+# 承認済み期間の当日までのシフトから勤怠を作成・更新する。
+# ====================================
+ATTENDANCE_AUTO_DERIVE_ENABLED = env_bool("ATTENDANCE_AUTO_DERIVE_ENABLED", False)
+
 # ====================================
 # QR Checkin
 # ====================================
@@ -55,6 +55,9 @@ CACHES = {
     }
 }
 
+# 公開ページキャッシュ（本番はデフォルト有効）
+PAGE_CACHE_ENABLED = env_bool("PAGE_CACHE_ENABLED", True)
+
 # ====================================
 # SameSite Cookie 設定
 # "Strict" だとLINEログインコールバックで問題が出るため "Lax" を使用
@@ -36,11 +36,12 @@ from booking.views_page_builder import (
 )
 from booking.views_site_wizard import SiteSetupWizardView
 from booking.views_line_admin import (
-    LineSegmentView, LineSegmentSendView,
+    LineSegmentView, LineSegmentSendView, LineCampaignReportView,
     LinePendingView, LineReservationConfirmView, LineReservationRejectView,
 )
 import booking.admin
 from booking.sitemaps import StaticPageSitemap, StoreStaffSitemap
+from booking.services.page_cache import surrogate_keys
 
 # サイトマップ辞書
 SITEMAPS = {
@@ -53,7 +54,7 @@ urlpatterns = [
     # sitemap.xml — SEO用サイトマップ
     path(
         "sitemap.xml",
-        sitemap,
+        surrogate_keys("stores", "notice")(sitemap),
         {"sitemaps": SITEMAPS},
         name="django.contrib.sitemaps.views.sitemap",
     ),
@@ -357,6 +358,11 @@ urlpatterns += i18n_patterns(
         custom_site.admin_view(LineSegmentSendView.as_view()),
         name="admin_line_segment_send",
     ),
+    path(
+        "admin/line/segment/report/<str:campaign_id>/",
+        custom_site.admin_view(LineCampaignReportView.as_view()),
+        name="admin_line_campaign_report",
+    ),
 
     # LINE管理: 仮予約確認
     path(
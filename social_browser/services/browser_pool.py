@@ -0,0 +1,325 @@
+"""ワーカープロセス常駐の Playwright ブラウザプール
+
+投稿ごとに Playwright と Chromium を起動し直す代わりに、ワーカープロセスが
+1つのブラウザを保持し、アカウント（プロファイルディレクトリ）ごとのコンテキストを再利用する。
+
+- コンテキストは保存済み storage_state から作成し、使用後に storage_state を保存する
+- 貸し出し前にヘルスチェック（ブラウザ接続・コンテキスト応答・使用回数・放置時間）を行い、
+  異常なら作り直す。使用中に例外が出たコンテキストも破棄する
+- コンテキストは max_uses 回で作り直し、ワーカーの子プロセス（Playwright ドライバ + Chromium）の
+  RSS 合計が max_rss_mb を超えたらブラウザごと再起動する
+- ブラウザ操作はプロセスごとに1本の専用スレッドで順に実行し（run_in_pool）、
+  同じアカウントの操作はプロファイルのファイルロックで他のワーカープロセスとも直列化する
+
+起動したままの同期 Playwright はそのスレッドでイベントループを動かし続け、同じスレッドの
+Django ORM 呼び出しが SynchronousOnlyOperation になる。そのためプールは呼び出し元
+（Celery タスク）のスレッドではなく専用スレッドが持つ。
+"""
+import atexit
+import logging
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from contextlib import contextmanager
+
+from django.conf import settings
+
+from .browser_service import (
+    DESKTOP_CONTEXT_OPTIONS,
+    MOBILE_CONTEXT_OPTIONS,
+    _get_browser_args,
+    _get_storage_state,
+    save_storage_state,
+)
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_USES = 50
+DEFAULT_MAX_RSS_MB = 1536
+DEFAULT_MAX_IDLE = 30 * 60
+LOCK_FILE = '.browser.lock'
+
+
+def process_tree_rss_mb(pid=None):
+    """pid（既定は自プロセス）の子孫プロセスの RSS 合計（MB）。/proc が無い環境では None。"""
+    root = pid or os.getpid()
+    try:
+        names = os.listdir('/proc')
+    except OSError:
+        return None
+    children = {}
+    rss_pages = {}
+    for name in names:
+        if not name.isdigit():
+            continue
+        try:
+            with open(f'/proc/{name}/stat') as f:
+                # comm に空白や括弧を含み得るので最後の ')' 以降を読む
+                fields = f.read().rsplit(')', 1)[1].split()
+        except (OSError, IndexError):
+            continue
+        proc = int(name)
+        children.setdefault(int(fields[1]), []).append(proc)
+        rss_pages[proc] = int(fields[21])
+
+    total = 0
+    stack = list(children.get(root, []))
+    while stack:
+        proc = stack.pop()
+        total += rss_pages.get(proc, 0)
+        stack.extend(children.get(proc, []))
+    return total * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024)
+
+
+@contextmanager
+def profile_lock(profile_dir):
+    """プロファイル単位のファイルロック（プロセス間で同一アカウントの操作を直列化）"""
+    if fcntl is None:
+        yield
+        return
+    os.makedirs(profile_dir, mode=0o700, exist_ok=True)
+    with open(os.path.join(profile_dir, LOCK_FILE), 'a') as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def _start_playwright():
+    from playwright.sync_api import sync_playwright
+    return sync_playwright().start()
+
+
+class _PooledContext:
+    def __init__(self, context):
+        self.context = context
+        self.uses = 0
+        self.last_used = time.monotonic()
+
+
+class BrowserPool:
+    """1つのブラウザとアカウント別の BrowserContext を保持する"""
+
+    def __init__(self, headless=True, max_uses=None, max_rss_mb=None, max_idle=None,
+                 playwright_factory=None, rss_probe=None):
+        self.headless = headless
+        self.max_uses = max_uses or getattr(settings, 'BROWSER_POOL_MAX_USES', DEFAULT_MAX_USES)
+        self.max_rss_mb = max_rss_mb or getattr(settings, 'BROWSER_POOL_MAX_RSS_MB', DEFAULT_MAX_RSS_MB)
+        self.max_idle = max_idle or getattr(settings, 'BROWSER_POOL_MAX_IDLE', DEFAULT_MAX_IDLE)
+        self._playwright_factory = playwright_factory or _start_playwright
+        self._rss_probe = rss_probe or process_tree_rss_mb
+        self._playwright = None
+        self._browser = None
+        self._contexts = {}
+        self.stats = {'launches': 0, 'contexts': 0, 'recycled': 0, 'restarts': 0, 'checkouts': 0}
+
+    # -- ブラウザ ---------------------------------------------------------------
+
+    def _ensure_browser(self):
+        if self._browser is not None:
+            if self._browser.is_connected():
+                return self._browser
+            logger.warning("Pooled browser disconnected, relaunching")
+            self._close_browser()
+        if self._playwright is None:
+            self._playwright = self._playwright_factory()
+        self._browser = self._playwright.chromium.launch(headless=self.headless, args=_get_browser_args())
+        self.stats['launches'] += 1
+        return self._browser
+
+    def _close_browser(self):
+        for key in list(self._contexts):
+            self._discard(key, count=False)
+        if self._browser is not None:
+            try:
+                self._browser.close()
+            except Exception as e:
+                logger.debug("Browser close failed: %s", e)
+            self._browser = None
+
+    def restart(self):
+        """ブラウザを閉じる（次の貸し出しで起動し直す）"""
+        self.stats['restarts'] += 1
+        self._close_browser()
+
+    def close(self):
+        """ブラウザと Playwright を停止する"""
+        self._close_browser()
+        if self._playwright is not None:
+            try:
+                self._playwright.stop()
+            except Exception as e:
+                logger.debug("Playwright stop failed: %s", e)
+            self._playwright = None
+
+    def _check_memory(self):
+        rss = self._rss_probe()
+        if rss is not None and rss > self.max_rss_mb:
+            logger.info("Browser pool RSS %.0fMB exceeds %sMB, restarting browser", rss, self.max_rss_mb)
+            self.restart()
+
+    # -- コンテキスト -------------------------------------------------------------
+
+    def _healthy(self, entry):
+        if entry.uses >= self.max_uses:
+            return False
+        if time.monotonic() - entry.last_used > self.max_idle:
+            return False
+        try:
+            # 閉じたコンテキスト・切断されたブラウザではここで例外になる
+            entry.context.cookies()
+        except Exception:
+            return False
+        return True
+
+    def _discard(self, key, count=True):
+        entry = self._contexts.pop(key, None)
+        if entry is None:
+            return
+        if count:
+            self.stats['recycled'] += 1
+        try:
+            entry.context.close()
+        except Exception as e:
+            logger.debug("Context close failed: %s", e)
+
+    def _checkout(self, key, profile_dir, mobile):
+        browser = self._ensure_browser()
+        entry = self._contexts.get(key)
+        if entry is not None and not self._healthy(entry):
+            self._discard(key)
+            entry = None
+        if entry is None:
+            options = MOBILE_CONTEXT_OPTIONS if mobile else DESKTOP_CONTEXT_OPTIONS
+            context = browser.new_context(storage_state=_get_storage_state(profile_dir), **options)
+            entry = self._contexts[key] = _PooledContext(context)
+            self.stats['contexts'] += 1
+        entry.uses += 1
+        self.stats['checkouts'] += 1
+        return entry
+
+    @contextmanager
+    def session(self, profile_dir, mobile=False):
+        """アカウントのコンテキストを借りて新しいページを渡す
+
+        Usage:
+            with pool.session(profile_dir) as (page, context):
+                page.goto('https://...')
+        """
+        key = (profile_dir, mobile)
+        with profile_lock(profile_dir):
+            entry = self._checkout(key, profile_dir, mobile)
+            page = entry.context.new_page()
+            ok = False
+            try:
+                yield page, entry.context
+                save_storage_state(entry.context, profile_dir)
+                ok = True
+            finally:
+                entry.last_used = time.monotonic()
+                try:
+                    page.close()
+                except Exception:
+                    ok = False
+                if not ok:
+                    # 途中で失敗したコンテキストは状態が分からないので作り直す
+                    self._discard(key)
+                self._check_memory()
+
+
+class _BrowserThread:
+    """ブラウザ操作を順に実行する専用スレッド"""
+
+    def __init__(self):
+        self.jobs = queue.Queue()
+        self.pools = {}
+        self.thread = threading.Thread(target=self._run, name='browser-pool', daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        while True:
+            future, fn, args, kwargs = self.jobs.get()
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                future.set_result(fn(*args, **kwargs))
+            except BaseException as e:
+                future.set_exception(e)
+
+    def call(self, fn, *args, **kwargs):
+        if threading.current_thread() is self.thread:
+            return fn(*args, **kwargs)
+        future = Future()
+        self.jobs.put((future, fn, args, kwargs))
+        return future.result()
+
+
+_browser_thread = None
+_browser_thread_pid = None
+_browser_thread_lock = threading.Lock()
+
+
+def _get_browser_thread():
+    global _browser_thread, _browser_thread_pid
+    with _browser_thread_lock:
+        # フォークした子プロセスにはスレッドが引き継がれないので作り直す
+        if _browser_thread is None or _browser_thread_pid != os.getpid():
+            _browser_thread = _BrowserThread()
+            _browser_thread_pid = os.getpid()
+        return _browser_thread
+
+
+def in_pool_thread():
+    """現在のスレッドがブラウザプールの専用スレッドか"""
+    return (
+        _browser_thread is not None
+        and _browser_thread_pid == os.getpid()
+        and threading.current_thread() is _browser_thread.thread
+    )
+
+
+def run_in_pool(fn, *args, **kwargs):
+    """ブラウザ操作 fn をプールの専用スレッドで実行して結果を返す
+
+    fn の中の browser_session はプールのコンテキストを使う。
+    settings.BROWSER_POOL_ENABLED = False なら呼び出し元スレッドでそのまま実行する。
+    """
+    if not getattr(settings, 'BROWSER_POOL_ENABLED', True):
+        return fn(*args, **kwargs)
+    return _get_browser_thread().call(fn, *args, **kwargs)
+
+
+def get_pool(headless=True):
+    """専用スレッドのブラウザプール（専用スレッド内から呼ぶ）"""
+    if not in_pool_thread():
+        raise RuntimeError('get_pool() must be called from the browser pool thread (use run_in_pool)')
+    pools = _browser_thread.pools
+    if headless not in pools:
+        pools[headless] = BrowserPool(headless=headless)
+    return pools[headless]
+
+
+def _close_pools():
+    pools = list(_browser_thread.pools.values())
+    _browser_thread.pools.clear()
+    for pool in pools:
+        pool.close()
+
+
+@atexit.register
+def shutdown_pools():
+    """このプロセスのブラウザプールをすべて停止する"""
+    if _browser_thread is None or _browser_thread_pid != os.getpid() or not _browser_thread.thread.is_alive():
+        return
+    try:
+        _browser_thread.call(_close_pools)
+    except Exception as e:
+        logger.debug("Browser pool shutdown failed: %s", e)
@@ -13,6 +13,27 @@ logger = logging.getLogger(__name__)
 # プラットフォームバリデーション用
 VALID_PLATFORMS = frozenset({'x', 'instagram', 'gbp', 'tiktok'})
 
+DESKTOP_CONTEXT_OPTIONS = {
+    'user_agent': (
+        'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) '
+        'AppleWebKit/537.36 (KHTML, like Gecko) '
+        'Chrome/120.0.0.0 Safari/537.36'
+    ),
+    'viewport': {'width': 1280, 'height': 720},
+}
+
+# Instagram 用
+MOBILE_CONTEXT_OPTIONS = {
+    'user_agent': (
+        'Mozilla/5.0 (iPhone; CPU iPhone OS 17_0 like Mac OS X) '
+        'AppleWebKit/605.1.15 (KHTML, like Gecko) '
+        'Version/17.0 Mobile/15E148 Safari/604.1'
+    ),
+    'viewport': {'width': 390, 'height': 844},
+    'is_mobile': True,
+    'has_touch': True,
+}
+
 
 def get_profile_dir(store_id, platform):
     """ブラウザプロファイルディレクトリのパスを返す"""
@@ -69,13 +90,8 @@ def create_browser_context(playwright_instance, profile_dir, headless=True):
         args=_get_browser_args(),
     )
     context = browser.new_context(
-        user_agent=(
-            'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) '
-            'AppleWebKit/537.36 (KHTML, like Gecko) '
-            'Chrome/120.0.0.0 Safari/537.36'
-        ),
-        viewport={'width': 1280, 'height': 720},
         storage_state=_get_storage_state(profile_dir),
+        **DESKTOP_CONTEXT_OPTIONS,
     )
     return browser, context
 
@@ -180,15 +196,8 @@ def create_browser_context_mobile(playwright_instance, profile_dir, headless=Tru
         args=_get_browser_args(),
     )
     context = browser.new_context(
-        user_agent=(
-            'Mozilla/5.0 (iPhone; CPU iPhone OS 17_0 like Mac OS X) '
-            'AppleWebKit/605.1.15 (KHTML, like Gecko) '
-            'Version/17.0 Mobile/15E148 Safari/604.1'
-        ),
-        viewport={'width': 390, 'height': 844},
-        is_mobile=True,
-        has_touch=True,
         storage_state=_get_storage_state(profile_dir),
+        **MOBILE_CONTEXT_OPTIONS,
     )
     return browser, context
 
@@ -197,6 +206,9 @@ def create_browser_context_mobile(playwright_instance, profile_dir, headless=Tru
 def browser_session(profile_dir, headless=True, mobile=False):
     """ブラウザセッションのコンテキストマネージャ（リソースリーク防止）
 
+    browser_pool.run_in_pool() から呼ばれた場合はワーカー常駐のブラウザプールから
+    アカウント別のコンテキストを借りる。それ以外は従来どおり毎回ブラウザを起動する。
+
     Usage:
         with browser_session(profile_dir) as (page, context):
             page.goto('https://...')
@@ -207,6 +219,12 @@ def browser_session(profile_dir, headless=True, mobile=False):
     except ImportError:
         raise RuntimeError('playwright is not installed')
 
+    from .browser_pool import get_pool, in_pool_thread
+    if in_pool_thread():
+        with get_pool(headless).session(profile_dir, mobile=mobile) as (page, context):
+            yield page, context
+        return
+
     with sync_playwright() as p:
         create_fn = create_browser_context_mobile if mobile else create_browser_context
         browser, context = create_fn(p, profile_dir, headless)
@@ -10,6 +10,8 @@ from .browser_service import (
 
 logger = logging.getLogger(__name__)
 
+X_HOME_URL = 'https://x.com/home'
+
 
 def post_to_x_browser(content, profile_dir, headless=True):
     """X にブラウザ経由で投稿
@@ -26,7 +28,7 @@ def post_to_x_browser(content, profile_dir, headless=True):
     try:
         with browser_session(profile_dir, headless) as (page, context):
             # X ホームに移動
-            page.goto('https://x.com/home', wait_until='networkidle', timeout=30000)
+            page.goto(X_HOME_URL, wait_until='networkidle', timeout=30000)
             random_delay(2, 4)
 
             # ログイン状態チェック
@@ -4,6 +4,7 @@ import os
 
 from celery import shared_task
 
+from social_browser.services.browser_pool import run_in_pool
 from social_browser.services.browser_service import VALID_PLATFORMS
 
 logger = logging.getLogger(__name__)
@@ -14,6 +15,7 @@ def task_browser_post(self, session_id, draft_post_id, content, platform):
     """ブラウザ経由で SNS に投稿
 
     queue='browser_posting', pool=solo で実行。
+    ブラウザ操作はワーカー常駐のブラウザプール（専用スレッド）で実行する。
     """
     # プラットフォームバリデーション
     if platform not in VALID_PLATFORMS:
@@ -24,7 +26,7 @@ def task_browser_post(self, session_id, draft_post_id, content, platform):
     from booking.models import DraftPost, SystemConfig
 
     # フィーチャーフラグチェック
-    if SystemConfig.get('browser_posting_enabled', 'false') != 'true':
+    if not SystemConfig.get_bool('browser_posting_enabled', False):
         logger.info("Browser posting is disabled via SystemConfig")
         return
 
@@ -52,19 +54,19 @@ def task_browser_post(self, session_id, draft_post_id, content, platform):
     try:
         if platform == 'x':
             from social_browser.services.x_browser_poster import post_to_x_browser
-            success, screenshot_path, error = post_to_x_browser(
-                content, session.profile_dir,
+            success, screenshot_path, error = run_in_pool(
+                post_to_x_browser, content, session.profile_dir,
             )
         elif platform == 'instagram':
             from social_browser.services.instagram_poster import post_to_instagram_browser
             image_path = draft.image.path if draft and draft.image else ''
-            success, screenshot_path, error = post_to_instagram_browser(
-                content, image_path, session.profile_dir,
+            success, screenshot_path, error = run_in_pool(
+                post_to_instagram_browser, content, image_path, session.profile_dir,
             )
         elif platform == 'gbp':
             from social_browser.services.gbp_poster import post_to_gbp_browser
-            success, screenshot_path, error = post_to_gbp_browser(
-                content, session.profile_dir,
+            success, screenshot_path, error = run_in_pool(
+                post_to_gbp_browser, content, session.profile_dir,
             )
 
     except Exception as exc:
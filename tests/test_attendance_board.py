@@ -0,0 +1,160 @@
+"""Tests for the live attendance board state (attendance_board service)."""
+import json
+from datetime import time, timedelta
+
+import pytest
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.utils import timezone
+
+from booking.models import AttendanceStamp, ShiftAssignment, ShiftPeriod, Staff
+from booking.services import attendance_board, live_events
+
+User = get_user_model()
+
+
+@pytest.fixture(autouse=True)
+def clear_cache():
+    cache.clear()
+    yield
+    cache.clear()
+
+
+def manual_stamp(client, staff, stamp_type):
+    return client.post(
+        '/api/attendance/manual-stamp/',
+        data=json.dumps({'staff_id': staff.id, 'stamp_type': stamp_type}),
+        content_type='application/json',
+    )
+
+
+def states(store):
+    return {e['name']: e['state'] for e in attendance_board.get_board(store.id)}
+
+
+@pytest.mark.django_db
+class TestAttendanceBoard:
+
+    def test_build_replays_todays_stamps(self, store, staff):
+        AttendanceStamp.objects.create(staff=staff, stamp_type='clock_in')
+        AttendanceStamp.objects.create(staff=staff, stamp_type='break_start')
+
+        entries = attendance_board.get_board(store.id)
+        entry = next(e for e in entries if e['staff_id'] == staff.id)
+        assert entry['state'] == attendance_board.STATE_BREAK
+        assert [s['type'] for s in entry['stamps']] == ['clock_in', 'break_start']
+
+    def test_cached_board_does_not_query(self, store, staff, django_assert_num_queries):
+        attendance_board.get_board(store.id)
+        with django_assert_num_queries(0):
+            attendance_board.get_board(store.id)
+
+    def test_stamp_api_updates_entry_and_publishes_card(
+        self, admin_client, store, staff, django_capture_on_commit_callbacks,
+    ):
+        attendance_board.get_board(store.id)  # 表示中のボード
+
+        with django_capture_on_commit_callbacks(execute=True):
+            resp = manual_stamp(admin_client, staff, 'clock_in')
+        assert resp.status_code == 200
+        assert states(store)[staff.name] == attendance_board.STATE_WORKING
+
+        events = live_events.events_since(attendance_board.topic(store.id), 0)[1]
+        assert len(events) == 1
+        assert events[0]['type'] == attendance_board.EVENT_STAFF
+        assert events[0]['data']['staff_id'] == staff.id
+        assert events[0]['data']['state'] == attendance_board.STATE_WORKING
+        assert f'data-staff-id="{staff.id}"' in events[0]['data']['html']
+
+    def test_stamp_updates_without_replaying_day(
+        self, admin_client, store, staff, django_capture_on_commit_callbacks,
+    ):
+        AttendanceStamp.objects.create(staff=staff, stamp_type='clock_in')
+        attendance_board.get_board(store.id)
+
+        with django_capture_on_commit_callbacks(execute=True):
+            manual_stamp(admin_client, staff, 'clock_out')
+
+        # 差分更新のみ（再構築していれば DB の打刻と同じになるはず）
+        AttendanceStamp.objects.filter(stamp_type='clock_in').update(stamp_type='break_start')
+        entry = next(e for e in attendance_board.get_board(store.id) if e['staff_id'] == staff.id)
+        assert [s['type'] for s in entry['stamps']] == ['clock_in', 'clock_out']
+        assert entry['state'] == attendance_board.STATE_LEFT
+
+    def test_stamp_created_outside_views_reaches_board(
+        self, store, staff, django_capture_on_commit_callbacks,
+    ):
+        attendance_board.get_board(store.id)  # 表示中のボード
+
+        with django_capture_on_commit_callbacks(execute=True):
+            AttendanceStamp.objects.create(staff=staff, stamp_type='clock_in')
+
+        assert states(store)[staff.name] == attendance_board.STATE_WORKING
+        events = live_events.events_since(attendance_board.topic(store.id), 0)[1]
+        assert [e['type'] for e in events] == [attendance_board.EVENT_STAFF]
+        assert events[0]['data']['staff_id'] == staff.id
+
+    def test_invalidated_stamp_rebuilds_board(
+        self, store, staff, django_capture_on_commit_callbacks,
+    ):
+        stamp = AttendanceStamp.objects.create(staff=staff, stamp_type='clock_in')
+        assert states(store)[staff.name] == attendance_board.STATE_WORKING
+
+        with django_capture_on_commit_callbacks(execute=True):
+            stamp.is_valid = False
+            stamp.save()
+
+        assert states(store)[staff.name] == attendance_board.STATE_ABSENT
+        events = live_events.events_since(attendance_board.topic(store.id), 0)[1]
+        assert events[-1]['type'] == attendance_board.EVENT_RESYNC
+
+    def test_overtime_is_computed_at_render_time(self, store, staff):
+        now = timezone.localtime()
+        entry = {
+            'staff_id': staff.id, 'name': staff.name,
+            'state': attendance_board.STATE_WORKING, 'stamps': [],
+            'shift_end': (now - timedelta(minutes=45)).time(),
+        }
+        if now.time() < time(0, 45):
+            pytest.skip('shift end would fall on the previous day')
+        info = attendance_board.staff_info(entry, now=now)
+        assert info['overtime'] is True
+        assert info['overtime_minutes'] >= 44
+
+        entry['state'] = attendance_board.STATE_LEFT
+        assert attendance_board.staff_info(entry, now=now)['overtime'] is False
+
+    def test_latest_shift_end_is_used(self, store, staff):
+        period = ShiftPeriod.objects.create(
+            store=store, year_month=timezone.localdate().replace(day=1),
+        )
+        today = timezone.localdate()
+        ShiftAssignment.objects.create(period=period, staff=staff, date=today, start_hour=9, end_hour=13)
+        ShiftAssignment.objects.create(period=period, staff=staff, date=today, start_hour=17, end_hour=24)
+
+        entry = next(e for e in attendance_board.get_board(store.id) if e['staff_id'] == staff.id)
+        assert entry['shift_end'] == time(23, 59)
+
+    def test_new_staff_rebuilds_board(self, store, staff, django_capture_on_commit_callbacks):
+        attendance_board.get_board(store.id)
+        with django_capture_on_commit_callbacks(execute=True):
+            Staff.objects.create(name='新人', store=store, user=User.objects.create_user('newbie'))
+        assert '新人' in states(store)
+
+    def test_board_page_and_fragment(self, admin_client, store, staff):
+        AttendanceStamp.objects.create(staff=staff, stamp_type='clock_in')
+
+        page = admin_client.get('/admin/attendance/board/')
+        assert page.status_code == 200
+        assert f'data-staff-id="{staff.id}"' in page.content.decode()
+
+        fragment = admin_client.get(f'/api/attendance/day-status-html/?store_id={store.id}')
+        assert fragment['X-Attendance-Seq'] == '0'
+        html = fragment.content.decode()
+        assert 'data-zone="working"' in html
+        assert staff.name in html
+
+    def test_long_poll_returns_staff_events(self, admin_client, store, staff):
+        live_events.publish(attendance_board.topic(store.id), 'staff', {'staff_id': staff.id})
+        resp = admin_client.get(f'/api/attendance/board-events/?store_id={store.id}&since=0')
+        assert resp.json()['events'][0]['data'] == {'staff_id': staff.id}
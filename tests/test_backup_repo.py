@@ -0,0 +1,389 @@
+"""
+Tests for the deduplicating backup pipeline.
+
+Covers:
+  - booking/services/backup_repo.py: iter_chunks, Repository (snapshot / restore / gc), sync
+  - booking/services/backup_storage.py: LocalStorage (resumable write), S3Storage (multipart resume)
+  - booking/services/backup_service.py: create_backup / restore_backup
+  - restore_backup management command
+"""
+import io
+import os
+import random
+import sqlite3
+from datetime import timedelta
+from unittest.mock import patch
+
+import pytest
+from django.core.management import CommandError, call_command
+
+from booking.models import BackupConfig
+from booking.services import backup_repo, backup_service
+from booking.services.backup_repo import BackupVerifyError, Repository, StageStats, iter_chunks
+from booking.services.backup_storage import LocalStorage, S3Storage
+
+PAGE = backup_repo.DEFAULT_PAGE_SIZE
+
+
+def random_bytes(n, seed=0):
+    return random.Random(seed).randbytes(n)
+
+
+@pytest.fixture
+def repo(tmp_path):
+    return Repository(LocalStorage(tmp_path / 'repo'))
+
+
+def write_file(path, data):
+    path.write_bytes(data)
+    return path
+
+
+def restored(repo, name):
+    buf = io.BytesIO()
+    repo.restore(name, buf)
+    return buf.getvalue()
+
+
+def make_sqlite(path, rows, seed=0):
+    rnd = random.Random(seed)
+    conn = sqlite3.connect(path)
+    conn.execute('CREATE TABLE IF NOT EXISTS t (id INTEGER PRIMARY KEY, body BLOB)')
+    conn.executemany('INSERT INTO t (body) VALUES (?)', [(rnd.randbytes(200),) for _ in range(rows)])
+    conn.commit()
+    conn.close()
+
+
+class TestChunking:
+    def test_chunks_are_page_aligned_and_bounded(self):
+        data = random_bytes(PAGE * 300)
+        chunks = list(iter_chunks(io.BytesIO(data)))
+        assert b''.join(chunks) == data
+        assert all(len(c) % PAGE == 0 for c in chunks)
+        assert all(backup_repo.MIN_CHUNK_PAGES * PAGE <= len(c) <= backup_repo.MAX_CHUNK_PAGES * PAGE
+                   for c in chunks[:-1])
+
+    def test_changed_page_changes_one_chunk(self):
+        data = bytearray(random_bytes(PAGE * 300))
+        before = list(iter_chunks(io.BytesIO(bytes(data))))
+        data[PAGE * 150 + 10] ^= 0xFF
+        after = list(iter_chunks(io.BytesIO(bytes(data))))
+        # 変更ページがチャンク境界の判定を変えても、影響は隣のチャンクまで
+        assert len(set(after) - set(before)) <= 2
+
+    def test_sqlite_page_size(self, tmp_path):
+        db = tmp_path / 'x.sqlite3'
+        conn = sqlite3.connect(db)
+        conn.execute('PRAGMA page_size = 8192')
+        conn.execute('CREATE TABLE t (x)')
+        conn.commit()
+        conn.close()
+        assert backup_repo.sqlite_page_size(db) == 8192
+        assert backup_repo.sqlite_page_size(write_file(tmp_path / 'raw', b'x' * 10)) == PAGE
+
+
+class TestRepository:
+    def test_second_snapshot_stores_only_changed_chunks(self, repo, tmp_path):
+        data = bytearray(random_bytes(PAGE * 400))
+        first = repo.create_snapshot('snap_1', write_file(tmp_path / 'a', bytes(data)))
+        assert first['summary']['new_chunks'] == len(set(first['order']))
+
+        data[PAGE * 200:PAGE * 201] = random_bytes(PAGE, seed=1)
+        second = repo.create_snapshot('snap_2', write_file(tmp_path / 'b', bytes(data)))
+        assert 1 <= second['summary']['new_chunks'] <= 2
+        assert second['summary']['stored_bytes'] < first['summary']['stored_bytes'] / 10
+
+        assert repo.list_snapshots() == ['snap_1', 'snap_2']
+        assert restored(repo, 'snap_2') == bytes(data)
+        assert restored(repo, 'snap_1') != bytes(data)
+
+    def test_compresses_and_dedups_within_snapshot(self, repo, tmp_path):
+        data = b'\x00' * (PAGE * 256)
+        manifest = repo.create_snapshot('zeros', write_file(tmp_path / 'z', data))
+        assert manifest['summary']['new_chunks'] == 1
+        assert manifest['summary']['stored_bytes'] < 2048
+        assert restored(repo, 'zeros') == data
+
+    def test_stage_stats(self, repo, tmp_path):
+        stats = StageStats()
+        repo.create_snapshot('s', write_file(tmp_path / 'a', random_bytes(PAGE * 50)), stats)
+        result = stats.as_dict()
+        assert set(result) == {'chunk', 'compress', 'store'}
+        assert result['chunk']['bytes'] == PAGE * 50
+
+    def test_corrupt_pack_is_detected(self, repo, tmp_path):
+        repo.create_snapshot('s', write_file(tmp_path / 'a', random_bytes(PAGE * 50)))
+        pack = repo.storage.list('packs/')[0]
+        path = os.path.join(repo.storage.root, pack)
+        raw = bytearray(open(path, 'rb').read())
+        raw[len(raw) // 2] ^= 0xFF
+        open(path, 'wb').write(bytes(raw))
+        with pytest.raises(BackupVerifyError):
+            restored(repo, 's')
+
+    def test_gc_removes_unreferenced_packs(self, repo, tmp_path, monkeypatch):
+        monkeypatch.setattr(backup_repo, 'PACK_TARGET_SIZE', PAGE * 8)
+        repo.create_snapshot('snap_1', write_file(tmp_path / 'a', random_bytes(PAGE * 100, seed=1)))
+        repo.create_snapshot('snap_2', write_file(tmp_path / 'b', random_bytes(PAGE * 100, seed=2)))
+        packs = len(repo.storage.list('packs/'))
+        repo.delete_snapshot('snap_1')
+        assert 0 < repo.gc() < packs
+        assert restored(repo, 'snap_2') == random_bytes(PAGE * 100, seed=2)
+
+    def test_sync_skips_snapshots_older_than_since(self, repo, tmp_path, monkeypatch):
+        monkeypatch.setattr(backup_repo, 'PACK_TARGET_SIZE', PAGE * 8)
+        remote = LocalStorage(tmp_path / 'remote')
+        repo.create_snapshot('snap_1', write_file(tmp_path / 'a', random_bytes(PAGE * 40, seed=1)))
+        repo.create_snapshot('snap_2', write_file(tmp_path / 'b', random_bytes(PAGE * 40, seed=2)))
+        backup_repo.sync(repo.storage, remote, since='snap_2')
+        assert Repository(remote).list_snapshots() == ['snap_2']
+        # snap_1 だけが参照するパックも送らない
+        assert Repository(remote).gc() == 0
+        assert restored(Repository(remote), 'snap_2') == random_bytes(PAGE * 40, seed=2)
+
+    def test_sync_copies_missing_objects_only(self, repo, tmp_path):
+        remote = LocalStorage(tmp_path / 'remote')
+        repo.create_snapshot('snap_1', write_file(tmp_path / 'a', random_bytes(PAGE * 40)))
+        stats = StageStats()
+        first = backup_repo.sync(repo.storage, remote, stats)
+        assert first == len(repo.storage.list())
+        assert backup_repo.sync(repo.storage, remote) == 0
+        assert stats.as_dict()['upload']['bytes'] > 0
+        assert restored(Repository(remote), 'snap_1') == random_bytes(PAGE * 40)
+
+
+class TestLocalStorage:
+    def test_resumes_partial_write(self, tmp_path):
+        storage = LocalStorage(tmp_path)
+        data = random_bytes(10000)
+        os.makedirs(tmp_path / 'packs')
+        (tmp_path / 'packs' / 'x.pack.part').write_bytes(data[:4000])
+        src = io.BytesIO(data)
+        storage.write('packs/x.pack', src, len(data))
+        assert storage.read('packs/x.pack') == data
+        assert storage.list() == ['packs/x.pack']
+
+    def test_rejects_escaping_keys(self, tmp_path):
+        with pytest.raises(ValueError):
+            LocalStorage(tmp_path / 'repo').exists('../secret')
+
+
+class FakeClientError(Exception):
+    def __init__(self, code):
+        super().__init__(code)
+        self.response = {'Error': {'Code': code}}
+
+
+class FakeS3:
+    def __init__(self):
+        self.objects = {}
+        self.uploads = {}
+        self.part_calls = []
+        self.fail_on_part = None
+
+    def head_object(self, Bucket, Key):
+        if Key not in self.objects:
+            raise FakeClientError('404')
+        return {}
+
+    def put_object(self, Bucket, Key, Body):
+        self.objects[Key] = bytes(Body)
+
+    def get_object(self, Bucket, Key):
+        return {'Body': io.BytesIO(self.objects[Key])}
+
+    def delete_object(self, Bucket, Key):
+        self.objects.pop(Key, None)
+
+    def list_objects_v2(self, Bucket, Prefix, ContinuationToken=None):
+        keys = sorted(k for k in self.objects if k.startswith(Prefix))
+        start = int(ContinuationToken or 0)
+        page = keys[start:start + 2]
+        resp = {'Contents': [{'Key': k} for k in page], 'IsTruncated': start + 2 < len(keys)}
+        if resp['IsTruncated']:
+            resp['NextContinuationToken'] = str(start + 2)
+        return resp
+
+    def create_multipart_upload(self, Bucket, Key):
+        upload_id = f'up{len(self.uploads)}'
+        self.uploads[upload_id] = {'Key': Key, 'parts': {}}
+        return {'UploadId': upload_id}
+
+    def upload_part(self, Bucket, Key, UploadId, PartNumber, Body):
+        if self.fail_on_part == PartNumber:
+            raise ConnectionError('connection reset')
+        self.part_calls.append(PartNumber)
+        self.uploads[UploadId]['parts'][PartNumber] = Body
+        return {'ETag': f'etag{PartNumber}'}
+
+    def list_multipart_uploads(self, Bucket, Prefix):
+        return {'Uploads': [{'Key': u['Key'], 'UploadId': uid}
+                            for uid, u in self.uploads.items() if u['Key'].startswith(Prefix)]}
+
+    def list_parts(self, Bucket, Key, UploadId):
+        return {'Parts': [{'PartNumber': n, 'ETag': f'etag{n}', 'Size': len(b)}
+                          for n, b in self.uploads[UploadId]['parts'].items()]}
+
+    def complete_multipart_upload(self, Bucket, Key, UploadId, MultipartUpload):
+        parts = self.uploads.pop(UploadId)['parts']
+        self.objects[Key] = b''.join(parts[p['PartNumber']] for p in MultipartUpload['Parts'])
+
+
+class TestS3Storage:
+    def test_small_objects_and_listing(self):
+        client = FakeS3()
+        storage = S3Storage('bucket', prefix='repo/', client=client)
+        for key in ('packs/a', 'packs/b', 'packs/c', 'snapshots/s'):
+            storage.write(key, io.BytesIO(b'data'), 4)
+        assert storage.list('packs/') == ['packs/a', 'packs/b', 'packs/c']
+        assert storage.exists('packs/a') and not storage.exists('packs/z')
+        storage.delete('packs/a')
+        assert storage.read('packs/b') == b'data'
+        assert not storage.exists('packs/a')
+
+    def test_multipart_upload_resumes(self):
+        client = FakeS3()
+        storage = S3Storage('bucket', prefix='repo/', client=client, part_size=100)
+        data = random_bytes(350)
+        client.fail_on_part = 3
+        with pytest.raises(ConnectionError):
+            storage.write('packs/big', io.BytesIO(data), len(data))
+        assert client.part_calls == [1, 2]
+
+        client.fail_on_part = None
+        storage.write('packs/big', io.BytesIO(data), len(data))
+        # 送信済みの 1, 2 は再送しない
+        assert client.part_calls == [1, 2, 3, 4]
+        assert client.objects['repo/packs/big'] == data
+        assert client.uploads == {}
+
+
+@pytest.fixture
+def backup_dirs(tmp_path, monkeypatch):
+    monkeypatch.setattr(backup_service, 'BACKUP_DIR', tmp_path / 'backups')
+    monkeypatch.setattr(backup_service, 'REPO_DIR', tmp_path / 'backups' / 'repo')
+    remote = Repository(LocalStorage(tmp_path / 's3'))
+    monkeypatch.setattr(backup_service, 's3_repository', lambda bucket: remote)
+    return tmp_path
+
+
+@pytest.fixture
+def source_db(tmp_path):
+    path = tmp_path / 'source.sqlite3'
+    make_sqlite(path, 2000)
+    with patch.object(backup_service, '_perform_sqlite_backup',
+                      side_effect=lambda src, dest: _copy_sqlite(path, dest)):
+        yield path
+
+
+def _copy_sqlite(src, dest):
+    source_conn = sqlite3.connect(src)
+    dest_conn = sqlite3.connect(dest)
+    source_conn.backup(dest_conn)
+    dest_conn.close()
+    source_conn.close()
+
+
+@pytest.mark.django_db
+class TestCreateBackup:
+    @pytest.fixture(autouse=True)
+    def config(self):
+        config = BackupConfig.load()
+        config.line_notify_enabled = False
+        config.save()
+        return config
+
+    def test_incremental_backup_and_restore(self, backup_dirs, source_db):
+        first = backup_service.create_backup(trigger='manual')
+        assert first.status == 'success', first.error_message
+        assert first.backup_file.endswith('.sqlite3')
+        assert first.s3_uploaded and first.s3_key.startswith('backups/repo/snapshots/')
+        assert set(first.stats['stages']) == {'snapshot', 'chunk', 'compress', 'store', 'upload'}
+        assert first.stats['stages']['snapshot']['bytes'] == first.file_size_bytes
+        # 一時的なフルコピーは残さない
+        assert not list((backup_dirs / 'backups').glob('*.tmp'))
+
+        make_sqlite(source_db, 20, seed=1)
+        with patch.object(backup_service.timezone, 'now',
+                          return_value=first.started_at.replace(year=first.started_at.year + 1)):
+            second = backup_service.create_backup(trigger='scheduled')
+        assert second.status == 'success', second.error_message
+        # 追記で変わるのはヘッダページと末尾のページを含むチャンクだけ
+        assert second.stats['new_chunks'] <= 2 < second.stats['chunks']
+        assert second.stats['stored_bytes'] < first.stats['stored_bytes'] / 4
+
+        out = backup_dirs / 'restored.sqlite3'
+        manifest = backup_service.restore_backup('latest', out)
+        assert manifest['name'] == second.backup_file
+        conn = sqlite3.connect(out)
+        assert conn.execute('SELECT COUNT(*) FROM t').fetchone()[0] == 2020
+        conn.close()
+
+        # S3 側は保持日数（90日）より古い1回目が削除され、ローカルには両方残る
+        remote = backup_service.s3_repository('bucket')
+        assert remote.list_snapshots() == [second.backup_file]
+        assert len(backup_service.local_repository().list_snapshots()) == 2
+        out_s3 = backup_dirs / 'restored_s3.sqlite3'
+        backup_service.restore_backup('latest', out_s3, source='s3')
+        assert out_s3.read_bytes() == out.read_bytes()
+
+        with pytest.raises(FileNotFoundError):
+            backup_service.restore_backup(first.backup_file, backup_dirs / 'gone.sqlite3', source='s3')
+
+    def test_s3_expired_snapshot_is_not_uploaded_again(self, backup_dirs, source_db):
+        first = backup_service.create_backup()
+        later = first.started_at.replace(year=first.started_at.year + 1)
+        with patch.object(backup_service.timezone, 'now', return_value=later):
+            second = backup_service.create_backup()
+        remote = backup_service.s3_repository('bucket')
+        assert remote.list_snapshots() == [second.backup_file]
+
+        # ローカルには1回目が残っている（個数で保持）が、S3 へは送り直さない
+        make_sqlite(source_db, 20, seed=2)
+        written = []
+        write = remote.storage.write
+
+        def recording_write(key, *args):
+            written.append(key)
+            return write(key, *args)
+
+        with patch.object(backup_service.timezone, 'now', return_value=later + timedelta(days=1)), \
+                patch.object(remote.storage, 'write', side_effect=recording_write):
+            third = backup_service.create_backup()
+        assert backup_repo.snapshot_key(first.backup_file) not in written
+        assert first.backup_file in backup_service.local_repository().list_snapshots()
+        assert remote.list_snapshots() == [second.backup_file, third.backup_file]
+        assert third.stats['stages']['upload']['bytes'] < first.stats['stages']['upload']['bytes'] / 4
+
+    def test_repository_retention(self, backup_dirs, source_db, config):
+        config.local_retention_count = 1
+        config.s3_enabled = False
+        config.save()
+        first = backup_service.create_backup()
+        with patch.object(backup_service.timezone, 'now',
+                          return_value=first.started_at.replace(year=first.started_at.year + 1)):
+            second = backup_service.create_backup()
+        assert backup_service.local_repository().list_snapshots() == [second.backup_file]
+        assert not second.s3_uploaded
+
+
+@pytest.mark.django_db
+class TestRestoreCommand:
+    def test_restore_and_refuse_overwrite(self, backup_dirs, source_db):
+        config = BackupConfig.load()
+        config.line_notify_enabled = False
+        config.s3_enabled = False
+        config.save()
+        history = backup_service.create_backup()
+
+        out = io.StringIO()
+        call_command('restore_backup', '--list', stdout=out)
+        assert history.backup_file in out.getvalue()
+
+        target = backup_dirs / 'r.sqlite3'
+        call_command('restore_backup', history.backup_file, '--output', str(target), stdout=io.StringIO())
+        assert target.exists()
+        with pytest.raises(CommandError):
+            call_command('restore_backup', '--output', str(target), stdout=io.StringIO())
+        with pytest.raises(CommandError):
+            call_command('restore_backup', 'missing', '--output', str(backup_dirs / 'x'), stdout=io.StringIO())
@@ -0,0 +1,308 @@
+"""
+Tests for the worker-resident Playwright browser pool.
+
+Covers:
+  - social_browser/services/browser_pool.py: BrowserPool, profile_lock, process_tree_rss_mb, get_pool
+  - social_browser/services/browser_service.py: browser_session (pooled)
+  - social_browser/services/x_browser_poster.py against a local static HTML stand-in (real Chromium)
+"""
+import functools
+import http.server
+import json
+import os
+import threading
+from unittest.mock import patch
+
+import pytest
+
+from social_browser.services import browser_pool
+from social_browser.services.browser_pool import BrowserPool, process_tree_rss_mb
+
+
+class FakePage:
+    def __init__(self, context):
+        self.context = context
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+class FakeContext:
+    def __init__(self, browser, options):
+        self.browser = browser
+        self.options = options
+        self.closed = False
+        self.pages = []
+
+    def new_page(self):
+        page = FakePage(self)
+        self.pages.append(page)
+        return page
+
+    def cookies(self):
+        if self.closed or not self.browser.connected:
+            raise RuntimeError("Target page, context or browser has been closed")
+        return []
+
+    def storage_state(self, path):
+        with open(path, "w") as f:
+            json.dump({"cookies": [], "origins": []}, f)
+
+    def close(self):
+        self.closed = True
+
+
+class FakeBrowser:
+    def __init__(self):
+        self.connected = True
+        self.contexts = []
+
+    def is_connected(self):
+        return self.connected
+
+    def new_context(self, **options):
+        context = FakeContext(self, options)
+        self.contexts.append(context)
+        return context
+
+    def close(self):
+        self.connected = False
+
+
+class FakePlaywright:
+    def __init__(self):
+        self.browsers = []
+        self.stopped = False
+        self.chromium = self
+
+    def launch(self, headless=True, args=None):
+        browser = FakeBrowser()
+        self.browsers.append(browser)
+        return browser
+
+    def stop(self):
+        self.stopped = True
+
+
+@pytest.fixture
+def fake_playwright():
+    return FakePlaywright()
+
+
+@pytest.fixture
+def pool(fake_playwright):
+    return BrowserPool(max_uses=3, max_rss_mb=1000, playwright_factory=lambda: fake_playwright,
+                       rss_probe=lambda: 100)
+
+
+@pytest.fixture
+def profile(tmp_path):
+    path = tmp_path / "profiles" / "1" / "x"
+    path.mkdir(parents=True)
+    return str(path)
+
+
+class TestBrowserPool:
+    def test_reuses_browser_and_context(self, pool, fake_playwright, profile):
+        for _ in range(2):
+            with pool.session(profile) as (page, context):
+                assert not page.closed
+        assert len(fake_playwright.browsers) == 1
+        browser = fake_playwright.browsers[0]
+        assert len(browser.contexts) == 1
+        assert all(p.closed for p in browser.contexts[0].pages)
+        assert os.path.exists(os.path.join(profile, "storage_state.json"))
+        assert pool.stats["launches"] == 1 and pool.stats["checkouts"] == 2
+
+    def test_context_uses_saved_storage_state(self, pool, fake_playwright, profile):
+        with pool.session(profile):
+            pass
+        pool.restart()
+        with pool.session(profile):
+            pass
+        context = fake_playwright.browsers[-1].contexts[0]
+        assert context.options["storage_state"] == os.path.join(profile, "storage_state.json")
+
+    def test_accounts_get_separate_contexts(self, pool, fake_playwright, tmp_path, profile):
+        other = str(tmp_path / "profiles" / "2" / "instagram")
+        with pool.session(profile) as (_, first):
+            pass
+        with pool.session(other, mobile=True) as (_, second):
+            pass
+        assert first is not second
+        assert second.options["is_mobile"] is True
+        assert "is_mobile" not in first.options
+
+    def test_recycles_after_max_uses(self, pool, fake_playwright, profile):
+        contexts = []
+        for _ in range(4):
+            with pool.session(profile) as (_, context):
+                contexts.append(context)
+        assert contexts[0] is contexts[2]
+        assert contexts[3] is not contexts[0]
+        assert contexts[0].closed
+        assert pool.stats["recycled"] == 1
+
+    def test_unhealthy_context_is_replaced(self, pool, profile):
+        with pool.session(profile) as (_, first):
+            pass
+        first.closed = True
+        with pool.session(profile) as (_, second):
+            pass
+        assert second is not first
+
+    def test_disconnected_browser_is_relaunched(self, pool, fake_playwright, profile):
+        with pool.session(profile):
+            pass
+        fake_playwright.browsers[0].connected = False
+        with pool.session(profile):
+            pass
+        assert len(fake_playwright.browsers) == 2
+
+    def test_failed_session_discards_context(self, pool, profile):
+        with pytest.raises(ValueError):
+            with pool.session(profile) as (_, first):
+                raise ValueError("selector not found")
+        assert first.closed
+        with pool.session(profile) as (_, second):
+            pass
+        assert second is not first
+
+    def test_memory_threshold_restarts_browser(self, fake_playwright, profile):
+        rss = [100]
+        pool = BrowserPool(max_rss_mb=500, playwright_factory=lambda: fake_playwright, rss_probe=lambda: rss[0])
+        with pool.session(profile):
+            pass
+        rss[0] = 900
+        with pool.session(profile):
+            pass
+        assert not fake_playwright.browsers[0].connected
+        rss[0] = 100
+        with pool.session(profile):
+            pass
+        assert len(fake_playwright.browsers) == 2
+        assert pool.stats["restarts"] == 1
+
+    def test_close_stops_playwright(self, pool, fake_playwright, profile):
+        with pool.session(profile):
+            pass
+        pool.close()
+        assert fake_playwright.stopped
+        assert not fake_playwright.browsers[0].connected
+
+    def test_same_account_is_serialised_across_workers(self, profile):
+        order = []
+
+        def worker():
+            with browser_pool.profile_lock(profile):
+                order.append("second")
+
+        with browser_pool.profile_lock(profile):
+            thread = threading.Thread(target=worker)
+            thread.start()
+            thread.join(0.2)
+            order.append("first")
+        thread.join(2)
+        assert order == ["first", "second"]
+
+
+class TestPoolHelpers:
+    def test_process_tree_rss(self):
+        if not os.path.isdir("/proc"):
+            pytest.skip("/proc is not available")
+        assert process_tree_rss_mb(1) >= 0
+
+    def test_run_in_pool_uses_dedicated_thread(self):
+        caller = threading.current_thread()
+        thread = browser_pool.run_in_pool(threading.current_thread)
+        assert thread is not caller
+        assert browser_pool.run_in_pool(threading.current_thread) is thread
+        assert not browser_pool.in_pool_thread()
+        assert browser_pool.run_in_pool(browser_pool.in_pool_thread)
+        with pytest.raises(ZeroDivisionError):
+            browser_pool.run_in_pool(lambda: 1 / 0)
+
+    def test_run_in_pool_disabled(self, settings):
+        settings.BROWSER_POOL_ENABLED = False
+        assert browser_pool.run_in_pool(threading.current_thread) is threading.current_thread()
+
+    def test_get_pool_outside_pool_thread(self):
+        with pytest.raises(RuntimeError):
+            browser_pool.get_pool()
+        first = browser_pool.run_in_pool(browser_pool.get_pool)
+        assert browser_pool.run_in_pool(browser_pool.get_pool) is first
+        assert browser_pool.run_in_pool(browser_pool.get_pool, headless=False) is not first
+
+    def test_browser_session_uses_pool_in_pool_thread(self, pool, profile):
+        from social_browser.services.browser_service import browser_session
+
+        def post():
+            with browser_session(profile) as (page, context):
+                return context
+
+        with patch("social_browser.services.browser_pool.get_pool", return_value=pool):
+            first = browser_pool.run_in_pool(post)
+            second = browser_pool.run_in_pool(post)
+        assert first is second
+        assert pool.stats["checkouts"] == 2 and pool.stats["launches"] == 1
+
+
+# ==============================
+# 実ブラウザ + ローカル静的 HTML（Chromium が無い環境ではスキップ）
+# ==============================
+
+COMPOSE_HTML = """<!doctype html>
+<html><body>
+<div data-testid="tweetTextarea_0" contenteditable="true" style="width:400px;height:80px"></div>
+<button data-testid="tweetButtonInline"
+  onclick="document.body.dataset.posted = document.querySelector('[data-testid=tweetTextarea_0]').innerText">
+  Post</button>
+</body></html>
+"""
+
+
+@pytest.fixture
+def static_site(tmp_path):
+    root = tmp_path / "site"
+    root.mkdir()
+    (root / "home.html").write_text(COMPOSE_HTML)
+    handler = functools.partial(http.server.SimpleHTTPRequestHandler, directory=str(root))
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+
+
+@pytest.fixture
+def real_pool():
+    pytest.importorskip("playwright.sync_api")
+    pool = browser_pool.run_in_pool(BrowserPool, max_uses=10)
+    try:
+        browser_pool.run_in_pool(pool._ensure_browser)
+    except Exception as e:
+        browser_pool.run_in_pool(pool.close)
+        pytest.skip(f"Chromium is not available: {e}")
+    yield pool
+    browser_pool.run_in_pool(pool.close)
+
+
+class TestRealBrowser:
+    def test_x_poster_against_static_stand_in(self, real_pool, static_site, profile):
+        from social_browser.services import x_browser_poster
+
+        with patch("social_browser.services.browser_pool.get_pool", return_value=real_pool), \
+                patch.object(x_browser_poster, "X_HOME_URL", f"{static_site}/home.html"), \
+                patch.object(x_browser_poster, "random_delay"), \
+                patch("social_browser.services.browser_service.random_delay"):
+            for text in ("first post", "second post"):
+                success, screenshot, error = browser_pool.run_in_pool(
+                    x_browser_poster.post_to_x_browser, text, profile,
+                )
+                assert success, error
+                assert os.path.exists(screenshot)
+
+        assert real_pool.stats["launches"] == 1
+        assert real_pool.stats["contexts"] == 1
+        assert real_pool.stats["checkouts"] == 2
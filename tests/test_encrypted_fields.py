@@ -0,0 +1,110 @@
+"""booking/fields.py (EncryptedCharField / CryptoProvider) のテスト"""
+import base64
+import hashlib
+from unittest.mock import patch
+
+import pytest
+from cryptography.fernet import Fernet
+from django.core.management import call_command
+
+from booking import fields
+from booking.models import SocialAccount
+
+
+def _stored(account, field):
+    """DB に保存されている暗号文をそのまま取得"""
+    from django.db import connection
+    table = SocialAccount._meta.db_table
+    with connection.cursor() as cursor:
+        cursor.execute(f'SELECT {field} FROM {table} WHERE id = %s', [account.pk])
+        return cursor.fetchone()[0]
+
+
+def _legacy_pbkdf2_token(secret, plaintext):
+    """キーID導入前の形式（PBKDF2 鍵・プレフィックス無し）"""
+    derived = hashlib.pbkdf2_hmac('sha256', secret.encode(), fields._KDF_SALT, 480_000, dklen=32)
+    return Fernet(base64.urlsafe_b64encode(derived)).encrypt(plaintext.encode()).decode()
+
+
+@pytest.fixture
+def account(store):
+    return SocialAccount.objects.create(
+        store=store, platform='x', account_name='enc',
+        access_token='access-1', refresh_token='refresh-1',
+    )
+
+
+class TestCryptoProvider:
+    def test_key_derived_once_per_secret(self, settings):
+        settings.SECRET_KEY = 'derive-once-secret'
+        with patch.object(fields.hashlib, 'pbkdf2_hmac', wraps=hashlib.pbkdf2_hmac) as kdf:
+            provider = fields.get_crypto_provider()
+            for i in range(20):
+                assert provider.decrypt(provider.encrypt(f'v{i}')) == f'v{i}'
+            assert fields.get_crypto_provider() is provider
+        assert kdf.call_count <= 1
+
+    def test_ciphertext_has_key_id_prefix(self, settings):
+        provider = fields.get_crypto_provider()
+        key_id, token = provider.split(provider.encrypt('hello'))
+        assert key_id == provider.current_key_id
+        assert token.startswith('gAAAA')
+
+    def test_rotation_reads_fallback_key(self, settings):
+        settings.SECRET_KEY = 'old-secret'
+        settings.SECRET_KEY_FALLBACKS = []
+        old_value = fields.get_crypto_provider().encrypt('rotated')
+
+        settings.SECRET_KEY = 'new-secret'
+        settings.SECRET_KEY_FALLBACKS = ['old-secret']
+        provider = fields.get_crypto_provider()
+        assert provider.decrypt(old_value) == 'rotated'
+        assert provider.needs_rotation(old_value)
+        assert not provider.needs_rotation(provider.encrypt('x'))
+
+    def test_unknown_key_id_returns_raw(self):
+        provider = fields.get_crypto_provider()
+        value = 'deadbeef:gAAAAAnot-a-token'
+        assert provider.decrypt(value) == value
+
+    def test_unprefixed_pbkdf2_and_legacy_values(self, settings):
+        provider = fields.get_crypto_provider()
+        pbkdf2_value = _legacy_pbkdf2_token(settings.SECRET_KEY, 'old-pbkdf2')
+        legacy_value = Fernet(fields._legacy_key(settings.SECRET_KEY)).encrypt(b'old-weak').decode()
+        assert provider.decrypt(pbkdf2_value) == 'old-pbkdf2'
+        assert provider.decrypt(legacy_value) == 'old-weak'
+        assert provider.decrypt('plain text') == 'plain text'
+
+    def test_decrypt_many_dedupes(self):
+        provider = fields.get_crypto_provider()
+        token = provider.encrypt('same')
+        with patch.object(provider, 'decrypt', wraps=provider.decrypt) as decrypt:
+            assert provider.decrypt_many([token, token, '', token]) == ['same', 'same', '', 'same']
+        assert decrypt.call_count == 2
+
+
+@pytest.mark.django_db
+class TestEncryptedCharField:
+    def test_stored_encrypted_with_key_id(self, account):
+        stored = _stored(account, 'access_token')
+        assert stored != 'access-1'
+        assert fields.CryptoProvider.split(stored)[0] == fields.get_crypto_provider().current_key_id
+        account.refresh_from_db()
+        assert account.access_token == 'access-1'
+
+    def test_decrypt_values(self, account):
+        values = fields.decrypt_values(SocialAccount.objects.all(), 'access_token', 'refresh_token')
+        assert values == {account.pk: {'access_token': 'access-1', 'refresh_token': 'refresh-1'}}
+
+    def test_rotate_command(self, account, settings):
+        old_key_id = fields.get_crypto_provider().current_key_id
+        settings.SECRET_KEY_FALLBACKS = [settings.SECRET_KEY]
+        settings.SECRET_KEY = 'rotated-secret'
+
+        call_command('rotate_encrypted_fields')
+
+        stored = _stored(account, 'refresh_token')
+        new_key_id = fields.CryptoProvider.split(stored)[0]
+        assert new_key_id == fields.get_crypto_provider().current_key_id != old_key_id
+        account.refresh_from_db()
+        assert (account.access_token, account.refresh_token) == ('access-1', 'refresh-1')
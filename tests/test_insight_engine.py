@@ -9,7 +9,9 @@ from booking.models import (
     Store, Staff, Product, Category, Order, OrderItem,
     Schedule, ShiftPeriod, ShiftAssignment, BusinessInsight,
 )
-from booking.services.insight_engine import generate_insights
+from booking.services.insight_engine import (
+    DEFAULT_INSIGHT_RULES, INSIGHT_KEY_FIELD, InsightFinding, InsightRule, generate_insights,
+)
 
 
 @pytest.fixture(autouse=True)
@@ -180,6 +182,94 @@ class TestCancellations:
         assert len(cust_insights) == 0
 
 
+class TestStaffing:
+    """Test staffing rule."""
+
+    @pytest.mark.django_db
+    def test_detects_understaffing(self, store):
+        user = User.objects.create_user(username='busy_staff', password='pass')
+        staff = Staff.objects.create(name='BusyStaff', store=store, user=user)
+        period = ShiftPeriod.objects.create(store=store, year_month=timezone.localdate().replace(day=1))
+        tomorrow = timezone.now() + timedelta(days=1)
+        ShiftAssignment.objects.create(
+            period=period, staff=staff, date=tomorrow.date(), start_hour=9, end_hour=17,
+        )
+        for i in range(6):
+            Schedule.objects.create(
+                staff=staff, start=tomorrow + timedelta(minutes=i),
+                end=tomorrow + timedelta(hours=1), is_temporary=False,
+            )
+        insights = generate_insights(store=store)
+        staffing = [i for i in insights if i.category == 'staffing']
+        assert len(staffing) == 1
+        assert staffing[0].data['reservations'] == 6
+        assert staffing[0].data['shifts'] == 1
+
+
+class TestInsightRuleEngine:
+    """Test batching, de-duplication and custom rules."""
+
+    @pytest.mark.django_db
+    def test_open_insight_is_not_duplicated(self, store, category):
+        Product.objects.create(
+            name='LowItem', sku='LOW-1', store=store, category=category,
+            price=500, stock=2, low_stock_threshold=10, is_active=True,
+        )
+        first = generate_insights(store=store)
+        assert [i.data[INSIGHT_KEY_FIELD] for i in first] == [f'low_stock:{first[0].data["product_id"]}:warning']
+        assert generate_insights(store=store) == []
+
+        # 既読にすると再検出される
+        BusinessInsight.objects.update(is_read=True)
+        assert len(generate_insights(store=store)) == 1
+
+    @pytest.mark.django_db
+    def test_escalation_creates_new_insight(self, store, category):
+        product = Product.objects.create(
+            name='LowItem', sku='LOW-1', store=store, category=category,
+            price=500, stock=2, low_stock_threshold=10, is_active=True,
+        )
+        generate_insights(store=store)
+        Product.objects.filter(pk=product.pk).update(stock=0)
+        insights = generate_insights(store=store)
+        assert [i.severity for i in insights] == ['critical']
+
+    @pytest.mark.django_db
+    def test_query_count_does_not_grow_with_stores(self, category, django_assert_num_queries):
+        for n in range(5):
+            s = Store.objects.create(name=f'Batch{n}')
+            Product.objects.create(
+                name=f'Low{n}', sku=f'LOWB-{n}', store=s, category=category,
+                price=500, stock=1, low_stock_threshold=10, is_active=True,
+            )
+        # 未読取得1 + ルールごと1 + bulk_create1
+        with django_assert_num_queries(1 + len(DEFAULT_INSIGHT_RULES) + 1):
+            created = generate_insights(store=None)
+        assert len({i.store_id for i in created}) == 5
+
+    @pytest.mark.django_db
+    def test_custom_rule(self, store):
+        rule = InsightRule(
+            name='always', category='menu',
+            aggregate=lambda store_ids, now: {store_id: 1 for store_id in store_ids},
+            evaluate=lambda value, now: [InsightFinding(key='always', severity='info', title='T', message='M')],
+        )
+        created = generate_insights(store=store, rules=[rule])
+        assert [(i.category, i.title) for i in created] == [('menu', 'T')]
+
+    @pytest.mark.django_db
+    def test_failing_rule_does_not_block_others(self, store, category):
+        def broken(store_ids, now):
+            raise RuntimeError('boom')
+
+        Product.objects.create(
+            name='LowItem', sku='LOW-1', store=store, category=category,
+            price=500, stock=2, low_stock_threshold=10, is_active=True,
+        )
+        rules = (InsightRule('broken', 'sales', broken, lambda v, now: []), *DEFAULT_INSIGHT_RULES)
+        assert len(generate_insights(store=store, rules=rules)) == 1
+
+
 class TestBusinessInsightModel:
     """Test the BusinessInsight model itself."""
 
@@ -0,0 +1,293 @@
+"""
+Tests for the batched IoT uplink.
+
+Covers:
+  - MB_IoT_device_main/uplink.py: encode_batch, reading_from_event, BatchUplink
+  - booking/services/iot_batch.py: decode_batch
+  - booking/views_iot_api.py: IoTEventAPIView batch path (application/x-iot-batch)
+"""
+import json
+import time
+import zlib
+from unittest.mock import patch
+
+import pytest
+
+from MB_IoT_device_main import uplink
+from MB_IoT_device_main.outbox import RingOutbox
+from booking.models import IoTEvent
+from booking.services.iot_batch import BatchDecodeError, decode_batch
+
+RAW_API_KEY = "test-api-key-12345"
+EVENTS_URL = "/api/iot/events/"
+
+
+def _readings(n, t0=None, step=30):
+    t0 = int(time.time()) - n * step if t0 is None else t0
+    return [
+        {
+            "ts": t0 + i * step,
+            "mq9": 120.5 + i * 0.25,
+            "light": 400 + i,
+            "sound": 50.0,
+            "pir": i % 2 == 0,
+            "temp": 22.4,
+            "hum": None if i == 1 else 41.0,
+        }
+        for i in range(n)
+    ]
+
+
+def _client_post(client):
+    """BatchUplink の post() を Django テストクライアントで実装する"""
+    def post(body, headers):
+        extra = {"HTTP_X_API_KEY": RAW_API_KEY}
+        if "X-Batch-Encoding" in headers:
+            extra["HTTP_X_BATCH_ENCODING"] = headers["X-Batch-Encoding"]
+        response = client.post(EVENTS_URL, data=body, content_type=headers["Content-Type"], **extra)
+        return response.status_code
+    return post
+
+
+class FakeClock:
+    def __init__(self, now=1000.0, step=0.0):
+        self.now = now
+        self.step = step
+
+    def __call__(self):
+        value = self.now
+        self.now += self.step
+        return value
+
+
+class FixedRandom:
+    def __init__(self, value):
+        self.value = value
+
+    def random(self):
+        return self.value
+
+
+# ==============================
+# encode / decode
+# ==============================
+
+class TestEnvelope:
+    def test_round_trip(self):
+        readings = _readings(20, t0=1_700_000_000)
+        body, headers = uplink.encode_batch("dev-1", readings)
+        assert headers["Content-Type"] == uplink.BATCH_CONTENT_TYPE
+        assert headers["X-Batch-Encoding"] == "zlib"
+
+        batch = decode_batch(body, headers["X-Batch-Encoding"])
+        assert batch["device"] == "dev-1"
+        assert batch["event_type"] == "sensor"
+        assert len(batch["readings"]) == 20
+        for sent, got in zip(readings, batch["readings"]):
+            assert got["ts"] == sent["ts"]
+            assert got["mq9"] == pytest.approx(sent["mq9"])
+            assert got["light"] == sent["light"]
+            assert got["pir"] == (1 if sent["pir"] else 0)
+            assert got["hum"] == sent["hum"]
+
+    def test_compressed_is_smaller_than_json(self):
+        readings = _readings(100)
+        body, _ = uplink.encode_batch("dev-1", readings)
+        assert len(body) < len(json.dumps(readings)) / 4
+
+    def test_uncompressed(self):
+        body, headers = uplink.encode_batch("dev-1", _readings(3), compress=False)
+        assert "X-Batch-Encoding" not in headers
+        assert len(decode_batch(body)["readings"]) == 3
+
+    @pytest.mark.parametrize("body,encoding", [
+        (b"not json", None),
+        (b'{"v": 2, "fields": [], "rows": []}', None),
+        (b'{"v": 1, "fields": ["mq9"], "rows": [[0]]}', None),
+        (b'{"v": 1, "fields": ["mq9"], "rows": [[0, 1.5]]}', None),
+        (b"garbage", "zlib"),
+        (b"{}", "br"),
+    ])
+    def test_invalid_envelope(self, body, encoding):
+        with pytest.raises(BatchDecodeError):
+            decode_batch(body, encoding)
+
+    def test_decompression_limit(self):
+        bomb = zlib.compress(b" " * (10 * 1024 * 1024))
+        with pytest.raises(BatchDecodeError):
+            decode_batch(bomb, "zlib")
+
+    def test_reading_from_event(self):
+        event = {"device": "dev-1", "event_type": "sensor", "payload": {"sensors": {"mq9": 1.5, "ts": 10}}}
+        assert uplink.reading_from_event(event)["mq9"] == 1.5
+        assert uplink.reading_from_event(event)["ts"] == 10
+        assert uplink.reading_from_event({"event_type": "ir_learned", "payload": {}}) is None
+
+        events = [event, event, {"event_type": "ir_learned"}, event]
+        assert len(uplink.leading_readings(events, 10)) == 2
+        assert len(uplink.leading_readings(events, 1)) == 1
+
+
+# ==============================
+# Django API
+# ==============================
+
+@pytest.mark.django_db
+class TestBatchAPI:
+    def test_batch_creates_events_with_device_time(self, api_client, iot_device):
+        readings = _readings(12, step=60)
+        body, headers = uplink.encode_batch(iot_device.external_id, readings)
+        with patch("booking.ventilation_control.check_ventilation_rules") as vent:
+            status = _client_post(api_client)(body, headers)
+
+        assert status == 201
+        events = list(IoTEvent.objects.filter(device=iot_device).order_by("id"))
+        assert len(events) == 12
+        assert [round(e.created_at.timestamp()) for e in events] == [r["ts"] for r in readings]
+        assert events[3].mq9_value == pytest.approx(readings[3]["mq9"])
+        assert events[0].pir_triggered is True and events[1].pir_triggered is False
+        assert json.loads(events[1].payload)["hum"] is None
+        # 換気判定はバッチ内の最大値で1回だけ
+        vent.assert_called_once()
+        assert vent.call_args[0][1] == pytest.approx(max(r["mq9"] for r in readings))
+
+        iot_device.refresh_from_db()
+        assert iot_device.last_seen_at is not None
+
+    def test_spike_in_middle_of_batch_is_evaluated(self, api_client, iot_device):
+        readings = _readings(5)
+        readings[2]["mq9"] = 900.0
+        readings[-1]["mq9"] = None
+        body, headers = uplink.encode_batch(iot_device.external_id, readings, event_type="mq9_alarm")
+        with patch("booking.ventilation_control.check_ventilation_rules") as vent, \
+                patch("booking.views_iot_api._send_mq9_alert") as alert:
+            assert _client_post(api_client)(body, headers) == 201
+
+        assert vent.call_args[0][1] == pytest.approx(900.0)
+        alert.assert_called_once()
+        assert alert.call_args[0][1] == pytest.approx(900.0)
+
+    def test_unsynchronised_clock_uses_receive_time(self, api_client, iot_device):
+        body, headers = uplink.encode_batch(iot_device.external_id, _readings(2, t0=1000))
+        assert _client_post(api_client)(body, headers) == 201
+        for evt in IoTEvent.objects.filter(device=iot_device):
+            assert abs(evt.created_at.timestamp() - time.time()) < 60
+
+    def test_invalid_batch_returns_400(self, api_client, iot_device):
+        response = api_client.post(
+            EVENTS_URL, data=b"\x00\x01", content_type=uplink.BATCH_CONTENT_TYPE,
+            HTTP_X_API_KEY=RAW_API_KEY, HTTP_X_BATCH_ENCODING="zlib",
+        )
+        assert response.status_code == 400
+        assert IoTEvent.objects.count() == 0
+
+    def test_invalid_event_type_returns_400(self, api_client, iot_device):
+        body, headers = uplink.encode_batch(iot_device.external_id, _readings(2), event_type="ir_learned")
+        assert _client_post(api_client)(body, headers) == 400
+
+    def test_wrong_key_returns_404(self, api_client, iot_device):
+        body, headers = uplink.encode_batch(iot_device.external_id, _readings(2))
+        response = api_client.post(
+            EVENTS_URL, data=body, content_type=headers["Content-Type"],
+            HTTP_X_API_KEY="wrong", HTTP_X_BATCH_ENCODING=headers["X-Batch-Encoding"],
+        )
+        assert response.status_code == 404
+
+
+# ==============================
+# BatchUplink
+# ==============================
+
+@pytest.mark.django_db
+class TestBatchUplinkEndToEnd:
+    def test_drains_outbox_into_events(self, tmp_path, api_client, iot_device):
+        box = RingOutbox(str(tmp_path / "outbox"))
+        link = uplink.BatchUplink(box, _client_post(api_client), iot_device.external_id,
+                                  initial_batch=4, clock=FakeClock())
+        for reading in _readings(30):
+            link.add(reading)
+
+        sent = []
+        while link.pending():
+            sent.append(link.flush())
+        # 成功のたびにバッチサイズが倍になる
+        assert sent == [4, 8, 16, 2]
+        assert IoTEvent.objects.filter(device=iot_device).count() == 30
+
+
+class TestBatchUplink:
+    def _link(self, tmp_path, statuses, **kwargs):
+        box = RingOutbox(str(tmp_path / "outbox"))
+        calls = []
+
+        def post(body, headers):
+            calls.append(decode_batch(body, headers.get("X-Batch-Encoding")))
+            status = statuses.pop(0)
+            if isinstance(status, Exception):
+                raise status
+            return status
+
+        link = uplink.BatchUplink(box, post, "dev-1", **kwargs)
+        for reading in _readings(50):
+            link.add(reading)
+        return link, calls
+
+    def test_backoff_is_exponential_with_jitter(self, tmp_path):
+        link, calls = self._link(
+            tmp_path, [503, OSError("timeout"), 0, 503], initial_batch=8,
+            base_backoff=10, max_backoff=25, clock=FakeClock(now=0), rng=FixedRandom(0.5),
+        )
+        delays = []
+        now = 0
+        for _ in range(4):
+            assert link.flush(now=now) == 0
+            delays.append(link.next_attempt - now)
+            # バックオフ中は送信しない
+            assert link.flush(now=now + 0.1) == 0
+            now = link.next_attempt
+        # 遅延 = d/2 + rng*d/2（d = 10, 20, 25 上限, 25）
+        assert delays == pytest.approx([7.5, 15.0, 18.75, 18.75])
+        assert len(calls) == 4
+        assert link.pending() == 50
+        assert link.batch_size == 1
+
+    def test_jitter_spreads_retries(self, tmp_path):
+        (tmp_path / "a").mkdir()
+        (tmp_path / "b").mkdir()
+        low, _ = self._link(tmp_path / "a", [503], base_backoff=10, clock=FakeClock(now=0), rng=FixedRandom(0.0))
+        high, _ = self._link(tmp_path / "b", [503], base_backoff=10, clock=FakeClock(now=0), rng=FixedRandom(0.99))
+        low.flush(now=0)
+        high.flush(now=0)
+        assert low.next_attempt == pytest.approx(5.0)
+        assert high.next_attempt == pytest.approx(9.95)
+
+    def test_success_resets_backoff_and_slow_send_shrinks(self, tmp_path):
+        clock = FakeClock(now=0)
+        link, calls = self._link(tmp_path, [503, 201, 201], initial_batch=8, clock=clock, rng=FixedRandom(0))
+        link.flush(now=0)
+        assert link.batch_size == 4
+        assert link.flush(now=link.next_attempt) == 4
+        assert link.failures == 0 and link.backoff_remaining(now=link.next_attempt) == 0
+        assert link.batch_size == 8
+
+        clock.step = uplink.SLOW_SEND_SECONDS + 1
+        assert link.flush(now=1000) == 8
+        assert link.batch_size == 4
+        assert link.pending() == 50 - 12
+
+    def test_weak_signal_sends_smaller_batches(self, tmp_path):
+        link, calls = self._link(tmp_path, [201], initial_batch=20, clock=FakeClock())
+        assert link.flush(rssi=uplink.WEAK_RSSI - 10) == 5
+        assert len(calls[0]["readings"]) == 5
+
+    def test_rejected_batch_is_dropped(self, tmp_path):
+        link, _ = self._link(tmp_path, [400], initial_batch=10, clock=FakeClock())
+        assert link.flush() == 0
+        assert link.pending() == 40
+        assert link.next_attempt == 0
+
+    def test_payload_too_large_halves_batch(self, tmp_path):
+        link, _ = self._link(tmp_path, [413, 201], initial_batch=16, clock=FakeClock(now=0), rng=FixedRandom(0))
+        link.flush(now=0)
+        assert link.pending() == 50
+        assert link.flush(now=link.next_attempt) == 4
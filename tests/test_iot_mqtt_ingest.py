@@ -0,0 +1,290 @@
+"""
+Tests for the MQTT ingest worker.
+
+Covers:
+  - booking/services/iot_mqtt_ingest.py: IoTIngestBridge, run_bridge, device_id_from_topic
+  - booking/management/commands/ingest_iot_mqtt.py
+"""
+import itertools
+import json
+import time
+from collections import deque
+from io import StringIO
+from types import SimpleNamespace
+from unittest.mock import patch
+
+import pytest
+from django.core.management import call_command
+from django.core.management.base import CommandError
+
+from MB_IoT_device_main import config as device_config
+from MB_IoT_device_main import signing
+from booking.models import IoTEvent
+from booking.services.iot_mqtt_ingest import IoTIngestBridge, device_id_from_topic, run_bridge
+
+
+class InProcessBroker:
+    """テスト用のブローカー代替（+ / # ワイルドカード対応、同期配送）"""
+
+    def __init__(self):
+        self.clients = []
+
+    @staticmethod
+    def matches(pattern, topic):
+        p_parts, t_parts = pattern.split('/'), topic.split('/')
+        for i, part in enumerate(p_parts):
+            if part == '#':
+                return True
+            if i >= len(t_parts) or (part != '+' and part != t_parts[i]):
+                return False
+        return len(p_parts) == len(t_parts)
+
+    def publish(self, topic, payload):
+        if isinstance(payload, (dict, list)):
+            payload = json.dumps(payload)
+        if isinstance(payload, str):
+            payload = payload.encode()
+        for client in self.clients:
+            if any(self.matches(sub, topic) for sub in client.subscriptions):
+                client.inbox.append(SimpleNamespace(topic=topic, payload=payload))
+
+
+class FakeClient:
+    """paho-mqtt Client 互換の最小実装"""
+
+    def __init__(self, broker, stop_when_idle=False):
+        self.broker = broker
+        self.subscriptions = []
+        self.inbox = deque()
+        self.connected = False
+        self.stop_when_idle = stop_when_idle
+        self.on_connect = None
+        self.on_message = None
+        broker.clients.append(self)
+
+    def subscribe(self, topic, qos=0):
+        self.subscriptions.append(topic)
+
+    def loop(self, timeout=1.0):
+        if not self.connected:
+            self.connected = True
+            self.on_connect(self, None, {}, 0, None)
+            return 0
+        if not self.inbox and self.stop_when_idle:
+            raise KeyboardInterrupt
+        while self.inbox:
+            self.on_message(self, None, self.inbox.popleft())
+        return 0
+
+    def disconnect(self):
+        self.connected = False
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+RAW_API_KEY = "test-api-key-12345"
+# 端末の ts（メッセージごとに増える。リプレイ判定に使われる）
+_ts = itertools.count(int(time.time()) - 120)
+
+
+def _signed(body, api_key=RAW_API_KEY):
+    body.setdefault("ts", next(_ts))
+    return signing.sign_message(api_key, body)
+
+
+def _message(mq9=100.0, **extra):
+    return _signed({"event_type": "sensor", "mq9": mq9, "light": 300, "pir": 1, **extra})
+
+
+def _topic(device):
+    return f"devices/{device.external_id}/sensors"
+
+
+def test_device_id_from_topic():
+    assert device_id_from_topic("devices/pico-1/sensors") == "pico-1"
+    assert device_id_from_topic(device_config.TOPIC_SENSOR) == device_config.DEVICE_ID
+    assert device_id_from_topic("devices//sensors") is None
+    assert device_id_from_topic(device_config.TOPIC_STATUS) is None
+    assert device_id_from_topic("django/events") is None
+
+
+@pytest.mark.django_db
+class TestIngestBridge:
+    def test_micro_batches_by_size(self, iot_device):
+        bridge = IoTIngestBridge(batch_size=5, flush_interval=60, clock=FakeClock())
+        with patch("booking.ventilation_control.check_ventilation_rules") as vent:
+            for i in range(12):
+                assert bridge.handle_message(_topic(iot_device), json.dumps(_message(mq9=100 + i)).encode())
+
+        assert IoTEvent.objects.filter(device=iot_device).count() == 10
+        assert bridge.pending_count == 2
+        # 換気判定はバッチごとに1回（最大値で）
+        assert vent.call_count == 2
+        assert vent.call_args[0][1] == 109.0
+
+        bridge.flush()
+        assert IoTEvent.objects.filter(device=iot_device).count() == 12
+        assert bridge.stats == {"received": 12, "stored": 12, "rejected": 0, "batches": 3}
+
+    def test_flush_interval(self, iot_device):
+        clock = FakeClock()
+        bridge = IoTIngestBridge(batch_size=100, flush_interval=2, clock=clock)
+        bridge.handle_message(_topic(iot_device), json.dumps(_message()).encode())
+        assert not bridge.due()
+        clock.now = 2.5
+        assert bridge.due()
+
+    def test_values_are_validated(self, iot_device):
+        bridge = IoTIngestBridge(clock=FakeClock())
+        bridge.handle_message(_topic(iot_device), json.dumps(
+            _message(mq9=-5, payload={"sensors": {"light": 12.5, "temp": 999}})
+        ).encode())
+        bridge.flush()
+        evt = IoTEvent.objects.get(device=iot_device)
+        assert evt.mq9_value is None
+        assert evt.light_value == 300
+        assert evt.pir_triggered is True
+        assert json.loads(evt.payload)["temp"] is None
+
+    def test_firmware_sensor_message(self, iot_device):
+        """main_aws_mqtt.py が config.TOPIC_SENSOR に publish する形そのまま（API キーは載せず署名のみ）"""
+        iot_device.external_id = device_config.DEVICE_ID
+        iot_device.save(update_fields=["external_id"])
+        ts = int(time.time()) - 30
+        mqtt_payload = {
+            "device": device_config.DEVICE_ID,
+            "mq9": 182,
+            "light": 512,
+            "sound": 37,
+            "pir": True,
+            "temp": 22.5,
+            "hum": None,
+            "ts": ts,
+        }
+        message = signing.sign_message(RAW_API_KEY, mqtt_payload)
+        assert RAW_API_KEY not in json.dumps(message)
+        bridge = IoTIngestBridge(clock=FakeClock())
+        assert bridge.handle_message(device_config.TOPIC_SENSOR, json.dumps(message).encode())
+        bridge.flush()
+
+        evt = IoTEvent.objects.get(device=iot_device)
+        assert evt.event_type == "sensor"
+        assert (evt.mq9_value, evt.light_value, evt.sound_value, evt.pir_triggered) == (182, 512, 37, True)
+        assert round(evt.created_at.timestamp()) == ts
+        assert json.loads(evt.payload)["temp"] == 22.5
+
+    @pytest.mark.parametrize("topic_suffix,message", [
+        ("sensors", {"mq9": 1, "ts": int(time.time())}),  # 署名なし（API キー未設定の端末）
+        ("sensors", _signed({"mq9": 1}, api_key="wrong-key")),
+        ("sensors", dict(_signed({"mq9": 1}), body=json.dumps({"mq9": 999, "ts": int(time.time())}))),
+        ("sensors", _signed({"event_type": "ir_learned"})),
+        ("sensors", _signed({"device": "other-device", "mq9": 1})),
+        ("sensors", _signed({"mq9": 1, "ts": int(time.time()) - 3600})),
+        ("sensors", signing.sign_message(RAW_API_KEY, {"mq9": 1})),  # ts なし
+        ("status", _signed({"mq9": 1})),
+        ("events", _signed({"mq9": 1})),
+    ])
+    def test_rejected(self, iot_device, topic_suffix, message):
+        bridge = IoTIngestBridge(clock=FakeClock())
+        topic = f"devices/{iot_device.external_id}/{topic_suffix}"
+        assert bridge.handle_message(topic, json.dumps(message).encode()) is False
+        assert bridge.handle_message(topic, b"{not json") is False
+        bridge.flush()
+        assert IoTEvent.objects.count() == 0
+        assert bridge.stats["rejected"] == 2
+
+    def test_replayed_message_is_rejected(self, iot_device):
+        bridge = IoTIngestBridge(clock=FakeClock())
+        alarm = json.dumps(_message(mq9=900, event_type="mq9_alarm")).encode()
+        assert bridge.handle_message(_topic(iot_device), alarm)
+        assert bridge.handle_message(_topic(iot_device), alarm) is False
+        bridge.flush()
+        assert IoTEvent.objects.filter(device=iot_device).count() == 1
+
+    def test_unsynchronised_device_clock_is_accepted(self, iot_device):
+        bridge = IoTIngestBridge(clock=FakeClock())
+        for ts in (1000, 1030):
+            message = _signed({"mq9": 1, "ts": ts})
+            assert bridge.handle_message(_topic(iot_device), json.dumps(message).encode())
+
+    def test_unknown_device_is_rejected(self, iot_device):
+        bridge = IoTIngestBridge(clock=FakeClock())
+        assert bridge.handle_message("devices/unknown/sensors", json.dumps(_message()).encode()) is False
+        bridge.flush()
+        assert IoTEvent.objects.count() == 0
+
+    def test_device_lookup_is_cached(self, iot_device, django_assert_num_queries):
+        bridge = IoTIngestBridge(batch_size=100, clock=FakeClock())
+        bridge.handle_message(_topic(iot_device), json.dumps(_message()).encode())
+        with django_assert_num_queries(0):
+            for _ in range(5):
+                bridge.handle_message(_topic(iot_device), json.dumps(_message()).encode())
+
+    def test_mq9_alarm_alerts_once_per_batch(self, iot_device):
+        bridge = IoTIngestBridge(clock=FakeClock())
+        with patch("booking.views_iot_api._send_mq9_alert") as alert:
+            for mq9 in (400, 500, 450):
+                bridge.handle_message(_topic(iot_device), json.dumps(_message(mq9=mq9, event_type="mq9_alarm")).encode())
+            bridge.flush()
+        alert.assert_called_once()
+        assert alert.call_args[0][1] == 500
+
+
+@pytest.mark.django_db
+class TestRunBridge:
+    def test_in_process_broker(self, iot_device):
+        broker = InProcessBroker()
+        client = FakeClient(broker)
+        bridge = IoTIngestBridge(batch_size=50, flush_interval=0, clock=FakeClock())
+
+        run_bridge(client, bridge, max_loops=1)
+        assert client.subscriptions == ["devices/+/sensors"]
+        for i in range(20):
+            broker.publish(_topic(iot_device), _message(mq9=50 + i))
+        broker.publish("other/topic", _message())
+        broker.publish(f"devices/{iot_device.external_id}/status", _message())
+        stats = run_bridge(client, bridge, max_loops=1)
+
+        assert stats["received"] == 20
+        assert IoTEvent.objects.filter(device=iot_device).count() == 20
+
+    def test_command(self, iot_device):
+        broker = InProcessBroker()
+        client = FakeClient(broker, stop_when_idle=True)
+        client.connected = True
+        client.subscriptions.append("devices/+/sensors")
+        for _ in range(3):
+            broker.publish(_topic(iot_device), _message())
+
+        out = StringIO()
+        with patch("booking.management.commands.ingest_iot_mqtt.Command._client", return_value=client):
+            call_command("ingest_iot_mqtt", "--flush-interval", "60", "--insecure", stdout=out)
+
+        assert IoTEvent.objects.filter(device=iot_device).count() == 3
+        assert "保存 3件" in out.getvalue()
+
+    @pytest.mark.parametrize("args", [
+        [],
+        ["--tls"],
+        ["--username", "ingest", "--password", "pw"],
+        ["--tls", "--cert", "client.pem"],
+    ])
+    def test_command_requires_tls_and_credentials(self, args):
+        with patch("booking.management.commands.ingest_iot_mqtt.Command._client") as client:
+            with pytest.raises(CommandError, match="--insecure"):
+                call_command("ingest_iot_mqtt", *args, stdout=StringIO())
+        client.assert_not_called()
+
+    @pytest.mark.parametrize("args", [
+        ["--tls", "--username", "ingest", "--password", "pw"],
+        ["--tls", "--cert", "client.pem", "--key", "client.key"],
+    ])
+    def test_command_starts_with_tls_and_credentials(self, args):
+        client = FakeClient(InProcessBroker(), stop_when_idle=True)
+        client.connected = True
+        with patch("booking.management.commands.ingest_iot_mqtt.Command._client", return_value=client):
+            call_command("ingest_iot_mqtt", *args, stdout=StringIO())
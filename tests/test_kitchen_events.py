@@ -0,0 +1,172 @@
+"""Tests for kitchen display live events (live_events + kitchen_events)."""
+import asyncio
+import json
+
+import pytest
+from django.core.cache import cache
+
+from booking.models import Order, OrderItem
+from booking.services import kitchen_events, live_events
+
+
+@pytest.fixture(autouse=True)
+def clear_cache():
+    cache.clear()
+    yield
+    cache.clear()
+
+
+class TestLiveEvents:
+
+    def test_events_since_returns_only_newer_events(self):
+        live_events.publish('t', 'order', {'n': 1})
+        live_events.publish('t', 'order', {'n': 2})
+        live_events.publish('t', 'order', {'n': 3})
+
+        seq, events, resync = live_events.events_since('t', 1)
+
+        assert seq == 3
+        assert resync is False
+        assert [e['data']['n'] for e in events] == [2, 3]
+
+    def test_up_to_date_returns_nothing(self):
+        live_events.publish('t', 'order', {})
+        assert live_events.events_since('t', 1) == (1, [], False)
+
+    def test_initial_request_returns_current_seq_without_resync(self):
+        live_events.publish('t', 'order', {})
+        assert live_events.events_since('t', None) == (1, [], False)
+
+    def test_missing_event_requests_resync(self):
+        live_events.publish('t', 'order', {})
+        live_events.publish('t', 'order', {})
+        cache.delete(live_events._event_key('t', 2))
+
+        seq, events, resync = live_events.events_since('t', 0)
+        assert (seq, events, resync) == (2, [], True)
+
+    def test_seq_ahead_of_server_requests_resync(self):
+        """キャッシュ消去で連番が巻き戻った場合"""
+        seq, events, resync = live_events.events_since('t', 5)
+        assert (seq, resync) == (0, True)
+
+    def test_backlog_overflow_requests_resync(self):
+        for _ in range(live_events.MAX_BACKLOG + 1):
+            live_events.publish('t', 'order', {})
+        assert live_events.events_since('t', 0)[2] is True
+
+    def test_wait_returns_immediately_when_events_pending(self):
+        live_events.publish('t', 'order', {'n': 1})
+        seq, events, _ = live_events.wait_for_events('t', 0, timeout=30)
+        assert seq == 1
+        assert len(events) == 1
+
+    def test_wait_times_out_empty(self):
+        assert live_events.wait_for_events('t', 0, timeout=0) == (0, [], False)
+
+    def test_stream_yields_sse_frames(self):
+        live_events.publish('t', 'order', {'n': 1})
+
+        async def first_frame():
+            gen = live_events.stream('t', 0, max_duration=5)
+            try:
+                return await gen.__anext__()
+            finally:
+                await gen.aclose()
+
+        frame = asyncio.run(first_frame())
+        assert frame == 'id: 1\nevent: order\ndata: {"n": 1}\n\n'
+
+
+@pytest.mark.django_db
+class TestKitchenEvents:
+
+    def _events(self, store):
+        return live_events.events_since(kitchen_events.topic(store.id), 0)[1]
+
+    def test_item_status_change_publishes_order_card(
+        self, admin_client, store, order_item, django_capture_on_commit_callbacks,
+    ):
+        with django_capture_on_commit_callbacks(execute=True):
+            resp = admin_client.put(
+                f'/api/pos/order-item/{order_item.id}/status/',
+                data=json.dumps({'status': 'PREPARING'}),
+                content_type='application/json',
+            )
+        assert resp.status_code == 200
+
+        events = self._events(store)
+        assert len(events) == 1
+        data = events[0]['data']
+        assert events[0]['type'] == 'order'
+        assert data['order_id'] == order_item.order_id
+        assert data['status'] == Order.STATUS_OPEN
+        assert f'data-order-id="{order_item.order_id}"' in data['html']
+        assert 'btn-serve' in data['html']
+
+    def test_complete_publishes_closed_card(
+        self, admin_client, store, order_item, django_capture_on_commit_callbacks,
+    ):
+        with django_capture_on_commit_callbacks(execute=True):
+            admin_client.post(f'/api/pos/order/{order_item.order_id}/complete/')
+
+        data = self._events(store)[0]['data']
+        assert data['status'] == Order.STATUS_CLOSED
+        assert 'closed-card' in data['html']
+
+    def test_table_order_publishes_new_order(
+        self, store, product, table_seat, django_capture_on_commit_callbacks,
+    ):
+        from rest_framework.test import APIClient
+
+        with django_capture_on_commit_callbacks(execute=True):
+            resp = APIClient().post(
+                f'/api/table/{table_seat.id}/order/create/',
+                {'items': [{'product_id': product.id, 'qty': 1}]},
+                format='json',
+            )
+        assert resp.status_code == 201
+
+        events = self._events(store)
+        assert [e['data']['order_id'] for e in events] == [resp.data['order_id']]
+        assert product.name in events[0]['data']['html']
+
+    def test_ec_orders_are_not_published(self, store, django_capture_on_commit_callbacks):
+        order = Order.objects.create(store=store, status=Order.STATUS_OPEN, channel='ec')
+        with django_capture_on_commit_callbacks(execute=True):
+            kitchen_events.publish_order(order.id)
+        assert self._events(store) == []
+
+    def test_long_poll_returns_events_since(self, admin_client, store, order_item):
+        kitchen_events_topic = kitchen_events.topic(store.id)
+        live_events.publish(kitchen_events_topic, 'order', {'order_id': order_item.order_id})
+
+        resp = admin_client.get(f'/api/pos/kitchen-events/?store_id={store.id}&since=0')
+
+        payload = resp.json()
+        assert payload['seq'] == 1
+        assert payload['resync'] is False
+        assert payload['events'][0]['data'] == {'order_id': order_item.order_id}
+
+    def test_fragment_reports_event_seq(self, admin_client, store, order_item):
+        live_events.publish(kitchen_events.topic(store.id), 'order', {})
+        resp = admin_client.get(f'/api/pos/kitchen-orders/?store_id={store.id}')
+        assert resp['X-Kitchen-Seq'] == '1'
+        assert f'data-order-id="{order_item.order_id}"' in resp.content.decode()
+
+    def test_stream_rejects_wsgi_requests(self, admin_client, store):
+        resp = admin_client.get(f'/api/pos/kitchen-events/stream/?store_id={store.id}')
+        assert resp.status_code == 501
+
+    def test_rolled_back_change_is_not_published(
+        self, store, order_item, django_capture_on_commit_callbacks,
+    ):
+        from django.db import transaction
+
+        with django_capture_on_commit_callbacks(execute=True):
+            with pytest.raises(RuntimeError):
+                with transaction.atomic():
+                    OrderItem.objects.filter(pk=order_item.pk).update(status='SERVED')
+                    kitchen_events.publish_order(order_item.order_id)
+                    raise RuntimeError
+        assert self._events(store) == []
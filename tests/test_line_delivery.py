@@ -0,0 +1,185 @@
+"""
+tests/test_line_delivery.py
+Tests for booking/services/line_delivery.py:
+  - TokenBucket (rate limiting with an injected clock)
+  - LineDeliveryEngine (parallel send, non-blocking retry, retry key, bulk logs)
+  - send_campaign / build_multicast_batches (multicast grouping, deterministic retry keys)
+  - get_campaign_report
+"""
+import pytest
+from unittest.mock import MagicMock
+
+from linebot.v3.messaging import ApiException
+
+from booking.models.line_customer import LineMessageLog
+from booking.services import line_delivery
+from booking.services.line_delivery import (
+    LineDeliveryEngine, TokenBucket, build_multicast_batches, build_text_outbound,
+    decrypt_line_user_ids, get_campaign_report,
+)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+def _make_customers(store, n):
+    from booking.services.line_bot_service import get_customer_or_create
+    return [
+        get_customer_or_create(f'U_delivery_{i:03d}', store=store)[0]
+        for i in range(n)
+    ]
+
+
+class TestTokenBucket:
+    def test_burst_then_throttle(self):
+        clock = FakeClock()
+        bucket = TokenBucket(rate=2, capacity=2, clock=clock, sleep=clock.sleep)
+        bucket.acquire()
+        bucket.acquire()
+        assert clock.sleeps == []
+        bucket.acquire()
+        assert clock.sleeps == [pytest.approx(0.5)]
+
+    def test_try_acquire_reports_wait(self):
+        clock = FakeClock()
+        bucket = TokenBucket(rate=10, capacity=1, clock=clock, sleep=clock.sleep)
+        assert bucket.try_acquire() == 0.0
+        assert bucket.try_acquire() == pytest.approx(0.1)
+
+
+@pytest.mark.django_db
+class TestLineDeliveryEngine:
+    def test_sends_all_and_bulk_logs(self, store, django_assert_max_num_queries):
+        customers = _make_customers(store, 5)
+        api = MagicMock()
+        engine = LineDeliveryEngine(rate_per_sec=1000, workers=4, messaging_api=api)
+
+        outbound = build_text_outbound(customers, 'hello')
+        with django_assert_max_num_queries(2):
+            report = engine.send(outbound, campaign_id='camp-1')
+
+        assert report.sent == 5
+        assert report.failed == 0
+        assert api.push_message.call_count == 5
+        assert LineMessageLog.objects.filter(campaign_id='camp-1', status='sent').count() == 5
+
+    def test_transient_error_is_rescheduled_with_same_retry_key(self, store):
+        customers = _make_customers(store, 1)
+        calls = []
+
+        def push(request, x_line_retry_key=None):
+            calls.append(x_line_retry_key)
+            if len(calls) == 1:
+                raise ApiException(status=500, reason='Server Error')
+
+        api = MagicMock()
+        api.push_message.side_effect = push
+        engine = LineDeliveryEngine(rate_per_sec=1000, workers=1, messaging_api=api)
+        engine._backoff = staticmethod(lambda attempt, error: 0.0)
+
+        report = engine.send(build_text_outbound(customers, 'retry me'))
+
+        assert report.sent == 1
+        assert report.retried == 1
+        assert len(calls) == 2
+        assert calls[0] == calls[1]
+
+    def test_permanent_error_is_not_retried(self, store):
+        customers = _make_customers(store, 1)
+        api = MagicMock()
+        api.push_message.side_effect = ApiException(status=400, reason='Bad Request')
+        engine = LineDeliveryEngine(rate_per_sec=1000, workers=1, messaging_api=api)
+
+        report = engine.send(build_text_outbound(customers, 'x'))
+
+        assert report.failed == 1
+        assert report.error_counts == {'400': 1}
+        assert api.push_message.call_count == 1
+
+    def test_already_accepted_counts_as_sent(self, store):
+        customers = _make_customers(store, 1)
+        api = MagicMock()
+        api.push_message.side_effect = ApiException(status=409, reason='Conflict')
+        engine = LineDeliveryEngine(rate_per_sec=1000, workers=1, messaging_api=api)
+
+        report = engine.send(build_text_outbound(customers, 'x'))
+
+        assert report.sent == 1
+
+    def test_decrypt_failure_is_reported(self, store):
+        customers = _make_customers(store, 1)
+        customers[0].line_user_enc = 'not-a-token'
+        api = MagicMock()
+        engine = LineDeliveryEngine(rate_per_sec=1000, workers=1, messaging_api=api)
+
+        report = engine.send(build_text_outbound(customers, 'x'))
+
+        assert report.failed == 1
+        assert report.error_counts == {'decrypt': 1}
+        api.push_message.assert_not_called()
+
+    def test_campaign_report_from_logs(self, store):
+        customers = _make_customers(store, 3)
+        api = MagicMock()
+        LineDeliveryEngine(rate_per_sec=1000, workers=2, messaging_api=api).send(
+            build_text_outbound(customers, 'x'), campaign_id='camp-2',
+        )
+        report = get_campaign_report('camp-2')
+        assert report == {'campaign_id': 'camp-2', 'total': 3, 'sent': 3, 'failed': 0}
+
+
+@pytest.mark.django_db
+class TestMulticastCampaign:
+    def test_groups_identical_messages(self, store):
+        customers = _make_customers(store, 4)
+        api = MagicMock()
+        engine = LineDeliveryEngine(rate_per_sec=1000, workers=2, messaging_api=api)
+        outbound = (
+            build_text_outbound(customers[:3], 'A')
+            + build_text_outbound(customers[3:], 'B')
+        )
+        sent_refs = []
+        for item, customer in zip(outbound, customers):
+            item.ref = customer.pk
+
+        report = engine.send_campaign(outbound, 'camp-m', on_batch_sent=sent_refs.extend)
+
+        assert report.sent == 4
+        api.multicast.assert_called_once()
+        assert len(api.multicast.call_args.args[0].to) == 3
+        api.push_message.assert_called_once()
+        assert sorted(sent_refs) == sorted(c.pk for c in customers)
+
+    def test_splits_at_recipient_limit(self, store, monkeypatch):
+        monkeypatch.setattr(line_delivery, 'MULTICAST_MAX_RECIPIENTS', 2)
+        customers = _make_customers(store, 5)
+        outbound = build_text_outbound(customers, 'x')
+        decrypted, _ = decrypt_line_user_ids(o.line_user_enc for o in outbound)
+        for item in outbound:
+            item.line_user_id = decrypted[item.line_user_enc]
+
+        batches = build_multicast_batches(outbound, 'camp-split')
+
+        assert [len(b.items) for b in batches] == [2, 2, 1]
+
+    def test_retry_key_is_deterministic(self, store):
+        customers = _make_customers(store, 3)
+
+        def keys(campaign_id):
+            outbound = build_text_outbound(customers, 'same')
+            for item in outbound:
+                item.line_user_id = item.customer.line_user_hash
+            return [b.retry_key for b in build_multicast_batches(outbound, campaign_id)]
+
+        assert keys('camp-k') == keys('camp-k')
+        assert keys('camp-k') != keys('camp-other')
@@ -3,11 +3,12 @@ tests/test_line_reminder.py
 Tests for booking/services/line_reminder.py:
   - send_day_before_reminders (sends, skips already-sent, skips cancelled)
   - send_same_day_reminders (sends, skips already-sent)
+  - multicast grouping, bulk flag update, deterministic retry keys
   - Celery task checks feature flag
 """
 import pytest
 from datetime import timedelta
-from unittest.mock import patch
+from unittest.mock import MagicMock, patch
 
 from django.utils import timezone
 
@@ -19,7 +20,18 @@ from booking.models.line_customer import LineCustomer
 # Helpers
 # ==============================================================
 
-def _create_schedule_with_line(staff, store, start, **kwargs):
+@pytest.fixture
+def mock_api():
+    """Shared MessagingApi を差し替える"""
+    api = MagicMock()
+    with patch(
+        'booking.services.line_delivery.get_shared_messaging_api',
+        return_value=(api, MagicMock()),
+    ):
+        yield api
+
+
+def _create_schedule_with_line(staff, store, start, line_user_id='U_reminder_test_001', **kwargs):
     """Create a Schedule with encrypted LINE user_id fields."""
     schedule = Schedule(
         staff=staff,
@@ -31,7 +43,7 @@ def _create_schedule_with_line(staff, store, start, **kwargs):
         is_temporary=False,
         **kwargs,
     )
-    schedule.set_line_user_id('U_reminder_test_001')
+    schedule.set_line_user_id(line_user_id)
     schedule.save()
     return schedule
 
@@ -42,8 +54,7 @@ def _create_schedule_with_line(staff, store, start, **kwargs):
 
 @pytest.mark.django_db
 class TestDayBeforeReminders:
-    @patch('booking.services.line_bot_service.push_text', return_value=True)
-    def test_day_before_sends_reminder(self, mock_push, staff, store):
+    def test_day_before_sends_reminder(self, mock_api, staff, store):
         """Sends reminder for tomorrow's schedule and sets flag."""
         now = timezone.now()
         tomorrow = (now + timedelta(days=1)).replace(
@@ -55,12 +66,11 @@ class TestDayBeforeReminders:
         sent = send_day_before_reminders()
 
         assert sent == 1
-        mock_push.assert_called_once()
+        mock_api.push_message.assert_called_once()
         schedule.refresh_from_db()
         assert schedule.reminder_sent_day_before is True
 
-    @patch('booking.services.line_bot_service.push_text', return_value=True)
-    def test_day_before_skips_already_sent(self, mock_push, staff, store):
+    def test_day_before_skips_already_sent(self, mock_api, staff, store):
         """Skips schedule where reminder_sent_day_before=True."""
         now = timezone.now()
         tomorrow = (now + timedelta(days=1)).replace(
@@ -74,10 +84,9 @@ class TestDayBeforeReminders:
         sent = send_day_before_reminders()
 
         assert sent == 0
-        mock_push.assert_not_called()
+        mock_api.push_message.assert_not_called()
 
-    @patch('booking.services.line_bot_service.push_text', return_value=True)
-    def test_day_before_skips_cancelled(self, mock_push, staff, store):
+    def test_day_before_skips_cancelled(self, mock_api, staff, store):
         """Skips cancelled schedules."""
         now = timezone.now()
         tomorrow = (now + timedelta(days=1)).replace(
@@ -91,7 +100,7 @@ class TestDayBeforeReminders:
         sent = send_day_before_reminders()
 
         assert sent == 0
-        mock_push.assert_not_called()
+        mock_api.push_message.assert_not_called()
 
 
 # ==============================================================
@@ -100,8 +109,7 @@ class TestDayBeforeReminders:
 
 @pytest.mark.django_db
 class TestSameDayReminders:
-    @patch('booking.services.line_bot_service.push_text', return_value=True)
-    def test_same_day_sends_reminder(self, mock_push, staff, store):
+    def test_same_day_sends_reminder(self, mock_api, staff, store):
         """Sends reminder for schedule within 2 hours and sets flag."""
         now = timezone.now()
         one_hour_later = now + timedelta(hours=1)
@@ -111,12 +119,11 @@ class TestSameDayReminders:
         sent = send_same_day_reminders()
 
         assert sent == 1
-        mock_push.assert_called_once()
+        mock_api.push_message.assert_called_once()
         schedule.refresh_from_db()
         assert schedule.reminder_sent_same_day is True
 
-    @patch('booking.services.line_bot_service.push_text', return_value=True)
-    def test_same_day_skips_already_sent(self, mock_push, staff, store):
+    def test_same_day_skips_already_sent(self, mock_api, staff, store):
         """Skips schedule where reminder_sent_same_day=True."""
         now = timezone.now()
         one_hour_later = now + timedelta(hours=1)
@@ -128,7 +135,68 @@ class TestSameDayReminders:
         sent = send_same_day_reminders()
 
         assert sent == 0
-        mock_push.assert_not_called()
+        mock_api.push_message.assert_not_called()
+
+
+# ==============================================================
+# Batching / idempotency
+# ==============================================================
+
+@pytest.mark.django_db
+class TestReminderBatching:
+    def _same_slot(self):
+        return (timezone.now() + timedelta(hours=1)).replace(second=0, microsecond=0)
+
+    def test_identical_messages_are_multicast(self, mock_api, staff, store):
+        """同一文面の当日リマインダーは1回の multicast にまとめる"""
+        start = self._same_slot()
+        schedules = [
+            _create_schedule_with_line(staff, store, start, line_user_id=f'U_multi_{i}')
+            for i in range(3)
+        ]
+
+        from booking.services.line_reminder import send_same_day_reminders
+        sent = send_same_day_reminders()
+
+        assert sent == 3
+        mock_api.push_message.assert_not_called()
+        mock_api.multicast.assert_called_once()
+        request = mock_api.multicast.call_args.args[0]
+        assert sorted(request.to) == ['U_multi_0', 'U_multi_1', 'U_multi_2']
+        assert Schedule.objects.filter(
+            pk__in=[s.pk for s in schedules], reminder_sent_same_day=True,
+        ).count() == 3
+
+    def test_customer_lookup_and_flag_update_are_batched(
+        self, mock_api, staff, store, django_assert_max_num_queries,
+    ):
+        """顧客の先読み・フラグ更新・ログ記録がレコード数に比例しない"""
+        start = self._same_slot()
+        for i in range(5):
+            _create_schedule_with_line(staff, store, start, line_user_id=f'U_batch_{i}')
+
+        from booking.services.line_reminder import send_same_day_reminders
+        # schedules, customers, flag UPDATE, log INSERT
+        with django_assert_max_num_queries(4):
+            assert send_same_day_reminders() == 5
+
+    def test_rerun_reuses_retry_key(self, mock_api, staff, store):
+        """再実行時は同じ retry key で送る（LINE 側で409 = 送信済み扱い）"""
+        from linebot.v3.messaging import ApiException
+
+        start = self._same_slot()
+        schedule = _create_schedule_with_line(staff, store, start)
+
+        from booking.services.line_reminder import send_same_day_reminders
+        send_same_day_reminders()
+        first_key = mock_api.push_message.call_args.kwargs['x_line_retry_key']
+
+        Schedule.objects.filter(pk=schedule.pk).update(reminder_sent_same_day=False)
+        mock_api.push_message.side_effect = ApiException(status=409, reason='Conflict')
+        assert send_same_day_reminders() == 1
+        assert mock_api.push_message.call_args.kwargs['x_line_retry_key'] == first_key
+        schedule.refresh_from_db()
+        assert schedule.reminder_sent_same_day is True
 
 
 # ==============================================================
@@ -1,14 +1,14 @@
 """
 tests/test_line_segment.py
 Tests for booking/services/line_segment.py:
-  - _compute_segment (vip by visits, vip by spent, regular, dormant, new)
-  - recompute_segments (updates DB)
+  - segment rules (vip by visits, vip by spent, regular, dormant, new, custom)
+  - recompute_segments (set-based update, per-segment counts and diffs)
   - get_customers_by_segment (filtering by segment and store)
-  - send_segment_message (batch send with mocked push_text)
+  - send_segment_message (batch send through the delivery engine with a mocked API)
 """
 import pytest
 from datetime import timedelta
-from unittest.mock import patch
+from unittest.mock import MagicMock, patch
 
 from django.utils import timezone
 
@@ -41,54 +41,58 @@ def _make_customer(store, line_user_id, visit_count=0, total_spent=0,
 
 
 # ==============================================================
-# _compute_segment
+# segment rules
 # ==============================================================
 
+def _segment_after_recompute(customer):
+    from booking.services.line_segment import recompute_segments
+
+    recompute_segments()
+    customer.refresh_from_db()
+    return customer.segment
+
+
 @pytest.mark.django_db
-class TestComputeSegment:
+class TestSegmentRules:
     def test_vip_by_visits(self, store):
         """visit_count >= 5 returns 'vip'."""
-        from booking.services.line_segment import _compute_segment
-
         customer = _make_customer(store, 'U_seg_vip_v', visit_count=5)
-        cutoff = timezone.now() - timedelta(days=90)
-        assert _compute_segment(customer, cutoff) == 'vip'
+        assert _segment_after_recompute(customer) == 'vip'
 
     def test_vip_by_spent(self, store):
         """total_spent >= 30000 returns 'vip'."""
-        from booking.services.line_segment import _compute_segment
-
         customer = _make_customer(store, 'U_seg_vip_s', total_spent=30000)
-        cutoff = timezone.now() - timedelta(days=90)
-        assert _compute_segment(customer, cutoff) == 'vip'
+        assert _segment_after_recompute(customer) == 'vip'
 
     def test_regular(self, store):
         """visit_count >= 2 with recent visit returns 'regular'."""
-        from booking.services.line_segment import _compute_segment
-
         customer = _make_customer(
             store, 'U_seg_regular', visit_count=2, last_visit_delta_days=30,
         )
-        cutoff = timezone.now() - timedelta(days=90)
-        assert _compute_segment(customer, cutoff) == 'regular'
+        assert _segment_after_recompute(customer) == 'regular'
 
     def test_dormant(self, store):
         """last_visit > 90 days ago returns 'dormant'."""
-        from booking.services.line_segment import _compute_segment
-
         customer = _make_customer(
             store, 'U_seg_dormant', visit_count=2, last_visit_delta_days=91,
         )
-        cutoff = timezone.now() - timedelta(days=90)
-        assert _compute_segment(customer, cutoff) == 'dormant'
+        assert _segment_after_recompute(customer) == 'dormant'
 
     def test_new(self, store):
         """visit_count <= 1 returns 'new'."""
-        from booking.services.line_segment import _compute_segment
+        customer = _make_customer(store, 'U_seg_new', visit_count=1, segment='regular')
+        assert _segment_after_recompute(customer) == 'new'
+
+    def test_custom_rules(self, store):
+        """Custom rules are compiled in order ahead of the default."""
+        from django.db.models import Q
+        from booking.services.line_segment import SegmentRule, recompute_segments
 
-        customer = _make_customer(store, 'U_seg_new', visit_count=1)
-        cutoff = timezone.now() - timedelta(days=90)
-        assert _compute_segment(customer, cutoff) == 'new'
+        customer = _make_customer(store, 'U_seg_custom', total_spent=100000)
+        rules = (SegmentRule('whale', lambda now: Q(total_spent__gte=100000)),)
+        recompute_segments(rules=rules)
+        customer.refresh_from_db()
+        assert customer.segment == 'whale'
 
 
 # ==============================================================
@@ -107,12 +111,33 @@ class TestRecomputeSegments:
         )
         assert customer.segment == 'new'
 
-        updated = recompute_segments()
-        assert updated >= 1
+        result = recompute_segments()
+        assert result['updated'] >= 1
+        assert result['changes']['new']['vip'] >= 1
+        assert result['counts']['vip'] >= 1
 
         customer.refresh_from_db()
         assert customer.segment == 'vip'
 
+    def test_unchanged_customers_not_counted(self, store):
+        """Customers already in the right segment are not rewritten."""
+        from booking.services.line_segment import recompute_segments
+
+        _make_customer(store, 'U_recomp_same', visit_count=5, segment='vip')
+        assert recompute_segments()['updated'] == 0
+
+    def test_chunked_update_uses_constant_queries(self, store, django_assert_max_num_queries):
+        """Query count depends on chunks, not on the number of customers."""
+        from booking.services.line_segment import recompute_segments
+
+        for i in range(6):
+            _make_customer(store, f'U_recomp_bulk_{i}', visit_count=5)
+
+        # bounds + (savepoint, diff, update, release) + counts
+        with django_assert_max_num_queries(8):
+            result = recompute_segments()
+        assert result['updated'] == 6
+
 
 # ==============================================================
 # get_customers_by_segment
@@ -149,11 +174,14 @@ class TestGetCustomersBySegment:
 
 @pytest.mark.django_db
 class TestSendSegmentMessage:
-    @patch('booking.services.line_bot_service.push_text', return_value=True)
-    def test_send_segment_message(self, mock_push, store):
+    @patch('booking.services.line_delivery.get_shared_messaging_api')
+    def test_send_segment_message(self, mock_get_api, store):
         """Sends messages to specified customers and counts results."""
         from booking.services.line_segment import send_segment_message
 
+        mock_api = MagicMock()
+        mock_get_api.return_value = (mock_api, MagicMock())
+
         c1 = _make_customer(store, 'U_batch_001')
         c2 = _make_customer(store, 'U_batch_002')
 
@@ -161,22 +189,45 @@ class TestSendSegmentMessage:
 
         assert results['sent'] == 2
         assert results['failed'] == 0
-        assert mock_push.call_count == 2
+        mock_api.multicast.assert_called_once()
+        assert sorted(mock_api.multicast.call_args.args[0].to) == ['U_batch_001', 'U_batch_002']
 
-    @patch('booking.services.line_bot_service.push_text')
-    def test_send_segment_message_partial_failure(self, mock_push, store):
-        """Counts failures when some push_text calls fail."""
+    @patch('booking.services.line_delivery.get_shared_messaging_api')
+    def test_send_segment_message_partial_failure(self, mock_get_api, store):
+        """Counts failures for recipients that cannot be decrypted."""
         from booking.services.line_segment import send_segment_message
 
-        mock_push.side_effect = [True, False]
+        mock_api = MagicMock()
+        mock_get_api.return_value = (mock_api, MagicMock())
 
         c1 = _make_customer(store, 'U_partial_001')
         c2 = _make_customer(store, 'U_partial_002')
+        LineCustomer.objects.filter(pk=c2.pk).update(line_user_enc='broken-token')
 
         results = send_segment_message([c1.pk, c2.pk], 'Campaign message')
 
         assert results['sent'] == 1
         assert results['failed'] == 1
+        assert results['failed_customer_ids'] == [c2.pk]
+
+    @patch('booking.services.line_delivery.get_shared_messaging_api')
+    def test_send_segment_message_rejected_batch(self, mock_get_api, store):
+        """A rejected multicast fails every recipient in the batch."""
+        from linebot.v3.messaging import ApiException
+        from booking.services.line_segment import send_segment_message
+
+        mock_api = MagicMock()
+        mock_api.multicast.side_effect = ApiException(status=400, reason='Bad Request')
+        mock_get_api.return_value = (mock_api, MagicMock())
+
+        c1 = _make_customer(store, 'U_reject_001')
+        c2 = _make_customer(store, 'U_reject_002')
+
+        results = send_segment_message([c1.pk, c2.pk], 'Campaign message')
+
+        assert results['sent'] == 0
+        assert results['failed'] == 2
+        assert results['error_counts'] == {'400': 2}
 
 
 # Need Store import for test_filters_by_segment_and_store
@@ -0,0 +1,226 @@
+"""Tests for booking/services/log_tail.py and the debug panel log tail endpoints."""
+import asyncio
+import os
+
+import pytest
+
+from booking.services import log_tail
+from booking.services.log_tail import LogFilter
+
+
+def record(level, module, message, n=0):
+    return f'{level} 2026-10-19 12:00:{n % 60:02d},000 {module} 100 200 {message}\n'
+
+
+@pytest.fixture
+def log_file(tmp_path):
+    return tmp_path / 'django.log'
+
+
+def write(path, text, mode='a'):
+    with open(path, mode, encoding='utf-8') as f:
+        f.write(text)
+
+
+class TestTail:
+    def test_last_lines_of_large_file(self, log_file, monkeypatch):
+        write(log_file, ''.join(record('INFO', 'views', f'line {i}', i) for i in range(20000)))
+        reads = []
+        real_open = open
+
+        def counting_open(*args, **kwargs):
+            f = real_open(*args, **kwargs)
+            read = f.read
+
+            def tracked(size=-1):
+                data = read(size)
+                reads.append(len(data))
+                return data
+
+            f.read = tracked
+            return f
+
+        monkeypatch.setattr('builtins.open', counting_open)
+        lines, cursor = log_tail.tail(str(log_file), 50)
+        monkeypatch.undo()
+
+        assert len(lines) == 50
+        assert lines[-1].endswith('line 19999')
+        assert lines[0].endswith('line 19950')
+        # ファイル全体（約1.2MB）ではなく末尾のブロックだけを読む
+        assert sum(reads) < 4 * log_tail.BLOCK_SIZE
+        assert cursor == f'{os.stat(log_file).st_ino}:{os.path.getsize(log_file)}'
+
+    def test_lines_spanning_blocks(self, log_file, monkeypatch):
+        monkeypatch.setattr(log_tail, 'BLOCK_SIZE', 16)
+        write(log_file, 'first line\n' + 'x' * 100 + '\nlast\n')
+        lines, _ = log_tail.tail(str(log_file), 10)
+        assert lines == ['first line', 'x' * 100, 'last']
+
+    def test_partial_last_line_is_excluded(self, log_file):
+        write(log_file, record('INFO', 'views', 'done') + 'INFO 2026-10-19 half-writ')
+        lines, cursor = log_tail.tail(str(log_file), 10)
+        assert lines == [record('INFO', 'views', 'done').rstrip('\n')]
+        assert cursor.endswith(f':{len(record("INFO", "views", "done"))}')
+
+    def test_missing_file(self, tmp_path):
+        assert log_tail.tail(str(tmp_path / 'missing.log')) == ([], None)
+        assert log_tail.tail('') == ([], None)
+
+    def test_invalid_utf8_is_replaced(self, log_file):
+        with open(log_file, 'wb') as f:
+            f.write(b'INFO ok\n\xff\xfe broken\n')
+        lines, _ = log_tail.tail(str(log_file), 10)
+        assert lines[1].endswith(' broken')
+
+    def test_scan_limit(self, log_file):
+        write(log_file, ''.join(record('DEBUG', 'views', f'noise {i}', i) for i in range(5000)))
+        lines, _ = log_tail.tail(str(log_file), 10, LogFilter(level='ERROR'), max_scan_bytes=64 * 1024)
+        assert lines == []
+
+
+class TestFilters:
+    @pytest.fixture
+    def mixed(self, log_file):
+        write(log_file, ''.join([
+            record('INFO', 'views', 'request ok'),
+            record('ERROR', 'views_pos', 'checkout failed'),
+            'Traceback (most recent call last):\n',
+            '  File "views_pos.py", line 10\n',
+            'ValueError: Payment declined\n',
+            record('WARNING', 'tasks', 'retrying sync'),
+            record('DEBUG', 'views_pos', 'cart payment=3'),
+        ]))
+        return str(log_file)
+
+    def test_level_keeps_continuation_lines(self, mixed):
+        lines, _ = log_tail.tail(mixed, 50, LogFilter(level='WARNING'))
+        assert len(lines) == 5
+        assert lines[0].startswith('ERROR') and lines[3] == 'ValueError: Payment declined'
+        assert lines[4].startswith('WARNING')
+
+    def test_logger_prefix(self, mixed):
+        lines, _ = log_tail.tail(mixed, 50, LogFilter(logger='views_pos'))
+        assert len(lines) == 5
+        assert lines[0].startswith('ERROR') and lines[-1].startswith('DEBUG')
+
+    def test_text_matches_whole_record(self, mixed):
+        lines, _ = log_tail.tail(mixed, 50, LogFilter(text='PAYMENT'))
+        # トレースバック中の一致でもレコード全体を返す
+        assert lines[0].startswith('ERROR') and len(lines) == 5
+
+    def test_filter_reads_back_until_enough_matches(self, log_file, monkeypatch):
+        monkeypatch.setattr(log_tail, 'BLOCK_SIZE', 256)
+        write(log_file, record('ERROR', 'views', 'old failure'))
+        write(log_file, ''.join(record('INFO', 'views', f'noise {i}', i) for i in range(200)))
+        lines, _ = log_tail.tail(str(log_file), 5, LogFilter(level='ERROR'))
+        assert len(lines) == 1 and lines[0].endswith('old failure')
+
+    def test_from_params(self):
+        f = LogFilter.from_params({'level': 'error', 'logger': ' booking ', 'q': ''})
+        assert f == LogFilter(level='ERROR', logger='booking')
+        assert not LogFilter.from_params({'level': 'bogus'})
+
+
+class TestReadSince:
+    def test_appended_lines(self, log_file):
+        write(log_file, record('INFO', 'views', 'before'))
+        _, cursor = log_tail.tail(str(log_file), 10)
+        write(log_file, record('INFO', 'views', 'after 1') + record('INFO', 'views', 'after 2'))
+        lines, cursor, rotated = log_tail.read_since(str(log_file), cursor)
+        assert [line.split()[-1] for line in lines] == ['1', '2'] and not rotated
+        assert log_tail.read_since(str(log_file), cursor)[:2] == ([], cursor)
+
+    def test_partial_line_waits_for_newline(self, log_file):
+        write(log_file, 'a\n')
+        _, cursor = log_tail.tail(str(log_file), 10)
+        write(log_file, 'INFO half')
+        lines, cursor2, _ = log_tail.read_since(str(log_file), cursor)
+        assert lines == [] and cursor2 == cursor
+        write(log_file, ' done\n')
+        lines, _, _ = log_tail.read_since(str(log_file), cursor)
+        assert lines == ['INFO half done']
+
+    def test_max_bytes(self, log_file):
+        write(log_file, '')
+        _, cursor = log_tail.tail(str(log_file), 0)
+        write(log_file, ''.join(f'line {i}\n' for i in range(100)))
+        lines, cursor, _ = log_tail.read_since(str(log_file), cursor, max_bytes=64)
+        assert lines and len(lines) < 100
+        rest, _, _ = log_tail.read_since(str(log_file), cursor)
+        assert lines + rest == [f'line {i}' for i in range(100)]
+
+    def test_rotation_reads_rest_of_old_file(self, log_file):
+        write(log_file, 'old 1\n')
+        _, cursor = log_tail.tail(str(log_file), 10)
+        write(log_file, 'old 2\n')
+        # RotatingFileHandler と同じく rename して新しいファイルを作る
+        os.rename(log_file, f'{log_file}.1')
+        write(log_file, 'new 1\n', mode='w')
+        lines, cursor, rotated = log_tail.read_since(str(log_file), cursor)
+        assert rotated and lines == ['old 2', 'new 1']
+        assert cursor == f'{os.stat(log_file).st_ino}:6'
+
+    def test_truncation_restarts_from_beginning(self, log_file):
+        write(log_file, 'a long line before truncation\n')
+        _, cursor = log_tail.tail(str(log_file), 10)
+        write(log_file, 'short\n', mode='w')
+        lines, _, rotated = log_tail.read_since(str(log_file), cursor)
+        assert rotated and lines == ['short']
+
+    def test_invalid_cursor_starts_at_end(self, log_file):
+        write(log_file, 'a\nb\n')
+        lines, cursor, rotated = log_tail.read_since(str(log_file), 'garbage')
+        assert lines == [] and cursor.endswith(':4') and not rotated
+
+    def test_filter(self, log_file):
+        write(log_file, '')
+        _, cursor = log_tail.tail(str(log_file), 0)
+        write(log_file, record('INFO', 'views', 'x') + record('ERROR', 'views', 'y') + 'trace\n')
+        lines, _, _ = log_tail.read_since(str(log_file), cursor, LogFilter(level='ERROR'))
+        assert len(lines) == 2 and lines[1] == 'trace'
+
+
+class TestStream:
+    def test_streams_appended_lines(self, log_file):
+        write(log_file, 'start\n')
+        _, cursor = log_tail.tail(str(log_file), 0)
+
+        async def collect():
+            gen = log_tail.stream(str(log_file), cursor, poll_interval=0.01, max_duration=5)
+            write(log_file, 'INFO hello\n')
+            chunk = await gen.__anext__()
+            await gen.aclose()
+            return chunk
+
+        chunk = asyncio.run(collect())
+        assert chunk.startswith(f'id: {os.stat(log_file).st_ino}:17\nevent: lines\n')
+        assert '"INFO hello"' in chunk
+
+
+@pytest.mark.django_db
+class TestLogTailAPI:
+    def test_forbidden_for_regular_user(self, authenticated_client):
+        assert authenticated_client.get('/api/debug/logs/').status_code == 403
+
+    def test_tail_then_follow(self, admin_client, settings, log_file):
+        settings.LOG_FILE = str(log_file)
+        write(log_file, record('INFO', 'views', 'hello') + record('ERROR', 'views', 'boom'))
+        data = admin_client.get('/api/debug/logs/', {'level': 'ERROR'}).json()
+        assert len(data['lines']) == 1 and data['lines'][0].endswith('boom')
+
+        write(log_file, record('ERROR', 'tasks', 'again'))
+        data = admin_client.get('/api/debug/logs/', {'cursor': data['cursor']}).json()
+        assert len(data['lines']) == 1 and data['lines'][0].endswith('again')
+        assert data['rotated'] is False
+
+    def test_stream_requires_asgi(self, admin_client):
+        assert admin_client.get('/api/debug/logs/stream/').status_code == 501
+
+    def test_panel_shows_filtered_tail(self, admin_client, settings, log_file):
+        settings.LOG_FILE = str(log_file)
+        write(log_file, record('INFO', 'views', 'quiet') + record('ERROR', 'views', 'loud'))
+        resp = admin_client.get('/admin/debug/', {'level': 'ERROR'})
+        assert resp.status_code == 200
+        assert [line.split()[-1] for line in resp.context['log_lines']] == ['loud']
+        assert resp.context['log_cursor'].endswith(f':{os.path.getsize(log_file)}')
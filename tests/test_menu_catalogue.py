@@ -0,0 +1,106 @@
+"""客側メニューのカタログキャッシュ（booking/services/menu_catalogue.py）のテスト"""
+import pytest
+from django.core.cache import cache
+from django.test import Client
+from django.urls import reverse
+
+from booking.models import Category, Product, ProductTranslation, StockMovement
+from booking.services import menu_catalogue
+
+
+@pytest.fixture(autouse=True)
+def clear_cache():
+    cache.clear()
+    yield
+    cache.clear()
+
+
+@pytest.fixture
+def menu(store):
+    drinks = Category.objects.create(store=store, name='ドリンク', sort_order=1)
+    food = Category.objects.create(store=store, name='フード', sort_order=2)
+    products = []
+    for i in range(5):
+        product = Product.objects.create(
+            store=store, category=drinks if i < 3 else food, sku=f'SKU{i}',
+            name=f'商品{i}', price=500 + i * 100, stock=10, popularity=i,
+        )
+        ProductTranslation.objects.create(product=product, lang='en', name=f'Item {i}')
+        products.append(product)
+    return products
+
+
+def _menu_json(client, store, **headers):
+    return client.get(reverse('booking_api:customer_menu_json'), {'store_id': store.pk, 'lang': 'en'}, **headers)
+
+
+@pytest.mark.django_db
+class TestMenuCatalogueAPI:
+    def test_translated_payload(self, store, menu):
+        response = _menu_json(Client(), store)
+        assert response.status_code == 200
+        data = response.json()
+        assert [c['name'] for c in data['categories']] == ['ドリンク', 'フード']
+        assert {p['name'] for p in data['products']} == {f'Item {i}' for i in range(5)}
+        assert response['ETag']
+
+    def test_if_none_match_returns_304(self, store, menu):
+        client = Client()
+        etag = _menu_json(client, store)['ETag']
+        response = _menu_json(client, store, HTTP_IF_NONE_MATCH=etag)
+        assert response.status_code == 304
+        assert response['ETag'] == etag
+
+    def test_build_is_not_n_plus_one(self, store, menu, site_settings, django_assert_num_queries):
+        client = Client()
+        client.get(reverse('booking_api:customer_menu_json'))  # ミドルウェアの初期化分を除外
+        # store, categories, products, translations (prefetch), stock map
+        with django_assert_num_queries(5):
+            _menu_json(client, store)
+        # 2回目以降は店舗の取得のみ
+        with django_assert_num_queries(1):
+            _menu_json(client, store)
+
+    def test_stock_change_patches_without_rebuild(
+        self, store, menu, django_capture_on_commit_callbacks,
+    ):
+        client = Client()
+        etag = _menu_json(client, store)['ETag']
+        product = menu[0]
+        with django_capture_on_commit_callbacks(execute=True):
+            StockMovement.objects.create(
+                store=store, product=product, movement_type=StockMovement.TYPE_OUT, qty=10,
+            )
+            Product.objects.filter(pk=product.pk).update(stock=0)
+
+        assert cache.get(menu_catalogue._version_key(store.pk)) is None  # 構成は据え置き
+        response = _menu_json(client, store, HTTP_IF_NONE_MATCH=etag)
+        assert response.status_code == 200
+        item = next(p for p in response.json()['products'] if p['id'] == product.pk)
+        assert item['stock'] == 0 and item['is_sold_out'] is True
+
+    def test_translation_change_invalidates(self, store, menu, django_capture_on_commit_callbacks):
+        client = Client()
+        _menu_json(client, store)
+        with django_capture_on_commit_callbacks(execute=True):
+            ProductTranslation.objects.filter(product=menu[0]).update(name='unused')
+            tr = ProductTranslation.objects.get(product=menu[0], lang='en')
+            tr.name = 'Renamed'
+            tr.save()
+        names = {p['name'] for p in _menu_json(client, store).json()['products']}
+        assert 'Renamed' in names
+
+
+@pytest.mark.django_db
+class TestMenuViews:
+    def test_customer_menu_page(self, store, menu):
+        response = Client().get(reverse('booking:customer_menu', args=[store.pk]), {'lang': 'en'})
+        assert response.status_code == 200
+        assert 'Item 0' in response.content.decode()
+
+    def test_alternatives_from_catalogue(self, store, menu):
+        Product.objects.filter(pk=menu[2].pk).update(stock=0)
+        response = Client().get(reverse('booking_api:product_alternatives_api'), {'product_id': menu[0].pk})
+        ids = [p['id'] for p in response.json()['alternatives']]
+        # 同カテゴリ・在庫あり・人気順（menu[2] は在庫切れ）
+        assert ids == [menu[1].pk]
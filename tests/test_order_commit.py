@@ -0,0 +1,85 @@
+"""booking/services/order_commit.py（注文明細の一括確定）のテスト"""
+from unittest.mock import patch
+
+import pytest
+from django.db import transaction
+
+from booking.models import Order, OrderItem, Product, StockMovement
+from booking.services.order_commit import (
+    OrderCommitError, commit_order_lines, normalize_lines,
+)
+
+
+@pytest.fixture
+def products(store):
+    return [
+        Product.objects.create(
+            store=store, sku=f'OC{i:03d}', name=f'商品{i}', price=100 + i,
+            stock=10, low_stock_threshold=2,
+        )
+        for i in range(30)
+    ]
+
+
+def _order(store):
+    return Order.objects.create(store=store, status=Order.STATUS_OPEN, channel='table')
+
+
+class TestNormalizeLines:
+    def test_merges_and_drops_invalid(self):
+        assert normalize_lines([(1, 2), (1, '3'), (2, 0), (3, 'x'), (None, 1)]) == {1: 5}
+
+
+@pytest.mark.django_db
+class TestCommitOrderLines:
+    def test_thirty_lines_constant_queries(self, store, products, django_assert_num_queries):
+        order = _order(store)
+        quantities = {p.id: 2 for p in products}
+        # lock, bulk StockMovement, CASE UPDATE, bulk OrderItem (+ savepoint/release)
+        with django_assert_num_queries(6):
+            result = commit_order_lines(order, quantities, note='bulk')
+
+        assert len(result.items) == 30
+        assert OrderItem.objects.filter(order=order).count() == 30
+        assert StockMovement.objects.filter(note='bulk').count() == 30
+        assert set(Product.objects.filter(store=store).values_list('stock', flat=True)) == {8}
+        item = OrderItem.objects.get(order=order, product=products[5])
+        assert (item.qty, item.unit_price) == (2, 105)
+
+    def test_shortage_rolls_back(self, store, products):
+        order = _order(store)
+        with pytest.raises(OrderCommitError) as exc:
+            with transaction.atomic():
+                commit_order_lines(order, {products[0].id: 1, products[1].id: 11}, note='x')
+        assert exc.value.code == OrderCommitError.INSUFFICIENT_STOCK
+        assert exc.value.product == products[1]
+        assert Product.objects.get(pk=products[0].pk).stock == 10
+        assert not StockMovement.objects.exists()
+
+    def test_missing_product(self, store, products):
+        with pytest.raises(OrderCommitError) as exc:
+            commit_order_lines(_order(store), {999999: 1}, note='x')
+        assert exc.value.code == OrderCommitError.NOT_FOUND
+        assert exc.value.product_ids == [999999]
+
+    def test_skip_missing(self, store, products):
+        result = commit_order_lines(
+            _order(store), {999999: 1, products[0].id: 1}, note='x', skip_missing=True,
+        )
+        assert [i.product_id for i in result.items] == [products[0].id]
+
+    def test_allow_shortage_skips_short_products(self, store, products):
+        result = commit_order_lines(
+            _order(store), {products[0].id: 1, products[1].id: 50},
+            note='pos', create_items=False, allow_shortage=True,
+        )
+        assert result.skipped_product_ids == [products[1].id]
+        assert Product.objects.get(pk=products[1].pk).stock == 10
+        assert StockMovement.objects.filter(note='pos').count() == 1
+
+    def test_low_stock_notifies_once(self, store, products):
+        quantities = {p.id: 9 for p in products[:5]}
+        with patch('booking.tasks.check_low_stock_and_notify.delay') as delay:
+            result = commit_order_lines(_order(store), quantities, note='x', notify_low_stock=True)
+        assert len(result.low_stock_product_ids) == 5
+        delay.assert_called_once()
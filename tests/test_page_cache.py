@@ -0,0 +1,170 @@
+"""Tests for the public full-page cache (PublicPageCacheMiddleware + page_cache service)."""
+import re
+
+import pytest
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import Client
+from django.urls import reverse
+
+from booking.models import Notice, SiteSettings, Staff, Store
+from booking.services import page_cache
+
+
+@pytest.fixture
+def page_cache_on(settings):
+    settings.PAGE_CACHE_ENABLED = True
+    settings.PAGE_CACHE_EDGE_HEADERS = False
+    cache.clear()
+    yield
+    cache.clear()
+
+
+@pytest.fixture
+def notice(db):
+    return Notice.objects.create(
+        title='お知らせ1', slug='notice-1', content='本文', is_published=True,
+    )
+
+
+@pytest.mark.django_db
+class TestPublicPageCache:
+
+    def test_second_anonymous_get_is_hit(self, page_cache_on, notice):
+        client = Client()
+        url = reverse('booking:notice_list')
+        first = client.get(url)
+        second = client.get(url)
+        assert first.status_code == 200
+        assert first['X-Page-Cache'] == 'MISS'
+        assert second['X-Page-Cache'] == 'HIT'
+        assert 'お知らせ1' in second.content.decode()
+
+    def test_disabled_by_default(self, notice):
+        client = Client()
+        url = reverse('booking:notice_list')
+        client.get(url)
+        response = client.get(url)
+        assert 'X-Page-Cache' not in response
+
+    def test_notice_change_purges_entry(self, page_cache_on, notice):
+        client = Client()
+        url = reverse('booking:notice_list')
+        client.get(url)
+        Notice.objects.create(title='新着', slug='notice-2', content='x', is_published=True)
+        response = client.get(url)
+        assert response['X-Page-Cache'] == 'MISS'
+        assert '新着' in response.content.decode()
+
+    def test_store_purge_is_scoped(self, page_cache_on, store):
+        other = Store.objects.create(name='別店舗', address='x', business_hours='x', nearest_station='x')
+        client = Client()
+        url_a = reverse('booking:staff_list', args=[store.pk])
+        url_b = reverse('booking:staff_list', args=[other.pk])
+        client.get(url_a)
+        client.get(url_b)
+        user = get_user_model().objects.create_user(username='newcast', password='x')
+        Staff.objects.create(name='追加キャスト', store=store, user=user, staff_type='fortune_teller')
+        assert client.get(url_a)['X-Page-Cache'] == 'MISS'
+        assert client.get(url_b)['X-Page-Cache'] == 'HIT'
+
+    def test_keyed_by_language(self, page_cache_on, notice):
+        client = Client()
+        client.get('/news/')
+        response = client.get('/en/news/')
+        assert response['X-Page-Cache'] == 'MISS'
+        assert client.get('/en/news/')['X-Page-Cache'] == 'HIT'
+
+    def test_hit_reissues_csp_nonce_and_csrf_token(self, page_cache_on, notice):
+        client = Client()
+        url = reverse('booking:notice_list')
+        client.get(url)
+        response = Client().get(url)
+        body = response.content.decode()
+        assert response['X-Page-Cache'] == 'HIT'
+        assert page_cache.NONCE_PLACEHOLDER not in body
+        assert page_cache.CSRF_PLACEHOLDER not in body
+        assert page_cache.NONCE_PLACEHOLDER not in response.get('Content-Security-Policy', '')
+        assert 'csrftoken' in response.cookies
+        # CSPMiddleware が付けるヘッダーの nonce と本文の nonce が一致する
+        nonces = re.findall(r"'nonce-([^']+)'", response.get('Content-Security-Policy', ''))
+        assert nonces and all(f'nonce="{n}"' in body for n in nonces)
+
+    def test_session_cookie_bypasses_cache(self, page_cache_on, notice, admin_client):
+        url = reverse('booking:notice_list')
+        admin_client.get(url)
+        response = admin_client.get(url)
+        assert 'X-Page-Cache' not in response
+
+    def test_untagged_view_not_cached(self, page_cache_on, store):
+        client = Client()
+        url = reverse('booking:date_first_calendar')
+        client.get(url)
+        response = client.get(url)
+        assert 'X-Page-Cache' not in response
+
+    def test_blocked_user_agent_gets_403_on_warm_key(self, page_cache_on, notice, settings):
+        settings.TESTING = False
+        url = reverse('booking:notice_list')
+        browser = Client(HTTP_USER_AGENT='Mozilla/5.0')
+        browser.get(url)
+        assert browser.get(url)['X-Page-Cache'] == 'HIT'
+        response = Client(HTTP_USER_AGENT='GPTBot/1.0').get(url)
+        assert response.status_code == 403
+        assert 'お知らせ1' not in response.content.decode()
+
+    def test_maintenance_mode_applies_on_warm_key(self, page_cache_on, notice):
+        url = reverse('booking:notice_list')
+        client = Client()
+        client.get(url)
+        site = SiteSettings.load()
+        site.maintenance_mode = True
+        site.save()
+        assert client.get(url).status_code == 503
+
+    def test_only_whitelisted_query_params_are_keyed(self, page_cache_on, notice):
+        client = Client()
+        url = reverse('booking:notice_list')
+        client.get(url)
+        assert client.get(url + '?utm_source=x&ref=y')['X-Page-Cache'] == 'HIT'
+        assert client.get(url + '?page=1')['X-Page-Cache'] == 'MISS'
+        assert client.get(url + '?page=1&utm_source=z')['X-Page-Cache'] == 'HIT'
+
+    def test_store_id_selects_separate_entries(self, page_cache_on, notice):
+        from booking.models import StoreTheme
+        themed = {}
+        for name, color in (('店舗A', '#111111'), ('店舗B', '#222222')):
+            store = Store.objects.create(name=name)
+            StoreTheme.objects.create(store=store, primary_color=color)
+            themed[store.pk] = color
+
+        client = Client()
+        url = reverse('booking:notice_list')
+        for store_id, color in themed.items():
+            response = client.get(f'{url}?store_id={store_id}')
+            assert response['X-Page-Cache'] == 'MISS'
+            assert color in response.content.decode()
+        for store_id, color in themed.items():
+            response = client.get(f'{url}?store_id={store_id}')
+            assert response['X-Page-Cache'] == 'HIT'
+            assert color in response.content.decode()
+
+    def test_edge_header_mode(self, page_cache_on, notice, settings):
+        settings.PAGE_CACHE_EDGE_HEADERS = True
+        settings.PAGE_CACHE_EDGE_TTL = 30
+        response = Client().get(reverse('booking:notice_list'))
+        assert response['X-Accel-Expires'] == '30'
+        assert 'notice' in response['Surrogate-Key'].split()
+
+
+class TestPurge:
+
+    def test_purge_invalidates_tagged_entries(self, page_cache_on):
+        from django.http import HttpResponse
+        response = page_cache.tag_response(HttpResponse('hello'), 'page:1')
+        page_cache.store_response('/p/1/x/', 'ja', response)
+        assert page_cache.get_entry('/p/1/x/', 'ja') is not None
+        page_cache.purge('page:2')
+        assert page_cache.get_entry('/p/1/x/', 'ja') is not None
+        page_cache.purge('page:1')
+        assert page_cache.get_entry('/p/1/x/', 'ja') is None
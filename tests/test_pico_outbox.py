@@ -0,0 +1,135 @@
+"""Pico W ファームウェアのリングバッファ outbox（CPython 上でファイルを flash の代わりに使う）"""
+import json
+
+import pytest
+
+from MB_IoT_device_main import outbox
+from MB_IoT_device_main.outbox import FlashFS, RingOutbox
+
+
+class RecordingFS(FlashFS):
+    """書き込みを記録し、指定回目の書き込みを途中で打ち切る（電源断の再現）。"""
+
+    def __init__(self, root):
+        super().__init__(root)
+        self.writes = []
+        self.tear_at = None
+        self.tear_bytes = 0
+
+    def write(self, name, offset, data):
+        self.writes.append((name, len(data)))
+        if self.tear_at is not None and len(self.writes) == self.tear_at:
+            super().write(name, offset, data[:self.tear_bytes])
+            raise OSError('power lost')
+        super().write(name, offset, data)
+
+
+@pytest.fixture
+def fs(tmp_path):
+    return RecordingFS(str(tmp_path / 'outbox'))
+
+
+def _open(fs, **kwargs):
+    kwargs.setdefault('segment_size', 256)
+    kwargs.setdefault('segment_count', 4)
+    return RingOutbox(fs=fs, **kwargs)
+
+
+class TestRingOutbox:
+    def test_fifo_enqueue_peek_ack(self, fs):
+        box = _open(fs)
+        for i in range(5):
+            assert box.enqueue('sensors/pico', {'i': i}) == i + 1
+        assert len(box) == 5
+        items = box.peek(2)
+        assert [item['payload']['i'] for item in items] == [0, 1]
+        assert items[0]['topic'] == 'sensors/pico'
+        assert box.ack(2) == 2
+        assert [item['payload']['i'] for item in box.peek(10)] == [2, 3, 4]
+
+    def test_state_survives_restart(self, fs):
+        box = _open(fs)
+        for i in range(12):
+            box.enqueue('t', {'i': i})
+        box.ack(7)
+        box = _open(fs)
+        assert len(box) == 5
+        assert [item['payload']['i'] for item in box.peek(10)] == [7, 8, 9, 10, 11]
+        assert box.enqueue('t', {'i': 12}) == 13
+
+    def test_torn_record_is_discarded_on_recovery(self, fs):
+        box = _open(fs)
+        box.enqueue('t', {'i': 0})
+        box.enqueue('t', {'i': 1})
+        fs.tear_at = len(fs.writes) + 1
+        fs.tear_bytes = 7
+        assert box.enqueue('t', {'i': 2}) is None
+
+        fs.tear_at = None
+        box = _open(fs)
+        assert [item['payload']['i'] for item in box.peek(10)] == [0, 1]
+        assert box.enqueue('t', {'i': 3}) == 3
+        assert [item['payload']['i'] for item in _open(fs).peek(10)] == [0, 1, 3]
+
+    def test_torn_pointer_write_keeps_previous_head(self, fs):
+        box = _open(fs)
+        for i in range(3):
+            box.enqueue('t', {'i': i})
+        box.ack(1)
+        fs.tear_at = len(fs.writes) + 1
+        fs.tear_bytes = 5
+        with pytest.raises(OSError):
+            box.ack(1)
+
+        fs.tear_at = None
+        box = _open(fs)
+        # 未確定の ack は再送される（at-least-once）
+        assert [item['payload']['i'] for item in box.peek(10)] == [1, 2]
+
+    def test_wraps_and_drops_oldest_segment_when_full(self, fs):
+        box = _open(fs, segment_size=128, segment_count=3)
+        for i in range(40):
+            box.enqueue('t', {'i': i})
+        items = box.peek(100)
+        seqs = [item['payload']['i'] for item in items]
+        assert seqs == list(range(seqs[0], 40))
+        assert box.dropped == seqs[0]
+        assert len(box) == len(seqs)
+        assert [item['payload']['i'] for item in _open(fs, segment_size=128, segment_count=3).peek(100)] == seqs
+
+    def test_drain_is_one_small_write_per_ack(self, fs):
+        box = _open(fs, segment_size=4096, segment_count=4)
+        for i in range(200):
+            box.enqueue('t', {'i': i})
+        fs.writes.clear()
+        drained = 0
+        while len(box):
+            drained += len(box.peek(1))
+            box.ack(1)
+        assert drained == 200
+        assert len(fs.writes) == 200
+        assert {name for name, _ in fs.writes} == {'ptr.bin'}
+        assert max(size for _, size in fs.writes) == 18
+
+    def test_oversized_entry_rejected(self, fs):
+        box = _open(fs, segment_size=64)
+        assert box.enqueue('t', 'x' * 100) is None
+        assert len(box) == 0
+
+
+class TestModuleInterface:
+    def test_legacy_jsonl_imported_and_legacy_helpers(self, tmp_path, monkeypatch):
+        monkeypatch.chdir(tmp_path)
+        monkeypatch.setattr(outbox, '_outbox', None)
+        with open(outbox.OUTBOX_FILE, 'w') as f:
+            f.write(json.dumps({'topic': 'a', 'payload': 1}) + '\n')
+            f.write('not json\n')
+
+        outbox.enqueue('b', 2)
+        assert [item['topic'] for item in outbox.peek_all()] == ['a', 'b']
+        assert not (tmp_path / outbox.OUTBOX_FILE).exists()
+        outbox.remove_first()
+        assert outbox.pending() == 1
+        assert outbox.peek()[0]['payload'] == 2
+        assert outbox.ack() == 1
+        assert outbox.peek_all() == []
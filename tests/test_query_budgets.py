@@ -0,0 +1,114 @@
+"""クエリ予算による性能回帰チェック（booking.services.query_budget / benchmark_query_budgets）のテスト"""
+import json
+from io import StringIO
+from unittest import mock
+
+import pytest
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import transaction
+
+from booking.services import query_budget
+from booking.services.query_budget import Scenario, check, compare
+
+
+def _row(queries, ms=10.0):
+    return {'queries': queries, 'ms': ms}
+
+
+SCENARIOS = (Scenario('menu', 5, None), Scenario('pos', 10, None))
+
+
+class TestCheck:
+    def test_within_budget(self):
+        results = {1: {'menu': _row(5), 'pos': _row(8)}, 10: {'menu': _row(5), 'pos': _row(8)}}
+        assert check(results, SCENARIOS) == []
+
+    def test_over_budget(self):
+        violations = check({1: {'menu': _row(6), 'pos': _row(8)}}, SCENARIOS)
+        assert violations == ['menu @ 1 stores: 6 queries > budget 5']
+
+    def test_queries_growing_with_store_count(self):
+        results = {1: {'menu': _row(3), 'pos': _row(8)}, 10: {'menu': _row(4), 'pos': _row(8)}}
+        assert check(results, SCENARIOS) == ['menu: queries grow with store count (3 @ 1 → 4 @ 10)']
+
+
+class TestCompare:
+    baseline = {'1': {'menu': _row(5, 100.0)}}
+
+    def test_query_increase_is_regression(self):
+        assert compare({1: {'menu': _row(6, 100.0)}}, self.baseline) == ['menu @ 1 stores: queries 5 → 6']
+
+    def test_timing_over_threshold_is_regression(self):
+        regressions = compare({1: {'menu': _row(5, 160.0)}}, self.baseline, threshold=0.5)
+        assert regressions == ['menu @ 1 stores: 100.0 ms → 160.0 ms (+60%)']
+
+    def test_timing_within_threshold_or_tiny_delta_passes(self):
+        assert compare({1: {'menu': _row(5, 140.0)}}, self.baseline, threshold=0.5) == []
+        small = {'1': {'menu': _row(5, 2.0)}}
+        assert compare({1: {'menu': _row(5, 8.0)}}, small, threshold=0.5) == []
+
+    def test_timing_disabled_and_unknown_entries(self):
+        assert compare({1: {'menu': _row(5, 500.0)}}, self.baseline, timing=False) == []
+        assert compare({10: {'menu': _row(50, 500.0)}, 1: {'new': _row(50)}}, self.baseline) == []
+
+
+def _measure(scale):
+    with transaction.atomic():
+        data = query_budget.seed(scale)
+        results = query_budget.measure(data, repeat=1)
+        transaction.set_rollback(True)
+    return results
+
+
+@pytest.mark.django_db
+class TestScenarios:
+    def test_budgets_hold_and_do_not_grow_with_stores(self):
+        results = {1: _measure(1), 3: _measure(3)}
+        assert set(results[1]) == {scenario.name for scenario in query_budget.SCENARIOS}
+        assert check(results) == []
+        # コミット済みベースラインからクエリ数が増えていないこと（所要時間は環境依存のため比較しない）
+        assert compare(results, query_budget.load_baseline(), timing=False) == []
+
+    def test_seed_creates_scaled_data(self):
+        from booking.models import Order, ShiftRequest, Staff
+        data = query_budget.seed(2)
+        assert len(data.stores) == 2
+        assert Staff.objects.filter(store__in=data.stores).count() == 2 * query_budget.STAFF_PER_STORE
+        assert Order.objects.filter(store__in=data.stores).count() == 2 * query_budget.ORDERS_PER_STORE
+        assert ShiftRequest.objects.filter(period=data.shift_period).exists()
+
+
+@pytest.mark.django_db
+class TestCommand:
+    def test_update_baseline_then_compare(self, tmp_path):
+        path = tmp_path / 'baseline.json'
+        call_command(
+            'benchmark_query_budgets', '--scales', '1', '--repeat', '1', '--update-baseline',
+            '--baseline', str(path), stdout=StringIO(),
+        )
+        baseline = json.loads(path.read_text())
+        assert set(baseline) == {'1'}
+        assert baseline['1']['menu_json']['queries'] > 0
+
+        out = StringIO()
+        call_command(
+            'benchmark_query_budgets', '--scales', '1', '--repeat', '1', '--no-timing',
+            '--baseline', str(path), stdout=out,
+        )
+        assert 'すべてのシナリオが予算内です' in out.getvalue()
+
+    def test_query_regression_fails(self, tmp_path):
+        path = tmp_path / 'baseline.json'
+        path.write_text(json.dumps({'1': {'menu_json': {'queries': 1, 'ms': 1.0}}}))
+        with pytest.raises(CommandError, match='menu_json @ 1 stores: queries 1 →'):
+            call_command(
+                'benchmark_query_budgets', '--scales', '1', '--repeat', '1', '--no-timing',
+                '--baseline', str(path), stdout=StringIO(),
+            )
+
+    def test_requires_sqlite(self):
+        with mock.patch('booking.management.commands.benchmark_query_budgets.connection') as conn:
+            conn.vendor = 'postgresql'
+            with pytest.raises(CommandError, match='SQLite'):
+                call_command('benchmark_query_budgets', stdout=StringIO())
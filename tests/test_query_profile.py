@@ -0,0 +1,145 @@
+"""ビュー別クエリ計測（QueryProfileMiddleware / booking.services.query_profile）のテスト"""
+import time
+from datetime import timedelta
+
+import pytest
+from django.core.cache import cache
+from django.utils import timezone
+
+from booking.models import QueryProfileSummary, SystemConfig
+from booking.services import query_profile
+from booking.services.query_profile import QueryRecorder, fingerprint, flush, record, regression_report
+
+
+@pytest.fixture(autouse=True)
+def clear_cache():
+    cache.clear()
+    yield
+    cache.clear()
+
+
+@pytest.fixture
+def profiling(settings):
+    settings.QUERY_PROFILE_ENABLED = True
+    settings.QUERY_PROFILE_SAMPLE_RATE = 1.0
+    return settings
+
+
+def _after_window():
+    return time.time() + query_profile.WINDOW_SECONDS
+
+
+def _recorder(*sqls):
+    recorder = QueryRecorder()
+    for sql in sqls:
+        recorder(lambda *args: None, sql, (), False, {})
+    return recorder
+
+
+class TestFingerprint:
+    def test_literals_are_normalized(self):
+        assert fingerprint("SELECT * FROM t WHERE id = 12 AND name = 'o''brien'") == \
+            'SELECT * FROM t WHERE id = ? AND name = ?'
+
+    def test_in_lists_of_any_length_match(self):
+        assert fingerprint('SELECT * FROM t WHERE id IN (%s, %s, %s)') == \
+            fingerprint('SELECT * FROM t WHERE id IN (%s)')
+
+    def test_recorder_counts_duplicates(self):
+        recorder = _recorder(
+            'SELECT * FROM store WHERE id = 1',
+            'SELECT * FROM store WHERE id = 2',
+            'SELECT * FROM store WHERE id = 3',
+            'SELECT * FROM menu',
+        )
+        assert recorder.count == 4
+        assert recorder.duplicates() == {'SELECT * FROM store WHERE id = ?': 3}
+
+
+@pytest.mark.django_db
+class TestMiddleware:
+    def test_disabled_records_nothing(self, admin_client, settings):
+        settings.QUERY_PROFILE_ENABLED = False
+        admin_client.get('/admin/debug/')
+        assert flush(now=_after_window()) == 0
+
+    def test_zero_sample_rate_from_system_config(self, admin_client, profiling):
+        SystemConfig.set('query_profile_sample_rate', '0')
+        admin_client.get('/admin/debug/')
+        assert flush(now=_after_window()) == 0
+
+    def test_records_per_view_and_flushes_once(self, admin_client, profiling):
+        admin_client.get('/admin/debug/')
+        admin_client.get('/admin/debug/')
+        admin_client.get('/healthz')
+
+        assert flush(now=_after_window()) == 2
+        assert flush(now=_after_window()) == 0  # 同じウィンドウは二重に加算しない
+
+        summaries = {s.view_name: s for s in QueryProfileSummary.objects.all()}
+        assert set(summaries) == {'admin_debug_panel', 'healthz'}
+        panel = summaries['admin_debug_panel']
+        assert panel.requests == 2
+        assert panel.queries > 0
+        assert panel.total_ms >= panel.db_ms > 0
+        assert sum(panel.latency_histogram) == 2
+        assert sum(panel.query_histogram) == 2
+        assert summaries['healthz'].requests == 1
+
+
+@pytest.mark.django_db
+class TestFlush:
+    def test_windows_merge_into_hourly_row(self):
+        recorder = _recorder('SELECT * FROM store WHERE id = 1', 'SELECT * FROM store WHERE id = 2')
+        hour = (time.time() // 3600) * 3600
+        record('menu', recorder, 0.02, now=hour + 10)
+        flush(now=hour + query_profile.WINDOW_SECONDS + 10)
+        record('menu', recorder, 0.3, now=hour + query_profile.WINDOW_SECONDS + 20)
+        flush(now=hour + 2 * query_profile.WINDOW_SECONDS + 20)
+
+        summary = QueryProfileSummary.objects.get(view_name='menu')
+        assert summary.requests == 2
+        assert summary.queries == 4
+        assert summary.duplicate_queries == 2
+        assert summary.top_duplicates == [{'sql': 'SELECT * FROM store WHERE id = ?', 'count': 2}]
+        assert summary.latency_histogram[1] == 1  # 20ms → ≤25
+        assert summary.latency_histogram[5] == 1  # 300ms → ≤500
+
+    def test_old_summaries_are_pruned(self):
+        QueryProfileSummary.objects.create(
+            view_name='old', period_start=timezone.now() - timedelta(days=query_profile.RETENTION_DAYS + 1),
+        )
+        flush()
+        assert not QueryProfileSummary.objects.filter(view_name='old').exists()
+
+
+@pytest.mark.django_db
+class TestRegressionReport:
+    def _summary(self, view_name, hours_ago, requests, total_ms, queries):
+        period = timezone.now().replace(minute=0, second=0, microsecond=0) - timedelta(hours=hours_ago)
+        QueryProfileSummary.objects.create(
+            view_name=view_name, period_start=period, requests=requests, total_ms=total_ms,
+            queries=queries, latency_histogram=[0, 0, 0, requests],
+        )
+
+    def test_orders_by_regression_then_queries(self):
+        self._summary('pos', 48, 10, 1000, 50)
+        self._summary('pos', 1, 10, 3000, 200)      # 平均 100ms → 300ms
+        self._summary('menu', 48, 10, 1000, 50)
+        self._summary('menu', 1, 10, 1000, 50)      # 変化なし
+        self._summary('iot', 1, 10, 500, 400)       # ベースライン無し・クエリ多
+
+        report = regression_report()
+        assert [r['view_name'] for r in report] == ['pos', 'iot', 'menu']
+        assert report[0]['change'] == 3.0
+        assert report[0]['avg_queries'] == 20.0
+        assert report[0]['baseline_avg_queries'] == 5.0
+        assert report[0]['p95_ms'] == query_profile.LATENCY_BUCKETS_MS[3]
+        assert report[1]['change'] is None
+
+    def test_debug_panel_shows_report(self, admin_client):
+        self._summary('pos', 1, 10, 3000, 200)
+        resp = admin_client.get('/admin/debug/')
+        assert resp.status_code == 200
+        assert [r['view_name'] for r in resp.context['query_profile_report']] == ['pos']
+        assert 'query-profile-table' in resp.content.decode()
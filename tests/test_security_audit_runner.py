@@ -0,0 +1,270 @@
+"""
+セキュリティ監査ランナーのテスト
+
+- 独立したチェックの並列実行（全体の所要時間 ≒ 最も遅いチェック）
+- 依存関係の順序と依存先の結果の受け渡し
+- 入力フィンガープリント・TTL による前回結果の再利用と再実行
+- タイムアウト・例外は warn 結果になり、キャッシュされない
+- latest_report / 管理画面 / healthz はチェックを実行しない
+"""
+import hashlib
+import json
+import threading
+import time
+from datetime import timedelta
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from booking.models import SecurityAudit
+from booking.services import security_audit
+from booking.services.security_audit import latest_report, register, report_summary, run_audit
+
+User = get_user_model()
+
+
+def _result(name, status='pass', message='ok'):
+    return {
+        'check_name': name,
+        'category': 'django_settings',
+        'severity': 'info',
+        'status': status,
+        'message': message,
+    }
+
+
+class RegistryTestCase(TestCase):
+    """テスト用の空のレジストリに差し替える"""
+
+    def setUp(self):
+        patcher = mock.patch.object(security_audit, 'REGISTRY', {})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.calls = []
+        self.inputs = {}
+
+    def add_check(self, name, delay=0.0, depends_on=(), **kwargs):
+        def fn(deps=None):
+            self.calls.append(name)
+            time.sleep(delay)
+            return _result(name, message=f'deps={sorted(deps or {})}')
+
+        kwargs.setdefault('inputs', lambda: self.inputs.get(name))
+        register(name, 'django_settings', depends_on=depends_on, **kwargs)(fn)
+
+
+class TestConcurrency(RegistryTestCase):
+
+    def test_wall_time_close_to_slowest_check(self):
+        for i in range(6):
+            self.add_check(f'slow{i}', delay=0.3)
+        started = time.perf_counter()
+        audit = run_audit()
+        elapsed = time.perf_counter() - started
+        self.assertEqual(audit['executed'], 6)
+        self.assertLess(elapsed, 1.0)  # 直列なら 1.8 秒
+
+    def test_db_checks_run_on_calling_thread(self):
+        seen = []
+
+        @register('db_check', 'credentials', uses_db=True)
+        def db_check():
+            seen.append(threading.current_thread() is threading.main_thread())
+            return _result('db_check')
+
+        run_audit()
+        self.assertEqual(seen, [True])
+
+
+class TestDependencies(RegistryTestCase):
+
+    def test_dependency_runs_first_and_result_is_passed(self):
+        self.add_check('base', delay=0.1)
+        self.add_check('child', depends_on=('base',))
+        audit = run_audit()
+        self.assertEqual(self.calls, ['base', 'child'])
+        child = next(r for r in audit['results'] if r['check_name'] == 'child')
+        self.assertEqual(child['message'], "deps=['base']")
+
+    def test_selecting_a_check_pulls_in_its_dependencies(self):
+        self.add_check('base')
+        self.add_check('child', depends_on=('base',))
+        self.add_check('other')
+        audit = run_audit(names=['child'])
+        self.assertEqual([r['check_name'] for r in audit['results']], ['base', 'child'])
+
+    def test_unknown_dependency_is_rejected(self):
+        with self.assertRaises(ValueError):
+            self.add_check('child', depends_on=('missing',))
+
+
+class TestCaching(RegistryTestCase):
+
+    def test_unchanged_inputs_reuse_previous_result(self):
+        self.add_check('a')
+        self.add_check('b')
+        run_audit()
+        self.calls.clear()
+
+        audit = run_audit()
+        self.assertEqual(self.calls, [])
+        self.assertEqual(audit['executed'], 0)
+        self.assertEqual(audit['cached'], 2)
+        self.assertTrue(all(r['cached'] for r in audit['results']))
+        self.assertEqual(SecurityAudit.objects.count(), 2)
+
+    def test_changed_inputs_rerun_only_that_check_and_its_dependents(self):
+        self.add_check('a')
+        self.add_check('b')
+        self.add_check('c', depends_on=('a',))
+        run_audit()
+        self.calls.clear()
+
+        self.inputs['a'] = 'changed'
+        audit = run_audit()
+        self.assertEqual(sorted(self.calls), ['a', 'c'])
+        self.assertEqual(audit['executed'], 2)
+        self.assertEqual(SecurityAudit.objects.filter(check_name='b').count(), 1)
+
+    def test_expired_result_is_rerun(self):
+        self.add_check('a', ttl=60)
+        run_audit()
+        self.calls.clear()
+
+        SecurityAudit.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+        run_audit()
+        self.assertEqual(self.calls, ['a'])
+
+    def test_force_reruns_everything(self):
+        self.add_check('a')
+        run_audit()
+        self.calls.clear()
+        run_audit(force=True)
+        self.assertEqual(self.calls, ['a'])
+
+    def test_checks_version_invalidates_cache(self):
+        self.add_check('a')
+        run_audit()
+        self.calls.clear()
+        with mock.patch.object(security_audit, 'CHECKS_VERSION', security_audit.CHECKS_VERSION + 1):
+            run_audit()
+        self.assertEqual(self.calls, ['a'])
+
+
+class TestFailures(RegistryTestCase):
+
+    def test_timeout_becomes_warning_and_is_not_cached(self):
+        self.add_check('hang', delay=1.0, timeout=0.1)
+        self.add_check('fast')
+        started = time.perf_counter()
+        audit = run_audit()
+        self.assertLess(time.perf_counter() - started, 0.8)
+        hang = audit['results'][0]
+        self.assertEqual(hang['status'], 'warn')
+        self.assertIn('タイムアウト', hang['message'])
+
+        row = SecurityAudit.objects.get(check_name='hang')
+        self.assertEqual(row.fingerprint, '')
+        self.calls.clear()
+        audit = run_audit()
+        self.assertEqual(audit['executed'], 1)  # hang だけ再実行
+
+    def test_exception_becomes_warning(self):
+        @register('boom', 'django_settings')
+        def boom():
+            raise RuntimeError('broken')
+
+        audit = run_audit()
+        self.assertEqual(audit['results'][0]['status'], 'warn')
+        self.assertIn('broken', audit['results'][0]['message'])
+
+
+class TestReport(RegistryTestCase):
+
+    def test_latest_report_reads_without_running(self):
+        self.add_check('a')
+        self.add_check('b')
+        self.assertEqual(latest_report(), [])
+        run_audit()
+        self.inputs['a'] = 'changed'
+        run_audit()
+        self.calls.clear()
+
+        report = latest_report()
+        self.assertEqual(self.calls, [])
+        self.assertEqual([r['check_name'] for r in report], ['a', 'b'])
+        self.assertFalse(any(r['stale'] for r in report))
+        # 別々の実行の最新結果を組み合わせる
+        self.assertNotEqual(report[0]['run_id'], report[1]['run_id'])
+
+    def test_summary_counts_missing_and_stale(self):
+        self.add_check('a', ttl=60)
+        self.add_check('b')
+        run_audit(names=['a'])
+        summary = report_summary(latest_report(now=timezone.now() + timedelta(minutes=5)))
+        self.assertEqual(summary['pass'], 1)
+        self.assertEqual(summary['stale'], 1)
+        self.assertEqual(summary['missing'], 1)
+
+
+class TestBuiltinChecks(TestCase):
+
+    def test_all_checks_registered(self):
+        self.assertEqual(len(security_audit.REGISTRY), 12)
+
+    def test_second_command_run_uses_cached_settings_checks(self):
+        call_command('security_audit', '--category', 'django_settings', stdout=mock.MagicMock())
+        first = SecurityAudit.objects.count()
+        call_command('security_audit', '--category', 'django_settings', stdout=mock.MagicMock())
+        self.assertEqual(SecurityAudit.objects.count(), first)
+
+    def test_secret_key_fingerprint_does_not_depend_on_key_value(self):
+        check = security_audit.REGISTRY['secret_key']
+        key_a, key_b = 'a' * 50, 'b' * 50
+        with override_settings(SECRET_KEY=key_a):
+            print_a = security_audit._fingerprint(check, [])
+            run_audit(names=['secret_key'])
+        with override_settings(SECRET_KEY=key_b):
+            self.assertEqual(security_audit._fingerprint(check, []), print_a)
+        with override_settings(SECRET_KEY='django-insecure-' + 'a' * 50):
+            self.assertNotEqual(security_audit._fingerprint(check, []), print_a)
+
+        stored = SecurityAudit.objects.get(check_name='secret_key').fingerprint
+        self.assertEqual(stored, print_a)
+        raw = {'version': security_audit.CHECKS_VERSION, 'inputs': key_a, 'deps': []}
+        self.assertNotEqual(stored, hashlib.sha256(json.dumps(raw, sort_keys=True).encode()).hexdigest())
+        self.assertNotEqual(stored, hashlib.sha256(key_a.encode()).hexdigest())
+
+    def test_debug_change_reruns_debug_and_cookie_checks(self):
+        with override_settings(DEBUG=False):
+            run_audit(category='django_settings')
+        with override_settings(DEBUG=True):
+            audit = run_audit(category='django_settings')
+        executed = {r['check_name'] for r in audit['results'] if not r['cached']}
+        self.assertEqual(executed, {'debug_mode', 'cookie_security'})
+
+
+class TestCachedViews(TestCase):
+
+    def setUp(self):
+        self.admin = User.objects.create_superuser('audit-admin', 'a@example.com', 'pw')
+        self.client.force_login(self.admin)
+
+    def test_admin_changelist_shows_cached_report_without_running(self):
+        run_audit(names=['debug_mode'])
+        with mock.patch.object(security_audit, 'run_audit') as run:
+            response = self.client.get('/admin/booking/securityaudit/')
+        run.assert_not_called()
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, '最新の監査結果')
+        self.assertEqual(len(response.context['audit_report']), 1)
+
+    def test_healthz_includes_security_summary(self):
+        run_audit(names=['debug_mode'])
+        response = self.client.get('/healthz?detail=1')
+        security = response.json()['security']
+        self.assertEqual(security['missing'], 11)
+        self.assertIsNotNone(security['last_run'])
@@ -95,3 +95,103 @@ class TestAIRecommendationAPI:
     def test_model_status(self, admin_client):
         resp = admin_client.get('/api/ai/model-status/')
         assert resp.status_code == 200
+
+
+def _seed_history(store, staff, shift_period, days=25):
+    for i in range(days):
+        d = date.today() - timedelta(days=i)
+        ShiftAssignment.objects.create(
+            period=shift_period, staff=staff,
+            date=d, start_hour=9, end_hour=17,
+            start_time=time(9, 0), end_time=time(17, 0),
+        )
+        VisitorCount.objects.bulk_create([
+            VisitorCount(store=store, date=d, hour=h, estimated_visitors=h, order_count=3)
+            for h in range(9, 17)
+        ])
+
+
+@pytest.fixture
+def model_media(settings, tmp_path):
+    from booking.services import ai_staff_recommend
+    settings.MEDIA_ROOT = str(tmp_path)
+    ai_staff_recommend._load_model.cache_clear()
+    yield
+    ai_staff_recommend._load_model.cache_clear()
+
+
+@pytest.mark.django_db
+class TestFeatureArrays:
+    def test_staff_counts_from_overlapping_shifts(self, store, staff, shift_period):
+        from booking.services.ai_staff_recommend import build_feature_matrix
+        today = date.today()
+        for start, end in ((9, 12), (10, 14), (12, 12)):
+            ShiftAssignment.objects.create(
+                period=shift_period, staff=staff, date=today,
+                start_hour=start, end_hour=end,
+                start_time=time(start, 0), end_time=time(end, 0),
+            )
+        VisitorCount.objects.create(store=store, date=today, hour=10, estimated_visitors=7, order_count=2)
+
+        X, y, names = build_feature_matrix(store, lookback_days=3)
+
+        assert [row[1] for row in X] == [9, 10, 11, 12, 13]
+        assert y == [1, 2, 2, 1, 1]
+        row = X[1]
+        assert row[names.index('day_of_week')] == today.weekday()
+        assert row[names.index('month')] == today.month
+        assert row[names.index('is_holiday')] == (1 if today.weekday() == 6 else 0)
+        assert (row[names.index('visitor_count')], row[names.index('order_count')]) == (7, 2)
+
+    def test_two_queries(self, store, staff, shift_period, django_assert_num_queries):
+        from booking.services.ai_staff_recommend import build_feature_arrays
+        _seed_history(store, staff, shift_period, days=10)
+        with django_assert_num_queries(2):
+            X, y = build_feature_arrays(store, lookback_days=30)
+        assert X.shape == (80, 6)
+        assert (y == 1).all()
+
+
+@pytest.mark.django_db
+class TestBatchedRecommendation:
+    def test_generate_predicts_once_and_upserts(self, store, staff, shift_period, model_media):
+        from unittest.mock import patch
+        import joblib
+        from booking.services.ai_staff_recommend import generate_recommendations, train_model
+
+        _seed_history(store, staff, shift_period)
+        rec_model = train_model(store)
+        assert rec_model is not None
+        rec_model.refresh_from_db()
+        assert set(rec_model.timings['train']) >= {'features', 'model_selection', 'fit', 'save'}
+
+        dates = [date.today() + timedelta(days=i) for i in range(1, 4)]
+        real_load = joblib.load
+        with patch('joblib.load', side_effect=real_load) as load:
+            assert generate_recommendations(store, dates) == 72
+            assert generate_recommendations(store, dates) == 72
+        assert load.call_count == 1
+
+        assert StaffRecommendationResult.objects.filter(store=store).count() == 72
+        assert set(
+            StaffRecommendationResult.objects.filter(store=store).values_list('hour', flat=True)
+        ) == set(range(24))
+
+        rec_model.refresh_from_db()
+        inference = rec_model.timings['inference']
+        assert inference['rows'] == 72
+        assert {'features', 'predict', 'persist'} <= set(inference)
+        assert 'train' in rec_model.timings
+
+    def test_single_predict_call(self, store, staff, shift_period, model_media):
+        from unittest.mock import patch
+        from booking.services import ai_staff_recommend
+
+        _seed_history(store, staff, shift_period)
+        rec_model = ai_staff_recommend.train_model(store)
+        model = ai_staff_recommend.load_model(rec_model)
+        dates = [date.today() + timedelta(days=i) for i in range(1, 8)]
+        with patch.object(type(model), 'predict', autospec=True, side_effect=type(model).predict) as predict:
+            ai_staff_recommend.generate_recommendations(store, dates)
+        assert predict.call_count == 1
+        assert predict.call_args.args[1].shape == (7 * 24, 6)
@@ -5,15 +5,20 @@ Covers:
 - _calc_break_minutes: statutory break time calculation
 - _classify_work_hours: classification into regular/overtime/late-night/holiday
 - derive_attendance_from_shifts: auto-generation of WorkAttendance from ShiftAssignment
+- derive_attendance_incremental: watermark-based re-derivation of changed shifts
 """
 import pytest
-from datetime import date, time
+from datetime import date, time, timedelta
 
-from booking.models import WorkAttendance, ShiftAssignment
+from django.utils import timezone
+
+from booking.models import WorkAttendance, ShiftAssignment, SystemConfig
 from booking.services.attendance_service import (
+    WATERMARK_KEY,
     _calc_break_minutes,
     _classify_work_hours,
     derive_attendance_from_shifts,
+    derive_attendance_incremental,
 )
 
 
@@ -220,3 +225,131 @@ class TestDeriveAttendanceFromShifts:
         att = WorkAttendance.objects.get(staff=shift_assignment.staff, date=shift_assignment.date)
         assert att.clock_in == time(9, 0)
         assert att.clock_out == time(17, 0)
+
+    @pytest.mark.django_db
+    def test_unchanged_records_are_not_rewritten(self, store, shift_period, shift_assignment):
+        derive_attendance_from_shifts(store, date(2025, 4, 1), date(2025, 4, 30))
+        assert derive_attendance_from_shifts(store, date(2025, 4, 1), date(2025, 4, 30)) == 0
+
+    @pytest.mark.django_db
+    def test_query_count_does_not_grow_with_assignments(self, store, staff, shift_period, django_assert_max_num_queries):
+        for day in range(1, 11):
+            ShiftAssignment.objects.create(
+                period=shift_period, staff=staff,
+                date=date(2025, 4, day), start_hour=9, end_hour=17,
+            )
+        # シフト1 + 既存勤怠1 + bulk_create1（+ savepoint）
+        with django_assert_max_num_queries(5):
+            count = derive_attendance_from_shifts(store, date(2025, 4, 1), date(2025, 4, 30))
+        assert count == 10
+
+    @pytest.mark.django_db
+    def test_latest_shift_of_the_day_wins(self, store, staff, shift_period):
+        ShiftAssignment.objects.create(period=shift_period, staff=staff, date=date(2025, 4, 10), start_hour=17, end_hour=22)
+        ShiftAssignment.objects.create(period=shift_period, staff=staff, date=date(2025, 4, 10), start_hour=9, end_hour=13)
+        assert derive_attendance_from_shifts(store, date(2025, 4, 1), date(2025, 4, 30)) == 1
+        att = WorkAttendance.objects.get(staff=staff, date=date(2025, 4, 10))
+        assert att.clock_in == time(17, 0)
+
+
+class TestDeriveAttendanceIncremental:
+
+    @pytest.fixture(autouse=True)
+    def approved(self, request):
+        """差分導出の対象は承認済み期間のみ"""
+        if 'shift_period' in request.fixturenames:
+            period = request.getfixturevalue('shift_period')
+            period.status = 'approved'
+            period.save(update_fields=['status'])
+
+    @pytest.fixture
+    def watermark(self, store):
+        """前回実行済みの状態にする"""
+        SystemConfig.set(
+            WATERMARK_KEY.format(store_id=store.id),
+            (timezone.now() - timedelta(days=1)).isoformat(),
+        )
+
+    @pytest.mark.django_db
+    def test_only_changed_assignments_are_derived(self, store, staff, shift_period, shift_assignment, watermark):
+        assert derive_attendance_incremental(store) == 1
+        assert WorkAttendance.objects.filter(staff=staff).count() == 1
+
+        # 変更の無いシフトは対象外（ウォーターマークを進めてから古いシフトを追加）
+        ShiftAssignment.objects.create(period=shift_period, staff=staff, date=date(2025, 4, 11), start_hour=9, end_hour=17)
+        SystemConfig.set(WATERMARK_KEY.format(store_id=store.id), timezone.now().isoformat())
+        assert derive_attendance_incremental(store) == 0
+        assert not WorkAttendance.objects.filter(date=date(2025, 4, 11)).exists()
+
+    @pytest.mark.django_db
+    def test_updated_assignment_is_rederived(self, store, staff, shift_period, shift_assignment, watermark):
+        derive_attendance_incremental(store)
+        SystemConfig.set(
+            WATERMARK_KEY.format(store_id=store.id),
+            (timezone.now() - timedelta(seconds=1)).isoformat(),
+        )
+
+        shift_assignment.end_hour = 19
+        shift_assignment.save()
+        assert derive_attendance_incremental(store) == 1
+        assert WorkAttendance.objects.get(staff=staff).clock_out == time(19, 0)
+
+    @pytest.mark.django_db
+    def test_manual_records_are_kept(self, store, staff, shift_period, shift_assignment, watermark):
+        WorkAttendance.objects.create(
+            staff=staff, date=date(2025, 4, 10),
+            clock_in=time(10, 0), clock_out=time(18, 0),
+            source='manual',
+        )
+        assert derive_attendance_incremental(store) == 0
+        assert WorkAttendance.objects.get(staff=staff).clock_in == time(10, 0)
+
+    @pytest.mark.django_db
+    @pytest.mark.parametrize('status', ['open', 'closed', 'scheduled'])
+    def test_unapproved_period_creates_nothing(self, store, staff, shift_period, shift_assignment, status):
+        shift_period.status = status
+        shift_period.save(update_fields=['status'])
+        assert derive_attendance_incremental(store) == 0
+        assert not WorkAttendance.objects.exists()
+
+    @pytest.mark.django_db
+    def test_future_shift_waits_until_its_day(self, store, staff, shift_period, watermark):
+        tomorrow = timezone.localdate() + timedelta(days=1)
+        assignment = ShiftAssignment.objects.create(
+            period=shift_period, staff=staff, date=tomorrow, start_hour=9, end_hour=17,
+        )
+        assert derive_attendance_incremental(store) == 0
+        assert not WorkAttendance.objects.exists()
+
+        # 当日を迎えたシフトは、更新されていなくても次の実行で反映される
+        ShiftAssignment.objects.filter(pk=assignment.pk).update(
+            date=timezone.localdate(), updated_at=timezone.now() - timedelta(days=2),
+        )
+        SystemConfig.set(
+            WATERMARK_KEY.format(store_id=store.id),
+            (timezone.now() - timedelta(days=1)).isoformat(),
+        )
+        assert derive_attendance_incremental(store) == 1
+
+    @pytest.mark.django_db
+    def test_task_is_opt_in(self, store, staff, shift_period, shift_assignment, settings):
+        from booking.tasks import derive_attendance_incremental as task
+
+        settings.ATTENDANCE_AUTO_DERIVE_ENABLED = False
+        assert task() == 0
+        assert not WorkAttendance.objects.exists()
+
+        settings.ATTENDANCE_AUTO_DERIVE_ENABLED = True
+        SystemConfig.set(
+            WATERMARK_KEY.format(store_id=store.id),
+            (timezone.now() - timedelta(days=1)).isoformat(),
+        )
+        assert task() == 1
+
+    @pytest.mark.django_db
+    def test_first_run_covers_current_month_and_stores_watermark(self, store, staff, shift_period, shift_assignment):
+        ShiftAssignment.objects.create(
+            period=shift_period, staff=staff, date=timezone.localdate(), start_hour=9, end_hour=17,
+        )
+        assert derive_attendance_incremental(store) == 1
+        assert SystemConfig.get(WATERMARK_KEY.format(store_id=store.id))
@@ -6,6 +6,7 @@ Covers:
 - _calc_social_insurance: pension, health, employment, long-term care, workers' comp
 - calculate_payroll_for_staff: hourly and monthly rate payroll computation
 - calculate_payroll_for_period: batch processing and status transitions
+- calculate_payroll_batch: grouped aggregation, bulk upsert, per-phase timings
 """
 import pytest
 from datetime import date, time
@@ -21,6 +22,8 @@ from booking.services.payroll_calculator import (
     _calc_social_insurance,
     calculate_payroll_for_staff,
     calculate_payroll_for_period,
+    calculate_payroll_batch,
+    period_calculation,
 )
 
 
@@ -343,3 +346,111 @@ class TestCalculatePayrollForPeriod:
         assert payroll_period.status == 'confirmed'
         # Default SalaryStructure with Decimal defaults should work
         assert len(entries) == 1
+
+
+# ==============================
+# calculate_payroll_batch
+# ==============================
+
+def _make_staff_with_contract(store, index):
+    from django.contrib.auth import get_user_model
+    from booking.models import Staff
+
+    user = get_user_model().objects.create_user(username=f'batch{index}')
+    member = Staff.objects.create(name=f'バッチ{index}', store=store, user=user)
+    contract = EmploymentContract.objects.create(
+        staff=member, pay_type='hourly', hourly_rate=1000 + index * 100,
+        commute_allowance=0, housing_allowance=0, family_allowance=0,
+        standard_monthly_remuneration=200000, resident_tax_monthly=0,
+        is_active=True,
+    )
+    WorkAttendance.objects.create(
+        staff=member, date=date(2025, 4, 10),
+        clock_in=time(9, 0), clock_out=time(17, 0),
+        regular_minutes=420, overtime_minutes=0,
+        late_night_minutes=0, holiday_minutes=0, break_minutes=60,
+        source='shift',
+    )
+    return member, contract
+
+
+class TestCalculatePayrollBatch:
+
+    @pytest.mark.django_db
+    def test_matches_per_staff_calculation(self, payroll_period, staff, employment_contract, salary_structure, work_attendance):
+        batch = calculate_payroll_batch(payroll_period, [(staff, employment_contract)], salary_structure)
+        batch_values = {f: getattr(batch.entries[0], f) for f in ('gross_pay', 'total_deductions', 'net_pay')}
+        batch_deductions = set(PayrollDeduction.objects.values_list('deduction_type', 'amount'))
+
+        single = calculate_payroll_for_staff(payroll_period, staff, employment_contract, salary_structure)
+        single.refresh_from_db()
+        assert {f: getattr(single, f) for f in batch_values} == batch_values
+        assert set(single.deductions.values_list('deduction_type', 'amount')) == batch_deductions
+
+    @pytest.mark.django_db
+    def test_query_count_does_not_grow_with_staff(self, store, payroll_period, salary_structure, django_assert_max_num_queries):
+        pairs = [_make_staff_with_contract(store, i) for i in range(5)]
+
+        # 集計1 + 既存取得1 + 作成1 + 控除削除1 + 控除作成1（+ savepoint）
+        with django_assert_max_num_queries(8):
+            result = calculate_payroll_batch(payroll_period, pairs, salary_structure)
+        assert len(result.entries) == 5
+        deductions = PayrollDeduction.objects.filter(entry__period=payroll_period).count()
+        assert deductions >= 5 * 5
+
+        # 再計算は更新（重複しない）
+        with django_assert_max_num_queries(8):
+            calculate_payroll_batch(payroll_period, pairs, salary_structure)
+        assert PayrollEntry.objects.filter(period=payroll_period).count() == 5
+        assert PayrollDeduction.objects.filter(entry__period=payroll_period).count() == deductions
+
+    @pytest.mark.django_db
+    def test_aggregates_each_staff_separately(self, store, payroll_period, salary_structure):
+        (a, ca), (b, cb) = [_make_staff_with_contract(store, i) for i in range(2)]
+        WorkAttendance.objects.create(
+            staff=b, date=date(2025, 4, 11),
+            clock_in=time(9, 0), clock_out=time(17, 0),
+            regular_minutes=420, overtime_minutes=0,
+            late_night_minutes=0, holiday_minutes=0, break_minutes=60,
+            source='shift',
+        )
+        entries = {e.staff_id: e for e in calculate_payroll_batch(payroll_period, [(a, ca), (b, cb)], salary_structure).entries}
+        assert entries[a.id].total_work_days == 1
+        assert entries[b.id].total_work_days == 2
+        assert entries[b.id].total_regular_hours == Decimal('14.00')
+
+    @pytest.mark.django_db
+    def test_failed_staff_is_skipped_and_reported(self, store, payroll_period, salary_structure):
+        pairs = [_make_staff_with_contract(store, i) for i in range(2)]
+        broken_staff, broken_contract = pairs[0]
+        broken_contract.pay_type = 'hourly'
+        broken_contract.hourly_rate = None
+
+        result = calculate_payroll_batch(payroll_period, pairs, salary_structure)
+        assert result.failed == [broken_staff]
+        assert [e.staff_id for e in result.entries] == [pairs[1][0].id]
+
+    @pytest.mark.django_db
+    def test_reports_phase_timings(self, payroll_period, staff, employment_contract, salary_structure):
+        with period_calculation(payroll_period) as (assignments, structure):
+            result = calculate_payroll_batch(payroll_period, assignments, structure)
+        payroll_period.refresh_from_db()
+        assert payroll_period.status == 'confirmed'
+        assert [e.staff_id for e in result.entries] == [staff.id]
+        assert set(result.timings) == {'aggregate', 'compute', 'persist'}
+        assert all(seconds >= 0 for seconds in result.timings.values())
+        assert '集計' in result.timing_summary()
+
+    @pytest.mark.django_db
+    def test_admin_action_reports_timings(self, payroll_period, staff, employment_contract, salary_structure):
+        from booking.admin.hr import PayrollPeriodAdmin
+        from booking.admin_site import custom_site
+
+        model_admin = PayrollPeriodAdmin(PayrollPeriod, custom_site)
+        with patch.object(model_admin, 'message_user') as message_user:
+            model_admin.run_payroll_calculation(None, PayrollPeriod.objects.filter(pk=payroll_period.pk))
+        messages = [c.args[1] for c in message_user.call_args_list]
+        assert any('集計' in m for m in messages)
+        assert messages[-1] == '1 件の給与明細を計算しました。'
+        payroll_period.refresh_from_db()
+        assert payroll_period.status == 'confirmed'
@@ -0,0 +1,114 @@
+"""Tests for booking/services/system_config.py (cached SystemConfig lookups)."""
+import pytest
+from django.core.cache import cache
+from django.db import transaction
+
+from booking.models import SystemConfig
+from booking.services import system_config
+
+
+@pytest.fixture(autouse=True)
+def clean_cache():
+    cache.clear()
+    system_config.clear_local()
+    yield
+    cache.clear()
+    system_config.clear_local()
+
+
+@pytest.fixture
+def expire_local(monkeypatch):
+    """ローカル層の世代確認を毎回行わせる（他ワーカー相当）"""
+    monkeypatch.setattr(system_config, 'LOCAL_CHECK_INTERVAL', 0)
+
+
+@pytest.mark.django_db(transaction=True)
+class TestCachedLookups:
+    def test_reads_are_cached(self, django_assert_num_queries):
+        SystemConfig.set('ec_enabled', 'true')
+        SystemConfig.set('log_level', 'INFO')
+        with django_assert_num_queries(1):
+            for _ in range(10):
+                assert SystemConfig.get('ec_enabled') == 'true'
+                assert SystemConfig.get('log_level') == 'INFO'
+                assert SystemConfig.get('missing', 'x') == 'x'
+
+    def test_shared_cache_survives_local_reset(self, django_assert_num_queries):
+        SystemConfig.set('ec_enabled', 'true')
+        SystemConfig.get('ec_enabled')
+        system_config.clear_local()
+        with django_assert_num_queries(0):
+            assert SystemConfig.get('ec_enabled') == 'true'
+
+    def test_save_and_delete_invalidate(self):
+        SystemConfig.set('log_level', 'INFO')
+        assert SystemConfig.get('log_level') == 'INFO'
+        SystemConfig.set('log_level', 'DEBUG')
+        assert SystemConfig.get('log_level') == 'DEBUG'
+        SystemConfig.objects.filter(key='log_level').delete()
+        assert SystemConfig.get('log_level', 'WARNING') == 'WARNING'
+
+    def test_other_worker_sees_change_after_version_bump(self, expire_local):
+        SystemConfig.set('browser_posting_enabled', 'false')
+        assert SystemConfig.get_bool('browser_posting_enabled') is False
+        stale = system_config._local
+
+        SystemConfig.set('browser_posting_enabled', 'true')
+        # 別ワーカーは古いローカル層を持ったまま（世代番号で気付く）
+        system_config._local = stale
+        assert SystemConfig.get_bool('browser_posting_enabled') is True
+
+    def test_rolled_back_write_is_not_cached(self):
+        SystemConfig.set('ec_enabled', 'false')
+        assert SystemConfig.get_bool('ec_enabled') is False
+        with pytest.raises(RuntimeError):
+            with transaction.atomic():
+                SystemConfig.set('ec_enabled', 'true')
+                # トランザクション内では自分の書き込みが見える
+                assert SystemConfig.get_bool('ec_enabled') is True
+                raise RuntimeError('rollback')
+        assert SystemConfig.get_bool('ec_enabled') is False
+
+    def test_get_many(self, django_assert_num_queries):
+        SystemConfig.set('a', '1')
+        SystemConfig.set('b', '2')
+        SystemConfig.get('a')
+        with django_assert_num_queries(0):
+            assert SystemConfig.get_many(['a', 'b', 'c'], defaults={'c': 'z'}) == {'a': '1', 'b': '2', 'c': 'z'}
+
+
+@pytest.mark.django_db(transaction=True)
+class TestTypedAccessors:
+    @pytest.mark.parametrize('raw,expected', [
+        ('true', True), ('TRUE', True), ('1', True), ('on', True),
+        ('false', False), ('0', False), ('', False), ('maybe', None),
+    ])
+    def test_get_bool(self, raw, expected):
+        SystemConfig.set('flag', raw)
+        assert SystemConfig.get_bool('flag', None) is expected
+
+    def test_get_int_and_json(self):
+        SystemConfig.set('max_reservations_per_day', ' 20 ')
+        SystemConfig.set('bad_int', 'abc')
+        SystemConfig.set('menu', '{"langs": ["ja", "en"]}')
+        SystemConfig.set('bad_json', '{')
+        assert SystemConfig.get_int('max_reservations_per_day') == 20
+        assert SystemConfig.get_int('bad_int', 7) == 7
+        assert SystemConfig.get_int('missing', 3) == 3
+        assert SystemConfig.get_json('menu') == {'langs': ['ja', 'en']}
+        assert SystemConfig.get_json('bad_json', {}) == {}
+
+    def test_parsed_once(self, monkeypatch):
+        SystemConfig.set('menu', '{"a": 1}')
+        calls = []
+        parse = system_config._parse_json
+
+        def counting(raw, default):
+            calls.append(raw)
+            return parse(raw, default)
+
+        monkeypatch.setattr(system_config, '_parse_json', counting)
+        first = SystemConfig.get_json('menu')
+        assert SystemConfig.get_json('menu') is first
+        assert len(calls) == 1
+